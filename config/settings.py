@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Configuración de rutas y parámetros de almacenamiento del Digital Taximeter.
+"""
+import os
+
+LOGS_DIR = 'logs'
+
+# Checkpoints mapeados en memoria de los viajes activos (recuperación tras caída)
+CHECKPOINT_DIR = os.path.join(LOGS_DIR, 'checkpoints')
+
+# Tabla de estado en vivo en memoria compartida (lectura para paneles de despacho)
+LIVE_STATE_ENABLED = True
+LIVE_STATE_NAME = 'taximeter_live'
+LIVE_STATE_SLOTS = 256
+CAB_ID = int(os.environ.get('TAXIMETER_CAB_ID', '0'))
+
+# Historial de viajes (los segmentos archivados siguen el patrón historial_viajes-*.txt)
+HISTORY_FILE = os.path.join(LOGS_DIR, 'historial_viajes.txt')
+# Un fichero de historial por taxi (cab-<CAB_ID>.txt): escrituras sin contención
+HISTORY_SHARD_DIR = os.path.join(LOGS_DIR, 'historial')
+
+# Sidecar de columnas del historial para el análisis con numpy/pandas (src/analysis.py)
+ANALYSIS_CACHE_DIR = os.path.join(LOGS_DIR, 'historial_columnas')
+
+# Repositorio SQLite de viajes (consultas por fecha, perfil y tarifa)
+TRIPS_DB = os.path.join(LOGS_DIR, 'viajes.db')
+
+# Detección automática de parado/en movimiento (TAXIMETER_SENSOR: ruta, FIFO o 'sim';
+# con SENSOR_KIND 'gps', un CSV/FIFO de posiciones o 'udp[:puerto]', y también mide la distancia)
+SENSOR_SOURCE = os.environ.get('TAXIMETER_SENSOR') or None
+SENSOR_KIND = os.environ.get('TAXIMETER_SENSOR_KIND', 'speed')  # 'speed', 'odometer' o 'gps'
+SENSOR_STOP_KMH = 3.0
+SENSOR_MOVE_KMH = 8.0
+SENSOR_DEBOUNCE_S = 2.0
+
+# Reglas de tarificación por perfil (mínimos, bajada de bandera, suplementos...); ver src/rules.py
+PRICING_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pricing_rules.json')
+
+# Caché de presupuestos (entradas y cuantización de las duraciones en segundos)
+QUOTE_CACHE_SIZE = 4096
+QUOTE_RESOLUTION_S = 0.1
+
+# Estimaciones antes del viaje (src/prediction.py): viajes mínimos de una hora y perfil para no usar
+# un histograma más general
+PREDICTION_MIN_TRIPS = 20
+
+# Idioma de los mensajes de la CLI ('es' o 'en')
+LANGUAGE = os.environ.get('TAXIMETER_LANG', 'es')
+
+# Salida de la CLI: refrescos por segundo como máximo (la línea de estado se agrupa)
+CONSOLE_MAX_FPS = 10.0
+# Dibujar la línea de estado con rich Live (TAXIMETER_RICH_LIVE=1) si rich está instalado
+CONSOLE_RICH_LIVE = os.environ.get('TAXIMETER_RICH_LIVE') == '1'
+
+# CLI sobre bucle de eventos (TAXIMETER_EVENT_LOOP=0 vuelve al bucle clásico con input())
+CLI_EVENT_LOOP = os.environ.get('TAXIMETER_EVENT_LOOP', '1') != '0'
+# Refresco de la línea de estado y latido del checkpoint con un viaje activo (segundos)
+CLI_STATUS_INTERVAL_S = 1.0
+CLI_HEARTBEAT_S = 5.0
+# Sin respuesta a "¿terminar el viaje antes de salir?" se sigue con el viaje
+CLI_CONFIRM_TIMEOUT_S = 30.0
+# Checkpoint del WAL de SQLite tras guardar un viaje, con la CLI ya en reposo
+CLI_HISTORY_FLUSH_S = 5.0
+
+# Envío de los viajes al servidor central (src/outbox.py); sin TAXIMETER_OUTBOX_URL no se envía nada
+OUTBOX_URL = os.environ.get('TAXIMETER_OUTBOX_URL') or None
+# Una cola por taxi (outbox-<CAB_ID>.db): cada emisor envía sus viajes con su propio CAB_ID
+OUTBOX_DIR = os.path.join(LOGS_DIR, 'outbox')
+OUTBOX_BATCH_SIZE = 100
+# Revisión de la cola sin avisos, espera máxima entre reintentos y timeout de cada petición (segundos)
+OUTBOX_INTERVAL_S = 30.0
+OUTBOX_MAX_BACKOFF_S = 300.0
+OUTBOX_TIMEOUT_S = 10.0
+
+# Idioma de los recibos ('es' o 'en'); por defecto el de la CLI
+RECEIPT_LOCALE = os.environ.get('TAXIMETER_RECEIPT_LOCALE', LANGUAGE)
+
+# Servidor de flota en varios procesos (src/fleet.py): trabajadores y checkpoints de la parada ordenada
+FLEET_WORKERS = os.cpu_count() or 1
+FLEET_CHECKPOINT_DIR = os.path.join(CHECKPOINT_DIR, 'fleet')
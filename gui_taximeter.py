@@ -4,8 +4,6 @@ Digital Taximeter - GUI Version
 Sistema de Taxímetro Digital con Interfaz Gráfica
 """
 
-import tkinter as tk
-from tkinter import ttk, messagebox, font
 import time
 import threading
 from datetime import datetime
@@ -17,18 +15,33 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Importar las funciones del taxímetro original
-import main as taximeter_main
-from main import calculate_fare, save_trip_to_history, PRICE_PROFILES, change_price_profile
+# tkinter y el taxímetro original se importan en el primer uso: importar este
+# módulo (p. ej. desde los tests) no paga el arranque de Tk ni de main.
+from src.utils import lazy_import
+from src.meter import RunningFare
+from src.trip import START, STOP, MOVE, FINISH, Trip
+from src.checkpoint import TripCheckpoint
+from src.repository import TripRepository
+
+tk = lazy_import('tkinter')
+ttk = lazy_import('tkinter.ttk')
+messagebox = lazy_import('tkinter.messagebox')
+taximeter_main = lazy_import('main')
 
 class TaximeterGUI:
-    def __init__(self):
-        self.root = tk.Tk()
+    # Periodo del refresco del display (ms)
+    TICK_MS = 100
+    
+    def __init__(self, root=None, clock=time.time):
+        # Raíz y reloj inyectables: src/gui_harness.py los sustituye para probar sin pantalla
+        self.root = root if root is not None else tk.Tk()
+        self.clock = clock
         self.setup_window()
         self.setup_variables()
         self.setup_styles()
         self.create_widgets()
         self.reset_trip()
+        self.resume_orphan_trip()
         
         # Timer para actualizar el display
         self.update_timer()
@@ -67,13 +80,17 @@ class TaximeterGUI:
     
     def setup_variables(self):
         """Configurar las variables del taxímetro"""
-        self.trip_active = False
-        self.state = "stopped"  # stopped, moving
+        # Máquina de estados del viaje (la misma que la CLI): parado, en movimiento o sin viaje
+        self.trip = Trip(RunningFare(*taximeter_main.current_rates()))
+        self.running_fare = self.trip.fare
         self.start_time = 0
         self.stopped_time = 0
         self.moving_time = 0
         self.current_state_start = 0
         self.timer_running = False
+        self.checkpoint = None
+        self.live_slot = taximeter_main.open_live_slot()
+        self.sensor_feed = taximeter_main.start_sensor_feed()
         
         # Variables de la interfaz
         self.status_var = tk.StringVar(value="🚖 Listo para iniciar viaje")
@@ -81,6 +98,7 @@ class TaximeterGUI:
         self.time_moving_var = tk.StringVar(value="0.0")
         self.fare_var = tk.StringVar(value="€0.00")
         self.profile_var = tk.StringVar(value="Normal")
+        self.tags_var = tk.StringVar(value="")
     
     def setup_styles(self):
         """Configurar estilos personalizados"""
@@ -328,7 +346,7 @@ class TaximeterGUI:
         self.profile_combo = ttk.Combobox(
             profile_frame,
             textvariable=self.profile_var,
-            values=[profile['name'] for profile in PRICE_PROFILES.values()],
+            values=[profile['name'] for profile in taximeter_main.PRICE_PROFILES.values()],
             state='readonly',
             font=self.fonts['body'],
             width=20
@@ -336,6 +354,20 @@ class TaximeterGUI:
         self.profile_combo.pack(side='left', padx=5)
         self.profile_combo.bind('<<ComboboxSelected>>', self.on_profile_change)
         
+        # Etiquetas del próximo viaje (suplementos con `when`, p. ej. aeropuerto)
+        tags_frame = tk.Frame(pricing_frame, bg=self.colors['bg_light'])
+        tags_frame.pack(pady=(0, 10))
+        
+        tk.Label(
+            tags_frame,
+            text="Etiquetas:",
+            font=self.fonts['body'],
+            fg=self.colors['text'],
+            bg=self.colors['bg_light']
+        ).pack(side='left', padx=(10, 5))
+        
+        tk.Entry(tags_frame, textvariable=self.tags_var, font=self.fonts['body'], width=22).pack(side='left', padx=5)
+        
         # Información del perfil actual
         self.profile_info = tk.Label(
             pricing_frame,
@@ -377,20 +409,31 @@ class TaximeterGUI:
     
     def toggle_trip(self):
         """Iniciar o finalizar viaje"""
-        if not self.trip_active:
+        if not self.trip.active:
             self.start_trip()
         else:
             self.finish_trip()
     
     def start_trip(self):
         """Iniciar un nuevo viaje"""
-        self.trip_active = True
-        self.start_time = time.time()
-        self.current_state_start = time.time()
-        self.state = "stopped"
+        now = self.clock()
+        if not self.trip.can(START):
+            taximeter_main.log_rejected(self.trip, START)
+            return
+        if self.sensor_feed is not None:
+            # Lo recorrido antes de empezar el viaje no se cobra
+            self.sensor_feed.take_distance()
+        # El viaje se cobra con las tarifas vigentes al empezar
+        self.trip.pin(taximeter_main.current_tariff())
+        self.trip.fire(START, now)
+        self.running_fare.set_tags(taximeter_main.parse_tags(self.tags_var.get()))
+        self.start_time = now
+        self.current_state_start = self.start_time
         self.stopped_time = 0
         self.moving_time = 0
         self.timer_running = True
+        self.checkpoint = TripCheckpoint.create(taximeter_main.checkpoint_dir())
+        self.persist_trip_state(self.start_time)
         
         # Actualizar interfaz
         self.start_finish_btn.config(
@@ -399,22 +442,75 @@ class TaximeterGUI:
         )
         self.stop_move_btn.config(state='normal', bg=self.colors['warning'])
         self.status_var.set("🚖 Viaje en curso - PARADO")
+        if self.sensor_feed is not None and self.sensor_feed.state == "moving":
+            # El sensor ya indica movimiento al empezar el viaje
+            self.set_state("moving", self.start_time)
         
         logging.info("Viaje iniciado desde GUI")
     
+    def resume_orphan_trip(self):
+        """Reanudar el viaje que quedó a medias si la GUI anterior se cayó"""
+        resumed = taximeter_main.recover_orphan_trips()
+        if resumed is None:
+            return
+        
+        if resumed.profile in taximeter_main.PRICE_PROFILES:
+            taximeter_main.change_price_profile(resumed.profile)
+            self.update_profile_info()
+        self.trip.pin(taximeter_main.current_tariff())
+        
+        self.timer_running = True
+        self.start_time = resumed.start_time
+        # El tiempo sin latido antes de la caída no se cobra (igual que al finalizar huérfanos)
+        self.trip.restore(*resumed.restore_args(self.clock()))
+        self.current_state_start = self.running_fare.segment_start
+        self.checkpoint = TripCheckpoint(resumed.path)
+        self.persist_trip_state(self.clock())
+        
+        # Actualizar interfaz
+        self.start_finish_btn.config(
+            text="🏁 FINALIZAR VIAJE",
+            bg=self.colors['error']
+        )
+        if self.trip.state == "moving":
+            self.stop_move_btn.config(state='normal', text="🏃 EN MOVIMIENTO", bg=self.colors['success'])
+            self.status_var.set("🚖 Viaje recuperado - EN MOVIMIENTO")
+        else:
+            self.stop_move_btn.config(state='normal', text="🛑 PARADO", bg=self.colors['warning'])
+            self.status_var.set("🚖 Viaje recuperado - PARADO")
+        
+        logging.info(f"Viaje recuperado tras caída desde GUI: {resumed.trip_id}")
+    
+    def persist_trip_state(self, now):
+        """Actualizar el checkpoint y el estado en vivo del viaje"""
+        tariff = self.trip.tariff
+        taximeter_main.persist_trip_state(self.checkpoint, self.live_slot, self.running_fare, now,
+                                          tariff.active if tariff is not None else None)
+    
+    def discard_checkpoint(self):
+        """Borrar el checkpoint del viaje (terminado o abandonado)"""
+        if self.checkpoint is not None:
+            self.checkpoint.discard()
+            self.checkpoint = None
+    
     def finish_trip(self):
         """Finalizar el viaje actual"""
-        if not self.trip_active:
+        if not self.trip.fire(FINISH, self.clock()):
+            taximeter_main.log_rejected(self.trip, FINISH)
             return
         
-        # Calcular tiempo final
-        self.update_times()
+        # Tiempos finales (el último tramo queda cerrado)
+        self.stopped_time = self.running_fare.stopped_time
+        self.moving_time = self.running_fare.moving_time
         
         # Calcular tarifa
-        total_fare = calculate_fare(self.stopped_time, self.moving_time)
+        total_fare = taximeter_main.calculate_fare(self.stopped_time, self.moving_time, self.running_fare.distance_km,
+                                                   self.running_fare.tags, tariff=self.trip.tariff)
         
         # Guardar en historial
-        save_trip_to_history(self.stopped_time, self.moving_time, total_fare)
+        taximeter_main.save_trip_to_history(self.stopped_time, self.moving_time, total_fare,
+                                            profile=self.trip.tariff.active, segments=self.running_fare.segments,
+                                            tags=self.running_fare.tags)
         
         # Mostrar resumen
         self.show_trip_summary(total_fare)
@@ -426,10 +522,12 @@ class TaximeterGUI:
     
     def reset_trip(self):
         """Resetear el estado del viaje"""
-        self.trip_active = False
         self.timer_running = False
         self.stopped_time = 0
         self.moving_time = 0
+        self.trip.reset()
+        self.discard_checkpoint()
+        self.persist_trip_state(self.clock())
         
         # Actualizar interfaz
         self.start_finish_btn.config(
@@ -448,85 +546,85 @@ class TaximeterGUI:
     
     def toggle_state(self):
         """Cambiar entre parado y movimiento"""
-        if not self.trip_active:
+        self.set_state("moving" if self.trip.state == "stopped" else "stopped", self.clock())
+    
+    def set_state(self, state, now):
+        """Pasar al estado indicado cerrando el tramo en el instante `now`"""
+        # Cerrar el tramo anterior y abrir el del nuevo estado
+        event = MOVE if state == "moving" else STOP
+        if not self.trip.fire(event, now):
+            taximeter_main.log_rejected(self.trip, event)
             return
         
-        # Actualizar tiempos antes del cambio
-        self.update_times()
-        
-        # Cambiar estado
-        if self.state == "stopped":
-            self.state = "moving"
+        if state == "moving":
             self.stop_move_btn.config(
                 text="🏃 EN MOVIMIENTO",
                 bg=self.colors['success']
             )
             self.status_var.set("🚖 Viaje en curso - EN MOVIMIENTO")
         else:
-            self.state = "stopped"
             self.stop_move_btn.config(
                 text="🛑 PARADO",
                 bg=self.colors['warning']
             )
             self.status_var.set("🚖 Viaje en curso - PARADO")
         
-        # Reiniciar contador para el nuevo estado
-        self.current_state_start = time.time()
+        self.current_state_start = now
+        self.persist_trip_state(self.current_state_start)
         
-        logging.info(f"Estado cambiado a: {self.state}")
-    
-    def update_times(self):
-        """Actualizar los tiempos acumulados"""
-        if not self.trip_active:
-            return
-        
-        current_time = time.time()
-        duration = current_time - self.current_state_start
-        
-        if self.state == "stopped":
-            self.stopped_time += duration
-        else:
-            self.moving_time += duration
-        
-        self.current_state_start = current_time
+        logging.info(f"Estado cambiado a: {state}")
     
     def update_timer(self):
         """Actualizar el timer y la interfaz"""
-        if self.timer_running and self.trip_active:
-            self.update_times()
+        if self.timer_running and self.trip.active:
+            now = self.clock()
             
-            # Actualizar display de tiempos
-            self.time_stopped_var.set(f"{self.stopped_time:.1f}")
-            self.time_moving_var.set(f"{self.moving_time:.1f}")
+            # Transiciones detectadas por el sensor, con su instante original
+            if self.sensor_feed is not None:
+                for state, at in self.sensor_feed.drain():
+                    if state != self.trip.state:
+                        self.set_state(state, max(at, self.running_fare.segment_start))
+                        logging.info(f"Estado detectado por el sensor: {state}")
+                # Distancia medida por el GPS (el checkpoint la guarda con el resto del viaje)
+                if taximeter_main.apply_sensor_distance(self.sensor_feed, self.trip):
+                    self.persist_trip_state(now)
             
-            # Calcular tarifa estimada
-            profile = PRICE_PROFILES[taximeter_main.CURRENT_PROFILE]
-            estimated_fare = (self.stopped_time * profile["stopped"] + 
-                             self.moving_time * profile["moving"])
-            self.fare_var.set(f"€{estimated_fare:.2f}")
+            # Actualizar display de tiempos (el tramo abierto no se cierra)
+            stopped_time, moving_time = self.running_fare.elapsed(now)
+            self.time_stopped_var.set(f"{stopped_time:.1f}")
+            self.time_moving_var.set(f"{moving_time:.1f}")
             
-            # Reiniciar el contador actual
-            self.current_state_start = time.time()
+            # Tarifa estimada: una multiplicación y suma sobre la caché
+            self.fare_var.set(f"€{self.running_fare.estimate(now):.2f}")
+            
+            # Marcar el viaje como vivo en el checkpoint (escritura en memoria)
+            tariff = self.trip.tariff
+            taximeter_main.touch_trip_state(self.checkpoint, self.live_slot, self.running_fare, now,
+                                            tariff.active if tariff is not None else None)
         
         # Programar siguiente actualización
-        self.root.after(100, self.update_timer)
+        self.root.after(self.TICK_MS, self.update_timer)
     
     def on_profile_change(self, event):
         """Manejar cambio de perfil de tarifa"""
         selected_name = self.profile_var.get()
         
         # Encontrar el key del perfil seleccionado
-        for key, profile in PRICE_PROFILES.items():
+        for key, profile in taximeter_main.PRICE_PROFILES.items():
             if profile['name'] == selected_name:
-                change_price_profile(key)
+                taximeter_main.change_price_profile(key)
                 break
         
+        # Invalidar la tarifa acumulada: el viaje pasa a cobrarse con el snapshot nuevo
+        self.trip.pin(taximeter_main.current_tariff())
+        self.persist_trip_state(self.clock())
+        
         self.update_profile_info()
         logging.info(f"Perfil cambiado a: {selected_name}")
     
     def update_profile_info(self):
         """Actualizar la información del perfil actual"""
-        profile = PRICE_PROFILES[taximeter_main.CURRENT_PROFILE]
+        profile = taximeter_main.current_tariff().profile
         info_text = f"Parado: €{profile['stopped']}/s | Movimiento: €{profile['moving']}/s"
         self.profile_info.config(text=info_text)
         
@@ -535,16 +633,8 @@ class TaximeterGUI:
     
     def show_trip_summary(self, total_fare):
         """Mostrar resumen del viaje"""
-        summary = f"""
-╔══════════════════════════════════════╗
-║            RESUMEN DEL VIAJE          ║
-╠══════════════════════════════════════╣
-║ 🛑 Tiempo parado:    {self.stopped_time:>8.1f}s ║
-║ 🏃 Tiempo movimiento: {self.moving_time:>8.1f}s ║
-║ ⏱️  Tiempo total:     {(self.stopped_time + self.moving_time):>8.1f}s ║
-║ 💰 Tarifa total:     {total_fare:>9.2f}€ ║
-╚══════════════════════════════════════╝
-        """
+        summary = taximeter_main.trip_receipt(self.stopped_time, self.moving_time, total_fare,
+                                              tariff=self.trip.tariff)
         
         messagebox.showinfo("🚖 Viaje Finalizado", summary)
         
@@ -556,51 +646,14 @@ class TaximeterGUI:
     
     def show_history(self):
         """Mostrar ventana de historial completo"""
-        history_window = tk.Toplevel(self.root)
-        history_window.title("📜 Historial de Viajes")
-        history_window.geometry("600x400")
-        history_window.configure(bg=self.colors['bg_dark'])
-        
-        # Centrar ventana
-        history_window.transient(self.root)
-        history_window.grab_set()
-        
-        # Texto del historial
-        history_text = tk.Text(
-            history_window,
-            font=('Consolas', 10),
-            bg=self.colors['bg_dark'],
-            fg=self.colors['text'],
-            relief='raised',
-            bd=2
-        )
-        history_text.pack(fill='both', expand=True, padx=10, pady=10)
-        
-        # Scrollbar
-        scrollbar = tk.Scrollbar(history_window)
-        scrollbar.pack(side='right', fill='y')
-        history_text.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=history_text.yview)
-        
-        # Cargar historial
         try:
-            if os.path.exists('logs/historial_viajes.txt'):
-                with open('logs/historial_viajes.txt', 'r', encoding='utf-8') as f:
-                    content = f.read()
-                if content:
-                    history_text.insert('1.0', content)
-                else:
-                    history_text.insert('1.0', "📭 No hay viajes en el historial aún.")
-            else:
-                history_text.insert('1.0', "📭 No hay viajes en el historial aún.")
+            HistoryWindow(self.root, self.colors, taximeter_main.sync_trip_repository())
         except Exception as e:
-            history_text.insert('1.0', f"❌ Error leyendo historial: {e}")
-        
-        history_text.config(state='disabled')
+            messagebox.showerror("📜 Historial de Viajes", f"❌ Error leyendo historial: {e}")
     
     def on_closing(self):
         """Manejar el cierre de la aplicación"""
-        if self.trip_active:
+        if self.trip.active:
             # Confirmar si hay un viaje activo
             if messagebox.askquestion(
                 "🚖 Viaje Activo", 
@@ -608,6 +661,12 @@ class TaximeterGUI:
                 icon='warning'
             ) == 'yes':
                 self.finish_trip()
+            else:
+                # Viaje abandonado voluntariamente: no hay nada que recuperar
+                self.discard_checkpoint()
+        
+        if self.sensor_feed is not None:
+            self.sensor_feed.stop()
         
         # Cerrar aplicación
         logging.info("🛑 Cerrando Digital Taximeter GUI")
@@ -618,9 +677,149 @@ class TaximeterGUI:
         """Ejecutar la aplicación"""
         self.root.mainloop()
 
+class HistoryWindow:
+    """
+    Ventana de historial virtualizada.
+    
+    El Treeview solo contiene las filas visibles: al desplazarse se pide al
+    repositorio de viajes la página nueva con LIMIT/OFFSET, ordenada y
+    filtrada por SQLite.
+    """
+    
+    PAGE_SIZE = 20
+    HEADINGS = {
+        'date': "📅 Fecha",
+        'stopped': "🛑 Parado (s)",
+        'moving': "🏃 Movimiento (s)",
+        'total': "⏱️ Total (s)",
+        'fare': "💰 Tarifa (€)"
+    }
+    
+    def __init__(self, parent, colors, repository):
+        self.repository = repository
+        self.colors = colors
+        self.sort_column = 'date'
+        self.descending = True
+        self.search = None
+        self.first = 0
+        self.total = repository.count()
+        
+        self.window = tk.Toplevel(parent)
+        self.window.title("📜 Historial de Viajes")
+        self.window.geometry("700x480")
+        self.window.configure(bg=colors['bg_dark'])
+        self.window.transient(parent)
+        self.window.grab_set()
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        self.create_widgets()
+        self.render()
+    
+    def create_widgets(self):
+        """Crear buscador, tabla y barra de desplazamiento"""
+        search_frame = tk.Frame(self.window, bg=self.colors['bg_dark'])
+        search_frame.pack(fill='x', padx=10, pady=(10, 0))
+        
+        tk.Label(
+            search_frame,
+            text="🔍 Buscar:",
+            bg=self.colors['bg_dark'],
+            fg=self.colors['text']
+        ).pack(side='left')
+        
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self.apply_search())
+        tk.Entry(search_frame, textvariable=self.search_var).pack(side='left', fill='x', expand=True, padx=5)
+        
+        self.count_label = tk.Label(search_frame, bg=self.colors['bg_dark'], fg=self.colors['text_secondary'])
+        self.count_label.pack(side='right')
+        
+        table_frame = tk.Frame(self.window, bg=self.colors['bg_dark'])
+        table_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        self.tree = ttk.Treeview(
+            table_frame,
+            columns=TripRepository.COLUMNS,
+            show='headings',
+            height=self.PAGE_SIZE,
+            selectmode='browse'
+        )
+        for column in TripRepository.COLUMNS:
+            self.tree.heading(column, text=self.HEADINGS[column], command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=170 if column == 'date' else 110, anchor='e')
+        self.tree.pack(side='left', fill='both', expand=True)
+        
+        # La barra no controla el Treeview sino la ventana de filas cargadas
+        self.scrollbar = tk.Scrollbar(table_frame, command=self.on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll_by(-1 if e.delta > 0 else 1))
+        self.tree.bind('<Button-4>', lambda e: self.scroll_by(-1))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_by(1))
+    
+    def render(self):
+        """Cargar en el Treeview solo las filas de la ventana visible"""
+        total = self.total
+        self.first = max(0, min(self.first, total - self.PAGE_SIZE))
+        self.tree.delete(*self.tree.get_children())
+        
+        trips = self.repository.query(search=self.search, order=self.sort_column, descending=self.descending,
+                                      limit=self.PAGE_SIZE, offset=self.first)
+        for trip in trips:
+            values = (trip.timestamp, f"{trip.stopped_time:.1f}", f"{trip.moving_time:.1f}",
+                      f"{trip.total_time:.1f}", f"{trip.fare:.2f}")
+            self.tree.insert('', 'end', values=values)
+        
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.PAGE_SIZE) / total))
+            self.count_label.config(text=f"{total} viajes")
+        else:
+            self.scrollbar.set(0.0, 1.0)
+            self.count_label.config(text="📭 No hay viajes")
+    
+    def on_scroll(self, action, value, unit=None):
+        """Traducir los eventos de la barra a la primera fila visible"""
+        if action == 'moveto':
+            self.first = int(float(value) * self.total)
+            self.render()
+        elif action == 'scroll':
+            step = self.PAGE_SIZE if unit == 'pages' else 1
+            self.scroll_by(int(value) * step)
+    
+    def scroll_by(self, rows):
+        """Desplazar la ventana visible `rows` filas"""
+        self.first += rows
+        self.render()
+    
+    def sort_by(self, column):
+        """Ordenar por columna (un segundo clic invierte el orden)"""
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = column
+            self.descending = column == 'date'
+        self.refresh_rows()
+    
+    def apply_search(self):
+        """Filtrar mientras se escribe (búsqueda incremental)"""
+        self.search = self.search_var.get() or None
+        self.refresh_rows()
+    
+    def refresh_rows(self):
+        self.total = self.repository.count(search=self.search)
+        self.first = 0
+        self.render()
+    
+    def close(self):
+        # La conexión al repositorio es de la sesión: no se cierra con la ventana
+        self.window.destroy()
+
 def main():
     """Función principal para ejecutar la GUI"""
     try:
+        # Crear directorio de logs si no existe
+        os.makedirs('logs', exist_ok=True)
+        
         # Configurar logging
         logging.basicConfig(
             level=logging.INFO,
@@ -631,9 +830,6 @@ def main():
             ]
         )
         
-        # Crear directorio de logs si no existe
-        os.makedirs('logs', exist_ok=True)
-        
         print("🚖 Iniciando Digital Taximeter GUI...")
         print("   - Interfaz gráfica profesional")
         print("   - Control de viajes en tiempo real") 
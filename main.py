@@ -10,26 +10,99 @@ if sys.platform == "win32":
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
     sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
 
+from src.utils import LazyObject
+from src.meter import RunningFare
+from src.trip import EVENTS, START, STOP, MOVE, FINISH, EXIT, Trip
+from src.checkpoint import TripCheckpoint, cab_checkpoint_dir, quarantine_checkpoint, scan_orphans
+from src.rules import load_rules
+from src.tariff import TariffBoard
+from src.quotes import QuoteCache
+from src.messages import YES_ANSWERS, MessageCatalog, colorama_palette
+from src.history import format_history_line
+from config import settings
+
 # Terminal enhancement libraries
-try:
-    from colorama import init, Fore, Back, Style
+# Se detectan sin importarlas: colorama y rich solo se cargan cuando se
+# imprime con color por primera vez, así el código de tarifas arranca rápido.
+from importlib.util import find_spec
+
+COLORS_AVAILABLE = find_spec("colorama") is not None
+RICH_AVAILABLE = find_spec("rich") is not None
+
+def _load_colorama():
+    """Importar e inicializar colorama (una sola vez)."""
     import colorama
     colorama.init(autoreset=True)
-    COLORS_AVAILABLE = True
-    print(f"{Fore.GREEN}✓ Colores de terminal activados 🎨{Style.RESET_ALL}")
-except ImportError:
-    COLORS_AVAILABLE = False
-    print("⚠ Colores no disponibles. Instala con: pip install colorama")
-
-try:
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.text import Text
-    RICH_AVAILABLE = True
-    console = Console()
-except ImportError:
-    RICH_AVAILABLE = False
-    console = None
+    return colorama
+
+colorama = LazyObject(_load_colorama)
+
+_console = None
+_messages = None
+_renderer = None
+
+def get_console():
+    """Devolver la consola de rich, creándola en el primer uso."""
+    global _console
+    if _console is None and RICH_AVAILABLE:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+def message_catalog():
+    """Catálogo de mensajes del idioma configurado, formateado una sola vez (con o sin colores)."""
+    global _messages
+    if _messages is None:
+        _messages = MessageCatalog(settings.LANGUAGE, colorama_palette(colorama) if COLORS_AVAILABLE else None)
+    return _messages
+
+def write_output(text, end='\n'):
+    """Escribir en la consola, con búfer si la CLI tiene activo el renderizador."""
+    if _renderer is not None:
+        _renderer.write(text + end)
+    else:
+        print(text, end=end)
+
+def say(key, end='\n', **params):
+    """Imprimir el mensaje `key` del catálogo (los mensajes vacíos no se imprimen)."""
+    text = message_catalog().format(key, **params)
+    if text:
+        write_output(text, end)
+
+def start_console_renderer(ticker=True):
+    """
+    Agrupar la salida de la CLI en refrescos a frecuencia acotada (con rich Live si se pide).
+
+    Sin `ticker` no se arranca el hilo de refresco: quien llame vacía el búfer.
+    """
+    global _renderer
+    from src.console import ConsoleRenderer, RichLiveRenderer
+    if settings.CONSOLE_RICH_LIVE and RICH_AVAILABLE and sys.stdout.isatty():
+        _renderer = RichLiveRenderer(get_console(), settings.CONSOLE_MAX_FPS)
+    else:
+        _renderer = ConsoleRenderer(max_fps=settings.CONSOLE_MAX_FPS)
+    return _renderer.start() if ticker else _renderer
+
+def stop_console_renderer():
+    """Escribir la salida pendiente y volver a imprimir directamente."""
+    global _renderer
+    if _renderer is not None:
+        _renderer.close()
+        _renderer = None
+
+def read_command(prompt):
+    """Leer una línea de la entrada mostrando `prompt` después de toda la salida pendiente."""
+    if _renderer is None or sys.stdin.isatty():
+        if _renderer is not None:
+            _renderer.flush(settle=True)
+        return input(prompt)
+    # Entrada por script: el prompt va al búfer y la salida sigue agrupándose
+    _renderer.write(prompt)
+    return input()
+
+def announce_terminal_features():
+    """Informar al usuario de si los colores de terminal están disponibles."""
+    say('colors_enabled')
 
 # Ensure logs directory exists
 os.makedirs('logs', exist_ok=True)
@@ -37,14 +110,15 @@ os.makedirs('logs', exist_ok=True)
 # Configuración de tarifas dinámicas
 PRICE_STOPPED = 0.02  # €/segundo cuando el taxi está parado
 PRICE_MOVING = 0.05   # €/segundo cuando el taxi está en movimiento
+# "km": €/km recorrido (viajes alimentados por GPS); 0 mantiene la tarifa solo por tiempo
 PRICE_PROFILES = {
-    "normal": {"stopped": 0.02, "moving": 0.05, "name": "Normal"},
-    "alta": {"stopped": 0.03, "moving": 0.08, "name": "Demanda Alta"}, 
-    "nocturna": {"stopped": 0.025, "moving": 0.06, "name": "Tarifa Nocturna"},
-    "aeropuerto": {"stopped": 0.04, "moving": 0.10, "name": "Aeropuerto/Estación"},
-    "festivo": {"stopped": 0.035, "moving": 0.09, "name": "Día Festivo"}
+    "normal": {"stopped": 0.02, "moving": 0.05, "km": 0.0, "name": "Normal"},
+    "alta": {"stopped": 0.03, "moving": 0.08, "km": 0.0, "name": "Demanda Alta"}, 
+    "nocturna": {"stopped": 0.025, "moving": 0.06, "km": 0.0, "name": "Tarifa Nocturna"},
+    "aeropuerto": {"stopped": 0.04, "moving": 0.10, "km": 0.0, "name": "Aeropuerto/Estación"},
+    "festivo": {"stopped": 0.035, "moving": 0.09, "km": 0.0, "name": "Día Festivo"}
 }
-CURRENT_PROFILE = "normal"
+DEFAULT_PROFILE = "normal"
 
 # Configuración de logging mejorada
 logging.basicConfig(
@@ -56,6 +130,44 @@ logging.basicConfig(
     ]
 )
 
+def load_pricing_rules():
+    """Añadir a PRICE_PROFILES las reglas del fichero de reglas de tarificación."""
+    for key, rules in load_rules(settings.PRICING_RULES_FILE).items():
+        if key in PRICE_PROFILES:
+            PRICE_PROFILES[key]["rules"] = rules
+        else:
+            logging.warning(f"Reglas para un perfil inexistente ignoradas: {key}")
+    publish_tariffs()
+
+def publish_tariffs():
+    """Publicar un snapshot de tarifas con el contenido actual de PRICE_PROFILES."""
+    global TARIFFS
+    if TARIFFS is None:
+        TARIFFS = TariffBoard(PRICE_PROFILES, DEFAULT_PROFILE)
+    else:
+        TARIFFS.load_profiles(PRICE_PROFILES)
+    if _predictor is not None:
+        _predictor.invalidate()
+
+# Tarifas vigentes: snapshot inmutable que se sustituye entero al cambiar de perfil o de reglas
+TARIFFS = None
+
+# Eventos rechazados por la máquina de estados del viaje: (mensaje de log, clave del aviso)
+REJECTED_EVENTS = {
+    START: ("Intento de iniciar viaje con trip activo", 'trip_already_active'),
+    STOP: ("Comando de estado sin viaje activo", 'no_active_trip'),
+    MOVE: ("Comando de estado sin viaje activo", 'no_active_trip'),
+    FINISH: ("Intento de finalizar viaje sin trip activo", 'no_trip_to_finish'),
+}
+
+# Presupuestos repetidos: caché LRU con la versión del snapshot de tarifas en la clave
+QUOTES = QuoteCache(lambda stopped, moving, profile_name, distance_km, version:
+                    compute_fare(stopped, moving, profile_name, distance_km, tariff=TARIFFS.get(version)),
+                    settings.QUOTE_CACHE_SIZE, settings.QUOTE_RESOLUTION_S)
+# Estimaciones antes del viaje a partir del historial (se construyen en el primer uso)
+_predictor = None
+load_pricing_rules()
+
 # ASCII Art para el taxi
 TAXI_FRAMES = [
     "    🚕💨     ",
@@ -68,34 +180,9 @@ TAXI_FRAMES = [
     "   🚕💨      "
 ]
 
-TAXI_LOGO = """
-╔════════════════════════════════════════════╗
-║           🚕 DIGITAL TAXIMETER 🚕           ║
-║                                            ║
-║    Professional Fare Calculation System    ║
-╚════════════════════════════════════════════╝
-"""
-
-HELP_MENU = """
-📋 Available Commands:
-┌─────────────────────────────────────────┐
-│ 🚀 start   │ Begin a new trip           │
-│ 🛑 stop    │ Set taxi to stopped state  │
-│ 🚗 move    │ Set taxi to moving state   │
-│ 🏁 finish  │ Complete trip & calculate  │
-│ 🚪 exit    │ Exit the application       │
-└─────────────────────────────────────────┘
-"""
-
 def print_colored(message, color=None, style=None, end='\n'):
     """Imprimir con colores si está disponible, sino texto normal."""
-    if COLORS_AVAILABLE and color:
-        color_code = getattr(Fore, color.upper(), '')
-        style_code = getattr(Style, style.upper(), '') if style else ''
-        reset = Style.RESET_ALL
-        print(f"{style_code}{color_code}{message}{reset}", end=end)
-    else:
-        print(message, end=end)
+    write_output(message_catalog().paint(message, color, style), end)
 
 def clear_screen():
     """Limpiar la pantalla de manera compatible."""
@@ -103,12 +190,11 @@ def clear_screen():
 
 def animate_taxi():
     """Mostrar una pequeña animación del taxi en movimiento."""
+    say('starting')
     if not COLORS_AVAILABLE:
-        print("🚕 Starting Digital Taximeter...")
         time.sleep(1)
         return
     
-    print_colored("\n🚀 Starting Digital Taximeter...\n", "cyan", "bright")
     for i in range(2):  # 2 ciclos de animación
         for frame in TAXI_FRAMES:
             print(f"\r{frame}", end="", flush=True)
@@ -118,465 +204,756 @@ def animate_taxi():
 def show_welcome():
     """Mostrar la pantalla de bienvenida."""
     clear_screen()
-    print_colored(TAXI_LOGO, "cyan", "bright")
+    say('logo')
     animate_taxi()
-    print_colored(HELP_MENU, "yellow")
-    print_colored("💡 Tip: Type 'help' anytime to see this menu again!", "green")
-    print()
-
-def show_status(trip_active, state, stopped_time, moving_time):
-    """Mostrar el estado actual del viaje."""
-    if trip_active:
-        status_color = "green" if state == "moving" else "yellow"
-        status_emoji = "🚗" if state == "moving" else "🛑"
-        print_colored(f"\n📊 Current Status: {status_emoji} {state.upper()}", status_color, "bright")
-        print(f"⏱️  Time stopped: {stopped_time:.1f}s | Time moving: {moving_time:.1f}s")
-        estimated_fare = stopped_time * 0.02 + moving_time * 0.05
-        print_colored(f"💰 Estimated fare: €{estimated_fare:.2f}", "magenta")
-        print()
-    else:
-        print_colored("\n📍 Status: No active trip", "red")
-        print_colored("💡 Use 'start' to begin a new trip", "yellow")
-        print()
+    say('help_menu')
+    say('help_tip')
+    write_output('')
+
+def format_status(trip_active, state, stopped_time, moving_time, estimated_fare=None):
+    """Línea de estado del viaje."""
+    if not trip_active:
+        return message_catalog().format('status_idle')
+    if estimated_fare is None:
+        stopped_rate, moving_rate, _ = current_rates()
+        estimated_fare = stopped_time * stopped_rate + moving_time * moving_rate
+    return message_catalog().format('status_moving' if state == "moving" else 'status_stopped',
+                                    stopped=stopped_time, moving=moving_time, fare=estimated_fare)
+
+def show_status(trip_active, state, stopped_time, moving_time, estimated_fare=None):
+    """
+    Mostrar el estado actual del viaje en una sola línea.
 
-def calculate_fare(seconds_stopped, seconds_moving):
+    En la CLI la línea se redibuja en su sitio y las actualizaciones que
+    llegan entre dos refrescos se agrupan en la última.
+    """
+    line = format_status(trip_active, state, stopped_time, moving_time, estimated_fare)
+    if _renderer is not None:
+        _renderer.status(line)
+    else:
+        print(line)
+
+def current_tariff():
+    """Snapshot de tarifas vigente: se lee una vez y se usa para todo el cálculo."""
+    return TARIFFS.current
+
+def activate_profile(profile_name):
+    """Publicar un snapshot con otro perfil activo, sin mensajes; devuelve el snapshot nuevo."""
+    return TARIFFS.activate(profile_name)
+
+def current_rates():
+    """Devolver (tarifa parado, tarifa movimiento, tarifa por km) del perfil activo."""
+    return TARIFFS.current.rates()
+
+def fare_evaluator(profile_name=None):
+    """Tarifa compilada (reglas incluidas) del perfil indicado o del activo."""
+    return TARIFFS.current.evaluator(profile_name)
+
+def compute_fare(seconds_stopped, seconds_moving, profile_name=None, distance_km=0.0, tags=(), tariff=None):
+    """Tarifa redondeada a céntimos, sin logs ni salida por pantalla (con el snapshot vigente o `tariff`)."""
+    return (tariff or TARIFFS.current).fare(seconds_stopped, seconds_moving, profile_name, distance_km, tags)
+
+def quote_fare(seconds_stopped, seconds_moving, profile_name=None, distance_km=0.0):
+    """Presupuesto de un viaje (duraciones cuantizadas), sin logs ni salida por pantalla."""
+    tariff = TARIFFS.current
+    return QUOTES.quote(seconds_stopped, seconds_moving, profile_name or tariff.active, distance_km, tariff.version)
+
+def fare_predictor():
+    """Estimaciones antes del viaje; se construyen del repositorio una vez y se amplían al guardar viajes."""
+    global _predictor
+    if _predictor is None:
+        from src.prediction import FarePredictor
+        _predictor = FarePredictor(lambda *trip: compute_fare(*trip), settings.PREDICTION_MIN_TRIPS)
+        _predictor.refresh(trip_repository())
+        _predictor.precompute(PRICE_PROFILES)
+    return _predictor
+
+def predict_fare(profile_name=None, hour=None):
+    """Mediana y p90 de la tarifa de un viaje que aún no ha empezado (None sin historial)."""
+    if hour is None:
+        hour = time.localtime().tm_hour
+    return fare_predictor().predict(profile_name or TARIFFS.current.active, hour)
+
+def parse_tags(text):
+    """Etiquetas de un viaje ('aeropuerto, nocturno' o 'aeropuerto nocturno') para los suplementos con `when`."""
+    return tuple(dict.fromkeys(tag for tag in text.lower().replace(',', ' ').split()))
+
+def calculate_fare(seconds_stopped, seconds_moving, distance_km=0.0, tags=(), tariff=None):
     """
     Función para calcular la tarifa total en euros usando tarifas dinámicas
+
+    `tags` son las etiquetas del viaje y `tariff` el snapshot fijado por el
+    viaje; sin él, el vigente.
     """
-    global PRICE_STOPPED, PRICE_MOVING, CURRENT_PROFILE
-    
-    # Usar tarifas del perfil actual
-    profile = PRICE_PROFILES[CURRENT_PROFILE]
+    # Un solo snapshot para todo el cálculo: perfil, tarifas y log siempre coinciden
+    tariff = tariff or TARIFFS.current
+    profile = tariff.profile
     stopped_rate = profile["stopped"]
     moving_rate = profile["moving"]
     
-    logging.info(f"Calculando tarifa: parado={seconds_stopped:.1f}s, movimiento={seconds_moving:.1f}s")
-    logging.info(f"Perfil: {profile['name']} - Parado: €{stopped_rate}/s, Movimiento: €{moving_rate}/s")
+    logging.info(f"Calculando tarifa: parado={seconds_stopped:.1f}s, movimiento={seconds_moving:.1f}s, distancia={distance_km:.2f}km")
+    logging.info(f"Perfil: {profile['name']} (tarifas v{tariff.version}) - Parado: €{stopped_rate}/s, Movimiento: €{moving_rate}/s, Distancia: €{profile.get('km', 0.0)}/km")
     
-    fare = seconds_stopped * stopped_rate + seconds_moving * moving_rate
     # Redondear a 2 decimales para evitar problemas de precisión con dinero
-    fare = round(fare, 2)
+    fare = tariff.fare(seconds_stopped, seconds_moving, distance_km=distance_km, tags=tags)
     
-    if COLORS_AVAILABLE:
-        print(f"{Fore.YELLOW}💰 Total calculado: {Fore.GREEN}€{fare} 🎯{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}📊 Perfil activo: {Fore.WHITE}{profile['name']}{Style.RESET_ALL}")
-    else:
-        print(f"💰 Total calculado: €{fare} 🎯")
-        print(f"📊 Perfil activo: {profile['name']}")
+    say('fare_total', fare=fare, profile=profile['name'])
     
     return fare
 
-def save_trip_to_history(stopped_time, moving_time, total_fare):
-    """Guardar viaje en historial de forma simple"""
+_repository = None
+
+def trip_repository():
+    """Repositorio SQLite de viajes; se abre una vez y la conexión se reutiliza."""
+    global _repository
+    if _repository is None:
+        from src.repository import TripRepository
+        _repository = TripRepository(settings.TRIPS_DB)
+        sync_trip_repository()
+    return _repository
+
+def sync_trip_repository():
+    """Traer al repositorio SQLite lo añadido a los historiales de texto (este taxi, otros taxis y la flota)."""
+    from src.history import history_paths
+    repository = trip_repository()
+    imported = repository.sync_history(history_paths(settings.HISTORY_FILE, settings.HISTORY_SHARD_DIR))
+    if imported:
+        logging.info(f"Historial importado a SQLite: {imported} viajes")
+    return repository
+
+_outbox = None
+_outbox_sender = None
+
+def outbox_path():
+    """Cola de envío de este taxi (CAB_ID): el emisor firma cada viaje con su propio taxi."""
+    from src.outbox import cab_outbox_path
+    return cab_outbox_path(settings.OUTBOX_DIR, settings.CAB_ID)
+
+def trip_outbox():
+    """Cola de envío al servidor central con su hilo emisor (None si OUTBOX_URL no está configurado)."""
+    global _outbox, _outbox_sender
+    if _outbox is None and settings.OUTBOX_URL:
+        from src.outbox import Outbox, OutboxSender
+        path = outbox_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        _outbox = Outbox(path)
+        _outbox_sender = OutboxSender(path, settings.OUTBOX_URL, cab_id=settings.CAB_ID,
+                                      batch_size=settings.OUTBOX_BATCH_SIZE, interval=settings.OUTBOX_INTERVAL_S,
+                                      max_backoff=settings.OUTBOX_MAX_BACKOFF_S,
+                                      timeout=settings.OUTBOX_TIMEOUT_S).start()
+    return _outbox
+
+def stop_outbox():
+    """Parar el hilo emisor sin esperar a la red; lo pendiente se envía en la próxima sesión."""
+    global _outbox, _outbox_sender
+    if _outbox_sender is not None:
+        _outbox_sender.stop()
+        _outbox.close()
+        _outbox = _outbox_sender = None
+
+def save_trip_to_history(stopped_time, moving_time, total_fare, timestamp=None, profile=None, segments=None,
+                         tags=()):
+    """Guardar viaje en el historial de texto, en el repositorio SQLite y en el outbox (con sus etiquetas)"""
+    from datetime import datetime
+    
+    # Crear línea del historial (un `timestamp` explícito no puede ser anterior a la última línea del fichero)
+    when = datetime.fromtimestamp(timestamp) if timestamp is not None else datetime.now()
+    now = when.strftime("%Y-%m-%d %H:%M:%S")
+    profile = profile or TARIFFS.current.active
+    
     try:
-        from datetime import datetime
-        
-        # Crear línea del historial
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        duration_total = stopped_time + moving_time
+        # Abrir el repositorio antes de escribir: la sincronización inicial no debe importar este viaje
+        repository = trip_repository()
         
-        trip_line = f"{now} | Parado: {stopped_time:.1f}s | Movimiento: {moving_time:.1f}s | Total: {duration_total:.1f}s | Tarifa: €{total_fare:.2f}\n"
+        # Guardar en el fichero propio de este taxi: sin contención con otros taxímetros
+        from src.history import shard_path
+        os.makedirs(settings.HISTORY_SHARD_DIR, exist_ok=True)
+        path = shard_path(settings.HISTORY_SHARD_DIR, settings.CAB_ID)
+        # Lo pendiente del fichero entra antes: el offset que se marca al añadir este viaje lo cubre todo
+        repository.sync_history([path])
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(format_history_line(now, stopped_time, moving_time, total_fare) + "\n")
         
-        # Guardar en archivo
-        with open('logs/historial_viajes.txt', 'a', encoding='utf-8') as f:
-            f.write(trip_line)
+        repository.add(now, stopped_time, moving_time, total_fare, profile, segments,
+                       source=(path, os.path.getsize(path)))
+        if _predictor is not None:
+            # Incremental: también trae los viajes que otros taxímetros guardaron en el repositorio
+            _predictor.refresh(repository)
             
     except Exception as e:
         logging.warning(f"Error guardando historial: {e}")
-
-def show_trip_history():
-    """Mostrar últimos 5 viajes del historial con diseño simple y colorido"""
+    
+    # Aparte del historial: un fallo del repositorio no debe dejar el viaje sin enviar
     try:
-        if not os.path.exists('logs/historial_viajes.txt'):
-            if COLORS_AVAILABLE:
-                print(f"\n{Back.YELLOW}{Fore.BLACK} 📭 HISTORIAL VACÍO 📭 {Style.RESET_ALL}")
-                print(f"{Fore.CYAN}No hay viajes registrados aún.{Style.RESET_ALL}")
-                print(f"{Fore.GREEN}💡 Realiza tu primer viaje con: {Fore.YELLOW}start{Style.RESET_ALL}\n")
-            else:
-                print("📭 No hay viajes en el historial aún.")
+        outbox = trip_outbox()
+        if outbox is not None:
+            # Solo se escribe en la cola local: el hilo emisor se ocupa de la red
+            outbox.put({'timestamp': now, 'stopped_time': stopped_time, 'moving_time': moving_time,
+                        'fare': total_fare, 'profile': profile, 'segments': segments, 'tags': list(tags)})
+            _outbox_sender.notify()
+    except Exception as e:
+        logging.warning(f"Error encolando el viaje para el servidor central: {e}")
+
+def trip_receipt(stopped_time, moving_time, total_fare, kind='text', timestamp=None, tariff=None):
+    """Recibo del viaje con el perfil activo o el de `tariff` (str en text/html, bytes en escpos)."""
+    from datetime import datetime
+    from src.receipts import render_receipt, receipt_for
+    when = datetime.fromtimestamp(timestamp) if timestamp is not None else datetime.now()
+    receipt = receipt_for(when.strftime("%Y-%m-%d %H:%M:%S"), stopped_time, moving_time, total_fare)
+    return render_receipt(kind, receipt, (tariff or TARIFFS.current).profile, settings.RECEIPT_LOCALE)
+
+def show_trip_history(page=1, page_size=5):
+    """Mostrar una página del historial (por defecto los últimos 5 viajes) con diseño simple y colorido"""
+    try:
+        # Incluye lo que otros taxis y la flota escribieron desde la última consulta
+        repository = sync_trip_repository()
+        total_trips = repository.count()
+        
+        if not total_trips:
+            say('history_empty')
             return
             
-        with open('logs/historial_viajes.txt', 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        # Solo se leen de la base de datos los viajes de la página pedida
+        recent_trips = repository.query(limit=page_size, offset=(page - 1) * page_size)
+        pages = (total_trips + page_size - 1) // page_size
         
-        if not lines:
-            if COLORS_AVAILABLE:
-                print(f"\n{Back.YELLOW}{Fore.BLACK} 📭 HISTORIAL VACÍO 📭 {Style.RESET_ALL}")
-                print(f"{Fore.CYAN}No hay viajes registrados aún.{Style.RESET_ALL}")
-                print(f"{Fore.GREEN}💡 Realiza tu primer viaje con: {Fore.YELLOW}start{Style.RESET_ALL}\n")
-            else:
-                print("📭 No hay viajes en el historial aún.")
+        if not recent_trips:
+            say('history_no_page', page=page, pages=pages)
             return
-            
-        # Mostrar últimos 5 viajes con diseño simple
-        recent_trips = lines[-5:]
         
-        if COLORS_AVAILABLE:
-            print(f"\n{Back.BLUE}{Fore.WHITE} 📜 HISTORIAL DE VIAJES (últimos {len(recent_trips)}) 📜 {Style.RESET_ALL}\n")
-            
-            for i, trip in enumerate(recent_trips, 1):
-                # Parsear la línea del viaje para extraer información
-                parts = trip.strip().split(' | ')
-                if len(parts) >= 5:
-                    date_time = parts[0]
-                    stopped_info = parts[1]
-                    moving_info = parts[2] 
-                    total_info = parts[3]
-                    fare_info = parts[4]
-                    
-                    # Alternar colores por viaje
-                    if i % 2 == 1:
-                        number_color = Fore.GREEN
-                        highlight_color = Fore.WHITE
-                    else:
-                        number_color = Fore.YELLOW
-                        highlight_color = Fore.CYAN
-                    
-                    print(f"{number_color}#{i:2} {Fore.MAGENTA}📅 {highlight_color}{date_time}{Style.RESET_ALL}")
-                    print(f"    {Fore.RED}🛑 {highlight_color}{stopped_info}{Style.RESET_ALL}  {Fore.GREEN}🏃 {highlight_color}{moving_info}{Style.RESET_ALL}")
-                    print(f"    {Fore.BLUE}⏱️  {highlight_color}{total_info}{Style.RESET_ALL}  {Fore.YELLOW}💰 {highlight_color}{fare_info}{Style.RESET_ALL}")
-                    if i < len(recent_trips):
-                        print(f"{Fore.CYAN}    ─────────────────────────────────────────{Style.RESET_ALL}")
-                else:
-                    # Fallback para formato simple
-                    if i % 2 == 1:
-                        color = Fore.GREEN
-                    else:
-                        color = Fore.CYAN
-                    print(f"{color}#{i}: {trip.strip()}{Style.RESET_ALL}")
-                    if i < len(recent_trips):
-                        print(f"{Fore.CYAN}    ─────────────────────────────────────────{Style.RESET_ALL}")
-            
-            print(f"\n{Fore.GREEN}💼 Total de viajes registrados: {len(lines)}{Style.RESET_ALL}\n")
-        else:
-            print("\n📜 HISTORIAL DE VIAJES (últimos 5):")
-            for i, trip in enumerate(recent_trips, 1):
-                print(f"{i}. {trip.strip()}")
-        print()
+        say('history_header', page=page, pages=pages)
+        for i, trip in enumerate(recent_trips, 1):
+            # Alternar colores por viaje
+            say('history_trip' if i % 2 == 1 else 'history_trip_alt', number=(page - 1) * page_size + i,
+                timestamp=trip.timestamp, stopped=trip.stopped_time, moving=trip.moving_time,
+                total=trip.total_time, fare=trip.fare)
+            if i < len(recent_trips):
+                say('history_separator')
+        
+        say('history_footer', total=total_trips)
+        if page < pages:
+            say('history_more', page=page + 1)
+        write_output('')
         
     except Exception as e:
         logging.warning(f"Error leyendo historial: {e}")
-        if COLORS_AVAILABLE:
-            print(f"{Fore.RED}❌ Error leyendo historial.{Style.RESET_ALL}")
-        else:
-            print("❌ Error leyendo historial.")
+        say('history_error')
+
+def merged_history():
+    """Líneas de todo el historial (fichero común, archivos y ficheros por taxi) en orden cronológico."""
+    from src.history import history_paths, merge_history_lines
+    return merge_history_lines(history_paths(settings.HISTORY_FILE, settings.HISTORY_SHARD_DIR))
+
+def show_history_stats():
+    """Mostrar totales de todo el historial."""
+    from src.history import history_stats
+    stats = history_stats(merged_history())
+    if not stats.trips:
+        say('stats_empty')
+        return
+    say('stats_summary', trips=stats.trips, first=stats.first, last=stats.last,
+        stopped=stats.stopped_time, moving=stats.moving_time,
+        revenue=stats.revenue_cents / 100, average=stats.revenue_cents / 100 / stats.trips)
+
+def export_history(path):
+    """Exportar todo el historial a CSV."""
+    from src.history import export_history_csv
+    try:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            exported = export_history_csv(merged_history(), f)
+    except OSError as e:
+        logging.warning(f"Error exportando historial: {e}")
+        say('export_error', error=e)
+        return
+    logging.info(f"Historial exportado a {path}: {exported} viajes")
+    say('export_done', count=exported, path=path)
 
 def display_welcome():
-    """Mostrar mensaje de bienvenida con formato mejorado y tabla de comandos en español"""
-    # Forzar el uso de la tabla azul con líneas continuas
+    """Mostrar mensaje de bienvenida con formato mejorado y tabla de comandos en el idioma configurado"""
     if COLORS_AVAILABLE:
         # Animación del taxi moviéndose
-        print(f"\n{Fore.YELLOW}🚕 Cargando Taxímetro Digital...{Style.RESET_ALL}")
+        say('loading')
         time.sleep(0.3)
         for i in range(20):
             print(f"\r{' ' * i}🚖💨", end='', flush=True)
             time.sleep(0.1)
-        print(f"\r{' ' * 20}¡Listo! ✨")
+        print(f"\r{' ' * 20}" + message_catalog().format('ready'))
         time.sleep(0.5)
-        
-        print(f"\n{Back.YELLOW}{Fore.BLACK} 🚖 TAXÍMETRO DIGITAL PROFESIONAL 🚕 {Style.RESET_ALL}")
-        print(f"{Back.CYAN}{Fore.WHITE} 📋 COMANDOS DISPONIBLES {Style.RESET_ALL}\n")
-        
-        # Diseño visual sin tabla - lista con colores y separadores
-        print(f"{Fore.CYAN}{'=' * 60}{Style.RESET_ALL}")
-        print(f"{Fore.WHITE}                    COMANDOS DEL TAXÍMETRO{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}{'=' * 60}{Style.RESET_ALL}\n")
-        
-        print(f"  {Fore.GREEN}🚀 start{Style.RESET_ALL}    {Fore.CYAN}→{Style.RESET_ALL} Iniciar un nuevo viaje")
-        print(f"  {Fore.RED}🛑 stop{Style.RESET_ALL}     {Fore.CYAN}→{Style.RESET_ALL} Poner taxi en estado parado") 
-        print(f"  {Fore.GREEN}🏃 move{Style.RESET_ALL}     {Fore.CYAN}→{Style.RESET_ALL} Taxi en movimiento")
-        print(f"  {Fore.BLUE}🏁 finish{Style.RESET_ALL}   {Fore.CYAN}→{Style.RESET_ALL} Finalizar viaje y calcular tarifa")
-        print(f"  {Fore.MAGENTA}📜 history{Style.RESET_ALL}  {Fore.CYAN}→{Style.RESET_ALL} Ver historial de viajes")
-        print(f"  {Fore.CYAN}💰 precios{Style.RESET_ALL}  {Fore.CYAN}→{Style.RESET_ALL} Ver y cambiar tarifas")
-        print(f"  {Fore.YELLOW}❓ help{Style.RESET_ALL}     {Fore.CYAN}→{Style.RESET_ALL} Mostrar esta lista de comandos")
-        print(f"  {Fore.MAGENTA}🚪 exit{Style.RESET_ALL}     {Fore.CYAN}→{Style.RESET_ALL} Salir de la aplicación")
-        
-        print(f"\n{Fore.CYAN}{'=' * 60}{Style.RESET_ALL}")
-        print(f"\n{Back.CYAN}{Fore.WHITE} 💡 Consejo: Usa 'start' → 'stop'/'move' → 'finish' {Style.RESET_ALL}\n")
-    else:
-        print("\n" + "="*65)
-        print("🚖 TAXÍMETRO DIGITAL PROFESIONAL 🚕".center(65))
-        print("="*65)
-        print("📋 TABLA DE COMANDOS".center(65))
-        print("="*65)
-        print("| Comando  | Descripción                    | Uso           |")
-        print("|----------|--------------------------------|---------------|")
-        print("| 🚀 start  | Iniciar un nuevo viaje         | start         |")
-        print("| 🛑 stop   | Poner taxi en estado parado    | stop          |")
-        print("| 🏃 move   | Poner taxi en movimiento       | move          |")
-        print("| 🏁 finish | Terminar viaje y calc tarifa   | finish        |")
-        print("| 📜 history| Ver historial de viajes        | history       |")
-        print("| ❓ help   | Mostrar esta tabla de comandos | help          |")
-        print("| 🚪 exit   | Salir de la aplicación         | exit          |")
-        print("="*65)
-        print("💡 Consejo: Alterna entre 'stop' y 'move' durante tu viaje, luego 'finish'\n")
+    say('commands')
 
 def change_price_profile(profile_name):
-    """Cambiar perfil de tarifas de forma simple"""
-    global CURRENT_PROFILE
-    
-    if profile_name in PRICE_PROFILES:
-        CURRENT_PROFILE = profile_name
-        profile = PRICE_PROFILES[profile_name]
+    """Cambiar perfil de tarifas de forma simple; devuelve el snapshot nuevo (None si no existe)."""
+    if profile_name in TARIFFS.current.profiles:
+        tariff = activate_profile(profile_name)
+        profile = tariff.profile
         
-        if COLORS_AVAILABLE:
-            print(f"\n{Back.GREEN}{Fore.BLACK} 💼 PERFIL CAMBIADO 💼 {Style.RESET_ALL}")
-            print(f"{Fore.GREEN}✅ Nuevo perfil: {Fore.WHITE}{profile['name']}{Style.RESET_ALL}")
-            print(f"{Fore.CYAN}🛑 Tarifa parado: {Fore.YELLOW}€{profile['stopped']}/segundo{Style.RESET_ALL}")
-            print(f"{Fore.CYAN}🏃 Tarifa movimiento: {Fore.YELLOW}€{profile['moving']}/segundo{Style.RESET_ALL}\n")
-        else:
-            print(f"✅ Nuevo perfil: {profile['name']}")
-            print(f"🛑 Tarifa parado: €{profile['stopped']}/segundo")
-            print(f"🏃 Tarifa movimiento: €{profile['moving']}/segundo")
+        say('profile_changed', name=profile['name'], stopped=profile['stopped'], moving=profile['moving'])
         
-        logging.info(f"Perfil de tarifas cambiado a: {profile['name']}")
-        return True
+        logging.info(f"Perfil de tarifas cambiado a: {profile['name']} (tarifas v{tariff.version})")
+        return tariff
     else:
-        if COLORS_AVAILABLE:
-            print(f"{Fore.RED}❌ Perfil '{profile_name}' no válido.{Style.RESET_ALL}")
-            print(f"{Fore.YELLOW}Perfiles disponibles: {', '.join(PRICE_PROFILES.keys())}{Style.RESET_ALL}")
-        else:
-            print(f"❌ Perfil '{profile_name}' no válido.")
-            print(f"Perfiles disponibles: {', '.join(PRICE_PROFILES.keys())}")
-        return False
+        say('profile_invalid', name=profile_name, available=', '.join(PRICE_PROFILES.keys()))
+        return None
 
 def show_price_profiles():
     """Mostrar todos los perfiles de precio disponibles"""
-    if COLORS_AVAILABLE:
-        print(f"\n{Back.MAGENTA}{Fore.WHITE} 💰 PERFILES DE TARIFAS DISPONIBLES 💰 {Style.RESET_ALL}\n")
-        
-        for key, profile in PRICE_PROFILES.items():
-            if key == CURRENT_PROFILE:
-                print(f"{Fore.GREEN}➤ {profile['name']:15} {Fore.CYAN}(ACTIVO){Style.RESET_ALL}")
-                print(f"  {Fore.WHITE}Comando: {Fore.YELLOW}{key:10} {Fore.RED}🛑 €{profile['stopped']}/s  {Fore.GREEN}🏃 €{profile['moving']}/s{Style.RESET_ALL}")
-            else:
-                print(f"  {Fore.WHITE}{profile['name']:15}{Style.RESET_ALL}")
-                print(f"  {Fore.CYAN}Comando: {Fore.YELLOW}{key:10} {Fore.RED}🛑 €{profile['stopped']}/s  {Fore.GREEN}🏃 €{profile['moving']}/s{Style.RESET_ALL}")
-            print()
-        
-        print(f"{Fore.YELLOW}💡 Para cambiar: escribe el comando del perfil (ej: 'alta', 'nocturna'){Style.RESET_ALL}\n")
-    else:
-        print("\n💰 PERFILES DE TARIFAS DISPONIBLES")
-        for key, profile in PRICE_PROFILES.items():
-            current = "(ACTIVO)" if key == CURRENT_PROFILE else ""
-            print(f"{profile['name']} {current}")
-            print(f"  Comando: {key} - Parado: €{profile['stopped']}/s, Movimiento: €{profile['moving']}/s")
-        print("\n💡 Para cambiar: escribe el comando del perfil")
-
- 
-        print("3. Hora nocturna → Tarifa Nocturna")
-        print("4. Día festivo → Tarifa Festivo")
-        print("5. Zona normal → Tarifa Normal")
-        print("6. Ver todas las tarifas")
-        
-        choice = input("Escribe el número (1-6): ").strip()
-        # Lógica simplificada para modo sin colores
-        suggestions = {"1": "alta", "2": "aeropuerto", "3": "nocturna", "4": "festivo", "5": "normal"}
-        
-        if choice == "6":
-            show_price_profiles()
-            return False
-        elif choice in suggestions:
-            profile_name = suggestions[choice]
-            profile = PRICE_PROFILES[profile_name]
-            print(f"\nSugerencia: {profile['name']}")
-            confirm = input("¿Aplicar esta tarifa? (s/n): ").strip().lower()
-            if confirm in ['s', 'si', 'y', 'yes']:
-                change_price_profile(profile_name)
-                return True
-        
-        print("Opción no válida o cancelada.")
-        return False
+    tariff = TARIFFS.current
+    say('profiles_header')
+    for key, profile in tariff.profiles.items():
+        say('profiles_active' if key == tariff.active else 'profiles_other',
+            command=key, name=profile['name'], stopped=profile['stopped'], moving=profile['moving'])
+    say('profiles_tip')
 
 def animate_taxi_exit():
     """Mostrar una pequeña animación del taxi alejándose al salir."""
+    say('closing')
     if not COLORS_AVAILABLE:
-        print("🚕 Digital Taximeter shutting down...")
         time.sleep(1)
         return
     
-    print_colored("\n🚀 Cerrando Taxímetro Digital...", "magenta", "bright")
     # Animación del taxi alejándose (hacia la derecha)
     for i in range(15):
         taxi_position = " " * i + "🚖💨"
         print(f"\r{taxi_position}", end="", flush=True)
         time.sleep(0.1)
-    print(f"\r{' ' * 25}¡Hasta luego! ✨")
+    print(f"\r{' ' * 25}" + message_catalog().format('goodbye'))
     time.sleep(0.3)
 
-def taximeter():
+def checkpoint_dir():
+    """Directorio de checkpoints de este taxi (CAB_ID): cada taxímetro solo recupera sus viajes."""
+    return cab_checkpoint_dir(settings.CHECKPOINT_DIR, settings.CAB_ID)
+
+def recover_orphan_trips():
     """
-    Función principal del taxímetro: manejar y mostrar opciones.
+    Revisar los checkpoints de viajes interrumpidos por una caída.
+
+    Los viajes huérfanos se finalizan y se guardan en el historial, salvo el
+    más reciente, que se devuelve para que el taxímetro lo reanude.
     """
-    display_welcome()
-    trip_active = False
-    start_time = 0
-    stopped_time = 0
-    moving_time = 0
-    state = None
-    state_start_time = 0
-
-    while True:
-        # Mostrar prompt dinámico con estado del taxi
-        if COLORS_AVAILABLE:
-            if trip_active:
-                if state == 'stopped':
-                    command = input(f"{Fore.BLUE}🚖{Style.RESET_ALL} {Fore.RED}🛑 PARADO{Style.RESET_ALL} {Fore.BLUE}> {Style.RESET_ALL}").strip().lower()
-                else:
-                    command = input(f"{Fore.BLUE}🚖{Style.RESET_ALL} {Fore.GREEN}🏃💨 EN MOVIMIENTO{Style.RESET_ALL} {Fore.BLUE}> {Style.RESET_ALL}").strip().lower()
-            else:
-                command = input(f"{Fore.BLUE}🚖 > {Style.RESET_ALL}").strip().lower()
+    orphans, corrupt = scan_orphans(checkpoint_dir())
+    for path in corrupt:
+        try:
+            path = quarantine_checkpoint(path)
+        except OSError as e:
+            logging.warning(f"No se pudo apartar el checkpoint corrupto {path}: {e}")
+            continue
+        logging.warning(f"Checkpoint corrupto apartado: {path}")
+    if not orphans:
+        return None
+
+    orphans.sort(key=lambda record: record.start_time)
+    resumable = orphans.pop()
+    for record in orphans:
+        stopped_time, moving_time = record.billed_times()
+        profile_name = record.profile if record.profile in PRICE_PROFILES else None
+        total_fare = compute_fare(stopped_time, moving_time, profile_name, record.distance_km, record.tags)
+        # Con la fecha de hoy, no la de la caída: cada fichero del historial debe seguir en orden
+        # cronológico para la mezcla de merge_history_lines
+        save_trip_to_history(stopped_time, moving_time, total_fare, profile=record.profile, tags=record.tags)
+        os.remove(record.path)
+    if orphans:
+        logging.info(f"Viajes interrumpidos finalizados al arrancar: {len(orphans)}")
+    return resumable
+
+def open_live_slot():
+    """Abrir la ranura de este taxi en la tabla de estado en vivo (None si no es posible)."""
+    if not settings.LIVE_STATE_ENABLED:
+        return None
+    try:
+        # Importación diferida: multiprocessing.shared_memory es costoso de cargar
+        from src.live_state import LiveStateTable
+        table = LiveStateTable.open(settings.LIVE_STATE_NAME, settings.LIVE_STATE_SLOTS)
+        return table.slot(settings.CAB_ID)
+    except (ImportError, OSError, ValueError) as e:
+        logging.warning(f"Estado en vivo no disponible: {e}")
+        return None
+
+def persist_trip_state(checkpoint, live_slot, running_fare, now, profile=None):
+    """Actualizar checkpoint y estado en vivo tras un cambio de estado (`profile`: el fijado por el viaje)."""
+    profile = profile or TARIFFS.current.active
+    if checkpoint is not None:
+        checkpoint.save(running_fare, profile, now)
+    if live_slot is not None:
+        live_slot.publish(running_fare, profile, now)
+
+def touch_trip_state(checkpoint, live_slot, running_fare, now, profile=None):
+    """
+    Latido del viaje activo: marcarlo vivo en el checkpoint y, si se cobra
+    con reglas (tarifa no lineal), volver a publicar su recta en el estado en vivo.
+    """
+    if checkpoint is not None:
+        checkpoint.touch(now)
+    if live_slot is not None and running_fare.evaluator is not None and running_fare.state is not None:
+        live_slot.publish(running_fare, profile or TARIFFS.current.active, now)
+
+def start_sensor_feed():
+    """Arrancar la detección automática de estado si hay un sensor configurado (None si no)."""
+    if not settings.SENSOR_SOURCE:
+        return None
+    if settings.SENSOR_KIND == 'gps':
+        from src.gps import GpsFeed, GpsIngestor, open_gps_source
+        logging.info(f"Detección de estado y distancia por GPS desde: {settings.SENSOR_SOURCE}")
+        ingestor = GpsIngestor(settings.SENSOR_STOP_KMH, settings.SENSOR_MOVE_KMH)
+        return GpsFeed(open_gps_source(settings.SENSOR_SOURCE), settings.CAB_ID, ingestor).start()
+    from src.detector import DETECTORS, SensorFeed, open_source
+    detector_class = DETECTORS.get(settings.SENSOR_KIND)
+    if detector_class is None:
+        logging.warning(f"Tipo de sensor desconocido: {settings.SENSOR_KIND}")
+        return None
+    detector = detector_class(settings.SENSOR_STOP_KMH, settings.SENSOR_MOVE_KMH, settings.SENSOR_DEBOUNCE_S)
+    logging.info(f"Detección automática de estado desde: {settings.SENSOR_SOURCE}")
+    return SensorFeed(open_source(settings.SENSOR_SOURCE), detector).start()
+
+def apply_sensor_transitions(sensor_feed, trip):
+    """
+    Aplicar al viaje las transiciones detectadas por el sensor.
+
+    Cada tramo se cierra en el instante original de la transición. Devuelve
+    el último estado aplicado, o None si no hubo cambios.
+    """
+    applied = None
+    for state, at in sensor_feed.drain():
+        if not trip.active or state == trip.state:
+            continue
+        trip.fire(MOVE if state == 'moving' else STOP, max(at, trip.fare.segment_start))
+        applied = state
+    return applied
+
+def apply_sensor_distance(sensor_feed, trip):
+    """Sumar al viaje activo la distancia medida desde la última llamada; devuelve los km sumados."""
+    km = sensor_feed.take_distance()
+    if not km or not trip.active:
+        # Lo recorrido sin viaje no se cobra
+        return 0.0
+    trip.fare.add_distance(km)
+    return km
+
+def log_rejected(trip, event):
+    """Registrar un evento que la máquina de estados del viaje no permite."""
+    logging.warning(f"{REJECTED_EVENTS[event][0]} (estado: {trip.state or 'sin viaje'})")
+
+class CliSession:
+    """
+    Estado y comandos de una sesión de la CLI.
+
+    `handle` ejecuta una línea de la entrada y devuelve False cuando el
+    usuario sale. Lo comparten el bucle clásico con `input()` y el bucle de
+    eventos de `src/cli_loop.py`; la confirmación de salida con un viaje
+    activo es la línea siguiente, así ningún comando bloquea leyendo.
+    """
+
+    def __init__(self):
+        self.trip = Trip(RunningFare(*current_rates()))
+        self.running_fare = self.trip.fare
+        self.checkpoint = None
+        self.live_slot = open_live_slot()
+        self.sensor_feed = start_sensor_feed()
+        self.confirming_exit = False
+
+    def resume(self):
+        """Reanudar el viaje que quedó a medias si el proceso anterior se cayó."""
+        # Arrancar el envío de lo que quedó en la cola en sesiones anteriores
+        trip_outbox()
+        resumed = recover_orphan_trips()
+        if resumed is None:
+            return
+        if resumed.profile in PRICE_PROFILES and resumed.profile != TARIFFS.current.active:
+            change_price_profile(resumed.profile)
+        self.trip.pin(TARIFFS.current)
+        # El tiempo sin latido antes de la caída no se cobra (igual que al finalizar huérfanos)
+        self.trip.restore(*resumed.restore_args(time.time()))
+        self.checkpoint = TripCheckpoint(resumed.path)
+        self.persist(time.time())
+        logging.info(f"Viaje recuperado tras caída: {resumed.trip_id}")
+        say('trip_recovered')
+
+    def prompt(self):
+        """Prompt dinámico con el estado del taxi (o la pregunta de salida pendiente)."""
+        if self.confirming_exit:
+            key = 'exit_finish_first'
+        elif not self.trip.active:
+            key = 'prompt_idle'
         else:
-            if trip_active:
-                if state == 'stopped':
-                    command = input("🚖 🛑 PARADO > ").strip().lower()
-                else:
-                    command = input("🚖 🏃💨 EN MOVIMIENTO > ").strip().lower()
-            else:
-                command = input("🚖 > ").strip().lower()
+            key = 'prompt_stopped' if self.trip.state == 'stopped' else 'prompt_moving'
+        return message_catalog().format(key)
+
+    def persist(self, now):
+        tariff = self.trip.tariff
+        persist_trip_state(self.checkpoint, self.live_slot, self.running_fare, now,
+                           tariff.active if tariff is not None else None)
+
+    def touch(self, now):
+        """Marcar el viaje como vivo: si el proceso cae, se factura hasta aquí."""
+        tariff = self.trip.tariff
+        touch_trip_state(self.checkpoint, self.live_slot, self.running_fare, now,
+                         tariff.active if tariff is not None else None)
+
+    def status_text(self, now):
+        """Línea de estado del viaje en `now`."""
+        stopped_time, moving_time = self.running_fare.elapsed(now)
+        return format_status(self.trip.active, self.trip.state, stopped_time, moving_time,
+                             self.running_fare.estimate(now))
+
+    def status_line(self, now):
+        """Mostrar el estado del viaje en `now`."""
+        stopped_time, moving_time = self.running_fare.elapsed(now)
+        show_status(self.trip.active, self.trip.state, stopped_time, moving_time, self.running_fare.estimate(now))
+
+    def apply_sensor(self, show=True):
+        """Aplicar las transiciones del sensor pendientes; devuelve el estado detectado o None."""
+        if self.sensor_feed is None:
+            return None
+        detected = apply_sensor_transitions(self.sensor_feed, self.trip)
+        km = apply_sensor_distance(self.sensor_feed, self.trip)
+        if detected is not None or km:
+            now = time.time()
+            self.persist(now)
+        if detected is not None:
+            logging.info(f"Estado detectado por el sensor: {detected}")
+            if show:
+                self.status_line(now)
+        return detected
+
+    def flush_history(self):
+        """Pasar a la base de datos lo que quede en el WAL del repositorio de viajes."""
+        if _repository is not None:
+            _repository.checkpoint()
+
+    def next_tariff_boundary(self, now):
+        """Segundos hasta que el tramo abierto cruce un umbral de tarifa del perfil (None si no hay)."""
+        if not self.trip.active:
+            return None
+        stopped_time, moving_time = self.running_fare.elapsed(now)
+        spent = stopped_time if self.trip.state == 'stopped' else moving_time
+        # El temporizador puede despertar un instante antes del umbral: ese ya no cuenta
+        upcoming = [after - spent for after in (self.trip.tariff or TARIFFS.current).evaluator().boundaries if after - spent > 0.001]
+        return min(upcoming) if upcoming else None
+
+    def handle(self, line):
+        """Ejecutar una línea de la entrada; False cuando hay que salir."""
+        command = line.strip().lower()
+        if self.confirming_exit:
+            return self.exit(command in YES_ANSWERS)
+
+        # Marcar el viaje como vivo y aplicar lo que detectó el sensor mientras se esperaba
+        self.touch(time.time())
+        self.apply_sensor()
+
+        trip = self.trip
+        running_fare = self.running_fare
+
+        # `start` admite etiquetas del viaje: start aeropuerto
+        if command.partition(' ')[0] == 'start':
+            command, _, tag_text = command.partition(' ')
+        # Eventos del viaje que la máquina de estados no permite en el estado actual
+        event = EVENTS.get(command)
+        if event is not None and event != EXIT and not trip.can(event):
+            log_rejected(trip, event)
+            say(REJECTED_EVENTS[event][1])
+            return True
 
         if command == 'help':
-            print_colored(HELP_MENU, "yellow")
-            continue
+            say('help_menu')
 
         elif command == 'status':
-            show_status(trip_active, state, stopped_time, moving_time)
-            continue
+            self.status_line(time.time())
 
         elif command == 'start':
-            if trip_active:
-                logging.warning("Intento de iniciar viaje con trip activo")
-                if COLORS_AVAILABLE:
-                    print(f"{Fore.RED}❌ Error: Ya hay un viaje en progreso.{Style.RESET_ALL}")
-                else:
-                    print("❌ Error: Ya hay un viaje en progreso.")
-                continue
-            
-            trip_active = True
             start_time = time.time()
-            stopped_time = 0
-            moving_time = 0
-            state = 'stopped'
-            state_start_time = time.time()
-            logging.info("Viaje iniciado")
-            if COLORS_AVAILABLE:
-                print(f"{Fore.GREEN}✅ ¡Viaje iniciado! Estado inicial: 'parado' 🛑{Style.RESET_ALL}")
-            else:
-                print("✅ ¡Viaje iniciado! Estado inicial: 'parado' 🛑")
+            # El viaje se cobra con las tarifas vigentes al empezar, aunque otro hilo cambie el perfil
+            trip.pin(TARIFFS.current)
+            trip.fire(START, start_time)
+            running_fare.set_tags(parse_tags(tag_text))
+            self.checkpoint = TripCheckpoint.create(checkpoint_dir())
+            self.persist(start_time)
+            logging.info(f"Viaje iniciado (etiquetas: {', '.join(running_fare.tags) or 'ninguna'})")
+            say('trip_started')
+            if self.sensor_feed is not None and self.sensor_feed.state == 'moving':
+                # El sensor ya indica movimiento al empezar el viaje
+                trip.fire(MOVE, start_time)
+                self.persist(start_time)
+                say('sensor_moving')
 
         elif command in ("stop", "move"):
-            if not trip_active:
-                logging.warning("Comando de estado sin viaje activo")
-                if COLORS_AVAILABLE:
-                    print(f"{Fore.RED}❌ Error: No hay viaje activo. Usa 'start' para comenzar.{Style.RESET_ALL}")
-                else:
-                    print("❌ Error: No hay viaje activo. Usa 'start' para comenzar.")
-                continue
-            
-            # Calcular tiempo en estado anterior
-            duration = time.time() - state_start_time
-            if state == 'stopped':
-                stopped_time += duration
-            else:
-                moving_time += duration
-
-            state = "stopped" if command == "stop" else "moving"
-            state_start_time = time.time()
-            logging.info(f"Estado cambiado a: {state}")
+            # Cerrar el tramo anterior y abrir el del nuevo estado
+            now = time.time()
+            trip.fire(event, now)
+            self.persist(now)
+            logging.info(f"Estado cambiado a: {trip.state}")
             
-            if COLORS_AVAILABLE:
-                if state == 'stopped':
-                    print(f"{Fore.RED}🛑 Estado cambiado a: 'parado'{Style.RESET_ALL}")
-                else:
-                    print(f"{Fore.GREEN}🏃 Estado cambiado a: 'en movimiento'{Style.RESET_ALL}")
-            else:
-                if state == 'stopped':
-                    print("� Estado cambiado a: 'parado'")
-                else:
-                    print("🏃 Estado cambiado a: 'en movimiento'")
+            say('state_stopped' if trip.state == 'stopped' else 'state_moving')
 
         elif command == 'finish':
-            if not trip_active:
-                logging.warning("Intento de finalizar viaje sin trip activo")
-                if COLORS_AVAILABLE:
-                    print(f"{Fore.RED}❌ Error: No hay viaje activo para terminar.{Style.RESET_ALL}")
-                else:
-                    print("❌ Error: No hay viaje activo para terminar.")
-                continue
-
             # Calcular tiempo final
-            duration = time.time() - state_start_time
-            if state == 'stopped':
-                stopped_time += duration
-            else:
-                moving_time += duration
+            trip.fire(FINISH, time.time())
+            stopped_time, moving_time = running_fare.stopped_time, running_fare.moving_time
 
-            total_fare = calculate_fare(stopped_time, moving_time)
+            total_fare = calculate_fare(stopped_time, moving_time, running_fare.distance_km, running_fare.tags,
+                                        tariff=trip.tariff)
             logging.info(f"Viaje finalizado - Tiempo parado: {stopped_time:.1f}s, Tiempo movimiento: {moving_time:.1f}s")
             logging.info(f"Tarifa total calculada: €{total_fare:.2f}")
             
             # Guardar en historial
-            save_trip_to_history(stopped_time, moving_time, total_fare)
+            save_trip_to_history(stopped_time, moving_time, total_fare, profile=trip.tariff.active,
+                                 segments=running_fare.segments, tags=running_fare.tags)
             
-            if COLORS_AVAILABLE:
-                print(f"\n{Back.BLUE}{Fore.WHITE} 🧾 --- RESUMEN DEL VIAJE --- 🧾 {Style.RESET_ALL}")
-                print(f"{Fore.YELLOW}🛑 Tiempo parado: {stopped_time:.1f} segundos{Style.RESET_ALL}")
-                print(f"{Fore.GREEN}🏃 Tiempo en movimiento: {moving_time:.1f} segundos{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}💰 Tarifa total: €{total_fare:.2f}{Style.RESET_ALL}")
-                print(f"{Back.BLUE}{Fore.WHITE} 🎯 -------------------------- 🎯 {Style.RESET_ALL}\n")
-            else:
-                print("\n🧾 --- RESUMEN DEL VIAJE ---")
-                print(f"🛑 Tiempo parado: {stopped_time:.1f} segundos")
-                print(f"🏃 Tiempo en movimiento: {moving_time:.1f} segundos")
-                print(f"💰 Tarifa total: €{total_fare:.2f}")
-                print("🎯 --------------------------\n")
+            print_colored(f"\n{trip_receipt(stopped_time, moving_time, total_fare, tariff=trip.tariff)}\n", "cyan")
 
-            trip_active = False
-            state = None
+            trip.reset()
+            self.checkpoint.discard()
+            self.checkpoint = None
+            self.persist(time.time())
 
         elif command == 'exit':
-            if trip_active:
-                print_colored("⚠️  Warning: You have an active trip!", "yellow")
-                confirm = input("🤔 Do you want to finish the trip first? (y/n): ").strip().lower()
-                if confirm == 'y':
-                    # Auto-finish the trip
-                    duration = time.time() - state_start_time
-                    if state == 'stopped':
-                        stopped_time += duration
-                    else:
-                        moving_time += duration
-                    total_fare = calculate_fare(stopped_time, moving_time)
-                    print_colored(f"🏁 Auto-completado trip. Tarifa final: €{total_fare:.2f}", "green")
-                    logging.info(f"Viaje auto-completado al salir - Tarifa: €{total_fare:.2f}")
-            
-            logging.info("Usuario salió de la aplicación")
-            
-            # Animación de salida
-            animate_taxi_exit()
-            
-            if COLORS_AVAILABLE:
-                print(f"{Fore.MAGENTA}👋 ¡Gracias por usar el Taxímetro Digital! �✨{Style.RESET_ALL}")
-            else:
-                print("👋 ¡Gracias por usar el Taxímetro Digital! �✨")
-            break
+            if trip.active:
+                say('exit_active_trip')
+                self.confirming_exit = True
+                return True
+            return self.exit(False)
+
         elif command in ['help', 'h', '?']:
+            # La animación escribe directamente: antes se vacía el búfer
+            if _renderer is not None:
+                _renderer.flush(settle=True)
             display_welcome()
-        elif command in ['history', 'hist']:
-            show_trip_history()
+        elif command.partition(' ')[0] in ('history', 'hist'):
+            # history [página]
+            page = command.partition(' ')[2].strip()
+            show_trip_history(int(page) if page.isdigit() and int(page) > 0 else 1)
+        elif command == 'rerate':
+            # Impacto en ingresos de recalcular el historial con cada perfil
+            from src.history import history_paths
+            from src.rerate import rerate_history, format_report
+            report = rerate_history(PRICE_PROFILES, history_paths(settings.HISTORY_FILE, settings.HISTORY_SHARD_DIR))
+            print_colored(f"\n{format_report(report)}\n", "cyan")
+        elif command == 'stats':
+            show_history_stats()
+        elif command.partition(' ')[0] == 'export':
+            # export [ruta.csv]: historial completo en orden cronológico
+            export_history(command.partition(' ')[2].strip() or os.path.join(settings.LOGS_DIR, 'historial.csv'))
+        elif command.partition(' ')[0] == 'quote':
+            # Presupuesto rápido: quote <segundos parado> <segundos en movimiento> [km]
+            try:
+                values = [float(value) for value in command.split()[1:]]
+                fare = quote_fare(values[0], values[1], distance_km=values[2] if len(values) > 2 else 0.0)
+            except (ValueError, IndexError):
+                say('quote_usage')
+                return True
+            stats = QUOTES.stats()
+            say('quote_result', fare=fare, hits=stats.hits, misses=stats.misses)
+        elif command.partition(' ')[0] == 'estimate':
+            # Estimación antes de empezar: estimate [hora]; por defecto la hora actual
+            hour = command.partition(' ')[2].strip()
+            if hour and not (hour.isdigit() and int(hour) < 24):
+                say('estimate_usage')
+                return True
+            hour = int(hour) if hour else time.localtime().tm_hour
+            prediction = predict_fare(hour=hour)
+            if prediction is None:
+                say('estimate_no_data')
+            else:
+                say('estimate_result', profile=TARIFFS.current.profile['name'], hour=hour,
+                    median=prediction.median, p90=prediction.p90, trips=prediction.trips)
+        elif command == 'outbox':
+            outbox = trip_outbox()
+            if outbox is None:
+                say('outbox_disabled')
+            else:
+                stats = _outbox_sender.stats(outbox)
+                say('outbox_status', pending=stats.pending, lag=stats.lag_s, sent=stats.sent,
+                    retries=stats.retries, rejected=stats.rejected)
         elif command in ['precios', 'tarifas', 'price']:
             show_price_profiles()
 
         elif command in PRICE_PROFILES:
-            change_price_profile(command)
+            tariff = change_price_profile(command)
+            if tariff is not None:
+                # El viaje en curso pasa a facturarse con el snapshot nuevo
+                trip.pin(tariff)
+                self.persist(time.time())
         else:
             logging.warning(f"Comando inválido recibido: '{command}'")
-            if COLORS_AVAILABLE:
-                print(f"{Fore.RED}❓ Comando inválido. Usa 'start', 'stop', 'move', 'finish', 'history', 'precios', 'help', o 'exit'.{Style.RESET_ALL}")
-                print(f"{Fore.YELLOW}💡 También puedes usar: {', '.join(PRICE_PROFILES.keys())} para cambiar tarifas{Style.RESET_ALL}")
-            else:
-                print("❓ Comando inválido. Usa 'start', 'stop', 'move', 'finish', 'history', 'precios', 'help', o 'exit'.")
-                print(f"💡 También puedes usar: {', '.join(PRICE_PROFILES.keys())} para cambiar tarifas")
+            say('invalid_command', profiles=', '.join(PRICE_PROFILES.keys()))
+        return True
+
+    def cancel_exit(self):
+        """Sin respuesta a la pregunta de salida: se sigue con el viaje."""
+        if self.confirming_exit:
+            self.confirming_exit = False
+            say('exit_cancelled')
+
+    def exit(self, finish_trip):
+        """Salir, finalizando antes el viaje activo si el usuario lo confirmó."""
+        self.confirming_exit = False
+        if finish_trip and self.trip.active:
+            # Auto-finish the trip
+            self.trip.fire(EXIT, time.time())
+            stopped_time, moving_time = self.running_fare.stopped_time, self.running_fare.moving_time
+            total_fare = calculate_fare(stopped_time, moving_time, self.running_fare.distance_km,
+                                        self.running_fare.tags, tariff=self.trip.tariff)
+            say('auto_finished', fare=total_fare)
+            logging.info(f"Viaje auto-completado al salir - Tarifa: €{total_fare:.2f}")
+
+        # Salida voluntaria: el checkpoint solo sirve para recuperar caídas
+        if self.checkpoint is not None:
+            self.checkpoint.discard()
+            self.checkpoint = None
+        if self.live_slot is not None:
+            self.trip.reset()
+            self.persist(time.time())
+        self.close()
+        logging.info("Usuario salió de la aplicación")
+        stop_console_renderer()
+
+        # Animación de salida
+        animate_taxi_exit()
+        
+        say('thanks')
+        return False
+
+    def hangup(self):
+        """Entrada cerrada o Ctrl+C: cerrar sin tocar el viaje, que se recupera al volver."""
+        self.confirming_exit = False
+        self.close()
+        logging.info("Sesión cerrada sin 'exit'")
+        stop_console_renderer()
+
+    def close(self):
+        """Liberar el estado en vivo y el sensor (el checkpoint, si queda, permite recuperar el viaje)."""
+        if self.live_slot is not None:
+            self.live_slot.table.close()
+            self.live_slot = None
+        if self.sensor_feed is not None:
+            self.sensor_feed.stop()
+            self.sensor_feed = None
+        stop_outbox()
+
+def taximeter():
+    """
+    Función principal del taxímetro: manejar y mostrar opciones.
+
+    Por defecto la CLI corre sobre un bucle de eventos (src/cli_loop.py) que
+    atiende la entrada, los temporizadores y el sensor sin bloquearse en
+    `input()`; con TAXIMETER_EVENT_LOOP=0 se usa el bucle clásico.
+    """
+    display_welcome()
+    if settings.CLI_EVENT_LOOP:
+        # El bucle de eventos vacía la salida él mismo: sin hilo de refresco
+        start_console_renderer(ticker=False)
+        session = CliSession()
+        session.resume()
+        from src.cli_loop import run_cli
+        run_cli(session, _renderer, status_interval=settings.CLI_STATUS_INTERVAL_S,
+                heartbeat_interval=settings.CLI_HEARTBEAT_S, confirm_timeout=settings.CLI_CONFIRM_TIMEOUT_S,
+                history_flush_delay=settings.CLI_HISTORY_FLUSH_S)
+        return
+    start_console_renderer()
+    session = CliSession()
+    session.resume()
+    while session.handle(read_command(session.prompt())):
+        pass
 
 if __name__ == "__main__":
+    announce_terminal_features()
     logging.info("🚀 Iniciando Taxímetro Digital")
     taximeter()
\ No newline at end of file
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Análisis del historial de viajes con numpy y pandas (pensado para el notebook).
+
+El historial de texto se parsea una sola vez a un sidecar de columnas: un
+fichero `.npy` por columna más `meta.json`, con el tamaño, la fecha de
+modificación, el inodo y los bytes ya parseados de cada fichero de
+historial. Mientras el historial no cambie, abrirlo es mapear los `.npy` en
+memoria (`np.load(..., mmap_mode='r')`) sin leer ni parsear nada, así que
+tarda milisegundos aunque haya millones de viajes.
+
+Si un fichero solo creció (lo normal: cada viaje terminado añade una línea)
+se parsean únicamente los bytes nuevos y se añaden al final de los `.npy`;
+los viajes añadidos quedan detrás de los anteriores. El sidecar se regenera
+entero solo si un fichero encoge, se sustituye o desaparece.
+
+Columnas:
+    timestamp       datetime64[s]
+    stopped_time    float32 (segundos)
+    moving_time     float32 (segundos)
+    total_time      float32 (segundos)
+    fare_cents      int64 (céntimos)
+
+Uso en el notebook:
+    from src.analysis import load_trips
+    trips = load_trips()
+    trips.set_index('timestamp').fare_cents.resample('D').sum() / 100
+"""
+import heapq
+import io
+import json
+import os
+from array import array
+
+import numpy as np
+
+from src.history import history_paths, iter_history_lines, parse_history_line
+
+SIDECAR_VERSION = 2
+
+COLUMNS = {
+    'timestamp': 'datetime64[s]',
+    'stopped_time': 'float32',
+    'moving_time': 'float32',
+    'total_time': 'float32',
+    'fare_cents': 'int64',
+}
+
+_META_FILE = 'meta.json'
+
+
+def _timestamps(values):
+    try:
+        return np.array(values, dtype='datetime64[s]')
+    except ValueError:
+        # Alguna fecha mal formada: se convierte una a una y las inválidas quedan como NaT
+        converted = np.empty(len(values), dtype='datetime64[s]')
+        for i, value in enumerate(values):
+            try:
+                converted[i] = np.datetime64(value, 's')
+            except ValueError:
+                converted[i] = np.datetime64('NaT')
+        return converted
+
+
+def parse_trip_columns(lines):
+    """Parsear líneas del historial a un diccionario {columna: array de numpy}."""
+    timestamps = []
+    stopped, moving, total = array('d'), array('d'), array('d')
+    cents = array('q')
+    for line in lines:
+        trip = parse_history_line(line)
+        if trip is None:
+            continue
+        timestamps.append(trip.timestamp)
+        stopped.append(trip.stopped_time)
+        moving.append(trip.moving_time)
+        total.append(trip.total_time)
+        cents.append(round(trip.fare * 100))
+    return {
+        'timestamp': _timestamps(timestamps),
+        'stopped_time': np.array(stopped, dtype=np.float32),
+        'moving_time': np.array(moving, dtype=np.float32),
+        'total_time': np.array(total, dtype=np.float32),
+        'fare_cents': np.array(cents, dtype=np.int64),
+    }
+
+
+def _stat(path):
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def _parsed_size(path, size):
+    # Hasta el último salto de línea: una línea a medio escribir se parsea en la próxima apertura
+    if path.endswith('.thc'):
+        return size
+    with open(path, 'rb') as f:
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def _read_range(path, start, end):
+    """Líneas de `path` entre los bytes `start` y `end` (un `.thc` se lee entero)."""
+    if path.endswith('.thc'):
+        yield from iter_history_lines([path])
+        return
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for raw in f:
+            start += len(raw)
+            if start > end:
+                break
+            yield raw.decode('utf-8', errors='replace')
+
+
+def _parse_ranges(ranges):
+    # Cada rango está en orden cronológico: mezcla de k vías como merge_history_lines
+    return parse_trip_columns(heapq.merge(*(_read_range(*item) for item in ranges), key=lambda line: line[:19]))
+
+
+def _pending_ranges(sources, paths):
+    """
+    (rangos por parsear, fuentes nuevas) respecto a las fuentes del sidecar;
+    None si algún fichero encogió, se sustituyó o desapareció.
+    """
+    known = {source[0]: source for source in sources}
+    ranges, updated = [], []
+    for path in paths:
+        current = _stat(path)
+        name, size, mtime_ns, inode = current
+        source = known.pop(name, None)
+        if source is None:
+            start = 0
+        elif source[2:] == current[1:]:
+            updated.append(source)
+            continue
+        elif path.endswith('.thc') or inode != source[4] or size <= source[2]:
+            return None
+        else:
+            start = source[1]
+        end = _parsed_size(path, size)
+        ranges.append((path, start, end))
+        updated.append([name, end, size, mtime_ns, inode])
+    if known:
+        return None
+    return ranges, updated
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, _META_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _column_path(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.npy")
+
+
+def _write_meta(cache_dir, trips, sources):
+    meta_path = os.path.join(cache_dir, _META_FILE)
+    meta = {'version': SIDECAR_VERSION, 'trips': trips, 'sources': sources}
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def _drop_meta(cache_dir):
+    # Sin meta mientras se reescriben las columnas: si se interrumpe, se regenera al abrir
+    meta_path = os.path.join(cache_dir, _META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+
+def build_sidecar(paths, cache_dir):
+    """Parsear el historial y escribir el sidecar de columnas; devuelve las columnas."""
+    ranges, sources = _pending_ranges([], paths)
+    columns = _parse_ranges(ranges)
+    os.makedirs(cache_dir, exist_ok=True)
+    _drop_meta(cache_dir)
+    for name, values in columns.items():
+        tmp_path = _column_path(cache_dir, name) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, values)
+        os.replace(tmp_path, _column_path(cache_dir, name))
+    _write_meta(cache_dir, len(columns['fare_cents']), sources)
+    return columns
+
+
+def _append_column(path, values):
+    """Añadir `values` al final de un `.npy` 1-D reescribiendo solo su cabecera; False si no se puede."""
+    fmt = np.lib.format
+    with open(path, 'r+b') as f:
+        version = fmt.read_magic(f)
+        if version != (1, 0):
+            return False
+        shape, fortran_order, dtype = fmt.read_array_header_1_0(f)
+        data_start = f.tell()
+        header = {'descr': fmt.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                  'shape': (shape[0] + len(values),)}
+        buffer = io.BytesIO()
+        fmt.write_array_header_1_0(buffer, header)
+        # numpy reserva hueco en la cabecera para que la longitud pueda crecer sin moverla
+        if len(shape) != 1 or buffer.tell() != data_start:
+            return False
+        f.seek(data_start + shape[0] * dtype.itemsize)
+        f.truncate()
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        f.seek(0)
+        f.write(buffer.getvalue())
+    return True
+
+
+def extend_sidecar(cache_dir, meta, ranges, sources):
+    """Parsear solo `ranges` (lo añadido a cada fichero) y añadirlo al sidecar; devuelve los viajes nuevos."""
+    columns = _parse_ranges(ranges)
+    trips = len(columns['fare_cents'])
+    if trips:
+        _drop_meta(cache_dir)
+        for name, values in columns.items():
+            path = _column_path(cache_dir, name)
+            if not _append_column(path, values):
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, np.concatenate([np.load(path, mmap_mode='r'), values]))
+                os.replace(tmp_path, path)
+    _write_meta(cache_dir, meta['trips'] + trips, sources)
+    return trips
+
+
+def trip_columns(paths=None, cache_dir=None):
+    """
+    Columnas del historial como arrays de numpy mapeados en memoria.
+
+    Por defecto se lee el historial completo de `settings` (fichero común,
+    archivos y ficheros por taxi) con el sidecar en `ANALYSIS_CACHE_DIR`.
+    """
+    if paths is None or cache_dir is None:
+        from config import settings
+        if paths is None:
+            paths = history_paths(settings.HISTORY_FILE, settings.HISTORY_SHARD_DIR)
+        if cache_dir is None:
+            cache_dir = settings.ANALYSIS_CACHE_DIR
+    meta = _read_meta(cache_dir)
+    pending = None
+    if meta is not None and meta.get('version') == SIDECAR_VERSION:
+        pending = _pending_ranges(meta['sources'], paths)
+    if pending is None:
+        build_sidecar(paths, cache_dir)
+    elif pending[0]:
+        extend_sidecar(cache_dir, meta, *pending)
+    return {name: np.load(_column_path(cache_dir, name), mmap_mode='r') for name in COLUMNS}
+
+
+def load_trips(paths=None, cache_dir=None):
+    """DataFrame de pandas con un viaje por fila y las columnas tipadas del sidecar."""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("load_trips necesita pandas: pip install pandas "
+                          "(trip_columns devuelve los mismos datos como arrays de numpy)") from None
+    return pd.DataFrame(trip_columns(paths, cache_dir), columns=list(COLUMNS), copy=False)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints de viajes activos en ficheros mapeados en memoria.
+
+Cada viaje activo tiene un fichero pequeño de tamaño fijo que se actualiza
+in situ (una copia de memoria, sin fsync) en cada cambio de estado. Si el
+proceso muere, el contenido sigue en la caché de páginas del sistema y al
+arrancar se puede reanudar o finalizar el viaje. No protege frente a un
+corte de corriente: para eso haría falta fsync en cada transición.
+
+El tiempo entre el último latido (`touch`) y la caída no se cobra: tanto al
+finalizar un viaje huérfano como al reanudarlo, el tramo abierto se cierra
+en `updated_at`. Cada taxi tiene su propio directorio (`cab_checkpoint_dir`)
+para no adoptar los viajes de otro taxímetro del mismo equipo.
+
+La versión 3 del formato (`TXC3`) guarda la distancia recorrida y las
+etiquetas del viaje en dos copias que se escriben por turnos: si el proceso
+muere a mitad de `save`, la copia anterior sigue completa y el viaje se
+reanuda desde ella. Los checkpoints `TXC2` y `TXC1` (una sola copia; `TXC1`
+sin distancia ni etiquetas) se siguen leyendo.
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+
+from src.meter import STATE_CODES, STATE_NAMES
+
+CHECKPOINT_SUFFIX = '.ckpt'
+# Los checkpoints ilegibles se apartan con este sufijo: ya no se escanean
+CORRUPT_SUFFIX = '.corrupt'
+# Lecturas antes de dar un checkpoint por corrupto (un proceso vivo puede estar escribiéndolo)
+READ_ATTEMPTS = 3
+MAGIC = b'TXC3'
+_MAGIC_V2 = b'TXC2'
+_MAGIC_V1 = b'TXC1'
+# Bytes para las etiquetas separadas por comas; las que no caben no se guardan (se avisa en el log)
+TAGS_SIZE = 256
+
+# Cada copia lleva el mismo número de secuencia delante y detrás (seqlock): si
+# un proceso muere a mitad de escritura no coinciden y esa copia se descarta.
+_FILE_HEAD = struct.Struct('<4s4x')
+_SEQ = struct.Struct('<I')
+_BODY = struct.Struct(f'<B3xIddddd16s{TAGS_SIZE}s')
+_UPDATED = struct.Struct('<d')
+_SLOT_UPDATED = _SEQ.size + _BODY.size
+_SLOT_SIZE = _SLOT_UPDATED + _UPDATED.size + _SEQ.size
+_SLOT_OFFSETS = (_FILE_HEAD.size, _FILE_HEAD.size + _SLOT_SIZE)
+RECORD_SIZE = _FILE_HEAD.size + 2 * _SLOT_SIZE
+
+# Formatos de una sola copia: cabecera con la secuencia, cuerpo, latido y cola
+_HEAD = struct.Struct('<4sI')
+_BODY_V2 = struct.Struct('<B3xIddddd16s32s')
+_BODY_V1 = struct.Struct('<B3xIdddd16s')  # sin distancia
+_SINGLE_BODIES = {_MAGIC_V2: _BODY_V2, _MAGIC_V1: _BODY_V1}
+
+
+def _slot_seq(data, slot):
+    # Secuencia de una copia completa (0 si está vacía o a medio escribir)
+    offset = _SLOT_OFFSETS[slot]
+    if len(data) < offset + _SLOT_SIZE:
+        return 0
+    seq = _SEQ.unpack_from(data, offset)[0]
+    if _SEQ.unpack_from(data, offset + _SLOT_SIZE - _SEQ.size)[0] != seq:
+        return 0
+    return seq
+
+
+def _latest_slot(data):
+    """(copia, secuencia) de la última copia completa de un checkpoint TXC3; secuencia 0 si no hay ninguna."""
+    first, second = _slot_seq(data, 0), _slot_seq(data, 1)
+    if not second or (first and (first - second) & 0xFFFFFFFF < 0x80000000):
+        return 0, first
+    return 1, second
+
+
+def _encode_tags(tags, path):
+    # Solo etiquetas completas: una etiqueta cortada ya no activaría su suplemento
+    kept = []
+    for tag in tags:
+        encoded = tag.encode('utf-8')
+        if b',' in encoded or len(b','.join(kept + [encoded])) > TAGS_SIZE:
+            logging.warning(f"Etiqueta '{tag}' no cabe en el checkpoint {path}: no se recuperará tras una caída")
+            continue
+        kept.append(encoded)
+    return b','.join(kept)
+
+
+class CheckpointRecord(namedtuple('CheckpointRecord', [
+        'path', 'trip_id', 'state', 'pid', 'start_time', 'segment_start',
+        'stopped_time', 'moving_time', 'profile', 'updated_at', 'distance_km', 'tags'])):
+    """Contenido de un checkpoint leído del disco."""
+
+    __slots__ = ()
+
+    def billed_times(self):
+        """Tiempos (parado, movimiento) hasta la última actualización conocida."""
+        duration = max(0.0, self.updated_at - self.segment_start)
+        if self.state == 'stopped':
+            return self.stopped_time + duration, self.moving_time
+        if self.state == 'moving':
+            return self.stopped_time, self.moving_time + duration
+        return self.stopped_time, self.moving_time
+
+    def restore_args(self, now):
+        """
+        Argumentos de `Trip.restore` para reanudar el viaje en `now`.
+
+        Misma regla que `billed_times`: el tramo abierto se cierra en
+        `updated_at` y el nuevo tramo, en el mismo estado, empieza en `now`.
+        """
+        stopped_time, moving_time = self.billed_times()
+        return (self.state or 'stopped', self.start_time, now, stopped_time, moving_time,
+                self.distance_km, self.tags)
+
+
+def cab_checkpoint_dir(directory, cab_id):
+    """Directorio de checkpoints propio del taxi `cab_id`."""
+    return os.path.join(directory, f"cab-{cab_id}")
+
+
+class TripCheckpoint:
+    """Checkpoint mapeado en memoria de un viaje activo."""
+
+    def __init__(self, path):
+        self.path = path
+        self.trip_id = os.path.basename(path)[:-len(CHECKPOINT_SUFFIX)]
+        self._file = open(path, 'r+b')
+        if os.fstat(self._file.fileno()).st_size < RECORD_SIZE:
+            # Checkpoint de una sola copia reanudado: el primer `save` lo reescribe en el formato actual
+            self._file.truncate(RECORD_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), RECORD_SIZE)
+        if self._map[:4] == MAGIC:
+            self._slot, self._seq = _latest_slot(self._map)
+        else:
+            # Nuevo: el primer `save` va a la copia 0. Formato anterior: va a la copia 1,
+            # que no pisa el registro antiguo, y solo después se cambia la firma
+            self._slot = 0 if self._map[:4] in _SINGLE_BODIES else 1
+            self._seq = 0
+
+    @classmethod
+    def create(cls, directory, trip_id=None):
+        """Crear el fichero de checkpoint de un viaje nuevo."""
+        os.makedirs(directory, exist_ok=True)
+        trip_id = trip_id or os.urandom(16).hex()
+        path = os.path.join(directory, trip_id + CHECKPOINT_SUFFIX)
+        with open(path, 'wb') as f:
+            f.write(bytes(RECORD_SIZE))
+        return cls(path)
+
+    def save(self, running_fare, profile, now):
+        """Volcar el estado de `running_fare` en la copia que no es la última (sin fsync)."""
+        self._seq = (self._seq + 1) & 0xFFFFFFFF or 1
+        slot = self._slot ^ 1
+        offset = _SLOT_OFFSETS[slot]
+        _SEQ.pack_into(self._map, offset, self._seq)
+        _BODY.pack_into(
+            self._map, offset + _SEQ.size,
+            STATE_CODES[running_fare.state], os.getpid(), running_fare.trip_start,
+            running_fare.segment_start, running_fare.stopped_time,
+            running_fare.moving_time, running_fare.distance_km, profile.encode('utf-8')[:16],
+            _encode_tags(running_fare.tags, self.path)
+        )
+        _UPDATED.pack_into(self._map, offset + _SLOT_UPDATED, now)
+        _SEQ.pack_into(self._map, offset + _SLOT_SIZE - _SEQ.size, self._seq)
+        # La copia ya está completa: a partir de aquí es la que se lee
+        self._slot = slot
+        if self._map[:4] != MAGIC:
+            _FILE_HEAD.pack_into(self._map, 0, MAGIC)
+
+    def touch(self, now):
+        """Registrar que el viaje sigue vivo en `now` (escritura de 8 bytes en la última copia)."""
+        _UPDATED.pack_into(self._map, _SLOT_OFFSETS[self._slot] + _SLOT_UPDATED, now)
+
+    def close(self):
+        """Liberar el mapeo dejando el fichero en disco."""
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def discard(self):
+        """Cerrar y borrar el checkpoint (viaje terminado)."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def read_checkpoint(path):
+    """Leer un checkpoint; devuelve None si está incompleto o corrupto."""
+    with open(path, 'rb') as f:
+        data = f.read(RECORD_SIZE)
+    if len(data) < _HEAD.size:
+        return None
+    magic = data[:4]
+    if magic == MAGIC:
+        slot, seq = _latest_slot(data)
+        if not seq:
+            return None
+        body = _BODY
+        body_offset = _SLOT_OFFSETS[slot] + _SEQ.size
+        updated_offset = _SLOT_OFFSETS[slot] + _SLOT_UPDATED
+    else:
+        body = _SINGLE_BODIES.get(magic)
+        if body is None:
+            return None
+        seq = _HEAD.unpack_from(data, 0)[1]
+        body_offset = _HEAD.size
+        updated_offset = body_offset + body.size
+        tail_offset = updated_offset + _UPDATED.size
+        if len(data) < tail_offset + _SEQ.size or _SEQ.unpack_from(data, tail_offset)[0] != seq:
+            return None
+    fields = body.unpack_from(data, body_offset)
+    state, pid, start_time, segment_start, stopped, moving = fields[:6]
+    if body is _BODY_V1:
+        distance, profile, tags = 0.0, fields[6], b''
+    else:
+        distance, profile, tags = fields[6:]
+    try:
+        profile = profile.rstrip(b'\0').decode('utf-8')
+        tags = tuple(tag for tag in tags.rstrip(b'\0').decode('utf-8').split(',') if tag)
+    except UnicodeDecodeError:
+        return None
+    return CheckpointRecord(
+        path, os.path.basename(path)[:-len(CHECKPOINT_SUFFIX)], STATE_NAMES.get(state),
+        pid, start_time, segment_start, stopped, moving,
+        profile, _UPDATED.unpack_from(data, updated_offset)[0], distance, tags
+    )
+
+
+def quarantine_checkpoint(path):
+    """Apartar un checkpoint ilegible (`<ruta>.corrupt`) para que no se vuelva a escanear."""
+    target = path + CORRUPT_SUFFIX
+    os.replace(path, target)
+    return target
+
+
+def _read_settled(path):
+    # Un escritor vivo puede estar a mitad de `save`: releer antes de darlo por corrupto
+    for attempt in range(READ_ATTEMPTS):
+        record = read_checkpoint(path)
+        if record is not None:
+            return record
+        time.sleep(0.001 * (attempt + 1))
+    return None
+
+
+def scan_orphans(directory):
+    """
+    Devolver los checkpoints cuyo proceso propietario ya no existe.
+
+    Los checkpoints corruptos se devuelven aparte para poder avisar de ellos
+    y apartarlos con `quarantine_checkpoint`.
+    """
+    orphans, corrupt = [], []
+    if not os.path.isdir(directory):
+        return orphans, corrupt
+    own_pid = os.getpid()
+    alive = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(CHECKPOINT_SUFFIX):
+                continue
+            record = read_checkpoint(entry.path) or _read_settled(entry.path)
+            if record is None:
+                corrupt.append(entry.path)
+                continue
+            if record.pid != own_pid:
+                if record.pid not in alive:
+                    alive[record.pid] = process_alive(record.pid)
+                if alive[record.pid]:
+                    continue
+            orphans.append(record)
+    return orphans, corrupt
+
+
+def process_alive(pid):
+    """Comprobar si el proceso `pid` sigue en ejecución."""
+    if pid <= 0:
+        return False
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Bucle de eventos de la CLI con asyncio.
+
+La CLI clásica se bloquea en `input()`: entre dos comandos no pasa nada. Aquí
+un solo bucle de asyncio atiende a la vez:
+
+- la entrada: stdin sin bloquear con `loop.add_reader` (o un hilo lector
+  cuando no se puede, p. ej. en Windows o con stdin redirigido a un fichero);
+- temporizadores: refresco de la línea de estado y latido del checkpoint
+  mientras hay un viaje activo, cambio de tramo de tarifa, caducidad de la
+  pregunta de salida y volcado del historial SQLite tras cada viaje;
+- fuentes externas: el sensor despierta al bucle desde su hilo.
+
+Los temporizadores solo existen mientras hacen falta: sin viaje activo el
+proceso queda dormido en select/epoll sin gastar CPU.
+
+La sesión (`main.CliSession`) ejecuta los comandos; el bucle solo decide
+cuándo.
+"""
+import asyncio
+import codecs
+import logging
+import os
+import sys
+import threading
+import time
+
+
+class CliEventLoop:
+    """
+    Multiplexor de entrada, temporizadores y sensor para una sesión de la CLI.
+
+    `renderer` es el `ConsoleRenderer` de la CLI: el bucle no arranca su hilo
+    de refresco, vacía el búfer después de cada evento.
+    """
+
+    def __init__(self, session, renderer, stdin=None, status_interval=1.0, heartbeat_interval=5.0,
+                 confirm_timeout=30.0, history_flush_delay=5.0, clock=time.time):
+        self.session = session
+        self.renderer = renderer
+        self._stdin = stdin
+        self.status_interval = status_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.confirm_timeout = confirm_timeout
+        self.history_flush_delay = history_flush_delay
+        self._clock = clock
+        self._loop = None
+        self._finished = None
+        self._timers = {}
+        self._reader_fd = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ''
+        self._prompt_shown = False
+        self._status_above = False
+        self.wakeups = 0
+
+    @property
+    def stdin(self):
+        return self._stdin if self._stdin is not None else sys.stdin
+
+    async def run(self):
+        """Atender la sesión hasta que el usuario salga o se cierre la entrada."""
+        self._loop = asyncio.get_running_loop()
+        self._finished = self._loop.create_future()
+        self._attach_input()
+        sensor = self.session.sensor_feed
+        if sensor is not None:
+            sensor.notify = self._notify_sensor
+        try:
+            self._after_event()
+            await self._finished
+        finally:
+            if sensor is not None:
+                sensor.notify = None
+            self._detach_input()
+            for handle in self._timers.values():
+                handle.cancel()
+            self._timers.clear()
+
+    def timers(self):
+        """Nombres de los temporizadores programados (en reposo y sin viaje activo, ninguno)."""
+        return sorted(self._timers)
+
+    # Entrada
+
+    def _attach_input(self):
+        try:
+            fd = self.stdin.fileno()
+            self._loop.add_reader(fd, self._on_readable, fd)
+            self._reader_fd = fd
+        except (AttributeError, ValueError, OSError, NotImplementedError):
+            # epoll no admite ficheros normales y el bucle de Windows no admite stdin
+            threading.Thread(target=self._read_lines, name='cli-stdin', daemon=True).start()
+
+    def _detach_input(self):
+        if self._reader_fd is not None:
+            self._loop.remove_reader(self._reader_fd)
+            self._reader_fd = None
+
+    def _on_readable(self, fd):
+        data = os.read(fd, 65536)
+        if not data:
+            self._detach_input()
+            self._on_eof()
+            return
+        self._pending += self._decoder.decode(data)
+        while '\n' in self._pending and not self._finished.done():
+            line, self._pending = self._pending.split('\n', 1)
+            self._on_line(line)
+
+    def _read_lines(self):
+        # Hilo lector: bloqueado en readline, sin sondear
+        post = self._loop.call_soon_threadsafe
+        try:
+            for line in iter(self.stdin.readline, ''):
+                post(self._on_line, line.rstrip('\n'))
+            post(self._on_eof)
+        except RuntimeError:
+            # El bucle ya terminó
+            pass
+
+    def _on_line(self, line):
+        if self._finished.done():
+            return
+        self.wakeups += 1
+        self._prompt_shown = False
+        self._status_above = False
+        was_active = self.session.trip.active
+        try:
+            keep_going = self.session.handle(line)
+        except Exception as e:
+            # Un comando que falla no cierra la sesión: se informa y se sigue con la entrada pendiente
+            logging.exception(f"Error ejecutando el comando {line!r}")
+            self.renderer.write(f"❌ Error en el comando '{line}': {e}\n")
+            keep_going = True
+        if not keep_going:
+            self._finish()
+            return
+        if was_active and not self.session.trip.active:
+            # Viaje guardado: volcar el historial cuando la CLI esté en reposo
+            self._timer('history', self.history_flush_delay, self._on_history_flush, restart=True)
+        self._after_event()
+
+    def _on_eof(self):
+        if self._finished.done():
+            return
+        logging.info("Entrada cerrada: se cierra la sesión")
+        self.session.hangup()
+        self._finish()
+
+    def _finish(self):
+        if not self._finished.done():
+            self._finished.set_result(None)
+
+    # Salida
+
+    def _show_prompt(self):
+        renderer = self.renderer
+        if self.session.trip.active and renderer.in_place and not self.session.confirming_exit:
+            # Línea de estado justo encima del prompt: los refrescos la reescriben en su sitio
+            renderer.status(self.session.status_text(self._clock()))
+            self._status_above = True
+        renderer.flush(settle=True)
+        renderer.write(self.session.prompt())
+        renderer.flush()
+        self._prompt_shown = True
+
+    def _interject(self, action):
+        """Ejecutar `action`, que escribe, con el prompt ya mostrado; después se repite el prompt."""
+        if self._finished.done():
+            return
+        self.wakeups += 1
+        if self._prompt_shown:
+            self.renderer.write("\n")
+        self._prompt_shown = False
+        self._status_above = False
+        action()
+        self._after_event()
+
+    def _after_event(self):
+        if self._finished.done():
+            return
+        self._schedule()
+        self._show_prompt()
+
+    # Temporizadores
+
+    def _timer(self, name, delay, callback, restart=False):
+        handle = self._timers.get(name)
+        if delay is None:
+            if handle is not None:
+                handle.cancel()
+                del self._timers[name]
+            return
+        if handle is not None:
+            if not restart:
+                return
+            handle.cancel()
+        self._timers[name] = self._loop.call_later(delay, self._fire, name, callback)
+
+    def _fire(self, name, callback):
+        self._timers.pop(name, None)
+        if not self._finished.done():
+            self.wakeups += 1
+            callback()
+
+    def _schedule(self):
+        session = self.session
+        active = session.trip.active
+        live_status = active and self.renderer.in_place and self.status_interval
+        self._timer('status', self.status_interval if live_status else None, self._on_status_tick)
+        beating = active and session.checkpoint is not None and self.heartbeat_interval
+        self._timer('heartbeat', self.heartbeat_interval if beating else None, self._on_heartbeat)
+        self._timer('tariff', session.next_tariff_boundary(self._clock()), self._on_tariff_boundary,
+                    restart=True)
+        confirming = session.confirming_exit and self.confirm_timeout
+        self._timer('confirm', self.confirm_timeout if confirming else None, self._on_confirm_timeout)
+
+    def _on_status_tick(self):
+        if self._status_above:
+            self.renderer.redraw_above(self.session.status_text(self._clock()))
+        self._schedule()
+
+    def _on_heartbeat(self):
+        self.session.touch(self._clock())
+        self._schedule()
+
+    def _on_tariff_boundary(self):
+        logging.info("Cambio de tramo de tarifa en el viaje en curso")
+        # La tarifa por segundo cambia: republicar el estado en vivo
+        self.session.touch(self._clock())
+        self._on_status_tick()
+
+    def _on_confirm_timeout(self):
+        self._interject(self.session.cancel_exit)
+
+    def _on_history_flush(self):
+        self.session.flush_history()
+
+    # Sensor
+
+    def _notify_sensor(self):
+        # Llamado desde el hilo del sensor
+        try:
+            self._loop.call_soon_threadsafe(self._on_sensor)
+        except RuntimeError:
+            pass
+
+    def _on_sensor(self):
+        if self._finished.done():
+            return
+        # Solo se escribe (y se repite el prompt) si la transición cambió el viaje
+        if self.session.apply_sensor(show=False) is not None:
+            self._interject(lambda: self.session.status_line(self._clock()))
+
+
+def run_cli(session, renderer, stdin=None, **intervals):
+    """Ejecutar la CLI sobre un bucle de asyncio hasta que el usuario salga."""
+    try:
+        asyncio.run(CliEventLoop(session, renderer, stdin, **intervals).run())
+    except KeyboardInterrupt:
+        # Ctrl+C: como una caída, el checkpoint permite recuperar el viaje al volver
+        session.hangup()
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+Historial de viajes compacto (ficheros `.thc`).
+
+Una línea del historial de texto ocupa unos 100 bytes, casi todos etiquetas
+repetidas y la fecha completa, y `Total` es la suma de los otros dos tiempos.
+Aquí cada viaje son cuatro enteros: la fecha como diferencia en segundos con
+el viaje anterior, los tiempos parado y en movimiento en décimas de segundo
+(la resolución del historial de texto) y la tarifa en céntimos. Se escriben
+como varints (7 bits por byte) en zigzag, para admitir diferencias negativas.
+
+Formato:
+    fichero = MAGIC, bloque*
+    bloque  = flags (1 byte: 0 sin comprimir, 1 zlib), viajes (varint),
+              bytes del contenido (varint), contenido
+    contenido = fechas, décimas parado, décimas en movimiento, céntimos:
+                cada columna seguida, `viajes` varints por columna
+
+La primera fecha de cada bloque es absoluta (diferencia con 0), así que los
+bloques son independientes y se pueden añadir al final del fichero. Las
+fechas son segundos desde 1970 de la hora local tal como está escrita, sin
+zona horaria, para que el texto se reconstruya igual. Los varints de un
+bloque se decodifican de una vez con numpy.
+
+`iter_text_lines` reconstruye las líneas del historial de texto (con `Total`
+recalculado de los tiempos redondeados); `history._read_lines` lo usa para
+que la mezcla del historial, las estadísticas, la exportación, el
+repositorio, la re-tarificación y el análisis lean los `.thc` sin cambios.
+
+Uso:
+    python -m src.compact_history compact historial_viajes-2025.txt [--replace]
+    python -m src.compact_history show historial_viajes-2025.thc
+    python -m src.compact_history bench [--trips N]
+"""
+import calendar
+import os
+import sys
+import time
+import zlib
+
+from src.history import HistoryTrip, format_history_line, parse_history_line
+
+COMPACT_EXT = '.thc'
+MAGIC = b'THC1'
+BLOCK_SIZE = 16384
+
+_RAW = 0
+_ZLIB = 1
+_COLUMNS = 4
+
+
+def trip_epoch(timestamp):
+    """Segundos de una fecha del historial ("YYYY-MM-DD HH:MM:SS"), sin zona horaria."""
+    if len(timestamp) != 19 or timestamp[4] != '-' or timestamp[10] != ' ' or timestamp[13] != ':':
+        raise ValueError(f"Fecha del historial no válida: {timestamp!r}")
+    return calendar.timegm((int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                            int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19])))
+
+
+def epoch_timestamp(seconds):
+    """Fecha del historial de unos segundos de `trip_epoch`."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds))
+
+
+def _put_varint(out, value):
+    # zigzag: 0, -1, 1, -2... -> 0, 1, 2, 3...
+    value = (value << 1) ^ (value >> 63)
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def encode_block(trips, compress=True):
+    """Bloque con los viajes `trips`: tuplas (segundos, décimas parado, décimas en movimiento, céntimos)."""
+    payload = bytearray()
+    previous = 0
+    for seconds, _, _, _ in trips:
+        _put_varint(payload, seconds - previous)
+        previous = seconds
+    for column in range(1, _COLUMNS):
+        for trip in trips:
+            _put_varint(payload, trip[column])
+    flags = _RAW
+    if compress:
+        packed = zlib.compress(bytes(payload), 6)
+        if len(packed) < len(payload):
+            payload, flags = packed, _ZLIB
+    header = bytearray([flags])
+    # Contadores sin signo: sin zigzag
+    for value in (len(trips), len(payload)):
+        while value > 0x7f:
+            header.append((value & 0x7f) | 0x80)
+            value >>= 7
+        header.append(value)
+    return bytes(header) + bytes(payload)
+
+
+def iter_blocks(data):
+    """(viajes, contenido descomprimido) de cada bloque de los bytes de un fichero `.thc`."""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("No es un historial compacto (cabecera desconocida)")
+    pos = len(MAGIC)
+    end = len(data)
+    while pos < end:
+        flags = data[pos]
+        count, pos = _read_varint(data, pos + 1)
+        size, pos = _read_varint(data, pos)
+        payload = data[pos:pos + size]
+        if len(payload) != size:
+            raise ValueError("Historial compacto truncado")
+        pos += size
+        if flags == _ZLIB:
+            payload = zlib.decompress(payload)
+        elif flags != _RAW:
+            raise ValueError(f"Bloque con flags desconocidos: {flags}")
+        yield count, payload
+
+
+def decode_block(count, payload):
+    """Columnas (segundos, décimas parado, décimas en movimiento, céntimos) de un bloque, como listas."""
+    values = []
+    pos = 0
+    for _ in range(count * _COLUMNS):
+        value, pos = _read_varint(payload, pos)
+        values.append(_unzigzag(value))
+    seconds = []
+    previous = 0
+    for delta in values[:count]:
+        previous += delta
+        seconds.append(previous)
+    return seconds, values[count:2 * count], values[2 * count:3 * count], values[3 * count:]
+
+
+def decode_block_numpy(np, count, payload):
+    """Como `decode_block`, con arrays de numpy int64 y sin bucles de Python."""
+    data = np.frombuffer(payload, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)[:count * _COLUMNS]
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    used = data[:ends[-1] + 1]
+    lengths = ends - starts + 1
+    if lengths.max() == 1:
+        raw = used.astype(np.int64)
+    else:
+        # Desplazamiento de cada byte dentro de su varint: 0, 7, 14...
+        offsets = np.arange(len(used)) - np.repeat(starts, lengths)
+        parts = (used & 0x7f).astype(np.int64) << (offsets * 7)
+        raw = np.add.reduceat(parts, starts)
+    values = (raw >> 1) ^ -(raw & 1)
+    seconds = np.cumsum(values[:count])
+    return seconds, values[count:2 * count], values[2 * count:3 * count], values[3 * count:]
+
+
+class CompactHistoryWriter:
+    """
+    Escritor de un historial compacto por bloques.
+
+    Los viajes se acumulan en memoria y se escriben al completar un bloque,
+    en `flush` y al cerrar. Si el fichero ya existe los bloques se añaden al
+    final.
+    """
+
+    def __init__(self, path, block_size=BLOCK_SIZE, compress=True):
+        self.path = path
+        self.block_size = block_size
+        self.compress = compress
+        self.trips = 0
+        self._pending = []
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def add(self, timestamp, stopped_time, moving_time, fare):
+        """Añadir un viaje con los valores del historial de texto."""
+        self._pending.append((trip_epoch(timestamp), round(stopped_time * 10), round(moving_time * 10),
+                              round(fare * 100)))
+        self.trips += 1
+        if len(self._pending) >= self.block_size:
+            self.flush()
+
+    def add_line(self, line):
+        """Añadir una línea del historial de texto; False si no tiene formato de viaje."""
+        trip = parse_history_line(line)
+        if trip is None:
+            return False
+        try:
+            self.add(trip.timestamp, trip.stopped_time, trip.moving_time, trip.fare)
+        except ValueError:
+            return False
+        return True
+
+    def flush(self):
+        """Escribir los viajes pendientes como un bloque."""
+        if self._pending:
+            self._file.write(encode_block(self._pending, self.compress))
+            self._pending = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def compact_lines(lines, path, block_size=BLOCK_SIZE, compress=True):
+    """Escribir las líneas de texto `lines` en el historial compacto `path`; devuelve (viajes, líneas omitidas)."""
+    skipped = 0
+    with CompactHistoryWriter(path, block_size, compress) as writer:
+        for line in lines:
+            if line.strip() and not writer.add_line(line):
+                skipped += 1
+    return writer.trips, skipped
+
+
+def compact_path(path):
+    """Ruta del historial compacto de un fichero de texto (`x.txt` -> `x.thc`)."""
+    return os.path.splitext(path)[0] + COMPACT_EXT
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def read_columns(path):
+    """
+    Todo el historial compacto como columnas.
+
+    Con numpy devuelve arrays: `timestamp` (datetime64[s]), `stopped_time` y
+    `moving_time` (float64, segundos) y `fare_cents` (int64); sin numpy,
+    listas con la fecha como texto.
+    """
+    blocks = list(iter_blocks(_read(path)))
+    try:
+        import numpy as np
+    except ImportError:
+        columns = {'timestamp': [], 'stopped_time': [], 'moving_time': [], 'fare_cents': []}
+        for count, payload in blocks:
+            seconds, stopped, moving, cents = decode_block(count, payload)
+            columns['timestamp'].extend(epoch_timestamp(value) for value in seconds)
+            columns['stopped_time'].extend(value / 10 for value in stopped)
+            columns['moving_time'].extend(value / 10 for value in moving)
+            columns['fare_cents'].extend(cents)
+        return columns
+    decoded = [decode_block_numpy(np, count, payload) for count, payload in blocks if count]
+    if decoded:
+        seconds, stopped, moving, cents = (np.concatenate(column) for column in zip(*decoded))
+    else:
+        seconds = stopped = moving = cents = np.zeros(0, dtype=np.int64)
+    return {
+        'timestamp': seconds.astype('datetime64[s]'),
+        'stopped_time': stopped / 10,
+        'moving_time': moving / 10,
+        'fare_cents': cents,
+    }
+
+
+def iter_trips(path):
+    """Viajes del historial compacto como `HistoryTrip`, en el orden del fichero."""
+    for count, payload in iter_blocks(_read(path)):
+        seconds, stopped, moving, cents = decode_block(count, payload)
+        for when, stopped_ds, moving_ds, fare_cents in zip(seconds, stopped, moving, cents):
+            yield HistoryTrip(epoch_timestamp(when), stopped_ds / 10, moving_ds / 10,
+                              (stopped_ds + moving_ds) / 10, fare_cents / 100)
+
+
+def iter_text_lines(path):
+    """Líneas del historial de texto (con salto de línea) reconstruidas del historial compacto."""
+    try:
+        import numpy as np
+    except ImportError:
+        for trip in iter_trips(path):
+            yield format_history_line(trip.timestamp, trip.stopped_time, trip.moving_time, trip.fare) + "\n"
+        return
+    for count, payload in iter_blocks(_read(path)):
+        if not count:
+            continue
+        seconds, stopped, moving, cents = decode_block_numpy(np, count, payload)
+        timestamps = np.datetime_as_string(seconds.astype('datetime64[s]')).tolist()
+        for when, stopped_ds, moving_ds, fare_cents in zip(timestamps, stopped.tolist(), moving.tolist(),
+                                                           cents.tolist()):
+            yield format_history_line(when.replace('T', ' '), stopped_ds / 10, moving_ds / 10, fare_cents / 100) + "\n"
+
+
+def render_text(path, out):
+    """Escribir el historial compacto como texto en el fichero abierto `out`; devuelve cuántos viajes."""
+    rendered = 0
+    for line in iter_text_lines(path):
+        out.write(line)
+        rendered += 1
+    return rendered
+
+
+def benchmark(trips=200_000, block_size=BLOCK_SIZE):
+    """Tamaño del texto y del compacto y velocidad de decodificación (texto equivalente por segundo)."""
+    import random
+    import tempfile
+    rng = random.Random(0)
+    lines = []
+    when = trip_epoch("2025-01-01 06:00:00")
+    for _ in range(trips):
+        when += int(rng.expovariate(1 / 600))
+        stopped, moving = round(rng.expovariate(1 / 300), 1), round(rng.expovariate(1 / 900), 1)
+        lines.append(format_history_line(epoch_timestamp(when), stopped, moving,
+                                         round(stopped * 0.02 + moving * 0.05, 2)) + "\n")
+    text_bytes = sum(len(line.encode('utf-8')) for line in lines)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'historial' + COMPACT_EXT)
+        started = time.perf_counter()
+        compact_lines(lines, path, block_size)
+        encode_s = time.perf_counter() - started
+        compact_bytes = os.path.getsize(path)
+        started = time.perf_counter()
+        columns = read_columns(path)
+        decode_s = time.perf_counter() - started
+        assert len(columns['fare_cents']) == trips
+    return text_bytes, compact_bytes, encode_s, decode_s
+
+
+def main(argv=None):
+    """Punto de entrada de línea de comandos."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Historial de viajes compacto")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    compact = subparsers.add_parser('compact', help="convertir ficheros de historial de texto a .thc")
+    compact.add_argument('paths', nargs='+')
+    compact.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+    compact.add_argument('--no-zlib', action='store_true', help="bloques sin comprimir")
+    compact.add_argument('--replace', action='store_true', help="borrar el texto tras convertirlo")
+    show = subparsers.add_parser('show', help="mostrar un historial compacto como texto")
+    show.add_argument('path')
+    bench = subparsers.add_parser('bench', help="tamaño y velocidad con viajes sintéticos")
+    bench.add_argument('--trips', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    if args.mode == 'show':
+        render_text(args.path, sys.stdout)
+        return 0
+    if args.mode == 'bench':
+        text_bytes, compact_bytes, encode_s, decode_s = benchmark(args.trips)
+        print(f"texto          {text_bytes:14,d} bytes")
+        print(f"compacto       {compact_bytes:14,d} bytes (x{text_bytes / compact_bytes:.1f} menos)")
+        print(f"codificar      {args.trips / encode_s:14,.0f} viajes/s")
+        print(f"decodificar    {args.trips / decode_s:14,.0f} viajes/s "
+              f"({text_bytes / decode_s / 1e6:,.0f} MB/s de texto equivalente)")
+        return 0
+    for path in args.paths:
+        target = compact_path(path)
+        if os.path.exists(target):
+            print(f"{target}: ya existe, se omite")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            trips, skipped = compact_lines(f, target, args.block_size, not args.no_zlib)
+        before, after = os.path.getsize(path), os.path.getsize(target)
+        print(f"{path} -> {target}: {trips} viajes, {before:,d} -> {after:,d} bytes"
+              + (f", {skipped} líneas sin formato omitidas" if skipped else ""))
+        if args.replace and not skipped:
+            os.remove(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Salida de consola con búfer y frecuencia de refresco acotada.
+
+Cuando el taxímetro lo manejan scripts o un sensor, escribir en la terminal
+con muchos `print` pequeños acaba siendo el cuello de botella. El
+renderizador acumula el texto y lo escribe de una vez como mucho
+`max_fps` veces por segundo. Las actualizaciones de estado se agrupan: entre
+dos refrescos solo se muestra la última, en una línea que se redibuja en su
+sitio (o, si la salida no es una terminal, como una línea normal cuando
+cambia). Así el coste de la salida es constante aunque lleguen miles de
+eventos por segundo.
+"""
+import sys
+import threading
+import time
+
+# Borrar hasta el final de la línea (la línea de estado nueva puede ser más corta)
+CLEAR_LINE = "\x1b[K"
+
+
+class ConsoleRenderer:
+    """
+    Búfer de salida con una línea de estado que se refresca en su sitio.
+
+    `write` añade texto y `status` sustituye la línea de estado pendiente;
+    ninguno de los dos escribe si no ha pasado un intervalo de refresco desde
+    la última escritura. `flush` escribe lo pendiente en una sola llamada.
+    Con `start` un hilo refresca lo que quede pendiente tras una ráfaga.
+    Sin `stream` se escribe en el `sys.stdout` de cada momento.
+    """
+
+    def __init__(self, stream=None, max_fps=10.0, clock=time.monotonic, in_place=None):
+        self._stream = stream
+        self.interval = 1.0 / max_fps
+        self._clock = clock
+        if in_place is None:
+            isatty = getattr(self.stream, 'isatty', None)
+            in_place = bool(isatty and isatty())
+        self.in_place = in_place
+        self._chunks = []
+        self._status = None
+        self._shown = None
+        self._last_line = None
+        self._last_flush = float('-inf')
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.frames = 0
+        self.coalesced = 0
+
+    @property
+    def stream(self):
+        return self._stream if self._stream is not None else sys.stdout
+
+    def write(self, text):
+        """Añadir texto a la salida."""
+        with self._lock:
+            if self._status is not None and not self.in_place:
+                # Sin terminal el estado es una línea más: se queda antes del texto nuevo
+                self._append_status_line(self._status)
+                self._status = None
+            self._chunks.append(text)
+            self._flush_if_due()
+
+    def status(self, line):
+        """Sustituir la línea de estado (las que no llegan a mostrarse se descartan)."""
+        with self._lock:
+            if self._status is not None:
+                self.coalesced += 1
+            self._status = line
+            self._flush_if_due()
+
+    def _append_status_line(self, status):
+        if status != self._last_line:
+            self._chunks.append(status + "\n")
+            self._last_line = status
+
+    def _flush_if_due(self):
+        if self._clock() - self._last_flush >= self.interval:
+            self._flush(settle=False)
+
+    def flush(self, settle=False):
+        """
+        Escribir ya lo pendiente.
+
+        Con `settle` la línea de estado deja de redibujarse en su sitio y se
+        termina con un salto de línea (antes de pedir datos al usuario).
+        """
+        with self._lock:
+            self._flush(settle)
+
+    def _flush(self, settle):
+        status, self._status = self._status, None
+        if status is not None and not self.in_place:
+            self._append_status_line(status)
+            status = None
+        text = ''.join(self._chunks)
+        self._chunks.clear()
+        self._last_flush = self._clock()
+        if text or status is not None or (settle and self._shown is not None):
+            self._emit(text, status, settle)
+            self.frames += 1
+
+    def _emit(self, text, status, settle):
+        out = []
+        if self.in_place:
+            if text and self._shown is not None:
+                # El texto va encima de la línea de estado, que se redibuja debajo
+                out.append("\r" + CLEAR_LINE)
+                if status is None:
+                    status = self._shown
+            out.append(text)
+            if status is not None:
+                out.append(f"\r{status}{CLEAR_LINE}")
+                self._shown = status
+            if settle and self._shown is not None:
+                out.append("\n")
+                self._shown = None
+        else:
+            out.append(text)
+        stream = self.stream
+        stream.write(''.join(out))
+        stream.flush()
+
+    def redraw_above(self, line):
+        """
+        Reescribir la línea anterior a la del cursor y volver a donde estaba.
+
+        Sirve para refrescar la línea de estado mientras el usuario escribe en
+        el prompt de debajo sin borrar lo que lleva escrito. Solo en terminal;
+        devuelve False si no se pudo.
+        """
+        if not self.in_place:
+            return False
+        with self._lock:
+            self._flush(settle=False)
+            stream = self.stream
+            # Guardar cursor, subir una línea, reescribirla y restaurar el cursor
+            stream.write(f"\x1b7\x1b[1A\r{line}{CLEAR_LINE}\x1b8")
+            stream.flush()
+            self.frames += 1
+        return True
+
+    def start(self):
+        """Refrescar en segundo plano lo que quede pendiente tras una ráfaga."""
+        self._thread = threading.Thread(target=self._run, name='console-renderer', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            with self._lock:
+                if self._chunks or self._status is not None:
+                    self._flush(settle=False)
+
+    def close(self):
+        """Parar el hilo de refresco y escribir lo pendiente."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(settle=True)
+
+
+class RichLiveRenderer(ConsoleRenderer):
+    """
+    Variante que dibuja la línea de estado con `rich.live.Live`.
+
+    El texto se imprime por encima de la zona en vivo; rich se encarga de
+    redibujarla. Los refrescos siguen limitados por `max_fps`.
+    """
+
+    def __init__(self, console, max_fps=10.0, clock=time.monotonic):
+        from rich.live import Live
+        from rich.text import Text
+        super().__init__(console.file, max_fps, clock, in_place=True)
+        self._text = Text
+        self._console = console
+        self._live = Live(console=console, auto_refresh=False, transient=True, redirect_stdout=False)
+        self._live.start()
+
+    def _emit(self, text, status, settle):
+        if text:
+            self._console.print(self._text.from_ansi(text), end='')
+        if status is not None:
+            self._shown = status
+            self._live.update(self._text.from_ansi(status), refresh=True)
+        if settle and self._shown is not None:
+            # La línea de estado queda impresa y la zona en vivo se vacía
+            self._console.print(self._text.from_ansi(self._shown))
+            self._live.update(self._text(""), refresh=True)
+            self._shown = None
+
+    def redraw_above(self, line):
+        # rich redibuja la zona en vivo por su cuenta
+        return False
+
+    def close(self):
+        super().close()
+        self._live.stop()
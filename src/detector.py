@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Detección automática de parado/en movimiento a partir de un sensor.
+
+Sustituye a los comandos manuales `stop`/`move` (o al botón de la GUI)
+cuando el taxi dispone de un sensor de velocidad u odómetro. Cada muestra
+``timestamp,valor`` se procesa en O(1): un umbral doble (histéresis) decide
+el estado candidato y el antirrebote exige que se mantenga `debounce_s`
+segundos antes de emitir la transición. La transición se emite con el
+instante en que empezó la condición, así que el tiempo facturado en cada
+estado no depende del antirrebote ni de cuándo se aplique.
+
+Uso (benchmark):
+    python -m src.detector [--samples N]
+"""
+import argparse
+import logging
+import math
+import queue
+import sys
+import threading
+import time
+
+
+class SpeedStateDetector:
+    """
+    Detector de estado a partir de muestras de velocidad (km/h).
+
+    `update` devuelve ``(estado, instante)`` cuando se confirma un cambio de
+    estado y None en el resto de muestras.
+    """
+
+    def __init__(self, stop_kmh=3.0, move_kmh=8.0, debounce_s=2.0, state='stopped'):
+        if stop_kmh >= move_kmh:
+            raise ValueError("stop_kmh debe ser menor que move_kmh (histéresis)")
+        self.stop_kmh = stop_kmh
+        self.move_kmh = move_kmh
+        self.debounce_s = debounce_s
+        self.state = state
+        self._candidate = None
+        self._candidate_since = 0.0
+
+    def update(self, timestamp, speed_kmh):
+        """Procesar una muestra de velocidad."""
+        if speed_kmh > self.move_kmh:
+            candidate = 'moving'
+        elif speed_kmh < self.stop_kmh:
+            candidate = 'stopped'
+        else:
+            # Entre umbrales no hay evidencia nueva: se mantiene lo pendiente
+            candidate = self._candidate
+        if candidate is None or candidate == self.state:
+            self._candidate = None
+            return None
+        if candidate != self._candidate:
+            self._candidate = candidate
+            self._candidate_since = timestamp
+        if timestamp - self._candidate_since < self.debounce_s:
+            return None
+        self.state = candidate
+        self._candidate = None
+        return candidate, self._candidate_since
+
+
+class OdometerStateDetector:
+    """
+    Detector de estado a partir de lecturas de un odómetro (km acumulados).
+
+    La velocidad se deriva de la diferencia con la lectura anterior y se
+    delega en un SpeedStateDetector.
+    """
+
+    def __init__(self, stop_kmh=3.0, move_kmh=8.0, debounce_s=2.0, state='stopped'):
+        self.speed = SpeedStateDetector(stop_kmh, move_kmh, debounce_s, state)
+        self._last_time = None
+        self._last_km = 0.0
+
+    @property
+    def state(self):
+        return self.speed.state
+
+    def update(self, timestamp, odometer_km):
+        """Procesar una lectura del odómetro."""
+        last_time, last_km = self._last_time, self._last_km
+        self._last_time, self._last_km = timestamp, odometer_km
+        if last_time is None or timestamp <= last_time:
+            return None
+        return self.speed.update(timestamp, (odometer_km - last_km) / (timestamp - last_time) * 3600.0)
+
+
+DETECTORS = {
+    'speed': SpeedStateDetector,
+    'odometer': OdometerStateDetector,
+}
+
+
+def parse_sample(line):
+    """Parsear una línea ``timestamp,valor``; None si no es válida."""
+    parts = line.strip().split(',')
+    if len(parts) != 2:
+        return None
+    try:
+        return float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+
+
+def stream_samples(stream):
+    """Muestras de un fichero abierto o de una tubería, línea a línea."""
+    for line in stream:
+        sample = parse_sample(line)
+        if sample is not None:
+            yield sample
+
+
+def file_samples(path):
+    """Muestras de un fichero o de una tubería con nombre (FIFO)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from stream_samples(f)
+
+
+def simulated_samples(profile, rate_hz=10.0, start=None, realtime=True):
+    """
+    Muestras de velocidad simuladas.
+
+    `profile` es una secuencia de ``(segundos, km/h)``. Con `realtime` las
+    muestras se entregan al ritmo del reloj y con marcas de tiempo reales.
+    """
+    now = time.time() if start is None else start
+    period = 1.0 / rate_hz
+    for duration, speed_kmh in profile:
+        for _ in range(max(1, int(duration * rate_hz))):
+            if realtime:
+                time.sleep(period)
+                now = time.time()
+            else:
+                now += period
+            yield now, speed_kmh
+
+
+def open_source(source):
+    """Fuente de muestras a partir de su descripción (ruta o 'sim')."""
+    if source == 'sim':
+        # Ciclo urbano: semáforo, avenida, atasco, calle
+        return simulated_samples([(5, 0.0), (20, 35.0), (10, 5.0), (5, 0.0), (30, 25.0)] * 1000)
+    return file_samples(source)
+
+
+class SensorFeed:
+    """
+    Hilo que lee una fuente de muestras y encola las transiciones detectadas.
+
+    El hilo no toca el taxímetro: la interfaz vacía la cola con `drain` desde
+    su propio bucle y aplica cada transición con su instante original. Si se
+    asigna `notify`, el hilo la llama tras encolar cada transición (para
+    despertar un bucle de eventos sin sondear la cola).
+    """
+
+    def __init__(self, samples, detector):
+        self.detector = detector
+        self._samples = samples
+        self._transitions = queue.SimpleQueue()
+        self._stopping = threading.Event()
+        self.notify = None
+        self._thread = threading.Thread(target=self._run, name='sensor-feed', daemon=True)
+
+    @property
+    def state(self):
+        """Último estado confirmado por el detector."""
+        return self.detector.state
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        update = self.detector.update
+        put = self._transitions.put
+        try:
+            for timestamp, value in self._samples:
+                if self._stopping.is_set():
+                    break
+                transition = update(timestamp, value)
+                if transition is not None:
+                    put(transition)
+                    if self.notify is not None:
+                        self.notify()
+        except OSError as e:
+            logging.warning(f"Fuente del sensor no disponible: {e}")
+
+    def drain(self):
+        """Devolver las transiciones pendientes, en orden."""
+        transitions = []
+        while True:
+            try:
+                transitions.append(self._transitions.get_nowait())
+            except queue.Empty:
+                return transitions
+
+    def take_distance(self):
+        """Distancia recorrida desde la llamada anterior: un sensor de estado no la mide."""
+        return 0.0
+
+    def stop(self):
+        self._stopping.set()
+
+
+def benchmark(samples=1_000_000, detector=None):
+    """Muestras por segundo que procesa un detector (una muestra cada 10 ms)."""
+    detector = detector or SpeedStateDetector()
+    update = detector.update
+    speeds = [0.0 if (i // 500) % 2 else 30.0 + 5.0 * math.sin(i) for i in range(samples)]
+    started = time.perf_counter()
+    for i, speed in enumerate(speeds):
+        update(i * 0.01, speed)
+    return samples / (time.perf_counter() - started)
+
+
+def main(argv=None):
+    """Punto de entrada del benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark del detector de parado/en movimiento")
+    parser.add_argument('--samples', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    for name, detector in DETECTORS.items():
+        rate = benchmark(args.samples, detector())
+        print(f"{name:10} {rate / 1e6:6.2f} M muestras/s ({1e9 / rate:.0f} ns por muestra)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
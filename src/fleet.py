@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor de taxímetros de una flota repartido en varios procesos.
+
+Un solo proceso de Python está limitado por el GIL. El supervisor arranca N
+procesos trabajadores y cada uno es dueño de una parte de los taxis, elegida
+con un anillo de hash consistente sobre el id del taxi: su estado de
+taxímetro vive solo en ese proceso y sus viajes terminados se escriben en el
+fichero de historial del trabajador (`historial/fleet-<n>.txt`). Los comandos
+viajan por pipes en lotes: el supervisor agrupa los de cada trabajador, se
+los envía a todos y después recoge las respuestas, así los trabajadores
+procesan sus lotes en paralelo.
+
+Parada ordenada: cada trabajador finaliza los viajes activos (se guardan en
+el historial) o los deja en checkpoints (`cab-<id>.ckpt`) que el dueño de
+cada taxi recupera al volver a arrancar, aunque cambie el número de
+trabajadores. El servidor solo escribe el historial de texto; el repositorio
+SQLite lo importa como el resto del historial.
+
+Uso:
+    python -m src.fleet serve --workers 4      comandos por stdin: "<taxi> <comando> [perfil]"
+    python -m src.fleet bench --workers 1 2 4  comandos por segundo con cada número de trabajadores
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+from src.checkpoint import CHECKPOINT_SUFFIX, TripCheckpoint, read_checkpoint
+from src.history import fleet_shard_path, format_history_line
+from src.meter import RunningFare
+from src.trip import EVENTS, FINISH, START, Trip
+from src.rules import CompiledProfile
+
+COMMANDS = ('start', 'stop', 'move', 'finish', 'profile', 'status')
+
+# Respuesta a un comando: `value` es la tarifa en finish, (estado, estimación) en
+# status, el perfil en profile y el motivo del error si ok es False
+Reply = namedtuple('Reply', ['cab_id', 'command', 'ok', 'value'])
+
+ShutdownReport = namedtuple('ShutdownReport', ['finalized', 'checkpointed'])
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Anillo de hash consistente de taxis a trabajadores.
+
+    Cada trabajador ocupa `replicas` puntos del anillo; un taxi pertenece al
+    primer punto a partir de su hash. Al añadir un trabajador solo cambian de
+    dueño alrededor de 1/N taxis.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        points = sorted((_hash(f"worker-{node}:{replica}"), node)
+                        for node in range(nodes) for replica in range(replicas))
+        self._keys = [key for key, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, cab_id):
+        """Trabajador dueño del taxi `cab_id`."""
+        i = bisect_right(self._keys, _hash(str(cab_id)))
+        return self._nodes[i % len(self._nodes)]
+
+
+def _checkpoint_cab(name):
+    # "cab-17.ckpt" -> "17"
+    return name[len('cab-'):-len(CHECKPOINT_SUFFIX)]
+
+
+class CabMeter:
+    """Viaje de un taxi dentro de un trabajador."""
+
+    __slots__ = ('trip', 'profile', 'checkpoint_path')
+
+    def __init__(self, trip, profile, checkpoint_path=None):
+        self.trip = trip
+        self.profile = profile
+        # Checkpoint recuperado al arrancar: se borra cuando el viaje termina
+        self.checkpoint_path = checkpoint_path
+
+
+class FleetWorker:
+    """
+    Taxímetros de los taxis de un shard.
+
+    Se ejecuta dentro de su proceso trabajador; también se puede usar
+    directamente (sin procesos) para pruebas.
+    """
+
+    def __init__(self, index, ring, profiles, shard_dir, checkpoint_dir, default_profile='normal'):
+        self.index = index
+        self.ring = ring
+        self.profiles = profiles
+        self.default_profile = default_profile
+        self.checkpoint_dir = checkpoint_dir
+        self.meters = {}
+        # Cada perfil se compila una vez por proceso
+        self.evaluators = {key: CompiledProfile(profile, key) for key, profile in profiles.items()}
+        os.makedirs(shard_dir, exist_ok=True)
+        self._history = open(fleet_shard_path(shard_dir, index), 'a', encoding='utf-8')
+
+    def _new_fare(self, profile):
+        rates = self.profiles[profile]
+        return RunningFare(rates["stopped"], rates["moving"], rates.get("km", 0.0), self.evaluators[profile])
+
+    def restore(self, now=None):
+        """
+        Recuperar los viajes de este shard que quedaron en checkpoints; devuelve cuántos.
+
+        Como con los huérfanos de la CLI, el tiempo entre el último latido y
+        `now` (el trabajador caído) no se cobra: el viaje se reanuda en `now`.
+        """
+        if not os.path.isdir(self.checkpoint_dir):
+            return 0
+        now = time.time() if now is None else now
+        restored = 0
+        with os.scandir(self.checkpoint_dir) as entries:
+            for entry in entries:
+                if not (entry.name.startswith('cab-') and entry.name.endswith(CHECKPOINT_SUFFIX)):
+                    continue
+                cab_id = _checkpoint_cab(entry.name)
+                if self.ring.owner(cab_id) != self.index:
+                    continue
+                record = read_checkpoint(entry.path)
+                if record is None or record.state is None:
+                    continue
+                profile = record.profile if record.profile in self.profiles else self.default_profile
+                trip = Trip(self._new_fare(profile))
+                trip.restore(*record.restore_args(now))
+                self.meters[cab_id] = CabMeter(trip, profile, entry.path)
+                restored += 1
+        return restored
+
+    def handle(self, cab_id, command, arg=None, at=None):
+        """Ejecutar un comando de un taxi y devolver su Reply."""
+        now = time.time() if at is None else at
+        meter = self.meters.get(cab_id)
+        if command == 'profile':
+            if arg not in self.profiles:
+                return Reply(cab_id, command, False, f"perfil desconocido: {arg}")
+            if meter is None:
+                # El perfil de un viaje nuevo va en `start <perfil>`
+                return Reply(cab_id, command, False, "sin viaje activo")
+            rates = self.profiles[arg]
+            meter.trip.fare.set_rates(rates["stopped"], rates["moving"], rates.get("km", 0.0), self.evaluators[arg])
+            meter.profile = arg
+            return Reply(cab_id, command, True, arg)
+        if command == 'status':
+            if meter is None:
+                return Reply(cab_id, command, False, "sin viaje activo")
+            return Reply(cab_id, command, True, (meter.trip.state, meter.trip.fare.estimate(now)))
+        if command not in COMMANDS:
+            return Reply(cab_id, command, False, f"comando desconocido: {command}")
+
+        # start/stop/move/finish: las reglas son las de la máquina de estados del viaje
+        event = EVENTS[command]
+        # start [perfil] [etiquetas...]
+        words = arg.split() if arg else []
+        if meter is None:
+            profile = words.pop(0) if words and words[0] in self.profiles else self.default_profile
+            meter = CabMeter(Trip(self._new_fare(profile)), profile)
+        trip = meter.trip
+        if not trip.fire(event, now):
+            return Reply(cab_id, command, False, "viaje ya activo" if trip.active else "sin viaje activo")
+        if event == START:
+            trip.fare.set_tags(word.lower() for word in words)
+            self.meters[cab_id] = meter
+        elif event == FINISH:
+            return Reply(cab_id, command, True, self._finish(cab_id, meter, now))
+        return Reply(cab_id, command, True, trip.state)
+
+    def _finish(self, cab_id, meter, now):
+        trip = meter.trip
+        if trip.active:
+            trip.fire(FINISH, now)
+        fare = trip.fare
+        total = self.evaluators[meter.profile].fare(fare.stopped_time, fare.moving_time, fare.distance_km, fare.tags)
+        timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        self._history.write(format_history_line(timestamp, fare.stopped_time, fare.moving_time, total) + "\n")
+        del self.meters[cab_id]
+        if meter.checkpoint_path is not None:
+            try:
+                os.remove(meter.checkpoint_path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def run_batch(self, commands):
+        """Ejecutar un lote de comandos (cab_id, comando, arg, instante) en orden."""
+        handle = self.handle
+        replies = [handle(*command) for command in commands]
+        # Un volcado por lote: los viajes terminados quedan en disco al responder
+        self._history.flush()
+        return replies
+
+    def shutdown(self, finalize=True, now=None):
+        """Finalizar o dejar en checkpoint los viajes activos y cerrar el historial."""
+        now = time.time() if now is None else now
+        finalized = checkpointed = 0
+        for cab_id, meter in list(self.meters.items()):
+            if finalize:
+                self._finish(cab_id, meter, now)
+                finalized += 1
+            else:
+                meter.trip.fare.close(now)
+                checkpoint = TripCheckpoint.create(self.checkpoint_dir, f"cab-{cab_id}")
+                checkpoint.save(meter.trip.fare, meter.profile, now)
+                checkpoint.close()
+                checkpointed += 1
+        self.meters.clear()
+        self._history.close()
+        return ShutdownReport(finalized, checkpointed)
+
+
+def _worker_main(conn, index, workers, replicas, profiles, shard_dir, checkpoint_dir):
+    """Bucle de un proceso trabajador: lotes de comandos hasta la orden de parada."""
+    # Ctrl+C llega a todo el grupo de procesos: la parada la coordina el supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = FleetWorker(index, HashRing(workers, replicas), profiles, shard_dir, checkpoint_dir)
+    worker.restore()
+    while True:
+        op, payload = conn.recv()
+        if op == 'batch':
+            conn.send(worker.run_batch(payload))
+        elif op == 'shutdown':
+            conn.send(worker.shutdown(*payload))
+            break
+    conn.close()
+
+
+def _profile_table(profiles):
+    # Solo lo necesario para tarificar: se envía a cada proceso
+    keys = ('stopped', 'moving', 'km', 'rules')
+    return {name: {key: profile[key] for key in keys if key in profile} for name, profile in profiles.items()}
+
+
+class FleetSupervisor:
+    """
+    Supervisor de los procesos trabajadores de la flota.
+
+    `execute` reparte un lote de comandos por dueño y devuelve las respuestas
+    en el orden de entrada; los comandos de un mismo taxi se ejecutan en orden.
+    """
+
+    def __init__(self, workers, profiles, shard_dir, checkpoint_dir, replicas=64):
+        self.workers = workers
+        self.ring = HashRing(workers, replicas)
+        self._replicas = replicas
+        self._profiles = _profile_table(profiles)
+        self._shard_dir = shard_dir
+        self._checkpoint_dir = checkpoint_dir
+        self._owners = {}
+        self._conns = []
+        self._processes = []
+
+    def start(self):
+        for index in range(self.workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker_main, name=f'fleet-worker-{index}',
+                args=(child, index, self.workers, self._replicas, self._profiles,
+                      self._shard_dir, self._checkpoint_dir))
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+        return self
+
+    def owner(self, cab_id):
+        """Trabajador dueño de `cab_id` (cacheado: el anillo no cambia mientras el servidor vive)."""
+        owner = self._owners.get(cab_id)
+        if owner is None:
+            owner = self._owners[cab_id] = self.ring.owner(cab_id)
+        return owner
+
+    def execute(self, commands):
+        """Ejecutar comandos (cab_id, comando, arg, instante) y devolver sus Reply en el mismo orden."""
+        groups = [[] for _ in range(self.workers)]
+        positions = [[] for _ in range(self.workers)]
+        owner = self.owner
+        for position, command in enumerate(commands):
+            worker = owner(command[0])
+            groups[worker].append(command)
+            positions[worker].append(position)
+        # Primero se envían todos los lotes y luego se recogen: los trabajadores van en paralelo
+        for conn, group in zip(self._conns, groups):
+            if group:
+                conn.send(('batch', group))
+        replies = [None] * len(commands)
+        for conn, group, where in zip(self._conns, groups, positions):
+            if group:
+                for position, reply in zip(where, conn.recv()):
+                    replies[position] = reply
+        return replies
+
+    def send(self, cab_id, command, arg=None):
+        """Ejecutar un solo comando ahora."""
+        return self.execute([(str(cab_id), command, arg, None)])[0]
+
+    def shutdown(self, finalize=True):
+        """
+        Parada ordenada: finalizar (o dejar en checkpoint) los viajes activos.
+
+        Devuelve un ShutdownReport con los totales de todos los trabajadores.
+        """
+        now = time.time()
+        for conn in self._conns:
+            conn.send(('shutdown', (finalize, now)))
+        finalized = checkpointed = 0
+        for conn, process in zip(self._conns, self._processes):
+            report = conn.recv()
+            finalized += report.finalized
+            checkpointed += report.checkpointed
+            conn.close()
+            process.join()
+        self._conns, self._processes = [], []
+        return ShutdownReport(finalized, checkpointed)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        if self._conns:
+            self.shutdown()
+
+
+def benchmark(workers, profiles, cabs=2000, trips=10, switches=8, batch_size=5000):
+    """
+    Comandos por segundo de una flota con `workers` procesos.
+
+    Cada taxi hace `trips` viajes de `switches` cambios de estado; los
+    comandos se envían en lotes de `batch_size` intercalando taxis.
+    """
+    directory = tempfile.mkdtemp(prefix='fleet-bench-')
+    try:
+        commands = []
+        at = 1_700_000_000.0
+        for _ in range(trips):
+            for step in ['start'] + ['move', 'stop'] * (switches // 2) + ['finish']:
+                at += 1.0
+                commands.extend((str(cab), step, None, at) for cab in range(cabs))
+        with FleetSupervisor(workers, profiles, os.path.join(directory, 'historial'),
+                             os.path.join(directory, 'checkpoints')) as supervisor:
+            started = time.perf_counter()
+            for i in range(0, len(commands), batch_size):
+                supervisor.execute(commands[i:i + batch_size])
+            elapsed = time.perf_counter() - started
+        return len(commands) / elapsed
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _parse_command(line):
+    parts = line.split()
+    if len(parts) < 2:
+        return None
+    return (parts[0], parts[1].lower(), ' '.join(parts[2:]) or None, None)
+
+
+def serve(supervisor, lines, out):
+    """Ejecutar comandos "<taxi> <comando> [perfil] [etiquetas...]" línea a línea y escribir las respuestas."""
+    for line in lines:
+        command = _parse_command(line)
+        if command is None:
+            continue
+        reply = supervisor.execute([command])[0]
+        status = 'ok' if reply.ok else 'error'
+        out.write(f"{reply.cab_id} {reply.command} {status} {reply.value}\n")
+        out.flush()
+
+
+def main(argv=None):
+    """Punto de entrada de línea de comandos (servidor y benchmark)."""
+    from config import settings
+    from main import PRICE_PROFILES
+
+    parser = argparse.ArgumentParser(description="Servidor de taxímetros de una flota en varios procesos")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    serve_parser = subparsers.add_parser('serve', help="comandos por stdin: <taxi> <comando> [perfil] [etiquetas...]")
+    serve_parser.add_argument('--workers', type=int, default=settings.FLEET_WORKERS)
+    serve_parser.add_argument('--finalize', action='store_true',
+                              help="al parar, finalizar los viajes activos en vez de dejarlos en checkpoint")
+    bench_parser = subparsers.add_parser('bench', help="rendimiento con distintos números de trabajadores")
+    bench_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    bench_parser.add_argument('--cabs', type=int, default=2000)
+    bench_parser.add_argument('--trips', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.mode == 'bench':
+        baseline = None
+        for workers in args.workers:
+            rate = benchmark(workers, PRICE_PROFILES, cabs=args.cabs, trips=args.trips)
+            baseline = baseline or rate
+            print(f"{workers:3d} trabajadores: {rate:12,.0f} comandos/s  (x{rate / baseline:.2f})")
+        return 0
+
+    supervisor = FleetSupervisor(args.workers, PRICE_PROFILES, settings.HISTORY_SHARD_DIR,
+                                 settings.FLEET_CHECKPOINT_DIR).start()
+    # SIGTERM también hace una parada ordenada
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(supervisor, sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        report = supervisor.shutdown(finalize=args.finalize)
+        print(f"Parada ordenada: {report.finalized} viajes finalizados, "
+              f"{report.checkpointed} en checkpoint", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
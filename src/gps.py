@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Ingesta de posiciones GPS para el componente por distancia de la tarifa.
+
+Las posiciones llegan por lotes (de un fichero o de un socket UDP local) con
+una línea CSV por posición: ``cab_id,timestamp,lat,lon``. Por cada lote se
+calcula con un haversine vectorizado la distancia desde la posición anterior
+de cada taxi, y la velocidad decide el estado parado/en movimiento con
+histéresis: se pasa a movimiento por encima de `move_kmh` y a parado por
+debajo de `stop_kmh`; entre ambos umbrales se mantiene el estado anterior.
+
+Con numpy todo el lote se procesa con operaciones vectoriales (miles de
+posiciones por milisegundo); sin numpy se usa un bucle equivalente.
+
+El taxímetro usa el GPS como fuente del sensor (`SENSOR_KIND = 'gps'`):
+`GpsFeed` sigue las posiciones de su taxi y entrega las transiciones con la
+misma interfaz que `SensorFeed`, más la distancia recorrida.
+"""
+import logging
+import math
+import queue
+import socket
+import threading
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+
+STOPPED = 0
+MOVING = 1
+STATE_NAMES = {STOPPED: 'stopped', MOVING: 'moving'}
+
+Transition = namedtuple('Transition', ['cab_id', 'state', 'timestamp'])
+BatchResult = namedtuple('BatchResult', ['transitions', 'distances'])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia en km entre dos posiciones (escalares o arrays de numpy)."""
+    if np is not None and isinstance(lat1, np.ndarray):
+        lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GpsIngestor:
+    """
+    Estado por taxi de la ingesta GPS: última posición, estado y distancia.
+
+    `feed` recibe un lote en columnas y devuelve las transiciones de estado
+    y la distancia recorrida por cada taxi del lote.
+    """
+
+    def __init__(self, stop_kmh=3.0, move_kmh=8.0):
+        if stop_kmh >= move_kmh:
+            raise ValueError("stop_kmh debe ser menor que move_kmh (histéresis)")
+        self.stop_kmh = stop_kmh
+        self.move_kmh = move_kmh
+        self._slots = {}
+        self._cab_ids = []
+        self._last = []  # [lat, lon, timestamp, state] por ranura
+        self.distance_km = []
+
+    def _slot(self, cab_id):
+        slot = self._slots.get(cab_id)
+        if slot is None:
+            slot = self._slots[cab_id] = len(self._cab_ids)
+            self._cab_ids.append(cab_id)
+            self._last.append([math.nan, math.nan, math.nan, STOPPED])
+            self.distance_km.append(0.0)
+        return slot
+
+    def state(self, cab_id):
+        """Estado actual ('stopped'/'moving') de `cab_id`; parado si aún no hay posiciones."""
+        slot = self._slots.get(cab_id)
+        return STATE_NAMES[STOPPED if slot is None else self._last[slot][3]]
+
+    def total_distance(self, cab_id):
+        """Distancia acumulada de `cab_id` desde que empezó la ingesta."""
+        return self.distance_km[self._slots[cab_id]]
+
+    def feed(self, cab_ids, timestamps, lats, lons):
+        """Procesar un lote de posiciones (columnas de igual longitud)."""
+        if not len(cab_ids):
+            return BatchResult([], {})
+        if np is not None:
+            return self._feed_vectorized(cab_ids, timestamps, lats, lons)
+        return self._feed_scalar(cab_ids, timestamps, lats, lons)
+
+    def _classify(self, speed, previous):
+        if speed > self.move_kmh:
+            return MOVING
+        if speed < self.stop_kmh:
+            return STOPPED
+        return previous
+
+    def _feed_scalar(self, cab_ids, timestamps, lats, lons):
+        transitions = []
+        distances = {}
+        order = sorted(range(len(cab_ids)), key=lambda i: (self._slot(cab_ids[i]), timestamps[i]))
+        for i in order:
+            cab_id, t, lat, lon = cab_ids[i], float(timestamps[i]), float(lats[i]), float(lons[i])
+            last = self._last[self._slots[cab_id]]
+            if math.isnan(last[2]):
+                distance = 0.0
+            else:
+                distance = haversine_km(last[0], last[1], lat, lon)
+                dt = t - last[2]
+                if dt > 0:
+                    state = self._classify(distance / dt * 3600.0, last[3])
+                    if state != last[3]:
+                        transitions.append(Transition(cab_id, STATE_NAMES[state], t))
+                        last[3] = state
+            last[0], last[1], last[2] = lat, lon, t
+            self.distance_km[self._slots[cab_id]] += distance
+            distances[cab_id] = distances.get(cab_id, 0.0) + distance
+        transitions.sort(key=lambda tr: tr.timestamp)
+        return BatchResult(transitions, distances)
+
+    def _feed_vectorized(self, cab_ids, timestamps, lats, lons):
+        slots = np.fromiter((self._slot(cab_id) for cab_id in cab_ids), dtype=np.int64, count=len(cab_ids))
+        t = np.asarray(timestamps, dtype=np.float64)
+        lat = np.asarray(lats, dtype=np.float64)
+        lon = np.asarray(lons, dtype=np.float64)
+
+        # Agrupar por taxi y ordenar por tiempo dentro de cada grupo
+        order = np.lexsort((t, slots))
+        slots, t, lat, lon = slots[order], t[order], lat[order], lon[order]
+        group_start = np.empty(len(slots), dtype=bool)
+        group_start[0] = True
+        group_start[1:] = slots[1:] != slots[:-1]
+
+        # Posición anterior: la del lote o, al inicio del grupo, la última conocida
+        last = np.asarray(self._last, dtype=np.float64)
+        prev_lat = np.where(group_start, last[slots, 0], np.roll(lat, 1))
+        prev_lon = np.where(group_start, last[slots, 1], np.roll(lon, 1))
+        prev_t = np.where(group_start, last[slots, 2], np.roll(t, 1))
+        prev_state = last[slots, 3]
+
+        distance = np.nan_to_num(haversine_km(prev_lat, prev_lon, lat, lon))
+        dt = t - prev_t
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speed = np.where(dt > 0, distance / dt * 3600.0, np.nan)
+
+        # Histéresis: -1 = entre umbrales (o sin velocidad), se arrastra el estado anterior
+        raw = np.full(len(slots), -1, dtype=np.int64)
+        raw[speed > self.move_kmh] = MOVING
+        raw[speed < self.stop_kmh] = STOPPED
+        raw = np.where(group_start & (raw < 0), prev_state.astype(np.int64), raw)
+        filled_from = np.maximum.accumulate(np.where(raw >= 0, np.arange(len(raw)), 0))
+        state = raw[filled_from]
+
+        before = np.where(group_start, prev_state, np.roll(state, 1))
+        changed = np.flatnonzero(state != before)
+        transitions = [Transition(self._cab_ids[slots[i]], STATE_NAMES[int(state[i])], float(t[i]))
+                       for i in changed[np.argsort(t[changed], kind='stable')]]
+
+        # Distancia por taxi y última posición de cada grupo
+        starts = np.flatnonzero(group_start)
+        per_group = np.add.reduceat(distance, starts)
+        ends = np.append(starts[1:], len(slots)) - 1
+        distances = {}
+        for group, end in enumerate(ends):
+            slot = int(slots[end])
+            self._last[slot] = [float(lat[end]), float(lon[end]), float(t[end]), int(state[end])]
+            km = float(per_group[group])
+            self.distance_km[slot] += km
+            distances[self._cab_ids[slot]] = km
+        return BatchResult(transitions, distances)
+
+
+def parse_fix(line):
+    """Parsear una línea ``cab_id,timestamp,lat,lon``; None si no es válida."""
+    parts = line.strip().split(',')
+    if len(parts) != 4:
+        return None
+    try:
+        return parts[0], float(parts[1]), float(parts[2]), float(parts[3])
+    except ValueError:
+        return None
+
+
+def _columns(fixes):
+    cab_ids, timestamps, lats, lons = [], [], [], []
+    for fix in fixes:
+        cab_ids.append(fix[0])
+        timestamps.append(fix[1])
+        lats.append(fix[2])
+        lons.append(fix[3])
+    return cab_ids, timestamps, lats, lons
+
+
+def file_batches(path, batch_size=5000):
+    """Leer posiciones de un fichero CSV en lotes de columnas."""
+    batch = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fix = parse_fix(line)
+            if fix is not None:
+                batch.append(fix)
+                if len(batch) >= batch_size:
+                    yield _columns(batch)
+                    batch = []
+    if batch:
+        yield _columns(batch)
+
+
+def udp_batches(host='127.0.0.1', port=5055, batch_size=5000, flush_interval=0.1):
+    """
+    Recibir posiciones por UDP local (una o varias líneas por datagrama).
+
+    Entrega un lote cuando se llena o cada `flush_interval` segundos.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.settimeout(flush_interval)
+    batch = []
+    try:
+        while True:
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                if batch:
+                    yield _columns(batch)
+                    batch = []
+                continue
+            for line in data.decode('utf-8', errors='replace').splitlines():
+                fix = parse_fix(line)
+                if fix is not None:
+                    batch.append(fix)
+            if len(batch) >= batch_size:
+                yield _columns(batch)
+                batch = []
+    finally:
+        sock.close()
+
+
+class GpsFleetMeter:
+    """
+    Taxímetros de una flota alimentados por GPS.
+
+    Aplica a la RunningFare de cada taxi con viaje activo las transiciones de
+    estado detectadas y la distancia recorrida en cada lote.
+    """
+
+    def __init__(self, rates, ingestor=None):
+        from src.meter import RunningFare
+
+        self._running_fare = RunningFare
+        self.rates = rates
+        self.ingestor = ingestor or GpsIngestor()
+        self.trips = {}
+
+    def start_trip(self, cab_id, now):
+        """Empezar un viaje para `cab_id` en el estado que indique el GPS."""
+        fare = self._running_fare(*self.rates)
+        fare.start(now, self.ingestor.state(cab_id))
+        self.trips[cab_id] = fare
+        return fare
+
+    def finish_trip(self, cab_id, now):
+        """Cerrar el viaje de `cab_id` y devolver su RunningFare."""
+        fare = self.trips.pop(cab_id)
+        fare.close(now)
+        return fare
+
+    def feed(self, cab_ids, timestamps, lats, lons):
+        """Procesar un lote de posiciones y actualizar los viajes activos."""
+        result = self.ingestor.feed(cab_ids, timestamps, lats, lons)
+        trips = self.trips
+        for transition in result.transitions:
+            fare = trips.get(transition.cab_id)
+            if fare is not None:
+                fare.switch(transition.state, transition.timestamp)
+        for cab_id, km in result.distances.items():
+            fare = trips.get(cab_id)
+            if fare is not None:
+                fare.add_distance(km)
+        return result
+
+
+def open_gps_source(source):
+    """
+    Lotes de posiciones a partir de la descripción de la fuente.
+
+    'udp' o 'udp:<puerto>' escucha en el socket local; cualquier otra cosa
+    es la ruta de un fichero o FIFO. Los lotes son de una posición: en el
+    taxímetro cada posición cuenta en cuanto llega.
+    """
+    if source == 'udp' or source.startswith('udp:'):
+        _, _, port = source.partition(':')
+        return udp_batches(port=int(port) if port else 5055, batch_size=1)
+    return file_batches(source, batch_size=1)
+
+
+class GpsFeed:
+    """
+    Hilo que sigue las posiciones de un taxi y encola sus transiciones.
+
+    Misma interfaz que `detector.SensorFeed` (`state`, `drain`, `notify`,
+    `stop`), y además `take_distance`: la distancia recorrida desde la
+    última llamada, para sumarla al viaje desde el bucle de la interfaz.
+    """
+
+    def __init__(self, batches, cab_id, ingestor=None):
+        self.cab_id = str(cab_id)
+        self.ingestor = ingestor or GpsIngestor()
+        self._batches = batches
+        self._transitions = queue.SimpleQueue()
+        self._distance_lock = threading.Lock()
+        self._distance_km = 0.0
+        self._stopping = threading.Event()
+        self.notify = None
+        self._thread = threading.Thread(target=self._run, name='gps-feed', daemon=True)
+
+    @property
+    def state(self):
+        """Último estado detectado para el taxi."""
+        return self.ingestor.state(self.cab_id)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        cab_id = self.cab_id
+        try:
+            for cab_ids, timestamps, lats, lons in self._batches:
+                if self._stopping.is_set():
+                    break
+                fixes = [i for i, fix_cab in enumerate(cab_ids) if fix_cab == cab_id]
+                if not fixes:
+                    continue
+                result = self.ingestor.feed([cab_id] * len(fixes), [timestamps[i] for i in fixes],
+                                            [lats[i] for i in fixes], [lons[i] for i in fixes])
+                km = result.distances.get(cab_id)
+                if km:
+                    with self._distance_lock:
+                        self._distance_km += km
+                for transition in result.transitions:
+                    self._transitions.put((transition.state, transition.timestamp))
+                if result.transitions and self.notify is not None:
+                    self.notify()
+        except OSError as e:
+            logging.warning(f"Fuente GPS no disponible: {e}")
+
+    def drain(self):
+        """Devolver las transiciones pendientes, en orden."""
+        transitions = []
+        while True:
+            try:
+                transitions.append(self._transitions.get_nowait())
+            except queue.Empty:
+                return transitions
+
+    def take_distance(self):
+        """Distancia (km) recorrida desde la llamada anterior."""
+        with self._distance_lock:
+            km, self._distance_km = self._distance_km, 0.0
+        return km
+
+    def stop(self):
+        self._stopping.set()
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+Interfaz gráfica sin pantalla para tests y medidas de rendimiento.
+
+`HeadlessGUI` construye un `TaximeterGUI` real sobre un tkinter falso
+(widgets que solo guardan sus opciones, variables con get/set y un
+messagebox que anota los diálogos) y un reloj falso. `FakeRoot` es el bucle
+de eventos: `after` programa callbacks en tiempo del reloj falso y
+`advance(segundos)` los ejecuta en orden, así que un viaje de diez minutos
+se recorre en milisegundos y los valores del display son deterministas.
+
+Cada callback que ejecuta el bucle (y cada acción medida con `measure`)
+deja una muestra de tiempo real y de CPU: la latencia del bucle es cuánto
+tiempo tiene bloqueado el hilo de Tk, que es lo que retrasa el siguiente
+clic o redibujado. Los widgets falsos no dibujan, así que las cifras son el
+coste del código del taxímetro por frame, sin el de Tk.
+
+No hace falta tkinter ni servidor X. Los ficheros del taxímetro (historial,
+repositorio, checkpoints) van al directorio indicado.
+
+Uso (benchmark):
+    python -m src.gui_harness [--ticks N] [--trips N]
+"""
+import heapq
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+from types import SimpleNamespace
+from unittest import mock
+
+# Resumen de las muestras de un tipo de frame (tiempos en ms)
+FrameStats = namedtuple('FrameStats', ['count', 'mean_ms', 'p99_ms', 'max_ms', 'cpu_ms'])
+
+
+def frame_stats(samples):
+    """FrameStats de una lista de muestras (tiempo real, CPU) en segundos; cpu_ms es la media."""
+    if not samples:
+        return FrameStats(0, 0.0, 0.0, 0.0, 0.0)
+    walls = sorted(wall for wall, _ in samples)
+    p99 = walls[min(len(walls) - 1, int(len(walls) * 0.99))]
+    return FrameStats(len(samples), sum(walls) / len(walls) * 1e3, p99 * 1e3, walls[-1] * 1e3,
+                      sum(cpu for _, cpu in samples) / len(samples) * 1e3)
+
+
+class FakeClock:
+    """Reloj de pared falso: se llama como `time.time` y solo avanza cuando se le pide."""
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeVar:
+    """StringVar sin Tk: get/set y trace_add('write')."""
+
+    def __init__(self, master=None, value=''):
+        self.value = value
+        self.traces = []
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+        for callback in self.traces:
+            callback('', '', 'write')
+
+    def trace_add(self, mode, callback):
+        self.traces.append(callback)
+
+
+class FakeWidget:
+    """Widget que guarda sus opciones; `cget('text')` devuelve lo que se mostraría."""
+
+    def __init__(self, master=None, **options):
+        self.master = master
+        self.options = options
+        self.bindings = {}
+        self.destroyed = False
+
+    def config(self, **options):
+        self.options.update(options)
+
+    configure = config
+
+    def cget(self, key):
+        return self.options.get(key)
+
+    def bind(self, sequence, callback):
+        self.bindings[sequence] = callback
+
+    def pack(self, **options):
+        pass
+
+    def set(self, *args):
+        # Scrollbar.set(primero, último)
+        self.options['position'] = args
+
+    def destroy(self):
+        self.destroyed = True
+
+    def invoke(self):
+        """Pulsar el botón (solo si no está deshabilitado)."""
+        if self.options.get('state') != 'disabled':
+            return self.options['command']()
+
+
+class FakeText(FakeWidget):
+    """Text de una sola pieza: insert/delete/get sobre todo el contenido."""
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.content = ''
+
+    def insert(self, index, text):
+        self.content = text + self.content if index == '1.0' else self.content + text
+
+    def delete(self, first, last=None):
+        self.content = ''
+
+    def get(self, first='1.0', last='end'):
+        return self.content
+
+
+class FakeTreeview(FakeWidget):
+    """Treeview con filas en un diccionario ordenado."""
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.rows = {}
+        self._ids = itertools.count(1)
+
+    def heading(self, column, **options):
+        pass
+
+    def column(self, column, **options):
+        pass
+
+    def insert(self, parent, index, values=()):
+        iid = f"I{next(self._ids):03X}"
+        self.rows[iid] = tuple(values)
+        return iid
+
+    def delete(self, *items):
+        for iid in items:
+            del self.rows[iid]
+
+    def get_children(self, item=''):
+        return tuple(self.rows)
+
+    def item(self, iid):
+        return {'values': self.rows[iid]}
+
+
+class FakeRoot(FakeWidget):
+    """
+    Ventana raíz y bucle de eventos sobre un `FakeClock`.
+
+    `after` usa milisegundos enteros (como Tk) para que los frames caigan en
+    instantes exactos; `samples` reúne (tiempo real, CPU) por callback.
+    """
+
+    def __init__(self, clock=None):
+        super().__init__()
+        self.clock = clock or FakeClock()
+        self.samples = {}
+        self._queue = []
+        self._ids = itertools.count()
+        self._cancelled = set()
+
+    # Métodos de ventana que el taxímetro llama sin necesitar respuesta
+    def title(self, text=None):
+        self.options['title'] = text
+
+    def geometry(self, spec=None):
+        self.options['geometry'] = spec
+
+    def protocol(self, name, callback):
+        self.bindings[name] = callback
+
+    def minsize(self, width, height):
+        pass
+
+    def maxsize(self, width, height):
+        pass
+
+    def iconify(self):
+        pass
+
+    def deiconify(self):
+        pass
+
+    def transient(self, master):
+        pass
+
+    def grab_set(self):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def winfo_width(self):
+        return 800
+
+    def winfo_height(self):
+        return 600
+
+    def winfo_screenwidth(self):
+        return 1920
+
+    def winfo_screenheight(self):
+        return 1080
+
+    def after(self, ms, callback, *args):
+        """Programar `callback(*args)` dentro de `ms` milisegundos del reloj falso."""
+        seq = next(self._ids)
+        due = round(self.clock.now * 1000) + int(ms)
+        heapq.heappush(self._queue, (due, seq, callback, args))
+        return f"after#{seq}"
+
+    def after_cancel(self, after_id):
+        self._cancelled.add(int(after_id.partition('#')[2]))
+
+    @property
+    def pending(self):
+        """Callbacks programados y no cancelados."""
+        return sum(1 for _, seq, _, _ in self._queue if seq not in self._cancelled)
+
+    def advance(self, seconds):
+        """Avanzar el reloj `seconds` ejecutando en orden los callbacks que venzan (incluido el último)."""
+        target = round(self.clock.now * 1000) + round(seconds * 1000)
+        while self._queue and self._queue[0][0] <= target:
+            due, seq, callback, args = heapq.heappop(self._queue)
+            if seq in self._cancelled:
+                self._cancelled.discard(seq)
+                continue
+            self.clock.now = due / 1000
+            self.measure(getattr(callback, '__name__', 'after'), callback, *args)
+        self.clock.now = target / 1000
+
+    def measure(self, name, action, *args):
+        """Ejecutar `action(*args)` anotando su tiempo real y de CPU bajo `name`."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return action(*args)
+        finally:
+            self.samples.setdefault(name, []).append((time.perf_counter() - wall, time.process_time() - cpu))
+
+    def stats(self, name):
+        """FrameStats de las muestras de `name` (p. ej. 'update_timer')."""
+        return frame_stats(self.samples.get(name, []))
+
+
+class FakeMessagebox:
+    """messagebox que anota los diálogos; `askquestion` devuelve `answer`."""
+
+    def __init__(self, answer='yes'):
+        self.answer = answer
+        self.shown = []
+
+    def showinfo(self, title, message, **options):
+        self.shown.append(('info', title, message))
+
+    def showerror(self, title, message, **options):
+        self.shown.append(('error', title, message))
+
+    def askquestion(self, title, message, **options):
+        self.shown.append(('question', title, message))
+        return self.answer
+
+
+def fake_toolkit(root):
+    """Módulos (tk, ttk) falsos; `tk.Tk()` devuelve `root`."""
+    tk = SimpleNamespace(Tk=lambda: root, Toplevel=lambda master=None: FakeRoot(root.clock),
+                         Frame=FakeWidget, Label=FakeWidget, Button=FakeWidget, Entry=FakeWidget,
+                         Scrollbar=FakeWidget, Text=FakeText, StringVar=FakeVar, END='end')
+    ttk = SimpleNamespace(Combobox=FakeWidget, Treeview=FakeTreeview)
+    return tk, ttk
+
+
+class HeadlessGUI:
+    """
+    `TaximeterGUI` sin pantalla, con reloj falso y ficheros en `directory`.
+
+    Se usa como gestor de contexto: al entrar sustituye tkinter en
+    `gui_taximeter` y redirige los ficheros del taxímetro; al salir lo
+    restaura todo. `gui` es la aplicación, `root` el bucle de eventos y
+    `messagebox` los diálogos mostrados.
+    """
+
+    def __init__(self, directory, clock=None, answer='yes'):
+        self.directory = directory
+        self.clock = clock or FakeClock()
+        self.root = FakeRoot(self.clock)
+        self.messagebox = FakeMessagebox(answer)
+        self.gui = None
+        self._stack = None
+
+    def __enter__(self):
+        import gui_taximeter
+        import main as taximeter_main
+        tk, ttk = fake_toolkit(self.root)
+        self._stack = stack = ExitStack()
+        for name, value in (('tk', tk), ('ttk', ttk), ('messagebox', self.messagebox)):
+            stack.enter_context(mock.patch.object(gui_taximeter, name, value))
+        paths = (('HISTORY_FILE', 'historial_viajes.txt'), ('HISTORY_SHARD_DIR', 'historial'),
+                 ('TRIPS_DB', 'viajes.db'), ('CHECKPOINT_DIR', 'checkpoints'))
+        for name, path in paths:
+            stack.enter_context(mock.patch.object(taximeter_main.settings, name, os.path.join(self.directory, path)))
+        for name, value in (('LIVE_STATE_ENABLED', False), ('SENSOR_SOURCE', None), ('OUTBOX_URL', None)):
+            stack.enter_context(mock.patch.object(taximeter_main.settings, name, value))
+        for name in ('_repository', '_outbox', '_outbox_sender', '_predictor'):
+            stack.enter_context(mock.patch.object(taximeter_main, name, None))
+        self._taximeter_main = taximeter_main
+        try:
+            self.gui = self.root.measure('__init__', gui_taximeter.TaximeterGUI, self.root, self.clock)
+        except BaseException:
+            stack.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self._taximeter_main._repository is not None:
+            self._taximeter_main._repository.close()
+        self._stack.close()
+        return False
+
+    def click(self, button):
+        """Pulsar un botón de la ventana ('start_finish_btn', 'stop_move_btn') midiendo el handler."""
+        widget = getattr(self.gui, button)
+        return self.root.measure(button, widget.invoke)
+
+    def display(self):
+        """Lo que muestra ahora la ventana principal."""
+        gui = self.gui
+        return {'status': gui.status_var.get(), 'stopped': gui.time_stopped_var.get(),
+                'moving': gui.time_moving_var.get(), 'fare': gui.fare_var.get(),
+                'profile': gui.profile_var.get(), 'last_trip': gui.last_trip_text.get()}
+
+
+def benchmark(ticks=6000, trips=10_000):
+    """
+    Coste por frame de la GUI: {nombre: FrameStats} para `update_timer`,
+    los clics de inicio y fin (con el recibo) y `show_history` con `trips`
+    viajes en el repositorio.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        with HeadlessGUI(directory) as harness:
+            import main as taximeter_main
+            repository = taximeter_main.trip_repository()
+            repository.add_many(("2025-01-01 08:00:00", i % 600, i % 1800, (i % 900) / 10, 'normal', 3)
+                                for i in range(trips))
+            root = harness.root
+            harness.click('start_finish_btn')
+            for _ in range(ticks // 100):
+                root.advance(5.0)
+                harness.click('stop_move_btn')
+                root.advance(5.0)
+            harness.click('start_finish_btn')
+            for _ in range(20):
+                root.measure('show_history', harness.gui.show_history)
+            return {name: root.stats(name) for name in
+                    ('update_timer', 'stop_move_btn', 'start_finish_btn', 'show_history')}
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    """Punto de entrada del benchmark."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Coste por frame de la GUI sin pantalla")
+    parser.add_argument('--ticks', type=int, default=6000)
+    parser.add_argument('--trips', type=int, default=10_000)
+    args = parser.parse_args(argv)
+    for name, stats in benchmark(args.ticks, args.trips).items():
+        print(f"{name:17} {stats.count:6d} frames  media {stats.mean_ms:7.3f} ms  p99 {stats.p99_ms:7.3f} ms  "
+              f"máx {stats.max_ms:7.3f} ms  CPU {stats.cpu_ms:7.3f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
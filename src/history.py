@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Lectura del historial de viajes (logs/historial_viajes.txt).
+
+Formato de cada línea, tal como lo escribe `save_trip_to_history`:
+    2025-12-11 09:30:00 | Parado: 8.1s | Movimiento: 18.5s | Total: 26.6s | Tarifa: €1.09
+
+Con varios taxímetros escribiendo a la vez cada uno añade sus viajes a su
+propio fichero (`historial/cab-<id>.txt`), sin competir por un único fichero.
+Cada fichero está en orden cronológico, así que la lectura global es una
+mezcla perezosa de k vías (heapq.merge) por la fecha de cada línea.
+"""
+import glob
+import heapq
+import os
+from collections import namedtuple
+
+HistoryTrip = namedtuple('HistoryTrip', ['timestamp', 'stopped_time', 'moving_time', 'total_time', 'fare'])
+
+
+def format_history_line(timestamp, stopped_time, moving_time, total_fare):
+    """Línea del historial de texto de un viaje."""
+    duration_total = stopped_time + moving_time
+    return (f"{timestamp} | Parado: {stopped_time:.1f}s | Movimiento: {moving_time:.1f}s | "
+            f"Total: {duration_total:.1f}s | Tarifa: €{total_fare:.2f}")
+
+
+def _field_value(part):
+    # "Parado: 8.1s" -> 8.1 ; "Tarifa: €1.09" -> 1.09
+    return float(part.partition(': ')[2].rstrip('s').lstrip('€'))
+
+
+def parse_history_line(line):
+    """Parsear una línea del historial; devuelve None si no tiene el formato esperado."""
+    parts = line.rstrip('\n').split(' | ')
+    if len(parts) < 5:
+        return None
+    try:
+        return HistoryTrip(parts[0], _field_value(parts[1]), _field_value(parts[2]),
+                           _field_value(parts[3]), _field_value(parts[4]))
+    except ValueError:
+        return None
+
+
+def shard_path(shard_dir, cab_id):
+    """Fichero de historial propio del taxi `cab_id`."""
+    return os.path.join(shard_dir, f"cab-{cab_id}.txt")
+
+
+def fleet_shard_path(shard_dir, worker):
+    """Fichero de historial del proceso trabajador `worker` del servidor de flota (src/fleet.py)."""
+    return os.path.join(shard_dir, f"fleet-{worker}.txt")
+
+
+def history_paths(history_file, shard_dir=None):
+    """
+    Ficheros que forman el historial, del más antiguo al más reciente.
+
+    Los segmentos archivados (`historial_viajes-<sufijo>.txt`, o `.thc` si se
+    compactaron con src/compact_history.py) van antes que el fichero activo,
+    ordenados por nombre; después van los ficheros por taxi y por trabajador
+    de la flota de `shard_dir`. Cada fichero está en orden cronológico.
+
+    Un segmento con texto y `.thc` a la vez (compactado sin `--replace`, o
+    con líneas omitidas) se lee una sola vez, del texto: es el original
+    completo y el `.thc` puede estar aún a medio escribir.
+    """
+    stem, ext = os.path.splitext(history_file)
+    texts = glob.glob(f"{glob.escape(stem)}-*{ext}")
+    text_stems = {os.path.splitext(path)[0] for path in texts}
+    compacted = [path for path in glob.glob(f"{glob.escape(stem)}-*.thc")
+                 if os.path.splitext(path)[0] not in text_stems]
+    archived = sorted(texts + compacted)
+    if os.path.exists(history_file):
+        archived.append(history_file)
+    if shard_dir is not None:
+        for pattern in ("cab-*.txt", "fleet-*.txt"):
+            archived.extend(sorted(glob.glob(os.path.join(glob.escape(shard_dir), pattern))))
+    return archived
+
+
+def _read_lines(path):
+    if path.endswith('.thc'):
+        # Historial compacto: se reconstruyen las líneas de texto
+        from src.compact_history import iter_text_lines
+        yield from iter_text_lines(path)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def iter_history_lines(paths):
+    """Recorrer en streaming las líneas no vacías de varios ficheros de historial."""
+    for path in paths:
+        yield from _read_lines(path)
+
+
+def _line_time(line):
+    # "2025-12-11 09:30:00 | ..." -> "2025-12-11 09:30:00" (ordena como texto)
+    return line[:19]
+
+
+def merge_history_lines(paths):
+    """
+    Líneas de todos los ficheros en orden cronológico global.
+
+    Cada fichero ya está ordenado, así que basta una mezcla de k vías: solo
+    hay una línea por fichero en memoria. A igual fecha se respeta el orden
+    de `paths`.
+    """
+    return heapq.merge(*(_read_lines(path) for path in paths), key=_line_time)
+
+
+HistoryStats = namedtuple('HistoryStats', ['trips', 'skipped_lines', 'stopped_time', 'moving_time',
+                                           'revenue_cents', 'first', 'last'])
+
+
+def history_stats(lines):
+    """Totales del historial en una sola pasada sobre `lines` (en orden cronológico)."""
+    trips = skipped = revenue_cents = 0
+    stopped_time = moving_time = 0.0
+    first = last = None
+    for line in lines:
+        trip = parse_history_line(line)
+        if trip is None:
+            skipped += 1
+            continue
+        trips += 1
+        stopped_time += trip.stopped_time
+        moving_time += trip.moving_time
+        revenue_cents += round(trip.fare * 100)
+        if first is None:
+            first = trip.timestamp
+        last = trip.timestamp
+    return HistoryStats(trips, skipped, stopped_time, moving_time, revenue_cents, first, last)
+
+
+def export_history_csv(lines, out):
+    """Escribir los viajes de `lines` como CSV en el fichero abierto `out`; devuelve cuántos."""
+    import csv
+    writer = csv.writer(out)
+    writer.writerow(['timestamp', 'stopped_time', 'moving_time', 'total_time', 'fare'])
+    exported = 0
+    for line in lines:
+        trip = parse_history_line(line)
+        if trip is not None:
+            writer.writerow([trip.timestamp, f"{trip.stopped_time:.1f}", f"{trip.moving_time:.1f}",
+                             f"{trip.total_time:.1f}", f"{trip.fare:.2f}"])
+            exported += 1
+    return exported
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Tabla de estado en vivo de los taxímetros en memoria compartida.
+
+Cada taxímetro publica su viaje en una ranura fija (una por cab_id) de un
+segmento de `multiprocessing.shared_memory`. Otros procesos locales (p. ej.
+el panel de despacho) leen la tabla directamente sobre la memoria, sin
+ninguna llamada de IPC. La ranura guarda los datos de `RunningFare`, así que
+el lector obtiene tiempos y tarifa estimada en cualquier instante con una
+multiplicación y suma, y el taxímetro solo escribe en los cambios de estado.
+Con reglas de tarificación la tarifa no es lineal (bajada de bandera, tramos,
+mínimo, máximo): la ranura guarda la recta de `RunningFare.line` y el
+taxímetro la vuelve a publicar en cada latido.
+
+Cada ranura se protege con un seqlock: el escritor pone el contador en impar
+mientras escribe y en par al terminar; el lector reintenta si lo ve impar o
+si cambia durante la lectura. Los lectores nunca bloquean al escritor.
+Si un escritor muere a mitad de `publish`, su ranura queda impar hasta que
+el taxímetro vuelve a arrancar: `read` lo señala con RuntimeError, pero
+`snapshot` la omite (igual que las ranuras de procesos que ya no existen)
+para que un taxi caído no impida leer el resto de la tabla.
+"""
+import os
+import struct
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from src.checkpoint import process_alive
+from src.meter import STATE_CODES, STATE_NAMES
+
+MAGIC = b'TXLS'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHHI')
+_SEQ = struct.Struct('<I')
+_SLOT = struct.Struct('<I B3x I I dddddd d 16s')
+SLOT_SIZE = _SLOT.size
+_MAX_READ_RETRIES = 100
+
+
+class LiveMeterState(namedtuple('LiveMeterState', [
+        'cab_id', 'pid', 'state', 'profile', 'trip_start', 'segment_start',
+        'stopped_time', 'moving_time', 'closed_fare', 'open_rate', 'updated_at'])):
+    """Copia consistente de una ranura de la tabla."""
+
+    __slots__ = ()
+
+    @property
+    def active(self):
+        return self.state is not None
+
+    def elapsed(self, now):
+        """Tiempos (parado, movimiento) en `now`, incluyendo el tramo abierto."""
+        if self.state is None:
+            return self.stopped_time, self.moving_time
+        duration = now - self.segment_start
+        if self.state == 'stopped':
+            return self.stopped_time + duration, self.moving_time
+        return self.stopped_time, self.moving_time + duration
+
+    def estimated_fare(self, now):
+        """Tarifa estimada en `now` (la recta publicada; exacta hasta el siguiente latido)."""
+        if self.state is None:
+            return self.closed_fare
+        return self.closed_fare + self.open_rate * (now - self.segment_start)
+
+
+def _create(name, size):
+    """Crear un segmento que no se borre cuando salga el proceso creador."""
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size, track=False)
+    except TypeError:
+        # Python < 3.13: no existe `track`, se desregistra a mano
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _untrack(shm)
+        return shm
+
+
+def _attach(name):
+    """Abrir un segmento existente sin que el resource_tracker lo borre al salir."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        _untrack(shm)
+        return shm
+
+
+def _untrack(shm):
+    if os.name == 'posix':
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+class LiveStateTable:
+    """Tabla de ranuras fijas con el estado en vivo de cada taxímetro."""
+
+    def __init__(self, shm):
+        self._shm = shm
+        self._buf = shm.buf
+        magic, version, slot_size, capacity = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            shm.close()
+            raise ValueError(f"El segmento '{shm.name}' no es una tabla de estado en vivo compatible")
+        self.name = shm.name
+        self.capacity = capacity
+
+    @classmethod
+    def open(cls, name, capacity=256, create=True):
+        """
+        Abrir la tabla `name`, creándola con `capacity` ranuras si no existe.
+
+        El segmento sobrevive a los procesos que lo usan (ninguno lo registra
+        para borrarlo al salir); usa `unlink()` para eliminarlo.
+        """
+        if create:
+            try:
+                shm = _create(name, _HEADER.size + capacity * SLOT_SIZE)
+            except FileExistsError:
+                pass
+            else:
+                _HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, SLOT_SIZE, capacity)
+                return cls(shm)
+        return cls(_attach(name))
+
+    def _offset(self, cab_id):
+        if not 0 <= cab_id < self.capacity:
+            raise ValueError(f"cab_id {cab_id} fuera de la tabla (0-{self.capacity - 1})")
+        return _HEADER.size + cab_id * SLOT_SIZE
+
+    def slot(self, cab_id):
+        """Devolver el escritor de la ranura de `cab_id`."""
+        return LiveSlot(self, cab_id, self._offset(cab_id))
+
+    def read(self, cab_id):
+        """Leer una copia consistente de la ranura de `cab_id`."""
+        return self._read_at(cab_id, self._offset(cab_id))
+
+    def snapshot(self, active_only=True, alive_only=True):
+        """
+        Leer todas las ranuras (por defecto solo las de viajes activos).
+
+        Se omiten las ranuras ilegibles (escritor muerto a mitad de
+        `publish`) y, con `alive_only`, las de procesos que ya no existen.
+        """
+        states = []
+        alive = {}
+        for cab_id in range(self.capacity):
+            try:
+                state = self._read_at(cab_id, _HEADER.size + cab_id * SLOT_SIZE)
+            except RuntimeError:
+                continue
+            if not state.pid or not (state.active or not active_only):
+                continue
+            if alive_only:
+                if state.pid not in alive:
+                    alive[state.pid] = process_alive(state.pid)
+                if not alive[state.pid]:
+                    continue
+            states.append(state)
+        return states
+
+    def _read_at(self, cab_id, offset):
+        buf = self._buf
+        for _ in range(_MAX_READ_RETRIES):
+            seq = _SEQ.unpack_from(buf, offset)[0]
+            if seq & 1:
+                continue
+            fields = _SLOT.unpack_from(buf, offset)
+            if _SEQ.unpack_from(buf, offset)[0] == seq:
+                break
+        else:
+            raise RuntimeError(f"No se pudo leer una copia consistente de la ranura {cab_id}")
+        _, state, pid, _cab, trip_start, segment_start, stopped, moving, closed, rate, updated, profile = fields
+        return LiveMeterState(cab_id, pid, STATE_NAMES.get(state), profile.rstrip(b'\0').decode('utf-8'),
+                              trip_start, segment_start, stopped, moving, closed, rate, updated)
+
+    def close(self):
+        """Desconectarse del segmento (no lo borra)."""
+        if self._shm is not None:
+            self._buf.release()
+            self._buf = None
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """Borrar el segmento del sistema (en Windows desaparece al cerrarlo)."""
+        self.close()
+        if os.name == 'posix':
+            import _posixshmem
+            try:
+                _posixshmem.shm_unlink('/' + self.name.lstrip('/'))
+            except FileNotFoundError:
+                pass
+
+
+class LiveSlot:
+    """Escritor de una ranura de la tabla (un único taxímetro por ranura)."""
+
+    def __init__(self, table, cab_id, offset):
+        self.table = table
+        self.cab_id = cab_id
+        self._offset = offset
+        self._seq = _SEQ.unpack_from(table._buf, offset)[0] & ~1
+
+    def publish(self, running_fare, profile, now):
+        """Publicar el estado de `running_fare` en `now` (cambio de estado o latido)."""
+        closed_fare, open_rate = running_fare.line(now)
+        buf = self.table._buf
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        _SEQ.pack_into(buf, self._offset, self._seq)
+        _SLOT.pack_into(
+            buf, self._offset, self._seq, STATE_CODES[running_fare.state], os.getpid(),
+            self.cab_id, running_fare.trip_start, running_fare.segment_start,
+            running_fare.stopped_time, running_fare.moving_time,
+            closed_fare, open_rate, now,
+            profile.encode('utf-8')[:16]
+        )
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        _SEQ.pack_into(buf, self._offset, self._seq)
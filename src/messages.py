@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo de mensajes de la CLI, por idioma y ya formateados.
+
+Los mensajes se escriben una vez con marcas de color al estilo de rich
+(``[red]``, ``[bright cyan]``, ``[black on yellow]`` y ``[/]`` para volver
+al color normal). Al crear el catálogo las marcas se sustituyen por los
+códigos de color de la terminal, o se quitan si no hay colores, y cada
+mensaje queda como una cadena final: imprimir es buscar la clave y, si el
+mensaje tiene parámetros, una llamada a `str.format`.
+
+Un mensaje puede ser una tupla ``(con colores, sin colores)`` cuando el modo
+sin colores usa otro diseño; una variante vacía no se imprime. Las claves que
+falten en un idioma se toman del español.
+"""
+import re
+from string import Formatter
+
+LANGUAGES = ('es', 'en')
+
+_COLORS = ('black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white')
+
+# Marca de estilo: "[red]", "[bright cyan]", "[black on yellow]" o "[/]"
+_TAG = re.compile(r"\[(/|[a-z]+(?: [a-z]+)*)\]")
+# Nombres de marca válidos, para reconocerlas también en el modo sin colores
+_NAMES = dict.fromkeys(['/', 'bright', 'dim'] + list(_COLORS) + ['on ' + name for name in _COLORS], '')
+
+MESSAGES = {
+    'es': {
+        'colors_enabled': ("[green]✓ Colores de terminal activados 🎨[/]",
+                           "⚠ Colores no disponibles. Instala con: pip install colorama"),
+        'logo': (
+            "[bright cyan]\n"
+            "╔════════════════════════════════════════════╗\n"
+            "║           🚕 TAXÍMETRO DIGITAL 🚕           ║\n"
+            "║                                            ║\n"
+            "║ Sistema Profesional de Cálculo de Tarifas  ║\n"
+            "╚════════════════════════════════════════════╝\n"
+            "[/]"
+        ),
+        'starting': ("\n[bright cyan]🚀 Iniciando Taxímetro Digital...\n[/]",
+                     "🚕 Iniciando Taxímetro Digital..."),
+        'help_menu': (
+            "[yellow]\n"
+            "📋 Comandos disponibles:\n"
+            "┌─────────────────────────────────────────┐\n"
+            "│ 🚀 start   │ Iniciar un nuevo viaje     │\n"
+            "│ 🛑 stop    │ Poner el taxi en parado    │\n"
+            "│ 🚗 move    │ Poner el taxi en marcha    │\n"
+            "│ 🏁 finish  │ Terminar y calcular tarifa │\n"
+            "│ 🚪 exit    │ Salir de la aplicación     │\n"
+            "└─────────────────────────────────────────┘\n"
+            "[/]"
+        ),
+        'help_tip': "[green]💡 Consejo: ¡escribe 'help' en cualquier momento para volver a ver este menú![/]",
+        'loading': "\n[yellow]🚕 Cargando Taxímetro Digital...[/]",
+        'ready': "¡Listo! ✨",
+        'commands': (
+            "\n[black on yellow] 🚖 TAXÍMETRO DIGITAL PROFESIONAL 🚕 [/]\n"
+            "[white on cyan] 📋 COMANDOS DISPONIBLES [/]\n\n"
+            "[cyan]============================================================[/]\n"
+            "[white]                    COMANDOS DEL TAXÍMETRO[/]\n"
+            "[cyan]============================================================[/]\n\n"
+            "  [green]🚀 start[/]    [cyan]→[/] Iniciar un nuevo viaje (start aeropuerto: con etiquetas)\n"
+            "  [red]🛑 stop[/]     [cyan]→[/] Poner taxi en estado parado\n"
+            "  [green]🏃 move[/]     [cyan]→[/] Taxi en movimiento\n"
+            "  [blue]🏁 finish[/]   [cyan]→[/] Finalizar viaje y calcular tarifa\n"
+            "  [magenta]📜 history[/]  [cyan]→[/] Ver historial de viajes\n"
+            "  [cyan]💰 precios[/]  [cyan]→[/] Ver y cambiar tarifas\n"
+            "  [yellow]❓ help[/]     [cyan]→[/] Mostrar esta lista de comandos\n"
+            "  [magenta]🚪 exit[/]     [cyan]→[/] Salir de la aplicación\n"
+            "\n[cyan]============================================================[/]\n"
+            "\n[white on cyan] 💡 Consejo: Usa 'start' → 'stop'/'move' → 'finish' [/]\n",
+
+            "\n=================================================================\n"
+            "              🚖 TAXÍMETRO DIGITAL PROFESIONAL 🚕\n"
+            "=================================================================\n"
+            "                      📋 TABLA DE COMANDOS\n"
+            "=================================================================\n"
+            "| Comando  | Descripción                    | Uso           |\n"
+            "|----------|--------------------------------|---------------|\n"
+            "| 🚀 start  | Iniciar un nuevo viaje         | start         |\n"
+            "| 🛑 stop   | Poner taxi en estado parado    | stop          |\n"
+            "| 🏃 move   | Poner taxi en movimiento       | move          |\n"
+            "| 🏁 finish | Terminar viaje y calc tarifa   | finish        |\n"
+            "| 📜 history| Ver historial de viajes        | history       |\n"
+            "| 💰 precios| Ver y cambiar tarifas          | precios       |\n"
+            "| ❓ help   | Mostrar esta tabla de comandos | help          |\n"
+            "| 🚪 exit   | Salir de la aplicación         | exit          |\n"
+            "=================================================================\n"
+            "💡 Consejo: Alterna entre 'stop' y 'move' durante tu viaje, luego 'finish'\n"
+        ),
+        # Líneas de estado: una sola línea, se redibujan en su sitio
+        'status_stopped': ("[bright yellow]📊 🛑 PARADO[/] | ⏱️  Parado: {stopped:.1f}s | "
+                           "Movimiento: {moving:.1f}s | [magenta]💰 €{fare:.2f}[/]"),
+        'status_moving': ("[bright green]📊 🚗 EN MOVIMIENTO[/] | ⏱️  Parado: {stopped:.1f}s | "
+                          "Movimiento: {moving:.1f}s | [magenta]💰 €{fare:.2f}[/]"),
+        'status_idle': "[red]📍 Sin viaje activo[/] | [yellow]💡 Usa 'start' para comenzar un viaje[/]",
+        'fare_total': "[yellow]💰 Total calculado: [green]€{fare} 🎯[/]\n[cyan]📊 Perfil activo: [white]{profile}[/]",
+        'history_empty': ("\n[black on yellow] 📭 HISTORIAL VACÍO 📭 [/]\n"
+                          "[cyan]No hay viajes registrados aún.[/]\n"
+                          "[green]💡 Realiza tu primer viaje con: [yellow]start[/]\n",
+                          "📭 No hay viajes en el historial aún."),
+        'history_no_page': "[yellow]📭 La página {page} no existe (hay {pages}).[/]",
+        'history_header': ("\n[white on blue] 📜 HISTORIAL DE VIAJES (página {page}/{pages}) 📜 [/]\n",
+                           "\n📜 HISTORIAL DE VIAJES (página {page}/{pages}):"),
+        'history_trip': ("[green]#{number:2} [magenta]📅 [white]{timestamp}[/]\n"
+                         "    [red]🛑 [white]Parado: {stopped:.1f}s[/]  [green]🏃 [white]Movimiento: {moving:.1f}s[/]\n"
+                         "    [blue]⏱️  [white]Total: {total:.1f}s[/]  [yellow]💰 [white]Tarifa: €{fare:.2f}[/]",
+                         "{number}. {timestamp} | Parado: {stopped:.1f}s | Movimiento: {moving:.1f}s | "
+                         "Total: {total:.1f}s | Tarifa: €{fare:.2f}"),
+        # Colores alternos para distinguir viajes consecutivos
+        'history_trip_alt': ("[yellow]#{number:2} [magenta]📅 [cyan]{timestamp}[/]\n"
+                             "    [red]🛑 [cyan]Parado: {stopped:.1f}s[/]  [green]🏃 [cyan]Movimiento: {moving:.1f}s[/]\n"
+                             "    [blue]⏱️  [cyan]Total: {total:.1f}s[/]  [yellow]💰 [cyan]Tarifa: €{fare:.2f}[/]",
+                             "{number}. {timestamp} | Parado: {stopped:.1f}s | Movimiento: {moving:.1f}s | "
+                             "Total: {total:.1f}s | Tarifa: €{fare:.2f}"),
+        'history_separator': ("[cyan]    ─────────────────────────────────────────[/]", ""),
+        'history_footer': "\n[green]💼 Total de viajes registrados: {total}[/]",
+        'history_more': "[yellow]💡 Más antiguos: history {page}[/]",
+        'history_error': "[red]❌ Error leyendo historial.[/]",
+        'stats_empty': "[yellow]📭 No hay viajes en el historial aún.[/]",
+        'stats_summary': ("\n[bright cyan]📊 Viajes: {trips} ({first} → {last})[/]\n"
+                          "🛑 Tiempo parado: {stopped:.1f}s | 🏃 Tiempo en movimiento: {moving:.1f}s\n"
+                          "💰 Ingresos: €{revenue:.2f} | Media por viaje: €{average:.2f}\n"),
+        'export_error': "[red]❌ No se pudo exportar el historial: {error}[/]",
+        'export_done': "[green]📤 {count} viajes exportados a {path}[/]",
+        'profile_changed': ("\n[black on green] 💼 PERFIL CAMBIADO 💼 [/]\n"
+                            "[green]✅ Nuevo perfil: [white]{name}[/]\n"
+                            "[cyan]🛑 Tarifa parado: [yellow]€{stopped}/segundo[/]\n"
+                            "[cyan]🏃 Tarifa movimiento: [yellow]€{moving}/segundo[/]\n",
+                            "✅ Nuevo perfil: {name}\n"
+                            "🛑 Tarifa parado: €{stopped}/segundo\n"
+                            "🏃 Tarifa movimiento: €{moving}/segundo"),
+        'profile_invalid': "[red]❌ Perfil '{name}' no válido.[/]\n[yellow]Perfiles disponibles: {available}[/]",
+        'profiles_header': ("\n[white on magenta] 💰 PERFILES DE TARIFAS DISPONIBLES 💰 [/]\n",
+                            "\n💰 PERFILES DE TARIFAS DISPONIBLES"),
+        'profiles_active': ("[green]➤ {name:15} [cyan](ACTIVO)[/]\n"
+                            "  [white]Comando: [yellow]{command:10} [red]🛑 €{stopped}/s  [green]🏃 €{moving}/s[/]\n",
+                            "{name} (ACTIVO)\n  Comando: {command} - Parado: €{stopped}/s, Movimiento: €{moving}/s"),
+        'profiles_other': ("  [white]{name:15}[/]\n"
+                           "  [cyan]Comando: [yellow]{command:10} [red]🛑 €{stopped}/s  [green]🏃 €{moving}/s[/]\n",
+                           "{name}\n  Comando: {command} - Parado: €{stopped}/s, Movimiento: €{moving}/s"),
+        'profiles_tip': ("[yellow]💡 Para cambiar: escribe el comando del perfil (ej: 'alta', 'nocturna')[/]\n",
+                         "\n💡 Para cambiar: escribe el comando del perfil"),
+        'closing': ("\n[bright magenta]🚀 Cerrando Taxímetro Digital...[/]",
+                    "🚕 Cerrando Taxímetro Digital..."),
+        'goodbye': "¡Hasta luego! ✨",
+        'thanks': "[magenta]👋 ¡Gracias por usar el Taxímetro Digital! 🚕✨[/]",
+        'trip_recovered': "[green]♻️  Viaje interrumpido recuperado. Continúa donde lo dejaste.[/]",
+        'prompt_idle': "[blue]🚖 > [/]",
+        'prompt_stopped': "[blue]🚖[/] [red]🛑 PARADO[/] [blue]> [/]",
+        'prompt_moving': "[blue]🚖[/] [green]🏃💨 EN MOVIMIENTO[/] [blue]> [/]",
+        'trip_already_active': "[red]❌ Error: Ya hay un viaje en progreso.[/]",
+        'trip_started': "[green]✅ ¡Viaje iniciado! Estado inicial: 'parado' 🛑[/]",
+        'sensor_moving': "[green]🏃 Estado detectado por el sensor: 'en movimiento'[/]",
+        'no_active_trip': "[red]❌ Error: No hay viaje activo. Usa 'start' para comenzar.[/]",
+        'state_stopped': "[red]🛑 Estado cambiado a: 'parado'[/]",
+        'state_moving': "[green]🏃 Estado cambiado a: 'en movimiento'[/]",
+        'no_trip_to_finish': "[red]❌ Error: No hay viaje activo para terminar.[/]",
+        'exit_active_trip': "[yellow]⚠️  ¡Atención: hay un viaje activo![/]",
+        'exit_finish_first': "🤔 ¿Quieres terminar el viaje antes de salir? (s/n): ",
+        'auto_finished': "[green]🏁 Viaje auto-completado. Tarifa final: €{fare:.2f}[/]",
+        'exit_cancelled': "[yellow]⌛ Sin respuesta: el viaje sigue en curso.[/]",
+        'quote_usage': "[yellow]💡 Uso: quote <segundos parado> <segundos en movimiento> [km][/]",
+        'quote_result': "[cyan]💰 Presupuesto: €{fare:.2f} (caché: {hits} aciertos, {misses} fallos)[/]",
+        'estimate_usage': "[yellow]💡 Uso: estimate [hora 0-23][/]",
+        'estimate_result': ("[cyan]🔮 Estimación ({profile}, {hour:02d}h): mediana €{median:.2f}, "
+                            "p90 €{p90:.2f} ({trips} viajes)[/]"),
+        'estimate_no_data': "[yellow]📭 Aún no hay viajes en el historial para estimar la tarifa.[/]",
+        'outbox_status': ("[cyan]📤 Envío al servidor central: {pending} pendientes (el más antiguo hace "
+                          "{lag:.0f}s), {sent} enviados, {retries} reintentos, {rejected} rechazados[/]"),
+        'outbox_disabled': "[yellow]📤 Envío al servidor central desactivado (TAXIMETER_OUTBOX_URL).[/]",
+        'invalid_command': ("[red]❓ Comando inválido. Usa 'start', 'stop', 'move', 'finish', 'history', "
+                            "'precios', 'help', o 'exit'.[/]\n"
+                            "[yellow]💡 También puedes usar: {profiles} para cambiar tarifas[/]"),
+    },
+    'en': {
+        'colors_enabled': ("[green]✓ Terminal colors enabled 🎨[/]",
+                           "⚠ Colors not available. Install with: pip install colorama"),
+        'logo': (
+            "[bright cyan]\n"
+            "╔════════════════════════════════════════════╗\n"
+            "║           🚕 DIGITAL TAXIMETER 🚕           ║\n"
+            "║                                            ║\n"
+            "║    Professional Fare Calculation System    ║\n"
+            "╚════════════════════════════════════════════╝\n"
+            "[/]"
+        ),
+        'starting': ("\n[bright cyan]🚀 Starting Digital Taximeter...\n[/]",
+                     "🚕 Starting Digital Taximeter..."),
+        'help_menu': (
+            "[yellow]\n"
+            "📋 Available Commands:\n"
+            "┌─────────────────────────────────────────┐\n"
+            "│ 🚀 start   │ Begin a new trip           │\n"
+            "│ 🛑 stop    │ Set taxi to stopped state  │\n"
+            "│ 🚗 move    │ Set taxi to moving state   │\n"
+            "│ 🏁 finish  │ Complete trip & calculate  │\n"
+            "│ 🚪 exit    │ Exit the application       │\n"
+            "└─────────────────────────────────────────┘\n"
+            "[/]"
+        ),
+        'help_tip': "[green]💡 Tip: Type 'help' anytime to see this menu again![/]",
+        'loading': "\n[yellow]🚕 Loading Digital Taximeter...[/]",
+        'ready': "Ready! ✨",
+        'commands': (
+            "\n[black on yellow] 🚖 PROFESSIONAL DIGITAL TAXIMETER 🚕 [/]\n"
+            "[white on cyan] 📋 AVAILABLE COMMANDS [/]\n\n"
+            "[cyan]============================================================[/]\n"
+            "[white]                    TAXIMETER COMMANDS[/]\n"
+            "[cyan]============================================================[/]\n\n"
+            "  [green]🚀 start[/]    [cyan]→[/] Begin a new trip (start aeropuerto: with tags)\n"
+            "  [red]🛑 stop[/]     [cyan]→[/] Set taxi to stopped state\n"
+            "  [green]🏃 move[/]     [cyan]→[/] Set taxi to moving state\n"
+            "  [blue]🏁 finish[/]   [cyan]→[/] Finish trip and calculate fare\n"
+            "  [magenta]📜 history[/]  [cyan]→[/] Show trip history\n"
+            "  [cyan]💰 precios[/]  [cyan]→[/] Show and change rates\n"
+            "  [yellow]❓ help[/]     [cyan]→[/] Show this command list\n"
+            "  [magenta]🚪 exit[/]     [cyan]→[/] Exit the application\n"
+            "\n[cyan]============================================================[/]\n"
+            "\n[white on cyan] 💡 Tip: Use 'start' → 'stop'/'move' → 'finish' [/]\n",
+
+            "\n=================================================================\n"
+            "              🚖 PROFESSIONAL DIGITAL TAXIMETER 🚕\n"
+            "=================================================================\n"
+            "                      📋 COMMAND TABLE\n"
+            "=================================================================\n"
+            "| Command  | Description                    | Usage         |\n"
+            "|----------|--------------------------------|---------------|\n"
+            "| 🚀 start  | Begin a new trip               | start         |\n"
+            "| 🛑 stop   | Set taxi to stopped state      | stop          |\n"
+            "| 🏃 move   | Set taxi to moving state       | move          |\n"
+            "| 🏁 finish | Finish trip and calculate fare | finish        |\n"
+            "| 📜 history| Show trip history              | history       |\n"
+            "| 💰 precios| Show and change rates          | precios       |\n"
+            "| ❓ help   | Show this command table        | help          |\n"
+            "| 🚪 exit   | Exit the application           | exit          |\n"
+            "=================================================================\n"
+            "💡 Tip: Switch between 'stop' and 'move' during your trip, then 'finish'\n"
+        ),
+        'status_stopped': ("[bright yellow]📊 🛑 STOPPED[/] | ⏱️  Stopped: {stopped:.1f}s | "
+                           "Moving: {moving:.1f}s | [magenta]💰 €{fare:.2f}[/]"),
+        'status_moving': ("[bright green]📊 🚗 MOVING[/] | ⏱️  Stopped: {stopped:.1f}s | "
+                          "Moving: {moving:.1f}s | [magenta]💰 €{fare:.2f}[/]"),
+        'status_idle': "[red]📍 No active trip[/] | [yellow]💡 Use 'start' to begin a new trip[/]",
+        'fare_total': "[yellow]💰 Total: [green]€{fare} 🎯[/]\n[cyan]📊 Active profile: [white]{profile}[/]",
+        'history_empty': ("\n[black on yellow] 📭 EMPTY HISTORY 📭 [/]\n"
+                          "[cyan]No trips recorded yet.[/]\n"
+                          "[green]💡 Make your first trip with: [yellow]start[/]\n",
+                          "📭 No trips in the history yet."),
+        'history_no_page': "[yellow]📭 Page {page} does not exist (there are {pages}).[/]",
+        'history_header': ("\n[white on blue] 📜 TRIP HISTORY (page {page}/{pages}) 📜 [/]\n",
+                           "\n📜 TRIP HISTORY (page {page}/{pages}):"),
+        'history_trip': ("[green]#{number:2} [magenta]📅 [white]{timestamp}[/]\n"
+                         "    [red]🛑 [white]Stopped: {stopped:.1f}s[/]  [green]🏃 [white]Moving: {moving:.1f}s[/]\n"
+                         "    [blue]⏱️  [white]Total: {total:.1f}s[/]  [yellow]💰 [white]Fare: €{fare:.2f}[/]",
+                         "{number}. {timestamp} | Stopped: {stopped:.1f}s | Moving: {moving:.1f}s | "
+                         "Total: {total:.1f}s | Fare: €{fare:.2f}"),
+        'history_trip_alt': ("[yellow]#{number:2} [magenta]📅 [cyan]{timestamp}[/]\n"
+                             "    [red]🛑 [cyan]Stopped: {stopped:.1f}s[/]  [green]🏃 [cyan]Moving: {moving:.1f}s[/]\n"
+                             "    [blue]⏱️  [cyan]Total: {total:.1f}s[/]  [yellow]💰 [cyan]Fare: €{fare:.2f}[/]",
+                             "{number}. {timestamp} | Stopped: {stopped:.1f}s | Moving: {moving:.1f}s | "
+                             "Total: {total:.1f}s | Fare: €{fare:.2f}"),
+        'history_footer': "\n[green]💼 Total trips recorded: {total}[/]",
+        'history_more': "[yellow]💡 Older trips: history {page}[/]",
+        'history_error': "[red]❌ Error reading the history.[/]",
+        'stats_empty': "[yellow]📭 No trips in the history yet.[/]",
+        'stats_summary': ("\n[bright cyan]📊 Trips: {trips} ({first} → {last})[/]\n"
+                          "🛑 Time stopped: {stopped:.1f}s | 🏃 Time moving: {moving:.1f}s\n"
+                          "💰 Revenue: €{revenue:.2f} | Average per trip: €{average:.2f}\n"),
+        'export_error': "[red]❌ Could not export the history: {error}[/]",
+        'export_done': "[green]📤 {count} trips exported to {path}[/]",
+        'profile_changed': ("\n[black on green] 💼 PROFILE CHANGED 💼 [/]\n"
+                            "[green]✅ New profile: [white]{name}[/]\n"
+                            "[cyan]🛑 Stopped rate: [yellow]€{stopped}/second[/]\n"
+                            "[cyan]🏃 Moving rate: [yellow]€{moving}/second[/]\n",
+                            "✅ New profile: {name}\n"
+                            "🛑 Stopped rate: €{stopped}/second\n"
+                            "🏃 Moving rate: €{moving}/second"),
+        'profile_invalid': "[red]❌ Invalid profile '{name}'.[/]\n[yellow]Available profiles: {available}[/]",
+        'profiles_header': ("\n[white on magenta] 💰 AVAILABLE RATE PROFILES 💰 [/]\n",
+                            "\n💰 AVAILABLE RATE PROFILES"),
+        'profiles_active': ("[green]➤ {name:15} [cyan](ACTIVE)[/]\n"
+                            "  [white]Command: [yellow]{command:10} [red]🛑 €{stopped}/s  [green]🏃 €{moving}/s[/]\n",
+                            "{name} (ACTIVE)\n  Command: {command} - Stopped: €{stopped}/s, Moving: €{moving}/s"),
+        'profiles_other': ("  [white]{name:15}[/]\n"
+                           "  [cyan]Command: [yellow]{command:10} [red]🛑 €{stopped}/s  [green]🏃 €{moving}/s[/]\n",
+                           "{name}\n  Command: {command} - Stopped: €{stopped}/s, Moving: €{moving}/s"),
+        'profiles_tip': ("[yellow]💡 To switch: type the profile command (e.g. 'alta', 'nocturna')[/]\n",
+                         "\n💡 To switch: type the profile command"),
+        'closing': ("\n[bright magenta]🚀 Closing Digital Taximeter...[/]",
+                    "🚕 Digital Taximeter shutting down..."),
+        'goodbye': "See you soon! ✨",
+        'thanks': "[magenta]👋 Thank you for using the Digital Taximeter! 🚕✨[/]",
+        'trip_recovered': "[green]♻️  Interrupted trip recovered. Carry on where you left off.[/]",
+        'prompt_stopped': "[blue]🚖[/] [red]🛑 STOPPED[/] [blue]> [/]",
+        'prompt_moving': "[blue]🚖[/] [green]🏃💨 MOVING[/] [blue]> [/]",
+        'trip_already_active': "[red]❌ Error: A trip is already in progress.[/]",
+        'trip_started': "[green]✅ Trip started! Initial state: 'stopped' 🛑[/]",
+        'sensor_moving': "[green]🏃 State detected by the sensor: 'moving'[/]",
+        'no_active_trip': "[red]❌ Error: No active trip. Use 'start' to begin.[/]",
+        'state_stopped': "[red]🛑 State changed to: 'stopped'[/]",
+        'state_moving': "[green]🏃 State changed to: 'moving'[/]",
+        'no_trip_to_finish': "[red]❌ Error: No active trip to finish.[/]",
+        'exit_active_trip': "[yellow]⚠️  Warning: You have an active trip![/]",
+        'exit_finish_first': "🤔 Do you want to finish the trip first? (y/n): ",
+        'auto_finished': "[green]🏁 Trip auto-completed. Final fare: €{fare:.2f}[/]",
+        'exit_cancelled': "[yellow]⌛ No answer: the trip continues.[/]",
+        'quote_usage': "[yellow]💡 Usage: quote <seconds stopped> <seconds moving> [km][/]",
+        'quote_result': "[cyan]💰 Quote: €{fare:.2f} (cache: {hits} hits, {misses} misses)[/]",
+        'estimate_usage': "[yellow]💡 Usage: estimate [hour 0-23][/]",
+        'estimate_result': ("[cyan]🔮 Estimate ({profile}, {hour:02d}h): median €{median:.2f}, "
+                            "p90 €{p90:.2f} ({trips} trips)[/]"),
+        'estimate_no_data': "[yellow]📭 No trips in the history yet to estimate the fare.[/]",
+        'outbox_status': ("[cyan]📤 Upload to the back office: {pending} pending (oldest {lag:.0f}s ago), "
+                          "{sent} sent, {retries} retries, {rejected} rejected[/]"),
+        'outbox_disabled': "[yellow]📤 Upload to the back office disabled (TAXIMETER_OUTBOX_URL).[/]",
+        'invalid_command': ("[red]❓ Invalid command. Use 'start', 'stop', 'move', 'finish', 'history', "
+                            "'precios', 'help', or 'exit'.[/]\n"
+                            "[yellow]💡 You can also use: {profiles} to change rates[/]"),
+    },
+}
+
+# Respuestas afirmativas aceptadas en las confirmaciones, en cualquier idioma
+YES_ANSWERS = ('s', 'si', 'sí', 'y', 'yes')
+
+
+def colorama_palette(colorama):
+    """Códigos de estilo por nombre de marca, tomados de colorama."""
+    palette = {'/': colorama.Style.RESET_ALL, 'bright': colorama.Style.BRIGHT, 'dim': colorama.Style.DIM}
+    for name in _COLORS:
+        palette[name] = getattr(colorama.Fore, name.upper())
+        palette['on ' + name] = getattr(colorama.Back, name.upper())
+    return palette
+
+
+def _style_codes(spec, palette):
+    """Códigos de una marca ("bright cyan", "black on yellow"); None si no es una marca conocida."""
+    if spec == '/':
+        return palette['/']
+    words = spec.split(' ')
+    codes = []
+    i = 0
+    while i < len(words):
+        name = words[i]
+        if name == 'on' and i + 1 < len(words):
+            name = 'on ' + words[i + 1]
+            i += 1
+        if name not in palette:
+            return None
+        codes.append(palette[name])
+        i += 1
+    return ''.join(codes)
+
+
+def render_markup(text, palette=None):
+    """Sustituir las marcas de estilo por códigos de `palette` (o quitarlas si es None)."""
+    def replace(match):
+        spec = match.group(1)
+        if palette is None:
+            # Sin colores: se quitan solo las marcas válidas ("[km]" queda tal cual)
+            return '' if _style_codes(spec, _NAMES) is not None else match.group(0)
+        codes = _style_codes(spec, palette)
+        return match.group(0) if codes is None else codes
+    return _TAG.sub(replace, text)
+
+
+
+def _has_fields(template):
+    return any(field is not None for _, field, _, _ in Formatter().parse(template))
+
+
+class MessageCatalog:
+    """
+    Mensajes de un idioma ya formateados para la terminal.
+
+    `palette` es el diccionario de códigos de estilo (ver `colorama_palette`);
+    con None los mensajes se generan sin colores. Los mensajes sin parámetros
+    se guardan como cadena final; los demás como el `format` de su plantilla.
+    """
+
+    def __init__(self, language='es', palette=None):
+        self.language = language if language in MESSAGES else 'es'
+        self.colored = palette is not None
+        self._palette = palette
+        self._static = {}
+        self._templates = {}
+        self._prefixes = {}
+        messages = dict(MESSAGES['es'])
+        messages.update(MESSAGES[self.language])
+        for key, text in messages.items():
+            if isinstance(text, tuple):
+                text = text[0] if self.colored else text[1]
+            template = render_markup(text, palette)
+            if _has_fields(template):
+                self._templates[key] = template.format
+            else:
+                self._static[key] = template.format()
+
+    def __contains__(self, key):
+        return key in self._static or key in self._templates
+
+    def format(self, key, **params):
+        """Mensaje `key` con los parámetros sustituidos."""
+        text = self._static.get(key)
+        if text is not None:
+            return text
+        return self._templates[key](**params)
+
+    def paint(self, text, color=None, style=None):
+        """Texto libre con un color y estilo (p. ej. un informe o un recibo)."""
+        if not self.colored or not color:
+            return text
+        prefix = self._prefixes.get((color, style))
+        if prefix is None:
+            prefix = self._prefixes[(color, style)] = (self._palette.get(style or '', '')
+                                                       + self._palette.get(color, ''))
+        return f"{prefix}{text}{self._palette['/']}"
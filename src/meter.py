@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Estado del taxímetro compartido por la versión de terminal y la GUI.
+"""
+
+# Códigos enteros de estado usados en los formatos binarios (checkpoints, memoria compartida)
+STATE_CODES = {None: 0, 'stopped': 1, 'moving': 2}
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+
+
+class RunningFare:
+    """
+    Acumulador de la tarifa en curso de un viaje.
+
+    Guarda la tarifa ya devengada en los tramos cerrados (y en la distancia
+    recorrida, si hay GPS) y la tarifa por segundo del tramo abierto, de modo
+    que cualquier estimación es una sola multiplicación y suma:
+    ``closed_fare + open_rate * (now - segment_start)``.
+    Al cerrar el viaje ``closed_fare`` se calcula con la misma expresión que
+    ``calculate_fare``, así que el resultado final es idéntico.
+
+    Con `evaluator` (la tarifa compilada del perfil fijado, con sus reglas)
+    la tarifa ya no es lineal: `estimate` evalúa la tarifa compilada sin
+    redondear, `closed_fare` incluye bajada de bandera, tramos, mínimo y
+    máximo, y `open_rate` es la tarifa por segundo del tramo abierto en ese
+    momento. Al redondear, la estimación es la tarifa que se cobrará.
+    """
+
+    def __init__(self, stopped_rate, moving_rate, km_rate=0.0, evaluator=None):
+        self.stopped_rate = stopped_rate
+        self.moving_rate = moving_rate
+        self.km_rate = km_rate
+        self.evaluator = evaluator
+        self.reset()
+
+    def reset(self):
+        """Dejar el acumulador sin viaje activo."""
+        self.state = None
+        self.trip_start = 0.0
+        self.stopped_time = 0.0
+        self.moving_time = 0.0
+        self.distance_km = 0.0
+        self.segments = 0
+        self.segment_start = 0.0
+        self.closed_fare = 0.0
+        self.open_rate = 0.0
+        self.tags = ()
+
+    def start(self, now, state='stopped'):
+        """Empezar un viaje nuevo en `state` en el instante `now`."""
+        self.reset()
+        self.state = state
+        self.trip_start = now
+        self.segment_start = now
+        self.segments = 1
+        if self.evaluator is None:
+            self.open_rate = self._rate_for(state)
+        else:
+            self._refresh_closed_fare()
+
+    def restore(self, state, trip_start, segment_start, stopped_time, moving_time, distance_km=0.0, tags=()):
+        """Reanudar un viaje a partir de sus tramos ya acumulados (checkpoint)."""
+        self.start(trip_start, state)
+        self.segment_start = segment_start
+        self.stopped_time = stopped_time
+        self.moving_time = moving_time
+        self.distance_km = distance_km
+        self.tags = tuple(tags)
+        self._refresh_closed_fare()
+
+    def switch(self, state, now):
+        """Cerrar el tramo abierto y abrir uno nuevo en `state`."""
+        self.close(now)
+        if state != self.state:
+            self.segments += 1
+        self.state = state
+        self.open_rate = self._rate_for(state)
+
+    def close(self, now):
+        """Sumar el tramo abierto a los acumulados sin cambiar de estado."""
+        if self.state is None:
+            return
+        duration = now - self.segment_start
+        if self.state == 'stopped':
+            self.stopped_time += duration
+        else:
+            self.moving_time += duration
+        self.segment_start = now
+        self._refresh_closed_fare()
+
+    def finish(self, now):
+        """Cerrar el último tramo y dejar el viaje sin estado (los acumulados se conservan)."""
+        self.close(now)
+        self.state = None
+        self.open_rate = 0.0
+
+    def add_distance(self, km):
+        """Sumar distancia recorrida (el componente por km entra en la caché)."""
+        if self.state is None:
+            return
+        self.distance_km += km
+        self._refresh_closed_fare()
+
+    def set_tags(self, tags):
+        """Etiquetas del viaje (p. ej. 'aeropuerto') para los suplementos con `when`."""
+        self.tags = tuple(tags)
+        self._refresh_closed_fare()
+
+    def set_rates(self, stopped_rate, moving_rate, km_rate=0.0, evaluator=None):
+        """Cambiar las tarifas (cambio de perfil) e invalidar la caché; sin `evaluator`, solo las tarifas base."""
+        self.stopped_rate = stopped_rate
+        self.moving_rate = moving_rate
+        self.km_rate = km_rate
+        self.evaluator = evaluator
+        self._refresh_closed_fare()
+        if self.state is not None:
+            self.open_rate = self._rate_for(self.state)
+
+    def elapsed(self, now):
+        """Devolver (tiempo parado, tiempo en movimiento) incluyendo el tramo abierto."""
+        if self.state is None:
+            return self.stopped_time, self.moving_time
+        duration = now - self.segment_start
+        if self.state == 'stopped':
+            return self.stopped_time + duration, self.moving_time
+        return self.stopped_time, self.moving_time + duration
+
+    def estimate(self, now):
+        """Tarifa estimada en el instante `now` (sin redondear)."""
+        if self.state is None:
+            return self.closed_fare
+        if self.evaluator is not None:
+            stopped_time, moving_time = self.elapsed(now)
+            return self.evaluator.estimate(stopped_time, moving_time, self.distance_km, self.tags)
+        return self.closed_fare + self.open_rate * (now - self.segment_start)
+
+    def line(self, now):
+        """
+        (tarifa en `segment_start`, tarifa por segundo) de la recta que pasa
+        por la estimación en `now`: lo que publica el estado en vivo para que
+        los lectores estimen con una multiplicación y suma.
+
+        Sin reglas es (closed_fare, open_rate); con reglas vale hasta el
+        siguiente cambio de tramo, mínimo o máximo.
+        """
+        if self.evaluator is None or self.state is None:
+            return self.closed_fare, self.open_rate
+        fare = self.estimate(now)
+        stopped_time, moving_time = self.elapsed(now)
+        spent = stopped_time if self.state == 'stopped' else moving_time
+        rate = self.evaluator.marginal_rate(self.state, spent, fare)
+        return fare - rate * (now - self.segment_start), rate
+
+    def _rate_for(self, state):
+        if self.evaluator is not None:
+            spent = self.stopped_time if state == 'stopped' else self.moving_time
+            return self.evaluator.marginal_rate(state, spent, self.closed_fare)
+        return self.stopped_rate if state == 'stopped' else self.moving_rate
+
+    def _refresh_closed_fare(self):
+        if self.evaluator is not None:
+            # La tarifa compilada del viaje, sin redondear: al final coincide con calculate_fare
+            self.closed_fare = self.evaluator.estimate(self.stopped_time, self.moving_time,
+                                                       self.distance_km, self.tags)
+            if self.state is not None:
+                self.open_rate = self._rate_for(self.state)
+            return
+        # Misma expresión que calculate_fare para que el total final coincida
+        self.closed_fare = (self.stopped_time * self.stopped_rate + self.moving_time * self.moving_rate
+                            + self.distance_km * self.km_rate)
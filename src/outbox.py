@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""
+Envío de los viajes terminados al servidor central (outbox).
+
+Al terminar un viaje su registro se guarda en una cola en disco (SQLite en
+modo WAL, una por taxi: `cab_outbox_path`) y el taxímetro sigue sin esperar a
+la red.
+Un hilo en segundo plano (`OutboxSender`) vacía la cola:
+
+- agrupa los registros en lotes de hasta `batch_size` viajes;
+- envía cada lote como JSON comprimido con gzip en un POST;
+- reutiliza conexiones HTTP/1.1 persistentes de un pool pequeño;
+- si la red falla o el servidor responde 429/5xx, reintenta el mismo lote
+  con espera exponencial (con jitter) hasta `max_backoff` segundos;
+- si responde con otro 4xx, el lote se marca como rechazado y deja de
+  enviarse (se conserva en la cola para revisarlo).
+
+Un registro solo sale de la cola cuando el servidor confirma el lote, así
+que un corte de red o de corriente no pierde viajes. Un lote confirmado
+cuya respuesta no llegó se reenvía: cada viaje lleva `cab` e `id` para que
+el servidor descarte duplicados.
+
+`StubBackend` es un servidor local que imita al central para los tests y el
+benchmark.
+
+Uso:
+    python -m src.outbox stub [--port N]          servidor local de pruebas
+    python -m src.outbox bench [--trips N]        rendimiento contra el servidor local
+"""
+import gzip
+import http.client
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+OutboxStats = namedtuple('OutboxStats', ['pending', 'lag_s', 'sent', 'batches', 'retries', 'rejected',
+                                         'trips_per_s', 'connections', 'last_error'])
+
+# AUTOINCREMENT: los ids no se reutilizan al vaciarse la cola (el servidor descarta duplicados por id)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    record TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def cab_outbox_path(directory, cab_id):
+    """Cola propia del taxi `cab_id`: los viajes de una cola se envían con ese taxi."""
+    return os.path.join(directory, f"outbox-{cab_id}.db")
+
+
+class Outbox:
+    """
+    Cola persistente de registros de viaje pendientes de enviar.
+
+    Cada hilo usa su propio objeto (sqlite3 no comparte conexiones entre
+    hilos); en modo WAL el taxímetro añade viajes mientras el emisor lee.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def put(self, record, now=None):
+        """Encolar un registro (diccionario serializable a JSON); devuelve su id."""
+        with self._conn:
+            cursor = self._conn.execute("INSERT INTO outbox (created, record) VALUES (?, ?)",
+                                        (time.time() if now is None else now, json.dumps(record)))
+        return cursor.lastrowid
+
+    def peek(self, limit):
+        """Los `limit` registros pendientes más antiguos: [(id, registro en JSON)]."""
+        return self._conn.execute("SELECT id, record FROM outbox WHERE rejected = 0 ORDER BY id LIMIT ?",
+                                  (limit,)).fetchall()
+
+    def ack(self, ids):
+        """Quitar de la cola los registros que el servidor confirmó."""
+        with self._conn:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", ((i,) for i in ids))
+
+    def retry(self, ids):
+        """Contar un intento fallido de los registros `ids`."""
+        with self._conn:
+            self._conn.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", ((i,) for i in ids))
+
+    def reject(self, ids):
+        """Dejar de enviar registros que el servidor no acepta (se conservan para revisarlos)."""
+        with self._conn:
+            self._conn.executemany("UPDATE outbox SET rejected = 1, attempts = attempts + 1 WHERE id = ?",
+                                   ((i,) for i in ids))
+
+    def pending(self):
+        """Registros pendientes de enviar."""
+        return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE rejected = 0").fetchone()[0]
+
+    def rejected(self):
+        """Registros rechazados por el servidor."""
+        return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE rejected = 1").fetchone()[0]
+
+    def lag(self, now=None):
+        """Segundos que lleva en la cola el registro pendiente más antiguo (0 con la cola vacía)."""
+        row = self._conn.execute("SELECT created FROM outbox WHERE rejected = 0 ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return 0.0
+        return max(0.0, (time.time() if now is None else now) - row[0])
+
+    def close(self):
+        self._conn.close()
+
+
+class ConnectionPool:
+    """
+    Conexiones HTTP persistentes a un servidor.
+
+    `get` devuelve una conexión libre o abre una nueva; `put` la devuelve al
+    pool si sigue abierta y hay sitio. `opened` cuenta las conexiones
+    abiertas en total (con keep-alive, una por hilo que envía).
+    """
+
+    def __init__(self, url, size=2, timeout=5.0):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"URL del servidor central no válida: {url}")
+        self._factory = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or '/'
+        self.size = size
+        self.timeout = timeout
+        self.opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        return self._factory(self.host, self.port, timeout=self.timeout)
+
+    def put(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+# Resultado del envío de un lote
+SENT, RETRY, REJECTED = 'sent', 'retry', 'rejected'
+
+
+class OutboxSender:
+    """
+    Hilo que vacía la cola hacia `url`.
+
+    `notify()` lo despierta en cuanto se encola un viaje; sin avisos revisa
+    la cola cada `interval` segundos. `stop()` no espera a la red más de
+    `join_timeout`: lo que no se haya enviado sigue en la cola para la
+    próxima vez.
+    """
+
+    def __init__(self, path, url, cab_id=0, batch_size=100, interval=5.0, backoff=0.5, max_backoff=60.0,
+                 timeout=5.0, connections=2):
+        self.path = path
+        self.cab_id = cab_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool = ConnectionPool(url, connections, timeout)
+        self.sent = 0
+        self.batches = 0
+        self.retries = 0
+        self.rejected = 0
+        self.failures = 0
+        self.last_error = None
+        self._busy_s = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """Hay viajes nuevos en la cola."""
+        self._wake.set()
+
+    def stop(self, join_timeout=1.0):
+        """Parar el hilo sin bloquear al taxímetro más de `join_timeout` segundos."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(join_timeout)
+        self.pool.close()
+
+    def stats(self, outbox, now=None):
+        """Métricas del envío; `outbox` es la cola del hilo que pregunta (para pendientes y retraso)."""
+        rate = self.sent / self._busy_s if self._busy_s else 0.0
+        return OutboxStats(outbox.pending(), outbox.lag(now), self.sent, self.batches, self.retries,
+                           self.rejected, rate, self.pool.opened, self.last_error)
+
+    def _run(self):
+        outbox = None
+        try:
+            while not self._stop.is_set():
+                # Borrar el aviso antes de leer: un viaje encolado después vuelve a despertar al hilo
+                self._wake.clear()
+                try:
+                    if outbox is None:
+                        outbox = Outbox(self.path)
+                    if not self._send_next(outbox):
+                        self._wake.wait(self.interval)
+                except Exception as e:
+                    # Error pasajero (p. ej. `database is locked` mientras se encola): el hilo sigue
+                    self.last_error = str(e) or type(e).__name__
+                    logging.warning(f"Error enviando viajes, se reintentará: {self.last_error}")
+                    self.retries += 1
+                    self._back_off()
+        finally:
+            if outbox is not None:
+                outbox.close()
+
+    def _send_next(self, outbox):
+        """Enviar el lote siguiente de la cola; False si estaba vacía."""
+        batch = outbox.peek(self.batch_size)
+        if not batch:
+            return False
+        ids = [row[0] for row in batch]
+        started = time.perf_counter()
+        result = self.send(batch)
+        self._busy_s += time.perf_counter() - started
+        if result == SENT:
+            outbox.ack(ids)
+            self.sent += len(ids)
+            self.batches += 1
+            self.failures = 0
+        elif result == REJECTED:
+            outbox.reject(ids)
+            self.rejected += len(ids)
+        else:
+            outbox.retry(ids)
+            self.retries += 1
+            self._back_off()
+        return True
+
+    def _back_off(self):
+        # Espera exponencial con jitter; solo `stop` la interrumpe
+        self.failures += 1
+        delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+        self._stop.wait(delay * random.uniform(0.5, 1.0))
+
+    def send(self, batch):
+        """Enviar un lote [(id, registro en JSON)]; devuelve SENT, RETRY o REJECTED."""
+        trips = [dict(json.loads(record), id=row_id) for row_id, record in batch]
+        body = gzip.compress(json.dumps({'cab': self.cab_id, 'trips': trips}).encode('utf-8'), 6)
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip',
+                   'Content-Length': str(len(body))}
+        connection = self.pool.get()
+        try:
+            connection.request('POST', self.pool.path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            # Conexión caída o servidor inaccesible: se abre otra en el siguiente intento
+            connection.close()
+            self.last_error = str(e) or type(e).__name__
+            logging.warning(f"Envío de viajes fallido, se reintentará: {self.last_error}")
+            return RETRY
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.put(connection)
+        if 200 <= response.status < 300:
+            return SENT
+        self.last_error = f"HTTP {response.status}"
+        if response.status == 429 or response.status >= 500:
+            logging.warning(f"Servidor central no disponible ({self.last_error}), se reintentará")
+            return RETRY
+        logging.error(f"Servidor central rechazó {len(batch)} viajes ({self.last_error})")
+        return REJECTED
+
+
+class StubBackend:
+    """
+    Servidor local que imita al servidor central.
+
+    Acepta POST con JSON (gzip o sin comprimir), guarda los viajes por
+    (cab, id) descartando duplicados y responde 200. `fail(n, status)` hace
+    que las `n` peticiones siguientes respondan `status`. `connections`
+    cuenta las conexiones TCP aceptadas.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        backend = self
+        self.trips = {}
+        self.requests = 0
+        self.connections = 0
+        self._failures = []
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with backend._lock:
+                    backend.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status = backend._receive(body, self.headers.get('Content-Encoding'))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/trips"
+
+    def start(self):
+        # Sondeo corto: stop() no espera medio segundo (el servidor solo es para pruebas)
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), name='outbox-stub',
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail(self, count, status=503):
+        """Responder `status` a las `count` peticiones siguientes."""
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def _receive(self, body, encoding):
+        with self._lock:
+            self.requests += 1
+            if self._failures:
+                return self._failures.pop(0)
+        try:
+            if encoding == 'gzip':
+                body = gzip.decompress(body)
+            payload = json.loads(body)
+            trips = {(payload['cab'], trip['id']): trip for trip in payload['trips']}
+        except (OSError, ValueError, KeyError, TypeError):
+            return 400
+        with self._lock:
+            self.trips.update(trips)
+        return 200
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def benchmark(trips=20_000, batch_size=200, put_rate=None):
+    """Viajes por segundo entregados al servidor local y retraso máximo de la cola."""
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory, StubBackend() as backend:
+        path = os.path.join(directory, 'outbox.db')
+        outbox = Outbox(path)
+        sender = OutboxSender(path, backend.url, batch_size=batch_size, interval=0.05).start()
+        record = {'timestamp': '2025-12-11 09:30:00', 'stopped_time': 8.1, 'moving_time': 18.5,
+                  'fare': 1.09, 'profile': 'normal', 'segments': 3}
+        started = time.perf_counter()
+        worst_lag = 0.0
+        for i in range(trips):
+            outbox.put(record)
+            sender.notify()
+            if put_rate:
+                time.sleep(1 / put_rate)
+            if i % 1000 == 0:
+                worst_lag = max(worst_lag, outbox.lag())
+        while len(backend.trips) < trips:
+            worst_lag = max(worst_lag, outbox.lag())
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        stats = sender.stats(outbox)
+        sender.stop()
+        outbox.close()
+    return trips / elapsed, worst_lag, stats
+
+
+def main(argv=None):
+    """Punto de entrada de línea de comandos."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Envío de viajes al servidor central")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    stub = subparsers.add_parser('stub', help="servidor central de pruebas")
+    stub.add_argument('--port', type=int, default=8765)
+    bench = subparsers.add_parser('bench', help="rendimiento contra el servidor local")
+    bench.add_argument('--trips', type=int, default=20_000)
+    bench.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    if args.mode == 'bench':
+        rate, worst_lag, stats = benchmark(args.trips, args.batch_size)
+        print(f"entregados     {rate:12,.0f} viajes/s (encolar y enviar)")
+        print(f"envío          {stats.trips_per_s:12,.0f} viajes/s ({stats.batches} lotes, "
+              f"{stats.connections} conexiones)")
+        print(f"retraso máx.   {worst_lag * 1000:12.1f} ms en cola")
+        return 0
+    backend = StubBackend(port=args.port).start()
+    print(f"Servidor central de pruebas en {backend.url} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{len(backend.trips)} viajes recibidos en {backend.requests} peticiones")
+    except KeyboardInterrupt:
+        backend.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
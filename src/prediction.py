@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Estimación de la tarifa antes de empezar el viaje a partir del historial.
+
+Para cada perfil y hora del día se guarda un histograma compacto de los
+viajes: celdas por duración total (escala logarítmica) y proporción del
+tiempo parado, con el número de viajes y la suma de segundos parado y en
+movimiento de cada celda. La tarifa de una celda es la de su viaje medio con
+la tarifa actual del perfil pedido, así que cambiar las reglas no obliga a
+releer el historial.
+
+La mediana y el p90 de cada (histograma, perfil) se calculan una vez y se
+guardan; una estimación es una búsqueda en un diccionario. Añadir viajes
+solo invalida los histogramas que tocan, que se recalculan en la siguiente
+estimación. Si una hora tiene pocos viajes se usan, por este orden, todos
+los perfiles a esa hora, el perfil a cualquier hora y el historial entero.
+
+Uso (benchmark):
+    python -m src.prediction [--trips N] [--quotes N]
+"""
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+# Celdas de duración total: 0-10 s y después escala logarítmica hasta 4 horas (las más largas, en la última)
+DURATION_BINS = 32
+DURATION_EDGES = tuple([0.0] + [10.0 * 1440.0 ** (i / (DURATION_BINS - 2)) for i in range(DURATION_BINS - 1)])
+RATIO_BINS = 8
+CELLS = DURATION_BINS * RATIO_BINS
+
+Prediction = namedtuple('Prediction', ['median', 'p90', 'trips', 'profile', 'hour'])
+PredictorStats = namedtuple('PredictorStats', ['trips', 'histograms', 'tables', 'last_id'])
+
+_MISSING = object()
+
+
+def trip_hour(timestamp):
+    """Hora del día de una fecha del historial ("YYYY-MM-DD HH:MM:SS"); None si no tiene ese formato."""
+    hour = timestamp[11:13]
+    return int(hour) if len(hour) == 2 and hour.isdigit() and int(hour) < 24 else None
+
+
+def trip_cell(stopped_time, moving_time):
+    """Celda del histograma de un viaje."""
+    total = stopped_time + moving_time
+    duration_bin = min(bisect_right(DURATION_EDGES, total) - 1, DURATION_BINS - 1)
+    ratio_bin = min(int(stopped_time / total * RATIO_BINS), RATIO_BINS - 1) if total > 0 else 0
+    return duration_bin * RATIO_BINS + ratio_bin
+
+
+class _Histogram:
+    """Viajes por celda y segundos parado/en movimiento acumulados en cada una."""
+
+    __slots__ = ('trips', 'counts', 'stopped', 'moving')
+
+    def __init__(self):
+        self.trips = 0
+        self.counts = array('L', [0]) * CELLS
+        self.stopped = array('d', [0.0]) * CELLS
+        self.moving = array('d', [0.0]) * CELLS
+
+    def add(self, cell, stopped_time, moving_time):
+        self.trips += 1
+        self.counts[cell] += 1
+        self.stopped[cell] += stopped_time
+        self.moving[cell] += moving_time
+
+    def quantiles(self, evaluate, profile_name, levels):
+        """Tarifas de `profile_name` en los cuantiles `levels` (viaje medio de cada celda)."""
+        cells = []
+        for cell, count in enumerate(self.counts):
+            if count:
+                cells.append((evaluate(self.stopped[cell] / count, self.moving[cell] / count, profile_name), count))
+        cells.sort()
+        results = []
+        seen = 0
+        cells = iter(cells)
+        fare = None
+        for level in levels:
+            # Cuantil inferior: la primera celda que alcanza level * viajes
+            while seen < level * self.trips or fare is None:
+                fare, count = next(cells)
+                seen += count
+            results.append(fare)
+        return results
+
+
+class FarePredictor:
+    """
+    Mediana y p90 de la tarifa por perfil y hora del día.
+
+    `evaluate(stopped_s, moving_s, profile_name)` calcula la tarifa sin
+    efectos secundarios; solo se llama al recalcular una tabla. Los
+    histogramas con menos de `min_trips` viajes ceden el sitio a uno más
+    general.
+    """
+
+    LEVELS = (0.5, 0.9)
+
+    def __init__(self, evaluate, min_trips=20):
+        self._evaluate = evaluate
+        self.min_trips = min_trips
+        self.last_id = 0
+        self._histograms = {}
+        # (perfil o None, hora o None) -> {perfil pedido: (mediana, p90)}
+        self._tables = {}
+        # (perfil pedido, hora) -> Prediction o None
+        self._quotes = {}
+
+    @property
+    def trips(self):
+        histogram = self._histograms.get((None, None))
+        return histogram.trips if histogram is not None else 0
+
+    def add(self, timestamp, stopped_time, moving_time, profile=None):
+        """Sumar un viaje del historial (`profile` es el perfil con el que se cobró)."""
+        hour = trip_hour(timestamp)
+        cell = trip_cell(stopped_time, moving_time)
+        for key in {(profile, hour), (None, hour), (profile, None), (None, None)}:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.add(cell, stopped_time, moving_time)
+            self._tables.pop(key, None)
+        self._quotes.clear()
+
+    def refresh(self, repository):
+        """Sumar los viajes del repositorio guardados desde la última vez; devuelve cuántos."""
+        added = 0
+        for record in repository.trips_after(self.last_id):
+            self.add(record.timestamp, record.stopped_time, record.moving_time, record.profile)
+            self.last_id = record.id
+            added += 1
+        return added
+
+    def invalidate(self):
+        """Descartar las tablas calculadas con la tarifa anterior (los histogramas se conservan)."""
+        self._tables.clear()
+        self._quotes.clear()
+
+    def precompute(self, profile_names):
+        """Calcular por adelantado las estimaciones de cada perfil a cada hora."""
+        for profile_name in profile_names:
+            for hour in range(24):
+                self.predict(profile_name, hour)
+
+    def predict(self, profile_name, hour):
+        """Estimación de un viaje de `profile_name` que empieza a la hora `hour`; None sin historial."""
+        key = (profile_name, hour)
+        prediction = self._quotes.get(key, _MISSING)
+        if prediction is _MISSING:
+            prediction = self._quotes[key] = self._resolve(profile_name, hour)
+        return prediction
+
+    def _resolve(self, profile_name, hour):
+        for key in ((profile_name, hour), (None, hour), (profile_name, None), (None, None)):
+            histogram = self._histograms.get(key)
+            if histogram is None or (histogram.trips < self.min_trips and key != (None, None)):
+                continue
+            tables = self._tables.setdefault(key, {})
+            quantiles = tables.get(profile_name)
+            if quantiles is None:
+                quantiles = tables[profile_name] = tuple(histogram.quantiles(self._evaluate, profile_name,
+                                                                             self.LEVELS))
+            return Prediction(quantiles[0], quantiles[1], histogram.trips, key[0], key[1])
+        return None
+
+    def stats(self):
+        """Viajes sumados, histogramas, tablas calculadas e id del último viaje leído del repositorio."""
+        tables = sum(len(table) for table in self._tables.values())
+        return PredictorStats(self.trips, len(self._histograms), tables, self.last_id)
+
+
+def benchmark(trips=100_000, quotes=1_000_000, profiles=('normal', 'alta', 'baja')):
+    """Viajes por segundo al construir, segundos en precalcular y estimaciones por segundo."""
+    import random
+    from src.rules import CompiledProfile
+    rates = {'normal': (0.02, 0.05), 'alta': (0.03, 0.07), 'baja': (0.015, 0.04)}
+    compiled = {name: CompiledProfile({'stopped': rates[name][0], 'moving': rates[name][1]}, name)
+                for name in profiles}
+    rng = random.Random(0)
+    history = []
+    for i in range(trips):
+        total = rng.lognormvariate(6.5, 0.7)
+        stopped = total * rng.betavariate(2, 5)
+        history.append((f"2025-12-{1 + i % 28:02d} {rng.randrange(24):02d}:00:00", stopped, total - stopped,
+                        profiles[i % len(profiles)]))
+
+    predictor = FarePredictor(lambda stopped, moving, name: compiled[name].fare(stopped, moving))
+    started = time.perf_counter()
+    for trip in history:
+        predictor.add(*trip)
+    build_rate = trips / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    predictor.precompute(profiles)
+    precompute_s = time.perf_counter() - started
+
+    queries = [(profiles[i % len(profiles)], i % 24) for i in range(quotes)]
+    predict = predictor.predict
+    started = time.perf_counter()
+    for profile_name, hour in queries:
+        predict(profile_name, hour)
+    quote_rate = quotes / (time.perf_counter() - started)
+    return build_rate, precompute_s, quote_rate
+
+
+def main(argv=None):
+    """Punto de entrada del benchmark."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark de las estimaciones antes del viaje")
+    parser.add_argument('--trips', type=int, default=100_000)
+    parser.add_argument('--quotes', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    build_rate, precompute_s, quote_rate = benchmark(args.trips, args.quotes)
+    print(f"construir      {build_rate:12,.0f} viajes/s")
+    print(f"precalcular    {precompute_s * 1000:12.1f} ms (3 perfiles x 24 horas)")
+    print(f"estimar        {quote_rate:12,.0f} estimaciones/s ({1e6 / quote_rate:.2f} µs por estimación)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Presupuestos de tarifa con caché LRU.
+
+Los presupuestos ("¿cuánto costaría este viaje?") se repiten mucho con las
+mismas duraciones. Las duraciones y la distancia se cuantizan (por defecto a
+la décima de segundo y a la centésima de km, la resolución del historial) y
+el resultado se guarda en una caché LRU acotada. La clave incluye la versión
+del snapshot de tarifas (`TariffSnapshot.version`): un cambio de perfil o de
+reglas no vacía la caché, los presupuestos de la versión anterior dejan de
+pedirse y el LRU los descarta.
+"""
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+QuoteStats = namedtuple('QuoteStats', ['hits', 'misses', 'size', 'maxsize'])
+
+
+def _ticks(value, resolution, name):
+    # Negativos, NaN, infinitos o tan grandes que no se pueden cuantizar: no son un viaje
+    ticks = value / resolution
+    if not math.isfinite(ticks) or value < 0:
+        raise ValueError(f"{name} debe ser un número finito no negativo: {value}")
+    return round(ticks)
+
+
+class QuoteCache:
+    """
+    Caché de presupuestos sobre una función de tarifa.
+
+    `evaluate(stopped_s, moving_s, profile_name, distance_km, version)`
+    calcula la tarifa con el snapshot `version` sin efectos secundarios;
+    solo se llama en los fallos de caché.
+    """
+
+    def __init__(self, evaluate, maxsize=4096, resolution_s=0.1, resolution_km=0.01):
+        self._evaluate = evaluate
+        self.resolution_s = resolution_s
+        self.resolution_km = resolution_km
+        self._cached = None
+        self.resize(maxsize)
+
+    def resize(self, maxsize):
+        """Cambiar el tamaño máximo (vacía la caché)."""
+        self.maxsize = maxsize
+        self._cached = lru_cache(maxsize=maxsize)(self._compute)
+
+    def _compute(self, stopped_ticks, moving_ticks, profile_name, km_ticks, version):
+        return self._evaluate(stopped_ticks * self.resolution_s, moving_ticks * self.resolution_s,
+                              profile_name, km_ticks * self.resolution_km, version)
+
+    def quote(self, stopped_s, moving_s, profile_name, distance_km=0.0, version=0):
+        """
+        Tarifa de un viaje con las duraciones cuantizadas, con el snapshot de
+        tarifas `version`. ValueError si alguna magnitud es negativa o no finita.
+        """
+        return self._cached(_ticks(stopped_s, self.resolution_s, "El tiempo parado"),
+                            _ticks(moving_s, self.resolution_s, "El tiempo en movimiento"),
+                            profile_name, _ticks(distance_km, self.resolution_km, "La distancia"), version)
+
+    def clear(self):
+        """Vaciar la caché (y sus estadísticas)."""
+        self._cached.cache_clear()
+
+    def stats(self):
+        """Aciertos, fallos y ocupación de la caché."""
+        info = self._cached.cache_info()
+        return QuoteStats(info.hits, info.misses, info.currsize, info.maxsize)
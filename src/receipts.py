@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Recibos de viaje en texto, HTML y bytes ESC/POS para impresora térmica.
+
+Cada plantilla se compila una vez por (formato, perfil, idioma): las
+etiquetas traducidas, el nombre del perfil y sus tarifas quedan fijados en
+una cadena de formato y renderizar un recibo es una sola llamada a
+`str.format` con los datos del viaje. El modo por lotes renderiza un rango
+del historial repartiendo bloques de viajes en un pool de procesos.
+
+Uso (lotes):
+    python -m src.receipts --start 0 --stop 1000 --format html --output recibos/
+"""
+import argparse
+import html
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+from src.history import history_paths, merge_history_lines, parse_history_line
+
+FORMATS = ('text', 'html', 'escpos')
+EXTENSIONS = {'text': 'txt', 'html': 'html', 'escpos': 'bin'}
+
+# Orden de los campos = posiciones en las plantillas compiladas
+Receipt = namedtuple('Receipt', ['timestamp', 'stopped_time', 'moving_time', 'total_time', 'fare'])
+
+LABELS = {
+    'es': {
+        'title': "RESUMEN DEL VIAJE",
+        'date': "Fecha",
+        'profile': "Perfil",
+        'stopped': "Tiempo parado",
+        'moving': "Tiempo movimiento",
+        'total': "Tiempo total",
+        'fare': "Tarifa total",
+        'rates': "Tarifa: €{stopped}/s parado, €{moving}/s en movimiento",
+        'thanks': "¡Gracias por viajar con nosotros!",
+    },
+    'en': {
+        'title': "TRIP RECEIPT",
+        'date': "Date",
+        'profile': "Profile",
+        'stopped': "Time stopped",
+        'moving': "Time moving",
+        'total': "Total time",
+        'fare': "Total fare",
+        'rates': "Rates: €{stopped}/s stopped, €{moving}/s moving",
+        'thanks': "Thank you for riding with us!",
+    },
+}
+
+# ESC/POS: inicializar, página de códigos 858 (con €), alinear, negrita y corte
+_ESC_INIT = "\x1b@\x1bt\x13"
+_ESC_CENTER = "\x1ba\x01"
+_ESC_LEFT = "\x1ba\x00"
+_ESC_BOLD_ON = "\x1bE\x01"
+_ESC_BOLD_OFF = "\x1bE\x00"
+_ESC_CUT = "\n\n\n\x1dV\x01"
+_ESC_ENCODING = 'cp858'
+_ESC_WIDTH = 32
+
+
+def _braces(text):
+    # Texto fijo dentro de una cadena de formato
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+def _text_template(labels, profile):
+    width = 44
+    # ⏱️ ocupa una columna en la mayoría de terminales: se compensa con un espacio
+    rows = [
+        ("📅 ", labels['date'], "{0:>19}"),
+        ("🛑 ", labels['stopped'], "{1:>18.1f}s"),
+        ("🏃 ", labels['moving'], "{2:>18.1f}s"),
+        ("⏱️  ", labels['total'], "{3:>18.1f}s"),
+        ("💰 ", labels['fare'], "{4:>18.2f}€"),
+    ]
+    lines = ["╔" + "═" * width + "╗",
+             "║" + _braces(labels['title'].center(width)) + "║",
+             "║" + _braces(f" {labels['profile']}: {profile['name']}".ljust(width)) + "║",
+             "╠" + "═" * width + "╣"]
+    for icon, label, field in rows:
+        lines.append(f"║ {icon}{_braces(label + ':'):<20}{field} ║")
+    lines.append("╚" + "═" * width + "╝")
+    return "\n".join(lines)
+
+
+def _html_template(labels, profile):
+    def row(label, field):
+        return f"<tr><th>{_braces(html.escape(label))}</th><td>{field}</td></tr>"
+    rates = labels['rates'].format(stopped=profile['stopped'], moving=profile['moving'])
+    return "".join([
+        '<div class="receipt">',
+        f"<h1>{_braces(html.escape(labels['title']))}</h1>",
+        "<table>",
+        row(labels['date'], "{0}"),
+        row(labels['profile'], _braces(html.escape(profile['name']))),
+        row(labels['stopped'], "{1:.1f} s"),
+        row(labels['moving'], "{2:.1f} s"),
+        row(labels['total'], "{3:.1f} s"),
+        row(labels['fare'], "€{4:.2f}"),
+        "</table>",
+        f"<p>{_braces(html.escape(rates))}</p>",
+        "</div>",
+    ])
+
+
+def _escpos_template(labels, profile):
+    def row(label, field, width):
+        return _braces(label) + " " * max(1, _ESC_WIDTH - len(label) - width) + field
+    return "\n".join([
+        _ESC_INIT + _ESC_CENTER + _ESC_BOLD_ON + _braces(labels['title']) + _ESC_BOLD_OFF,
+        _braces(profile['name']),
+        _ESC_LEFT + "-" * _ESC_WIDTH,
+        row(labels['date'], "{0:>19}", 19),
+        row(labels['stopped'], "{1:>8.1f}s", 9),
+        row(labels['moving'], "{2:>8.1f}s", 9),
+        row(labels['total'], "{3:>8.1f}s", 9),
+        "-" * _ESC_WIDTH,
+        _ESC_BOLD_ON + row(labels['fare'], "{4:>8.2f}€", 9) + _ESC_BOLD_OFF,
+        _ESC_CENTER + _braces(labels['thanks']) + _ESC_CUT,
+    ])
+
+
+_BUILDERS = {'text': _text_template, 'html': _html_template, 'escpos': _escpos_template}
+
+
+@lru_cache(maxsize=None)
+def compile_template(kind, profile_name, stopped_rate, moving_rate, locale='es'):
+    """Plantilla compilada: función que recibe un Receipt y devuelve el recibo."""
+    if kind not in _BUILDERS:
+        raise ValueError(f"Formato de recibo desconocido: {kind} (formatos: {', '.join(FORMATS)})")
+    labels = LABELS.get(locale, LABELS['es'])
+    profile = {'name': profile_name, 'stopped': stopped_rate, 'moving': moving_rate}
+    fmt = _BUILDERS[kind](labels, profile).format
+    if kind == 'escpos':
+        return lambda receipt: fmt(*receipt).encode(_ESC_ENCODING, errors='replace')
+    return lambda receipt: fmt(*receipt)
+
+
+def receipt_renderer(kind, profile, locale='es'):
+    """Renderizador cacheado para un perfil de PRICE_PROFILES."""
+    return compile_template(kind, profile['name'], profile['stopped'], profile['moving'], locale)
+
+
+def render_receipt(kind, receipt, profile, locale='es'):
+    """Renderizar un recibo (str en text/html, bytes en escpos)."""
+    return receipt_renderer(kind, profile, locale)(receipt)
+
+
+def receipt_for(timestamp, stopped_time, moving_time, fare):
+    """Datos de recibo de un viaje terminado."""
+    return Receipt(timestamp, stopped_time, moving_time, stopped_time + moving_time, fare)
+
+
+def _render_chunk(kind, profile, locale, receipts):
+    """Renderizar un bloque de recibos (se ejecuta en un proceso del pool)."""
+    render = receipt_renderer(kind, profile, locale)
+    return [render(receipt) for receipt in receipts]
+
+
+def _history_receipts(lines):
+    for line in lines:
+        trip = parse_history_line(line)
+        if trip is not None:
+            yield Receipt(*trip)
+
+
+def render_batch(receipts, kind, profile, locale='es', workers=None, chunk_size=500):
+    """
+    Renderizar muchos recibos en paralelo, en el orden de `receipts`.
+
+    Los bloques se reparten en un pool de procesos con un número acotado en
+    vuelo; `workers=0` renderiza en el propio proceso.
+    """
+    profile = {'name': profile['name'], 'stopped': profile['stopped'], 'moving': profile['moving']}
+    receipts = iter(receipts)
+    chunks = iter(lambda: list(islice(receipts, chunk_size)), [])
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 0:
+        for chunk in chunks:
+            yield from _render_chunk(kind, profile, locale, chunk)
+        return
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in chunks:
+            pending.append(pool.submit(_render_chunk, kind, profile, locale, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def render_history_range(paths, start, stop, kind, profile, output_dir, locale='es', workers=None):
+    """
+    Renderizar los viajes `start`..`stop` (exclusivo) del historial a ficheros.
+
+    Los viajes se numeran en orden cronológico sobre el historial mezclado;
+    cada recibo se guarda como `recibo-<n>.<ext>`. Devuelve cuántos se escribieron.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    receipts = islice(_history_receipts(merge_history_lines(paths)), start, stop)
+    extension = EXTENSIONS[kind]
+    written = 0
+    for number, rendered in enumerate(render_batch(receipts, kind, profile, locale, workers), start):
+        mode = 'wb' if isinstance(rendered, bytes) else 'w'
+        with open(os.path.join(output_dir, f"recibo-{number}.{extension}"), mode,
+                  **({} if mode == 'wb' else {'encoding': 'utf-8'})) as f:
+            f.write(rendered)
+        written += 1
+    return written
+
+
+def main(argv=None):
+    """Punto de entrada de línea de comandos (recibos por lotes)."""
+    from config import settings
+    from main import PRICE_PROFILES
+
+    parser = argparse.ArgumentParser(description="Renderizar recibos de un rango del historial")
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--stop', type=int, default=None)
+    parser.add_argument('--format', choices=FORMATS, default='text')
+    parser.add_argument('--profile', choices=sorted(PRICE_PROFILES), default='normal')
+    parser.add_argument('--locale', choices=sorted(LABELS), default=settings.RECEIPT_LOCALE)
+    parser.add_argument('--workers', type=int, default=None, help="procesos del pool (0 = sin pool)")
+    parser.add_argument('--output', default=os.path.join(settings.LOGS_DIR, 'recibos'))
+    args = parser.parse_args(argv)
+
+    paths = history_paths(settings.HISTORY_FILE, settings.HISTORY_SHARD_DIR)
+    written = render_history_range(paths, args.start, args.stop, args.format, PRICE_PROFILES[args.profile],
+                                   args.output, args.locale, args.workers)
+    print(f"{written} recibos escritos en {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Repositorio SQLite de viajes.
+
+Guarda lo mismo que `save_trip_to_history` escribe en el historial de texto,
+más el perfil de tarifas y el número de tramos parado/en movimiento, para
+poder consultar por fecha, perfil y rango de tarifa sin parsear ficheros.
+
+Se mantiene una sola conexión abierta en modo WAL (los lectores no bloquean
+al escritor). Las sentencias son textos constantes con parámetros, así que
+sqlite3 las prepara una vez y las reutiliza desde su caché de sentencias.
+
+El historial de texto (el del taxímetro, los de otros taxis y los de la flota)
+se importa de forma incremental con `sync_history`: la tabla `imported_files`
+guarda hasta qué byte se importó cada fichero, y cada sincronización lee solo
+lo añadido después. Así `history` (SQLite) y estadísticas, exportación y
+re-tarificación (texto) ven los mismos viajes.
+"""
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+
+from src.history import merge_history_lines, parse_history_line
+
+TripRecord = namedtuple('TripRecord', ['id', 'timestamp', 'stopped_time', 'moving_time',
+                                       'total_time', 'fare', 'profile', 'segments'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    stopped_time REAL NOT NULL,
+    moving_time REAL NOT NULL,
+    total_time REAL NOT NULL,
+    fare REAL NOT NULL,
+    profile TEXT,
+    segments INTEGER
+);
+CREATE INDEX IF NOT EXISTS trips_timestamp ON trips (timestamp);
+CREATE TABLE IF NOT EXISTS imported_files (
+    source TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+"""
+
+_INSERT = ("INSERT INTO trips (timestamp, stopped_time, moving_time, total_time, fare, profile, segments) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+# Bases de datos anteriores a `imported_files`: un viaje del texto solo entra si no está ya
+# (el texto redondea los tiempos a décimas y la tarifa a céntimos)
+_INSERT_MISSING = (
+    "INSERT INTO trips (timestamp, stopped_time, moving_time, total_time, fare, profile, segments) "
+    "SELECT ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM trips WHERE timestamp = ? "
+    "AND abs(stopped_time - ?) < 0.051 AND abs(moving_time - ?) < 0.051 AND abs(fare - ?) < 0.006)"
+)
+
+_SET_OFFSET = "INSERT OR REPLACE INTO imported_files (source, offset) VALUES (?, ?)"
+
+IMPORT_BATCH_SIZE = 5000
+
+
+def _source_key(path):
+    # Sin extensión: un archivo compactado a .thc sigue siendo el mismo fichero ya importado
+    return os.path.splitext(os.path.abspath(path))[0]
+
+
+class TripRepository:
+    """
+    Viajes guardados en SQLite con consultas paginadas (LIMIT/OFFSET).
+
+    Las columnas ordenables usan los mismos nombres que la ventana de
+    historial: date, stopped, moving, total, fare y profile.
+    """
+
+    COLUMNS = ('date', 'stopped', 'moving', 'total', 'fare')
+    SORT_COLUMNS = {
+        'date': 'timestamp',
+        'stopped': 'stopped_time',
+        'moving': 'moving_time',
+        'total': 'total_time',
+        'fare': 'fare',
+        'profile': 'profile',
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, cached_statements=256)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL solo sincroniza en los checkpoints: commits baratos y sin corrupción
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def checkpoint(self):
+        """Pasar el WAL a la base de datos sin bloquear a nadie (con la CLI en reposo)."""
+        self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def add(self, timestamp, stopped_time, moving_time, fare, profile=None, segments=None, source=None):
+        """
+        Guardar un viaje y devolver su id.
+
+        `source` es (fichero de historial, offset) cuando el viaje también se
+        escribió en ese fichero: el offset se marca como importado en la misma
+        transacción para que `sync_history` no lo duplique.
+        """
+        with self._conn:
+            cursor = self._conn.execute(_INSERT, (timestamp, stopped_time, moving_time,
+                                                  stopped_time + moving_time, fare, profile, segments))
+            if source is not None:
+                self._conn.execute(_SET_OFFSET, (_source_key(source[0]), source[1]))
+        return cursor.lastrowid
+
+    def add_many(self, trips):
+        """
+        Guardar muchos viajes en una sola transacción.
+
+        `trips` es un iterable de tuplas
+        ``(timestamp, stopped_time, moving_time, fare, profile, segments)``.
+        """
+        with self._conn:
+            cursor = self._conn.executemany(_INSERT, ((t, s, m, s + m, f, p, n) for t, s, m, f, p, n in trips))
+        return cursor.rowcount
+
+    def sync_history(self, paths, batch_size=IMPORT_BATCH_SIZE):
+        """
+        Importar lo que cada fichero de historial tiene después de lo ya
+        importado; devuelve los viajes nuevos.
+
+        Una línea sin salto de línea final (otro proceso escribiéndola) se
+        deja para la siguiente sincronización. Un fichero más corto que su
+        offset se ha sustituido y se vuelve a leer desde el principio; los
+        `.thc` son inmutables y se importan una sola vez.
+        """
+        offsets = dict(self._conn.execute("SELECT source, offset FROM imported_files"))
+        # Base de datos con viajes de la importación anterior, sin offsets: no duplicar
+        legacy = not offsets and self.count() > 0
+        imported = 0
+        for path in paths:
+            source = _source_key(path)
+            offset = offsets.get(source)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if path.endswith('.thc'):
+                if offset is None:
+                    lines = ((line, None) for line in merge_history_lines([path]))
+                    imported += self._import_lines(lines, source, legacy, batch_size, end=size)
+                continue
+            if offset is None or offset > size:
+                if offset is not None:
+                    logging.warning(f"Historial sustituido, se vuelve a importar: {path}")
+                offset = 0
+            if offset < size:
+                imported += self._import_tail(path, source, offset, legacy, batch_size)
+        return imported
+
+    def _import_tail(self, path, source, offset, legacy, batch_size):
+        def lines():
+            position = offset
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break
+                    position += len(raw)
+                    yield raw.decode('utf-8', errors='replace'), position
+        return self._import_lines(lines(), source, legacy, batch_size)
+
+    def _import_lines(self, lines, source, legacy, batch_size, end=None):
+        # `lines` da (línea, offset tras ella o None); al terminar se marca `end` o el último offset
+        imported = 0
+        batch, position = [], None
+        for line, position in lines:
+            trip = parse_history_line(line)
+            if trip is not None:
+                batch.append((trip.timestamp, trip.stopped_time, trip.moving_time, trip.fare))
+            if len(batch) >= batch_size:
+                imported += self._insert_imported(batch, source, position, legacy)
+                batch = []
+        end = position if end is None else end
+        if batch or end is not None:
+            imported += self._insert_imported(batch, source, end, legacy)
+        return imported
+
+    def _insert_imported(self, batch, source, offset, legacy):
+        with self._conn:
+            if legacy:
+                inserted = 0
+                for t, s, m, f in batch:
+                    inserted += self._conn.execute(_INSERT_MISSING, (t, s, m, s + m, f, None, None, t, s, m, f)).rowcount
+            else:
+                inserted = self._conn.executemany(_INSERT, ((t, s, m, s + m, f, None, None)
+                                                            for t, s, m, f in batch)).rowcount
+            if offset is not None:
+                self._conn.execute(_SET_OFFSET, (source, offset))
+        return max(inserted, 0)
+
+    def trips_after(self, last_id=0):
+        """Viajes con id mayor que `last_id`, en orden de id (para leer solo los nuevos)."""
+        cursor = self._conn.execute("SELECT id, timestamp, stopped_time, moving_time, total_time, fare, profile, "
+                                    "segments FROM trips WHERE id > ? ORDER BY id", (last_id,))
+        for row in cursor:
+            yield TripRecord(*row)
+
+    @staticmethod
+    def _where(since, until, profile, min_fare, max_fare, search):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if profile is not None:
+            clauses.append("profile = ?")
+            params.append(profile)
+        if min_fare is not None:
+            clauses.append("fare >= ?")
+            params.append(min_fare)
+        if max_fare is not None:
+            clauses.append("fare <= ?")
+            params.append(max_fare)
+        if search:
+            # Misma búsqueda de texto que sobre el historial: fecha, tarifa o perfil
+            clauses.append("(instr(timestamp, ?) OR instr(printf('%.2f', fare), ?) OR instr(profile, ?))")
+            params.extend([search] * 3)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, since=None, until=None, profile=None, min_fare=None, max_fare=None, search=None,
+              order='date', descending=True, limit=50, offset=0):
+        """
+        Página de viajes que cumplen los filtros.
+
+        `since` y `until` son fechas en el formato del historial
+        ("YYYY-MM-DD" o "YYYY-MM-DD HH:MM:SS"); `until` es exclusivo.
+        """
+        column = self.SORT_COLUMNS.get(order)
+        if column is None:
+            raise ValueError(f"Columna de orden desconocida: {order}")
+        where, params = self._where(since, until, profile, min_fare, max_fare, search)
+        direction = "DESC" if descending else "ASC"
+        # id como desempate: el orden entre viajes con la misma clave es estable entre páginas
+        sql = (f"SELECT id, timestamp, stopped_time, moving_time, total_time, fare, profile, segments "
+               f"FROM trips{where} ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?")
+        return [TripRecord(*row) for row in self._conn.execute(sql, params + [limit, offset])]
+
+    def count(self, since=None, until=None, profile=None, min_fare=None, max_fare=None, search=None):
+        """Número de viajes que cumplen los filtros."""
+        where, params = self._where(since, until, profile, min_fare, max_fare, search)
+        return self._conn.execute(f"SELECT COUNT(*) FROM trips{where}", params).fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Re-tarificación del historial de viajes con perfiles candidatos.
+
+Recalcula la tarifa de cada viaje del historial (sus segmentos archivados
+y los ficheros por taxi incluidos) con uno o varios perfiles candidatos para medir el impacto en
+ingresos de un cambio de `PRICE_PROFILES`. El historial se lee en streaming
+por bloques que se reparten en un pool de procesos; solo hay un número
+acotado de bloques en vuelo, así que la memoria no depende del tamaño del
+historial y el rendimiento escala con los núcleos.
+
+Uso:
+    python -m src.rerate [--profiles candidatos.json] [--workers N] [--diffs diffs.csv]
+
+El historial solo guarda los tiempos con una décima de segundo, así que la
+tarifa recalculada con el perfil original puede diferir en algún céntimo.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from src.history import history_paths, merge_history_lines, parse_history_line
+from src.rules import CompiledProfile
+
+DEFAULT_CHUNK_SIZE = 20000
+
+RerateTotals = namedtuple('RerateTotals', ['profile', 'trips', 'recorded_cents', 'rerated_cents'])
+# line_number cuenta desde 1 las líneas del historial completo en orden cronológico
+# (archivos y ficheros por taxi mezclados)
+TripDiff = namedtuple('TripDiff', ['line_number', 'timestamp', 'recorded_fare', 'fares'])
+
+
+class RerateReport:
+    """Totales por perfil candidato de una re-tarificación."""
+
+    def __init__(self, profiles):
+        self.profiles = list(profiles)
+        self.trips = 0
+        self.skipped_lines = 0
+        self.recorded_cents = 0
+        self.rerated_cents = dict.fromkeys(self.profiles, 0)
+
+    def add_chunk(self, trips, skipped, recorded_cents, rerated_cents):
+        self.trips += trips
+        self.skipped_lines += skipped
+        self.recorded_cents += recorded_cents
+        for name, cents in rerated_cents.items():
+            self.rerated_cents[name] += cents
+
+    def totals(self):
+        """Devolver un RerateTotals por perfil candidato."""
+        return [RerateTotals(name, self.trips, self.recorded_cents, self.rerated_cents[name])
+                for name in self.profiles]
+
+
+def _rate_table(candidates):
+    # Solo lo necesario para calcular: se envía a cada proceso del pool
+    keys = ('stopped', 'moving', 'km', 'rules')
+    return tuple((name, {key: profile[key] for key in keys if key in profile})
+                 for name, profile in candidates.items())
+
+
+def _rerate_chunk(first_line, lines, rates, with_diffs):
+    """Re-tarificar un bloque de líneas (se ejecuta en un proceso del pool)."""
+    trips = skipped = recorded_cents = 0
+    rerated_cents = dict.fromkeys([name for name, _ in rates], 0)
+    # Las funciones compiladas no se envían entre procesos: se compilan por bloque
+    evaluators = [(name, CompiledProfile(profile, name).fare) for name, profile in rates]
+    diffs = [] if with_diffs else None
+    for offset, line in enumerate(lines):
+        trip = parse_history_line(line)
+        if trip is None:
+            skipped += 1
+            continue
+        trips += 1
+        recorded_cents += round(trip.fare * 100)
+        fares = {}
+        for name, fare_for in evaluators:
+            # Misma tarifa compilada (reglas incluidas) que calculate_fare
+            fare = fare_for(trip.stopped_time, trip.moving_time)
+            rerated_cents[name] += round(fare * 100)
+            fares[name] = fare
+        if with_diffs:
+            diffs.append(TripDiff(first_line + offset, trip.timestamp, trip.fare, fares))
+    return trips, skipped, recorded_cents, rerated_cents, diffs
+
+
+def _chunks(lines, chunk_size):
+    line_number = 1
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield line_number, chunk
+        line_number += len(chunk)
+
+
+def rerate_history(candidates, paths, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, on_diff=None):
+    """
+    Re-tarificar el historial con cada perfil de `candidates`.
+
+    `candidates` tiene la forma de PRICE_PROFILES ({clave: {"stopped", "moving"}},
+    con sus "rules" opcionales).
+    Si se pasa `on_diff`, se llama en orden con un TripDiff por viaje, sin
+    acumularlos en memoria. `workers=0` procesa en el propio proceso.
+    """
+    rates = _rate_table(candidates)
+    report = RerateReport(candidates)
+    with_diffs = on_diff is not None
+    chunks = _chunks(merge_history_lines(paths), chunk_size)
+
+    def consume(result):
+        trips, skipped, recorded_cents, rerated_cents, diffs = result
+        report.add_chunk(trips, skipped, recorded_cents, rerated_cents)
+        if with_diffs:
+            for diff in diffs:
+                on_diff(diff)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 0:
+        for first_line, lines in chunks:
+            consume(_rerate_chunk(first_line, lines, rates, with_diffs))
+        return report
+
+    # Ventana acotada de bloques en vuelo: memoria constante y orden preservado
+    max_in_flight = workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for first_line, lines in chunks:
+            pending.append(pool.submit(_rerate_chunk, first_line, lines, rates, with_diffs))
+            if len(pending) >= max_in_flight:
+                consume(pending.popleft().result())
+        while pending:
+            consume(pending.popleft().result())
+    return report
+
+
+def format_report(report):
+    """Tabla de texto con el impacto de cada perfil candidato."""
+    lines = [f"Viajes re-tarificados: {report.trips} (líneas ignoradas: {report.skipped_lines})",
+             f"Ingresos registrados: €{report.recorded_cents / 100:.2f}",
+             f"{'Perfil':15} {'Total':>12} {'Diferencia':>12} {'%':>8}"]
+    for totals in report.totals():
+        delta = totals.rerated_cents - totals.recorded_cents
+        percent = (delta / totals.recorded_cents * 100) if totals.recorded_cents else 0.0
+        lines.append(f"{totals.profile:15} {totals.rerated_cents / 100:>12.2f} "
+                     f"{delta / 100:>+12.2f} {percent:>+7.1f}%")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """Punto de entrada de línea de comandos."""
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Re-tarificar el historial de viajes con perfiles candidatos")
+    parser.add_argument('paths', nargs='*', help="ficheros de historial (por defecto, el historial y sus archivos)")
+    parser.add_argument('--profiles', help="JSON con perfiles candidatos en el formato de PRICE_PROFILES")
+    parser.add_argument('--workers', type=int, default=None, help="procesos del pool (0 = sin pool)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--diffs', help="CSV donde escribir la diferencia de cada viaje")
+    args = parser.parse_args(argv)
+
+    if args.profiles:
+        with open(args.profiles, 'r', encoding='utf-8') as f:
+            candidates = json.load(f)
+    else:
+        from main import PRICE_PROFILES
+        candidates = PRICE_PROFILES
+    paths = args.paths or history_paths(settings.HISTORY_FILE, settings.HISTORY_SHARD_DIR)
+
+    if args.diffs:
+        with open(args.diffs, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['line', 'timestamp', 'recorded'] + list(candidates))
+
+            def write_diff(diff):
+                writer.writerow([diff.line_number, diff.timestamp, f"{diff.recorded_fare:.2f}"]
+                                + [f"{diff.fares[name]:.2f}" for name in candidates])
+
+            report = rerate_history(candidates, paths, args.workers, args.chunk_size, write_diff)
+    else:
+        report = rerate_history(candidates, paths, args.workers, args.chunk_size)
+    print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
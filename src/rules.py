@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Reglas de tarificación declarativas compiladas a funciones de Python.
+
+Cada perfil de `PRICE_PROFILES` puede llevar una lista ``"rules"`` (en el
+propio perfil o en el fichero `settings.PRICING_RULES_FILE`, con la forma
+``{clave_perfil: [reglas]}``). Tipos de regla:
+
+    {"type": "flag_drop", "amount": 2.5}                 bajada de bandera
+    {"type": "surcharge", "amount": 5.0, "when": "aeropuerto"}
+                                                         suplemento (si el viaje
+                                                         lleva la etiqueta `when`,
+                                                         o siempre si no hay `when`;
+                                                         `start aeropuerto` en la CLI)
+    {"type": "tiered", "after_minutes": 10, "stopped": 0.03, "moving": 0.06}
+                                                         tarifa por segundo de cada
+                                                         estado a partir de N minutos
+                                                         en ese estado
+    {"type": "minimum", "amount": 4.0}                   tarifa mínima
+    {"type": "cap", "amount": 120.0}                     tarifa máxima
+
+Los importes se suman a la tarifa base por tiempo y distancia; después se
+aplican el mínimo y el máximo, y se redondea a céntimos. Cada perfil se
+compila una sola vez a una función sin bucles ni condicionales sobre las
+reglas: evaluar un viaje es una llamada en línea recta. La versión por lotes
+usa la misma expresión sobre arrays de numpy.
+"""
+import os
+from collections import namedtuple
+
+RULE_TYPES = ('flag_drop', 'surcharge', 'tiered', 'minimum', 'cap')
+
+# Parámetros numéricos de un perfil ya validados
+_Tariff = namedtuple('_Tariff', ['stopped', 'moving', 'km', 'tiers', 'fees', 'surcharges', 'minimum', 'cap'])
+
+
+def load_rules(path):
+    """Leer el fichero de reglas ({clave_perfil: [reglas]}); vacío si no existe."""
+    if not path or not os.path.exists(path):
+        return {}
+    import json
+    with open(path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, dict):
+        raise ValueError(f"{path}: se esperaba un objeto {{perfil: [reglas]}}")
+    return rules
+
+
+def _number(rule, key):
+    try:
+        value = float(rule[key])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Regla {rule!r}: '{key}' debe ser un número") from None
+    if value != value or value in (float('inf'), float('-inf')):
+        raise ValueError(f"Regla {rule!r}: '{key}' debe ser finito")
+    return value
+
+
+def _parse(profile):
+    stopped, moving = float(profile["stopped"]), float(profile["moving"])
+    tiers, fees, surcharges = [], [], []
+    minimum = cap = None
+    for rule in profile.get("rules", ()):
+        kind = rule.get("type") if isinstance(rule, dict) else None
+        if kind == 'flag_drop':
+            fees.append(_number(rule, 'amount'))
+        elif kind == 'surcharge':
+            when = rule.get("when")
+            if when is None:
+                fees.append(_number(rule, 'amount'))
+            elif isinstance(when, str):
+                surcharges.append((when.lower(), _number(rule, 'amount')))
+            else:
+                raise ValueError(f"Regla {rule!r}: 'when' debe ser una etiqueta")
+        elif kind == 'tiered':
+            tiers.append((_number(rule, 'after_minutes') * 60.0,
+                          _number(rule, 'stopped') if 'stopped' in rule else stopped,
+                          _number(rule, 'moving') if 'moving' in rule else moving))
+        elif kind == 'minimum':
+            minimum = _number(rule, 'amount') if minimum is None else max(minimum, _number(rule, 'amount'))
+        elif kind == 'cap':
+            cap = _number(rule, 'amount') if cap is None else min(cap, _number(rule, 'amount'))
+        else:
+            raise ValueError(f"Regla desconocida {rule!r} (tipos: {', '.join(RULE_TYPES)})")
+    tiers.sort()
+    return _Tariff(stopped, moving, float(profile.get("km", 0.0)), tiers, fees, surcharges, minimum, cap)
+
+
+def _bands(rate, tiers):
+    """[(desde, tarifa)] de un estado, sin umbrales repetidos ni tramos con la misma tarifa que el anterior."""
+    bands = [(0.0, rate)]
+    for after, tier_rate in tiers:
+        if after <= bands[-1][0]:
+            bands[-1] = (bands[-1][0], tier_rate)
+        else:
+            bands.append((after, tier_rate))
+        if len(bands) > 1 and bands[-1][1] == bands[-2][1]:
+            bands.pop()
+    return bands
+
+
+def _state_bands(tariff):
+    """Tramos [(desde, tarifa)] de cada estado."""
+    return {'stopped': _bands(tariff.stopped, [(after, rate) for after, rate, _ in tariff.tiers]),
+            'moving': _bands(tariff.moving, [(after, rate) for after, _, rate in tariff.tiers])}
+
+
+def _time_term(variable, bands):
+    """
+    Expresión de la tarifa por tiempo de un estado.
+
+    Cada tramo multiplica sus propios segundos por su tarifa: todos los
+    sumandos son no negativos, así que la tarifa nunca baja al sumar tiempo
+    (con diferencias de tarifa, viajes muy largos perdían precisión por
+    cancelación y el redondeo a céntimos podía bajar un céntimo).
+    """
+    if len(bands) == 1:
+        return f"{variable} * {bands[0][1]!r}"
+    terms = [f"_min({variable}, {bands[1][0]!r}) * {bands[0][1]!r}"]
+    for (start, rate), (end, _) in zip(bands[1:], bands[2:]):
+        terms.append(f"_min(_pos({variable} - {start!r}), {end - start!r}) * {rate!r}")
+    terms.append(f"_pos({variable} - {bands[-1][0]!r}) * {bands[-1][1]!r}")
+    return " + ".join(terms)
+
+
+def _source(tariff, vector, rounded=True):
+    """Código de la función de tarifa: una línea por regla, sin bucles."""
+    # Sin tramos, misma expresión base que compute_fare: el resultado sin reglas es idéntico
+    bands = _state_bands(tariff)
+    stopped = _time_term('stopped_s', bands['stopped'])
+    moving = _time_term('moving_s', bands['moving'])
+    lines = [f"fare = {stopped} + {moving} + distance_km * {tariff.km!r}"]
+    if tariff.fees:
+        lines.append(f"fare = fare + {sum(tariff.fees)!r}")
+    for tag, amount in tariff.surcharges:
+        if vector:
+            lines.append(f"fare = fare + _tag(tags, {tag!r}) * {amount!r}")
+        else:
+            lines.append(f"if {tag!r} in tags: fare = fare + {amount!r}")
+    if tariff.minimum is not None:
+        lines.append(f"fare = _max(fare, {tariff.minimum!r})")
+    if tariff.cap is not None:
+        lines.append(f"fare = _min(fare, {tariff.cap!r})")
+    lines.append("return _round(fare, 2)" if rounded else "return fare")
+    tags_default = 'None' if vector else '()'
+    header = f"def fare(stopped_s, moving_s, distance_km=0.0, tags={tags_default}):"
+    return '\n'.join([header] + ['    ' + line for line in lines])
+
+
+def _build(source, namespace, filename):
+    exec(compile(source, filename, 'exec'), namespace)
+    return namespace['fare']
+
+
+def _scalar_pos(x):
+    return x if x > 0.0 else 0.0
+
+
+def _vector_round(np):
+    def round_cents(fare, digits):
+        # np.round redondea fare*100 (con su error de representación) y empata a
+        # par; round de Python redondea el valor exacto del float. Solo difieren
+        # cerca de medio céntimo: ahí se usa round para que lotes y viajes sueltos
+        # den la misma tarifa.
+        rounded = np.round(fare, digits)
+        scaled = np.abs(fare) * 10 ** digits
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        if near_half.any():
+            rounded = np.array(rounded, dtype=np.float64)
+            rounded[near_half] = [round(value, digits) for value in np.asarray(fare)[near_half].tolist()]
+        return rounded
+    return round_cents
+
+
+class CompiledProfile:
+    """
+    Tarifa de un perfil compilada a funciones.
+
+    `fare(stopped_s, moving_s, distance_km=0.0, tags=())` calcula un viaje;
+    `estimate` es la misma función sin redondear (la tarifa en curso de
+    `RunningFare`). `fare_batch` recibe arrays (y `tags` como {etiqueta:
+    array de bool}) y devuelve un array con la tarifa de cada viaje.
+    `boundaries` son los segundos en un estado a partir de los que cambia la
+    tarifa por segundo.
+    """
+
+    def __init__(self, profile, name='perfil'):
+        self.name = name
+        self._tariff = _parse(profile)
+        self.boundaries = tuple(after for after, _, _ in self._tariff.tiers)
+        self.source = _source(self._tariff, vector=False)
+        namespace = {'_pos': _scalar_pos, '_max': max, '_min': min, '_round': round}
+        self.fare = _build(self.source, dict(namespace), f"<tarifa {name}>")
+        self.estimate = _build(_source(self._tariff, vector=False, rounded=False), namespace,
+                               f"<tarifa {name} (en curso)>")
+        self._bands = _state_bands(self._tariff)
+        self._batch = None
+
+    def marginal_rate(self, state, spent_s, fare):
+        """
+        Tarifa por segundo en `state` tras `spent_s` segundos en ese estado.
+
+        Es 0 si `fare` (sin redondear) está en el mínimo o en el máximo: ahí
+        el tiempo no cambia la tarifa hasta que se cruza el límite.
+        """
+        tariff = self._tariff
+        if (tariff.minimum is not None and fare <= tariff.minimum) or (tariff.cap is not None and fare >= tariff.cap):
+            return 0.0
+        rate = 0.0
+        for start, band_rate in self._bands[state]:
+            if spent_s < start:
+                break
+            rate = band_rate
+        return rate
+
+    def fare_batch(self, stopped_s, moving_s, distance_km=0.0, tags=None):
+        """Tarifa de un lote de viajes (arrays de igual longitud)."""
+        if self._batch is None:
+            self._batch = self._compile_batch()
+        return self._batch(stopped_s, moving_s, distance_km, tags or {})
+
+    def _compile_batch(self):
+        try:
+            import numpy as np
+        except ImportError:
+            return self._fallback_batch
+
+        def tag(tags, name):
+            return np.asarray(tags.get(name, False), dtype=np.float64)
+
+        namespace = {'_pos': lambda x: np.maximum(x, 0.0), '_max': np.maximum, '_min': np.minimum,
+                     '_round': _vector_round(np), '_tag': tag}
+        vector = _build(_source(self._tariff, vector=True), namespace, f"<tarifa {self.name} (lotes)>")
+
+        def batch(stopped_s, moving_s, distance_km, tags):
+            stopped_s = np.asarray(stopped_s, dtype=np.float64)
+            moving_s = np.asarray(moving_s, dtype=np.float64)
+            # Sin reglas por etiqueta el resultado se ensancha igualmente a la forma del lote
+            return np.broadcast_to(vector(stopped_s, moving_s, np.asarray(distance_km, dtype=np.float64), tags),
+                                   stopped_s.shape)
+        return batch
+
+    def _fallback_batch(self, stopped_s, moving_s, distance_km, tags):
+        count = len(stopped_s)
+        distances = distance_km if hasattr(distance_km, '__len__') else [distance_km] * count
+        names = list(tags)
+        fare = self.fare
+        return [fare(stopped_s[i], moving_s[i], distances[i], [n for n in names if tags[n][i]])
+                for i in range(count)]
+
+
+def compile_profiles(profiles):
+    """Compilar todos los perfiles ({clave: perfil}) una sola vez."""
+    return {key: CompiledProfile(profile, key) for key, profile in profiles.items()}
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshots inmutables y versionados de las tarifas.
+
+Un `TariffSnapshot` congela los perfiles de precio, el perfil activo y la
+tarifa compilada de cada perfil bajo un número de versión. Nada de él
+cambia después de construirlo: cambiar de perfil o recargar reglas publica
+un snapshot nuevo en el `TariffBoard`, que sustituye la referencia
+`current` con una sola asignación.
+
+Así un cálculo lee `board.current` una vez y usa ese objeto de principio a
+fin: nunca mezcla el nombre de un perfil con las tarifas de otro aunque otro
+hilo cambie el perfil a la vez, y los lectores no toman ningún bloqueo (solo
+los escritores se serializan entre sí). Cada viaje fija (`Trip.pin`) el
+snapshot con el que empezó o con el que se facturó su último cambio de
+perfil, y se cobra con él aunque el perfil global cambie después.
+
+Uso (benchmark):
+    python -m src.tariff [--readers N] [--seconds S]
+"""
+import copy
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+from src.rules import CompiledProfile
+
+# Snapshots anteriores que se pueden consultar por versión (los viajes fijan el objeto, no la versión)
+VERSIONS_KEPT = 64
+
+
+def _freeze(profile):
+    """Vista de solo lectura de una copia privada del perfil (reglas incluidas)."""
+    frozen = dict(profile)
+    if 'rules' in frozen:
+        frozen['rules'] = tuple(MappingProxyType(dict(rule)) if isinstance(rule, dict) else rule
+                                for rule in frozen['rules'])
+    return MappingProxyType(frozen)
+
+
+class TariffSnapshot:
+    """
+    Perfiles de precio, perfil activo y tarifas compiladas de una versión.
+
+    Inmutable: los perfiles se copian y se exponen como vistas de solo
+    lectura, y asignar atributos lanza AttributeError. Las tarifas se
+    compilan al construir el snapshot, no en el primer uso, para que ningún
+    lector tenga que escribir en él.
+    """
+
+    __slots__ = ('version', 'active', 'profiles', 'evaluators')
+
+    def __init__(self, version, profiles, active, evaluators=None):
+        if active not in profiles:
+            raise KeyError(f"Perfil desconocido: {active}")
+        if evaluators is None:
+            # Compilar sobre una copia: el diccionario del llamador puede cambiar después
+            profiles = copy.deepcopy(dict(profiles))
+            evaluators = MappingProxyType({key: CompiledProfile(profile, key) for key, profile in profiles.items()})
+            profiles = MappingProxyType({key: _freeze(profile) for key, profile in profiles.items()})
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'active', active)
+        object.__setattr__(self, 'profiles', profiles)
+        object.__setattr__(self, 'evaluators', evaluators)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TariffSnapshot es inmutable: publica uno nuevo en el TariffBoard")
+
+    def __delattr__(self, name):
+        raise AttributeError("TariffSnapshot es inmutable: publica uno nuevo en el TariffBoard")
+
+    def __repr__(self):
+        return f"TariffSnapshot(version={self.version}, active={self.active!r})"
+
+    @property
+    def profile(self):
+        """Perfil activo (vista de solo lectura)."""
+        return self.profiles[self.active]
+
+    def rates(self, profile_name=None):
+        """(tarifa parado, tarifa movimiento, tarifa por km) del perfil indicado o del activo."""
+        profile = self.profiles[profile_name or self.active]
+        return profile["stopped"], profile["moving"], profile.get("km", 0.0)
+
+    def evaluator(self, profile_name=None):
+        """Tarifa compilada del perfil indicado o del activo."""
+        return self.evaluators[profile_name or self.active]
+
+    def fare(self, seconds_stopped, seconds_moving, profile_name=None, distance_km=0.0, tags=()):
+        """Tarifa redondeada a céntimos con las tarifas de este snapshot."""
+        return self.evaluators[profile_name or self.active].fare(seconds_stopped, seconds_moving, distance_km, tags)
+
+    def with_active(self, profile_name, version):
+        """Snapshot `version` igual que este con otro perfil activo (reutiliza las tarifas compiladas)."""
+        if profile_name not in self.profiles:
+            raise KeyError(f"Perfil desconocido: {profile_name}")
+        return TariffSnapshot(version, self.profiles, profile_name, self.evaluators)
+
+    def with_profiles(self, profiles, version):
+        """Snapshot `version` con perfiles nuevos; conserva el perfil activo si sigue existiendo."""
+        active = self.active if self.active in profiles else next(iter(profiles))
+        return TariffSnapshot(version, profiles, active)
+
+
+class TariffBoard:
+    """
+    Snapshot de tarifas vigente con cambio atómico.
+
+    Los lectores solo leen `current` (una referencia que se sustituye de una
+    vez, sin bloqueos). `activate` y `load_profiles` construyen el snapshot
+    siguiente y lo publican bajo un bloqueo para que dos escritores no
+    repitan versión ni pisen el cambio del otro.
+    """
+
+    def __init__(self, profiles, active):
+        self._lock = threading.Lock()
+        self._versions = OrderedDict()
+        self._publish(TariffSnapshot(1, profiles, active))
+
+    def _publish(self, snapshot):
+        self._versions[snapshot.version] = snapshot
+        if len(self._versions) > VERSIONS_KEPT:
+            self._versions.popitem(last=False)
+        self.current = snapshot
+        return snapshot
+
+    def get(self, version):
+        """Snapshot de una versión reciente (None si ya no se conserva)."""
+        return self._versions.get(version)
+
+    def activate(self, profile_name):
+        """Publicar un snapshot con `profile_name` como perfil activo (KeyError si no existe)."""
+        with self._lock:
+            current = self.current
+            return self._publish(current.with_active(profile_name, current.version + 1))
+
+    def load_profiles(self, profiles):
+        """Publicar un snapshot con los perfiles `profiles` recompilados (p. ej. reglas recargadas)."""
+        with self._lock:
+            current = self.current
+            return self._publish(current.with_profiles(profiles, current.version + 1))
+
+
+def benchmark(profiles, readers=3, seconds=1.0):
+    """
+    Cálculos por segundo de `readers` hilos lectores mientras otro hilo
+    cambia de perfil sin parar; devuelve (cálculos/s, cambios, incoherencias).
+
+    Una incoherencia es un cálculo cuya tarifa no corresponde al perfil que
+    el mismo snapshot dice tener activo; con snapshots debe ser siempre 0.
+    """
+    board = TariffBoard(profiles, next(iter(profiles)))
+    expected = {key: board.current.fare(60.0, 120.0, key) for key in profiles}
+    keys = list(profiles)
+    stop = threading.Event()
+    counts, mismatches, switches = [0] * readers, [0] * readers, [0]
+
+    def read(index):
+        done = bad = 0
+        while not stop.is_set():
+            for _ in range(1000):
+                snapshot = board.current
+                if snapshot.fare(60.0, 120.0) != expected[snapshot.active]:
+                    bad += 1
+            done += 1000
+        counts[index], mismatches[index] = done, bad
+
+    def write():
+        while not stop.is_set():
+            board.activate(keys[switches[0] % len(keys)])
+            switches[0] += 1
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads + [writer]:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return sum(counts) / elapsed, switches[0], sum(mismatches)
+
+
+def main(argv=None):
+    """Punto de entrada del benchmark."""
+    import argparse
+    from main import PRICE_PROFILES
+    parser = argparse.ArgumentParser(description="Lectores concurrentes de snapshots de tarifas")
+    parser.add_argument('--readers', type=int, default=3)
+    parser.add_argument('--seconds', type=float, default=1.0)
+    args = parser.parse_args(argv)
+    rate, switches, mismatches = benchmark(PRICE_PROFILES, args.readers, args.seconds)
+    print(f"{rate / 1e6:.2f} M cálculos/s con {args.readers} lectores, {switches} cambios de perfil, "
+          f"{mismatches} incoherencias")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
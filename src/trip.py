@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Máquina de estados del ciclo de vida de un viaje.
+
+Las reglas (no se puede iniciar dos veces, `stop`/`move`/`finish` exigen un
+viaje activo, `exit` finaliza el viaje en curso) están en una tabla de
+transiciones indexada por códigos enteros de estado y de evento, la misma
+para la CLI, la GUI y el servidor de flota. `Trip` aplica la transición al
+acumulador de tarifa (`RunningFare`), que lleva la cuenta de tramos.
+`Trip.pin` fija el snapshot de tarifas (`src/tariff.py`) con el que se
+cobra el viaje.
+
+`advance_trips` aplica la misma tabla a muchos viajes a la vez con numpy
+(códigos de estado y eventos en arrays), para servidores con miles de taxis.
+
+Uso (benchmark):
+    python -m src.trip [--trips N] [--events N]
+"""
+import sys
+import time
+
+from src.meter import STATE_CODES, STATE_NAMES, RunningFare
+
+# Códigos de estado (los mismos que en checkpoints y memoria compartida)
+IDLE = STATE_CODES[None]
+STOPPED = STATE_CODES['stopped']
+MOVING = STATE_CODES['moving']
+
+# Códigos de evento
+START, STOP, MOVE, FINISH, EXIT = range(5)
+EVENTS = {'start': START, 'stop': STOP, 'move': MOVE, 'finish': FINISH, 'exit': EXIT}
+EVENT_NAMES = {code: name for name, code in EVENTS.items()}
+
+INVALID = -1
+
+# TRANSITIONS[estado][evento] -> estado siguiente (INVALID si no está permitido)
+TRANSITIONS = (
+    # start     stop     move    finish   exit
+    (STOPPED, INVALID, INVALID, INVALID, IDLE),   # IDLE
+    (INVALID, STOPPED, MOVING, IDLE, IDLE),       # STOPPED
+    (INVALID, STOPPED, MOVING, IDLE, IDLE),       # MOVING
+)
+
+
+class Trip:
+    """
+    Viaje con transiciones validadas.
+
+    `fire(event, now)` aplica un evento (código de `EVENTS`) y devuelve False
+    sin tocar nada si la tabla no lo permite; `rejected` cuenta esos intentos
+    para que cada front-end decida cómo avisar. Al finalizar, los tiempos y
+    la distancia del viaje siguen en `fare` hasta el siguiente `start`.
+    `tariff` es el snapshot de tarifas fijado con `pin` (None si no hay).
+    """
+
+    __slots__ = ('code', 'fare', 'transitions', 'rejected', 'tariff')
+
+    def __init__(self, fare):
+        self.fare = fare
+        self.code = IDLE
+        self.transitions = 0
+        self.rejected = 0
+        self.tariff = None
+
+    @classmethod
+    def with_rates(cls, stopped_rate, moving_rate, km_rate=0.0):
+        """Viaje nuevo con su propio acumulador de tarifa."""
+        return cls(RunningFare(stopped_rate, moving_rate, km_rate))
+
+    @property
+    def active(self):
+        return self.code != IDLE
+
+    @property
+    def state(self):
+        """Nombre del estado ('stopped', 'moving' o None sin viaje)."""
+        return STATE_NAMES[self.code]
+
+    def pin(self, tariff):
+        """Cobrar el viaje con el snapshot `tariff` (reprecia el acumulado con su perfil activo)."""
+        self.tariff = tariff
+        self.fare.set_rates(*tariff.rates(), evaluator=tariff.evaluator())
+
+    def can(self, event):
+        """¿Permite la tabla `event` en el estado actual?"""
+        return TRANSITIONS[self.code][event] != INVALID
+
+    def fire(self, event, now):
+        """Aplicar `event` en el instante `now`; False si la transición no es válida."""
+        code = self.code
+        target = TRANSITIONS[code][event]
+        if target == INVALID:
+            self.rejected += 1
+            return False
+        if code == IDLE:
+            if target != IDLE:
+                self.fare.start(now, STATE_NAMES[target])
+        elif target == IDLE:
+            self.fare.finish(now)
+        else:
+            self.fare.switch(STATE_NAMES[target], now)
+        self.code = target
+        self.transitions += 1
+        return True
+
+    def restore(self, state, trip_start, segment_start, stopped_time, moving_time, distance_km=0.0, tags=()):
+        """Reanudar un viaje activo a partir de un checkpoint."""
+        self.fare.restore(state, trip_start, segment_start, stopped_time, moving_time, distance_km, tags)
+        self.code = STATE_CODES[state]
+
+    def reset(self):
+        """Olvidar el viaje (también los acumulados y el snapshot del último viaje finalizado)."""
+        self.fare.reset()
+        self.code = IDLE
+        self.tariff = None
+
+
+_TABLE = None
+
+
+def transition_table():
+    """La tabla de transiciones como array de numpy (estado, evento) -> estado."""
+    global _TABLE
+    if _TABLE is None:
+        import numpy as np
+        _TABLE = np.array(TRANSITIONS, dtype=np.int8)
+    return _TABLE
+
+
+def advance_trips(codes, events):
+    """
+    Aplicar un evento a cada viaje de un lote.
+
+    `codes` y `events` son arrays de enteros de igual longitud; devuelve
+    (códigos nuevos, máscara de transiciones válidas). Los viajes con un
+    evento no válido conservan su estado.
+    """
+    import numpy as np
+    targets = transition_table()[codes, events]
+    valid = targets != INVALID
+    return np.where(valid, targets, codes).astype(np.int8, copy=False), valid
+
+
+def benchmark(trips=1000, events=200_000):
+    """Transiciones por segundo de `Trip.fire` repartidas entre `trips` viajes."""
+    fleet = [Trip.with_rates(0.02, 0.05) for _ in range(trips)]
+    cycle = (START, MOVE, STOP, MOVE, STOP, FINISH)
+    sequence = [(fleet[i % trips].fire, cycle[(i // trips) % len(cycle)]) for i in range(events)]
+    started = time.perf_counter()
+    for i, (fire, event) in enumerate(sequence):
+        fire(event, i)
+    return events / (time.perf_counter() - started)
+
+
+def benchmark_batch(trips=100_000, rounds=60):
+    """Transiciones por segundo de `advance_trips` con `trips` viajes por lote."""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    events = rng.integers(0, len(EVENTS), size=(rounds, trips), dtype=np.int8)
+    codes = np.zeros(trips, dtype=np.int8)
+    started = time.perf_counter()
+    for batch in events:
+        codes, _ = advance_trips(codes, batch)
+    return trips * rounds / (time.perf_counter() - started)
+
+
+def main(argv=None):
+    """Punto de entrada del benchmark."""
+    # argparse solo hace falta aquí: main.py importa este módulo al arrancar
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark de la máquina de estados de viajes")
+    parser.add_argument('--trips', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+    rate = benchmark(args.trips, args.events)
+    print(f"Trip.fire      {rate / 1e6:7.2f} M transiciones/s ({1e9 / rate:.0f} ns por transición)")
+    try:
+        rate = benchmark_batch()
+    except ImportError:
+        print("advance_trips  (necesita numpy)")
+    else:
+        print(f"advance_trips  {rate / 1e6:7.2f} M transiciones/s ({1e9 / rate:.1f} ns por transición)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
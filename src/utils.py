@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Utilidades compartidas del Digital Taximeter.
+"""
+import importlib
+
+
+class LazyObject:
+    """
+    Proxy que construye el objeto real la primera vez que se usa.
+
+    Permite declarar a nivel de módulo librerías de presentación (colorama,
+    rich, tkinter) sin pagar su importación hasta que realmente se necesitan.
+    """
+
+    def __init__(self, factory):
+        self.__dict__['_factory'] = factory
+        self.__dict__['_target'] = None
+
+    def _resolve(self):
+        target = self.__dict__['_target']
+        if target is None:
+            target = self.__dict__['_factory']()
+            self.__dict__['_target'] = target
+        return target
+
+    def __getattr__(self, name):
+        value = getattr(self._resolve(), name)
+        # Cachear el atributo en el proxy: los siguientes accesos son directos
+        self.__dict__[name] = value
+        return value
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        if self.__dict__['_target'] is None:
+            return f"<LazyObject sin cargar: {self.__dict__['_factory']!r}>"
+        return repr(self.__dict__['_target'])
+
+
+def lazy_import(module_name):
+    """Devolver un proxy que importa `module_name` en el primer acceso."""
+    return LazyObject(lambda: importlib.import_module(module_name))
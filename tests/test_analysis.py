@@ -0,0 +1,122 @@
+"""
+Tests del sidecar de columnas para el análisis del historial.
+"""
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+from importlib.util import find_spec
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+    from src import analysis
+except ImportError:
+    np = None
+
+
+def trip_line(day, stopped, moving, fare):
+    return (f"2025-12-{day:02d} 10:00:00 | Parado: {stopped:.1f}s | Movimiento: {moving:.1f}s | "
+            f"Total: {stopped + moving:.1f}s | Tarifa: €{fare:.2f}\n")
+
+
+@unittest.skipIf(np is None, "numpy no instalado")
+class TestTripColumns(unittest.TestCase):
+    """Tests de columnas tipadas y del sidecar mapeado en memoria."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'columnas')
+        self.paths = [os.path.join(self.directory, 'cab-1.txt'), os.path.join(self.directory, 'cab-2.txt')]
+        with open(self.paths[0], 'w', encoding='utf-8') as f:
+            f.write(trip_line(1, 8.1, 18.5, 1.09) + trip_line(3, 2.0, 4.0, 0.24) + "línea corrupta\n")
+        with open(self.paths[1], 'w', encoding='utf-8') as f:
+            f.write(trip_line(2, 1.0, 1.0, 0.07))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_columnas_tipadas(self):
+        """Las columnas tienen los tipos pedidos y el orden cronológico del historial mezclado."""
+        columns = analysis.trip_columns(self.paths, self.cache_dir)
+        self.assertEqual({name: str(values.dtype) for name, values in columns.items()}, analysis.COLUMNS)
+        self.assertEqual(columns['fare_cents'].tolist(), [109, 7, 24])
+        self.assertEqual(str(columns['timestamp'][1]), '2025-12-02T10:00:00')
+        self.assertAlmostEqual(float(columns['total_time'][0]), 26.6, places=5)
+        self.assertIsInstance(columns['fare_cents'], np.memmap)
+
+    def test_sidecar_reutilizado(self):
+        """Si el historial no cambia, el sidecar se abre sin volver a parsear."""
+        analysis.trip_columns(self.paths, self.cache_dir)
+        original = analysis.parse_trip_columns
+        analysis.parse_trip_columns = None
+        try:
+            columns = analysis.trip_columns(self.paths, self.cache_dir)
+        finally:
+            analysis.parse_trip_columns = original
+        self.assertEqual(len(columns['timestamp']), 3)
+
+    def parsed_lines(self):
+        """Abrir las columnas registrando las líneas que se parsean."""
+        parsed = []
+        original = analysis.parse_trip_columns
+
+        def parse(lines):
+            lines = list(lines)
+            parsed.extend(lines)
+            return original(lines)
+        analysis.parse_trip_columns = parse
+        try:
+            return analysis.trip_columns(self.paths, self.cache_dir), parsed
+        finally:
+            analysis.parse_trip_columns = original
+
+    def test_sidecar_ampliado(self):
+        """Un viaje nuevo en el historial se añade al sidecar parseando solo la línea nueva."""
+        analysis.trip_columns(self.paths, self.cache_dir)
+        with open(self.paths[1], 'a', encoding='utf-8') as f:
+            f.write(trip_line(4, 3.0, 3.0, 0.21) + trip_line(5, 1.0, 1.0, 0.07)[:30])
+        columns, parsed = self.parsed_lines()
+        self.assertEqual(parsed, [trip_line(4, 3.0, 3.0, 0.21)])
+        self.assertEqual(columns['fare_cents'].tolist(), [109, 7, 24, 21])
+        self.assertEqual(str(columns['timestamp'][3]), '2025-12-04T10:00:00')
+        # La línea a medio escribir entra cuando se completa
+        with open(self.paths[1], 'a', encoding='utf-8') as f:
+            f.write(trip_line(5, 1.0, 1.0, 0.07)[30:])
+        columns, parsed = self.parsed_lines()
+        self.assertEqual(parsed, [trip_line(5, 1.0, 1.0, 0.07)])
+        self.assertEqual(columns['fare_cents'].tolist(), [109, 7, 24, 21, 7])
+
+    def test_sidecar_regenerado(self):
+        """Un fichero sustituido por otro más corto regenera el sidecar entero."""
+        analysis.trip_columns(self.paths, self.cache_dir)
+        with open(self.paths[0], 'w', encoding='utf-8') as f:
+            f.write(trip_line(1, 8.1, 18.5, 1.09))
+        columns, parsed = self.parsed_lines()
+        self.assertEqual(len(parsed), 2)
+        self.assertEqual(columns['fare_cents'].tolist(), [109, 7])
+
+    def test_meta_perdido(self):
+        """Sin meta.json (escritura interrumpida) el sidecar se regenera."""
+        analysis.trip_columns(self.paths, self.cache_dir)
+        os.remove(os.path.join(self.cache_dir, 'meta.json'))
+        self.assertEqual(len(analysis.trip_columns(self.paths, self.cache_dir)['fare_cents']), 3)
+
+    def test_historial_vacio(self):
+        """Sin ficheros de historial las columnas están vacías."""
+        columns = analysis.trip_columns([], self.cache_dir)
+        self.assertEqual(len(columns['timestamp']), 0)
+
+    @unittest.skipUnless(find_spec('pandas'), "pandas no instalado")
+    def test_dataframe(self):
+        """load_trips devuelve un DataFrame con las mismas columnas."""
+        trips = analysis.load_trips(self.paths, self.cache_dir)
+        self.assertEqual(list(trips.columns), list(analysis.COLUMNS))
+        self.assertEqual(int(trips.fare_cents.sum()), 140)
+
+
+if __name__ == '__main__':
+    unittest.main()
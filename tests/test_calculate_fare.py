@@ -8,12 +8,21 @@ import os
 # Agregar el directorio principal al path para importar main
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import main
 from main import calculate_fare
 
 
 class TestCalculateFare(unittest.TestCase):
     """Tests unitarios para la función calculate_fare."""
     
+    def setUp(self):
+        """Las cifras esperadas son las del perfil normal, sea cual sea el activo."""
+        self.profile_anterior = main.current_tariff().active
+        main.activate_profile("normal")
+    
+    def tearDown(self):
+        main.activate_profile(self.profile_anterior)
+    
     def test_solo_tiempo_parado(self):
         """Test: Solo tiempo detenido, sin movimiento."""
         resultado = calculate_fare(100, 0)  # 100 segundos parado
@@ -0,0 +1,223 @@
+"""
+Tests de los checkpoints de viajes activos y de la recuperación tras caída.
+"""
+import unittest
+import tempfile
+import shutil
+import time
+import struct
+import sys
+import os
+from unittest import mock
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.meter import RunningFare
+from src.checkpoint import CHECKPOINT_SUFFIX, CORRUPT_SUFFIX, TripCheckpoint, read_checkpoint, scan_orphans, RECORD_SIZE
+from src.trip import Trip
+
+
+class TestTripCheckpoint(unittest.TestCase):
+    """Tests del fichero de checkpoint mapeado en memoria."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_trip(self, start=1000.0):
+        fare = RunningFare(0.02, 0.05)
+        fare.start(start)
+        checkpoint = TripCheckpoint.create(self.directory)
+        checkpoint.save(fare, 'normal', start)
+        return fare, checkpoint
+
+    def test_guardar_y_leer(self):
+        """Lo guardado en cada transición se lee igual desde el disco."""
+        fare, checkpoint = self.make_trip()
+        fare.switch('moving', 1012.5)
+        checkpoint.save(fare, 'alta', 1012.5)
+        checkpoint.touch(1020.0)
+
+        record = read_checkpoint(checkpoint.path)
+        checkpoint.close()
+        self.assertEqual(record.state, 'moving')
+        self.assertEqual(record.profile, 'alta')
+        self.assertEqual(record.stopped_time, 12.5)
+        self.assertEqual(record.billed_times(), (12.5, 7.5))
+        self.assertEqual(os.path.getsize(checkpoint.path), RECORD_SIZE)
+
+    def test_escritura_incompleta_se_descarta(self):
+        """Si cabecera y cola no coinciden y no hay otra copia el checkpoint se considera corrupto."""
+        fare, checkpoint = self.make_trip()
+        checkpoint.close()
+        with open(checkpoint.path, 'r+b') as f:
+            # Secuencia de la copia 0, la única escrita
+            f.seek(8)
+            f.write(b'\xff\xff\xff\xff')
+
+        self.assertIsNone(read_checkpoint(checkpoint.path))
+        orphans, corrupt = scan_orphans(self.directory)
+        self.assertEqual(orphans, [])
+        self.assertEqual(corrupt, [checkpoint.path])
+
+    def test_caida_a_mitad_de_guardar(self):
+        """Si el proceso muere a mitad de `save` se lee la escritura anterior, no se pierde el viaje."""
+        fare, checkpoint = self.make_trip(start=0.0)
+        fare.switch('moving', 10.0)
+        checkpoint.save(fare, 'normal', 10.0)
+        fare.switch('stopped', 20.0)
+        # Muere tras escribir la secuencia y el cuerpo de la copia nueva, antes del latido y la cola
+        with mock.patch('src.checkpoint._UPDATED') as updated:
+            updated.pack_into.side_effect = KeyboardInterrupt
+            with self.assertRaises(KeyboardInterrupt):
+                checkpoint.save(fare, 'normal', 20.0)
+        record = read_checkpoint(checkpoint.path)
+        self.assertEqual((record.state, record.updated_at), ('moving', 10.0))
+        # La copia buena sigue siendo la que reciben los latidos y la siguiente escritura la sustituye
+        checkpoint.touch(15.0)
+        self.assertEqual(read_checkpoint(checkpoint.path).updated_at, 15.0)
+        checkpoint.save(fare, 'normal', 20.0)
+        checkpoint.close()
+        self.assertEqual(read_checkpoint(checkpoint.path).state, 'stopped')
+
+    def test_etiquetas_que_no_caben(self):
+        """Las etiquetas se guardan enteras (también las de varios bytes); las que no caben se avisan."""
+        fare, checkpoint = self.make_trip(start=0.0)
+        tags = ('aeropuerto', 'señalización' * 10, 'x' * 300, 'nocturno')
+        fare.set_tags(tags)
+        with self.assertLogs(level='WARNING') as logs:
+            checkpoint.save(fare, 'normal', 5.0)
+        record = read_checkpoint(checkpoint.path)
+        checkpoint.close()
+        self.assertEqual(record.tags, ('aeropuerto', 'señalización' * 10, 'nocturno'))
+        self.assertEqual(len(logs.records), 1)
+
+    def test_reanudar_cierra_el_tramo_en_el_ultimo_latido(self):
+        """Al reanudar, el tiempo entre el último latido y la caída no se cobra, como al finalizar."""
+        fare, checkpoint = self.make_trip(start=0.0)
+        fare.switch('moving', 10.0)
+        checkpoint.save(fare, 'normal', 10.0)
+        checkpoint.touch(30.0)
+        record = read_checkpoint(checkpoint.path)
+        checkpoint.close()
+
+        self.assertEqual(record.restore_args(100.0), ('moving', 0.0, 100.0, 10.0, 20.0, 0.0, ()))
+        trip = Trip.with_rates(0.02, 0.05)
+        trip.restore(*record.restore_args(100.0))
+        self.assertEqual(trip.fare.elapsed(110.0), (10.0, 30.0))
+
+    def test_distancia_y_etiquetas(self):
+        """La distancia del GPS y las etiquetas se guardan y se recuperan al reanudar."""
+        fare, checkpoint = self.make_trip(start=0.0)
+        fare.add_distance(1.25)
+        fare.set_tags(('aeropuerto', 'nocturno'))
+        checkpoint.save(fare, 'normal', 5.0)
+        record = read_checkpoint(checkpoint.path)
+        checkpoint.close()
+        self.assertEqual((record.distance_km, record.tags), (1.25, ('aeropuerto', 'nocturno')))
+        trip = Trip.with_rates(0.02, 0.05, 1.0)
+        trip.restore(*record.restore_args(10.0))
+        self.assertEqual((trip.fare.distance_km, trip.fare.tags), (1.25, ('aeropuerto', 'nocturno')))
+        self.assertAlmostEqual(trip.fare.estimate(10.0), 5 * 0.02 + 1.25)
+
+    def test_formato_anterior(self):
+        """Un checkpoint TXC1 (sin distancia) se sigue leyendo y se puede reanudar."""
+        path = os.path.join(self.directory, 'v1' + CHECKPOINT_SUFFIX)
+        body = struct.pack('<B3xIdddd16s', 2, os.getpid(), 0.0, 10.0, 10.0, 0.0, b'normal')
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<4sI', b'TXC1', 3) + body + struct.pack('<dI', 30.0, 3))
+        record = read_checkpoint(path)
+        self.assertEqual((record.state, record.billed_times(), record.distance_km), ('moving', (10.0, 20.0), 0.0))
+        checkpoint = TripCheckpoint(path)
+        fare = RunningFare(0.02, 0.05)
+        fare.restore(*record.restore_args(40.0))
+        checkpoint.save(fare, record.profile, 40.0)
+        checkpoint.close()
+        self.assertEqual(read_checkpoint(path).billed_times(), (10.0, 20.0))
+
+    def test_descartar_borra_el_fichero(self):
+        """Al terminar el viaje el checkpoint desaparece."""
+        fare, checkpoint = self.make_trip()
+        checkpoint.discard()
+        self.assertFalse(os.path.exists(checkpoint.path))
+
+
+class TestRecoverOrphanTrips(unittest.TestCase):
+    """Tests de la recuperación de viajes huérfanos al arrancar."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        patcher = mock.patch.object(main.settings, 'CHECKPOINT_DIR', self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = main.checkpoint_dir()
+        self.saved = []
+        patcher = mock.patch.object(main, 'save_trip_to_history',
+                                    side_effect=lambda *args, **kwargs: self.saved.append(args))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_orphans(self, count, directory=None):
+        for i in range(count):
+            fare = RunningFare(0.02, 0.05)
+            fare.start(float(i))
+            fare.switch('moving', i + 10.0)
+            checkpoint = TripCheckpoint.create(directory or self.directory)
+            checkpoint.save(fare, 'normal', i + 10.0)
+            checkpoint.touch(i + 30.0)
+            checkpoint.close()
+
+    def test_reanuda_el_mas_reciente_y_finaliza_el_resto(self):
+        """El viaje más reciente se reanuda; los demás van al historial."""
+        self.write_orphans(3)
+        resumed = main.recover_orphan_trips()
+
+        self.assertEqual(resumed.start_time, 2.0)
+        self.assertEqual(len(self.saved), 2)
+        stopped, moving, fare = self.saved[0]
+        self.assertEqual((stopped, moving), (10.0, 20.0))
+        self.assertEqual(fare, main.compute_fare(10.0, 20.0, 'normal'))
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(resumed.path)])
+
+    def test_checkpoint_corrupto_se_aparta(self):
+        """Un checkpoint ilegible se aparta con otro sufijo: no se vuelve a avisar en cada arranque."""
+        self.write_orphans(1)
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        with open(path, 'r+b') as f:
+            f.write(b'XXXX')
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(main.recover_orphan_trips())
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(path) + CORRUPT_SUFFIX])
+        self.assertEqual(scan_orphans(self.directory), ([], []))
+
+    def test_solo_los_viajes_de_este_taxi(self):
+        """Los checkpoints de otro taxi del mismo equipo no se adoptan."""
+        with mock.patch.object(main.settings, 'CAB_ID', 1):
+            self.write_orphans(1, main.checkpoint_dir())
+        self.assertIsNone(main.recover_orphan_trips())
+        with mock.patch.object(main.settings, 'CAB_ID', 1):
+            self.assertIsNotNone(main.recover_orphan_trips())
+
+    def test_sin_checkpoints(self):
+        """Sin viajes interrumpidos no hay nada que reanudar."""
+        self.assertIsNone(main.recover_orphan_trips())
+
+    def test_recuperacion_de_miles_de_viajes_es_rapida(self):
+        """Recuperar miles de viajes lleva milisegundos, no segundos."""
+        self.write_orphans(2000)
+        started = time.perf_counter()
+        main.recover_orphan_trips()
+        elapsed = time.perf_counter() - started
+        self.assertEqual(len(self.saved), 1999)
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+"""
+Tests del bucle de eventos de la CLI (entrada sin bloquear, temporizadores y sensor).
+"""
+import unittest
+import asyncio
+import tempfile
+import shutil
+import io
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cli_loop import CliEventLoop
+from src.console import ConsoleRenderer
+
+
+class FakeTrip:
+    active = False
+
+
+class FakeSession:
+    """Sesión mínima: registra lo que el bucle le pide."""
+
+    def __init__(self, boundary=None):
+        self.trip = FakeTrip()
+        self.checkpoint = None
+        self.sensor_feed = None
+        self.confirming_exit = False
+        self.boundary = boundary
+        self.lines = []
+        self.events = []
+
+    def prompt(self):
+        return "> "
+
+    def status_text(self, now):
+        return "estado"
+
+    def status_line(self, now):
+        self.events.append('status')
+
+    def handle(self, line):
+        self.lines.append(line)
+        if line == 'start':
+            self.trip.active = True
+            self.checkpoint = object()
+        elif line == 'finish':
+            self.trip.active = False
+            self.checkpoint = None
+        elif line == 'exit' and self.trip.active:
+            self.confirming_exit = True
+        elif line == 'exit' or self.confirming_exit:
+            return False
+        elif line == 'falla':
+            raise ValueError("fallo simulado")
+        return True
+
+    def touch(self, now):
+        self.events.append('touch')
+
+    def next_tariff_boundary(self, now):
+        return self.boundary if self.trip.active else None
+
+    def cancel_exit(self):
+        self.confirming_exit = False
+        self.events.append('cancel_exit')
+
+    def apply_sensor(self, show=True):
+        self.events.append('sensor')
+        return 'moving'
+
+    def flush_history(self):
+        self.events.append('flush_history')
+
+    def hangup(self):
+        self.events.append('hangup')
+
+
+class FakeSensor:
+    notify = None
+
+
+class TestCliEventLoop(unittest.TestCase):
+    """Tests del multiplexado de entrada, temporizadores y fuentes externas."""
+
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.stdin = os.fdopen(self.read_fd, 'r', encoding='utf-8')
+        self.out = io.StringIO()
+        self.session = FakeSession()
+
+    def tearDown(self):
+        self.stdin.close()
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+
+    def send(self, text):
+        os.write(self.write_fd, text.encode('utf-8'))
+
+    def close_input(self):
+        os.close(self.write_fd)
+        self.write_fd = None
+
+    def make_loop(self, **intervals):
+        renderer = ConsoleRenderer(self.out, max_fps=1000.0, in_place=False)
+        return CliEventLoop(self.session, renderer, self.stdin, **intervals)
+
+    def run_loop(self, loop, script):
+        async def main():
+            task = asyncio.ensure_future(loop.run())
+            await script(loop)
+            await asyncio.wait_for(task, timeout=5)
+        asyncio.run(main())
+
+    def test_lines_in_order_until_exit(self):
+        """Las líneas se atienden en orden y el bucle acaba cuando la sesión sale."""
+        async def script(loop):
+            self.send("status\nhistory 2\nexit\nignored\n")
+        self.run_loop(self.make_loop(), script)
+        self.assertEqual(self.session.lines, ['status', 'history 2', 'exit'])
+        self.assertIn("> ", self.out.getvalue())
+
+    def test_command_error_keeps_reading(self):
+        """Un comando que lanza una excepción se informa y las líneas siguientes se atienden."""
+        async def script(loop):
+            self.send("falla\nstatus\nexit\n")
+        with self.assertLogs(level='ERROR'):
+            self.run_loop(self.make_loop(), script)
+        self.assertEqual(self.session.lines, ['falla', 'status', 'exit'])
+        output = self.out.getvalue()
+        self.assertIn("fallo simulado", output)
+        self.assertEqual(output.count("> "), 3)
+
+    def test_idle_has_no_timers(self):
+        """Sin viaje activo no queda ningún temporizador programado (cero CPU en reposo)."""
+        seen = {}
+
+        async def script(loop):
+            await asyncio.sleep(0.05)
+            seen['idle'] = loop.timers()
+            self.send("start\n")
+            await asyncio.sleep(0.05)
+            seen['active'] = loop.timers()
+            self.send("finish\n")
+            await asyncio.sleep(0.05)
+            seen['finished'] = loop.timers()
+            self.send("exit\n")
+        self.run_loop(self.make_loop(heartbeat_interval=10.0, history_flush_delay=10.0), script)
+        self.assertEqual(seen['idle'], [])
+        self.assertEqual(seen['active'], ['heartbeat'])
+        self.assertEqual(seen['finished'], ['history'])
+
+    def test_heartbeat_while_active(self):
+        """Con un viaje activo el checkpoint se marca vivo sin esperar a ningún comando."""
+        async def script(loop):
+            self.send("start\n")
+            await asyncio.sleep(0.2)
+            self.send("finish\nexit\n")
+        self.run_loop(self.make_loop(heartbeat_interval=0.03), script)
+        self.assertGreaterEqual(self.session.events.count('touch'), 3)
+
+    def test_history_flush_after_trip(self):
+        """Tras guardar un viaje el historial se vuelca en reposo."""
+        async def script(loop):
+            self.send("start\nfinish\n")
+            await asyncio.sleep(0.1)
+            self.send("exit\n")
+        self.run_loop(self.make_loop(history_flush_delay=0.02), script)
+        self.assertEqual(self.session.events.count('flush_history'), 1)
+
+    def test_tariff_boundary_timer(self):
+        """El cambio de tramo de tarifa se programa con el tiempo que falta."""
+        self.session.boundary = 0.02
+        seen = {}
+
+        async def script(loop):
+            self.send("start\n")
+            await asyncio.sleep(0.01)
+            seen['timers'] = loop.timers()
+            self.send("finish\nexit\n")
+        self.run_loop(self.make_loop(heartbeat_interval=None), script)
+        self.assertEqual(seen['timers'], ['tariff'])
+
+    def test_exit_confirmation_times_out(self):
+        """Sin respuesta a la pregunta de salida, se cancela y el viaje sigue."""
+        async def script(loop):
+            self.send("start\nexit\n")
+            await asyncio.sleep(0.2)
+            self.send("finish\nexit\n")
+        self.run_loop(self.make_loop(confirm_timeout=0.05, heartbeat_interval=None), script)
+        self.assertIn('cancel_exit', self.session.events)
+        self.assertEqual(self.session.lines, ['start', 'exit', 'finish', 'exit'])
+
+    def test_sensor_wakes_the_loop(self):
+        """El sensor despierta al bucle desde otro hilo sin que llegue ninguna línea."""
+        self.session.sensor_feed = FakeSensor()
+
+        async def script(loop):
+            await asyncio.sleep(0.02)
+            await asyncio.get_running_loop().run_in_executor(None, self.session.sensor_feed.notify)
+            await asyncio.sleep(0.05)
+            self.send("exit\n")
+        self.run_loop(self.make_loop(), script)
+        self.assertEqual(self.session.events[:2], ['sensor', 'status'])
+        self.assertIsNone(self.session.sensor_feed.notify)
+
+    def test_end_of_input_hangs_up(self):
+        """Al cerrarse la entrada la sesión se cierra sin 'exit'."""
+        async def script(loop):
+            self.send("start\n")
+            self.close_input()
+        self.run_loop(self.make_loop(), script)
+        self.assertEqual(self.session.events[-1], 'hangup')
+
+
+class TestCliEventLoopFileInput(unittest.TestCase):
+    """Tests con stdin redirigido a un fichero (sin add_reader: hilo lector)."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_regular_file(self):
+        """Un fichero de comandos se atiende igual que una terminal."""
+        path = os.path.join(self.directory, 'comandos.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("start\nfinish\n")
+        session = FakeSession()
+        with open(path, 'r', encoding='utf-8') as stdin:
+            loop = CliEventLoop(session, ConsoleRenderer(io.StringIO(), in_place=False), stdin)
+            asyncio.run(asyncio.wait_for(loop.run(), timeout=5))
+        self.assertEqual(session.lines, ['start', 'finish'])
+        self.assertEqual(session.events[-1], 'hangup')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Tests del historial de viajes compacto (.thc).
+"""
+import unittest
+import tempfile
+import shutil
+import io
+import sys
+import os
+from contextlib import redirect_stdout
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import compact_history
+from src.compact_history import (CompactHistoryWriter, compact_lines, decode_block, encode_block, iter_blocks,
+                                 iter_text_lines, iter_trips, read_columns, render_text, trip_epoch)
+from src.history import format_history_line, history_paths, merge_history_lines
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def history_lines(count, start="2025-03-01 06:00:00"):
+    lines = []
+    when = trip_epoch(start)
+    for i in range(count):
+        when += 37 * (i % 50) + 5
+        stopped, moving = (i * 7 % 900) / 10, (i * 13 % 9000) / 10
+        lines.append(format_history_line(compact_history.epoch_timestamp(when), stopped, moving,
+                                         round(stopped * 0.02 + moving * 0.05, 2)) + "\n")
+    return lines
+
+
+class TestCompactHistory(unittest.TestCase):
+    """Tests de codificación, decodificación y renderizado a texto."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'historial_viajes-2025.thc')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ida_y_vuelta_del_texto(self):
+        """El texto reconstruido es idéntico al original, también entre bloques."""
+        lines = history_lines(1000)
+        self.assertEqual(compact_lines(lines, self.path, block_size=300), (1000, 0))
+        self.assertEqual(list(iter_text_lines(self.path)), lines)
+        trip = next(iter_trips(self.path))
+        self.assertEqual((trip.timestamp, trip.total_time), (lines[0][:19], trip.stopped_time + trip.moving_time))
+
+    def test_diez_veces_menos(self):
+        """Fechas en diferencias, enteros y zlib: al menos 10 veces menos que el texto."""
+        lines = history_lines(20000)
+        compact_lines(lines, self.path)
+        text_bytes = sum(len(line.encode('utf-8')) for line in lines)
+        self.assertGreaterEqual(text_bytes / os.path.getsize(self.path), 10)
+
+    def test_fechas_desordenadas_y_lineas_corruptas(self):
+        """Las diferencias negativas se admiten; las líneas sin formato se omiten y se cuentan."""
+        lines = [format_history_line("2025-01-02 10:00:00", 1.0, 2.0, 0.12) + "\n",
+                 "línea corrupta\n",
+                 format_history_line("2025-01-01 09:00:00", 0.0, 0.0, 0.0) + "\n",
+                 "ayer | Parado: 1.0s | Movimiento: 1.0s | Total: 2.0s | Tarifa: €0.07\n"]
+        self.assertEqual(compact_lines(lines, self.path), (2, 2))
+        self.assertEqual([trip.timestamp for trip in iter_trips(self.path)],
+                         ["2025-01-02 10:00:00", "2025-01-01 09:00:00"])
+
+    def test_anadir_bloques(self):
+        """Un fichero existente se amplía con bloques nuevos al final."""
+        lines = history_lines(10)
+        compact_lines(lines[:4], self.path)
+        with CompactHistoryWriter(self.path, compress=False) as writer:
+            for line in lines[4:]:
+                writer.add_line(line)
+        self.assertEqual([count for count, _ in iter_blocks(open(self.path, 'rb').read())], [4, 6])
+        self.assertEqual(list(iter_text_lines(self.path)), lines)
+
+    @unittest.skipIf(np is None, "numpy no instalado")
+    def test_numpy_igual_que_python(self):
+        """La decodificación con numpy da las mismas columnas que la de Python."""
+        trips = [(1_700_000_000, 0, 5, 0), (1_699_999_990, 100000, 1, 20000), (1_700_000_100, 127, 128, 16384)]
+        count, payload = next(iter_blocks(compact_history.MAGIC + encode_block(trips, compress=False)))
+        expected = decode_block(count, payload)
+        decoded = compact_history.decode_block_numpy(np, count, payload)
+        self.assertEqual([column.tolist() for column in decoded], [list(column) for column in expected])
+        self.assertEqual(expected[0], [1_700_000_000, 1_699_999_990, 1_700_000_100])
+
+    @unittest.skipIf(np is None, "numpy no instalado")
+    def test_columnas(self):
+        """read_columns devuelve arrays tipados de todo el fichero."""
+        compact_lines(history_lines(50), self.path, block_size=20)
+        columns = read_columns(self.path)
+        self.assertEqual(str(columns['timestamp'].dtype), 'datetime64[s]')
+        self.assertEqual(len(columns['fare_cents']), 50)
+        self.assertEqual(str(columns['timestamp'][0]), '2025-03-01T06:00:05')
+
+    def test_fichero_no_compacto_o_truncado(self):
+        """Una cabecera desconocida o un bloque incompleto es un error, no datos a medias."""
+        compact_lines(history_lines(10), self.path)
+        data = open(self.path, 'rb').read()
+        with self.assertRaises(ValueError):
+            list(iter_blocks(b'XXXX' + data[4:]))
+        with self.assertRaises(ValueError):
+            list(iter_blocks(data[:-3]))
+
+    def test_historial_mezclado_con_archivos_compactos(self):
+        """Los archivos .thc entran en history_paths y se leen como texto en la mezcla."""
+        history_file = os.path.join(self.directory, 'historial_viajes.txt')
+        archived = history_lines(3, start="2024-01-01 08:00:00")
+        compact_lines(archived, self.path)
+        current = history_lines(2, start="2026-01-01 08:00:00")
+        with open(history_file, 'w', encoding='utf-8') as f:
+            f.writelines(current)
+        paths = history_paths(history_file)
+        self.assertEqual(paths, [self.path, history_file])
+        self.assertEqual(list(merge_history_lines(paths)), archived + current)
+
+    def test_comando_compact_y_show(self):
+        """La línea de comandos convierte un fichero de texto y lo muestra de nuevo como texto."""
+        text_path = os.path.join(self.directory, 'historial_viajes-2024.txt')
+        lines = history_lines(5)
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        with redirect_stdout(io.StringIO()):
+            compact_history.main(['compact', text_path, '--replace'])
+        self.assertFalse(os.path.exists(text_path))
+        out = io.StringIO()
+        with redirect_stdout(out):
+            compact_history.main(['show', os.path.join(self.directory, 'historial_viajes-2024.thc')])
+        self.assertEqual(out.getvalue(), ''.join(lines))
+        rendered = io.StringIO()
+        self.assertEqual(render_text(os.path.join(self.directory, 'historial_viajes-2024.thc'), rendered), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests del renderizador de consola con búfer.
+"""
+import unittest
+import sys
+import os
+from io import StringIO
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.console import CLEAR_LINE, ConsoleRenderer
+
+
+class FakeClock:
+    """Reloj manual para controlar los intervalos de refresco."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingStream(StringIO):
+    """StringIO que cuenta las escrituras."""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+class TestConsoleRenderer(unittest.TestCase):
+    """Tests de agrupación y frecuencia de refresco."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stream = CountingStream()
+
+    def renderer(self, in_place):
+        return ConsoleRenderer(self.stream, max_fps=10, clock=self.clock, in_place=in_place)
+
+    def test_agrupa_escrituras_por_refresco(self):
+        """Las escrituras dentro de un intervalo salen en una sola escritura."""
+        renderer = self.renderer(in_place=False)
+        renderer.write("a\n")
+        for i in range(1000):
+            renderer.write(f"{i}\n")
+        self.assertEqual(self.stream.writes, 1)
+        self.clock.now = 0.1
+        renderer.write("fin\n")
+        self.assertEqual(self.stream.writes, 2)
+        self.assertTrue(self.stream.getvalue().endswith("998\n999\nfin\n"))
+
+    def test_estado_en_su_sitio(self):
+        """En una terminal solo se dibuja el último estado de cada intervalo, en la misma línea."""
+        renderer = self.renderer(in_place=True)
+        renderer.status("estado 0")
+        for i in range(1, 500):
+            renderer.status(f"estado {i}")
+        self.clock.now = 0.1
+        renderer.status("estado final")
+        self.assertEqual(self.stream.getvalue(), f"\restado 0{CLEAR_LINE}\restado final{CLEAR_LINE}")
+        self.assertEqual(renderer.coalesced, 499)
+
+    def test_texto_sobre_el_estado(self):
+        """El texto se imprime encima de la línea de estado, que se redibuja debajo."""
+        renderer = self.renderer(in_place=True)
+        renderer.status("estado")
+        self.clock.now = 0.1
+        renderer.write("mensaje\n")
+        renderer.flush(settle=True)
+        self.assertEqual(self.stream.getvalue(),
+                         f"\restado{CLEAR_LINE}\r{CLEAR_LINE}mensaje\n\restado{CLEAR_LINE}\n")
+
+    def test_estado_sin_terminal(self):
+        """Sin terminal el estado es una línea normal, en orden y sin repetir."""
+        renderer = self.renderer(in_place=False)
+        renderer.write("inicio\n")
+        renderer.status("estado 1")
+        renderer.status("estado 2")
+        renderer.write("texto\n")
+        renderer.status("estado 2")
+        renderer.status("estado 3")
+        renderer.close()
+        self.assertEqual(self.stream.getvalue(), "inicio\nestado 2\ntexto\nestado 3\n")
+
+    def test_hilo_vacia_lo_pendiente(self):
+        """Con el hilo de refresco lo pendiente se escribe sin más llamadas."""
+        renderer = ConsoleRenderer(self.stream, max_fps=100, in_place=False).start()
+        renderer.write("uno\n")
+        renderer.write("dos\n")
+        renderer._stopping.wait(0.2)
+        self.assertEqual(self.stream.getvalue(), "uno\ndos\n")
+        renderer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Tests de la detección automática de parado/en movimiento.
+"""
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.meter import RunningFare
+from src.trip import START, Trip
+from src.detector import (SpeedStateDetector, OdometerStateDetector, SensorFeed,
+                          file_samples, benchmark)
+
+
+def run(detector, samples):
+    """Transiciones emitidas por el detector para una lista de muestras."""
+    transitions = []
+    for timestamp, value in samples:
+        transition = detector.update(timestamp, value)
+        if transition is not None:
+            transitions.append(transition)
+    return transitions
+
+
+class TestSpeedStateDetector(unittest.TestCase):
+    """Tests de histéresis y antirrebote."""
+
+    def test_antirrebote(self):
+        """Un pico más corto que el antirrebote no cambia el estado."""
+        detector = SpeedStateDetector(debounce_s=1.0)
+        samples = [(t / 10, 30.0 if 5 <= t < 12 else 0.0) for t in range(30)]
+        self.assertEqual(run(detector, samples), [])
+        self.assertEqual(detector.state, 'stopped')
+
+    def test_transicion_con_instante_original(self):
+        """La transición se emite con el instante en que empezó la condición."""
+        detector = SpeedStateDetector(debounce_s=1.0)
+        samples = [(t / 10, 30.0 if 5 <= t < 25 else 0.0) for t in range(50)]
+        self.assertEqual(run(detector, samples), [('moving', 0.5), ('stopped', 2.5)])
+
+    def test_histeresis(self):
+        """Entre umbrales se mantiene el estado: sin oscilaciones en un atasco."""
+        detector = SpeedStateDetector(stop_kmh=3.0, move_kmh=8.0, debounce_s=0.0)
+        speeds = [10.0, 5.0, 7.0, 4.0, 6.0, 2.0]
+        transitions = run(detector, enumerate(speeds))
+        self.assertEqual(transitions, [('moving', 0), ('stopped', 5)])
+
+    def test_entre_umbrales_no_reinicia_antirrebote(self):
+        """Una muestra entre umbrales no anula el cambio pendiente."""
+        detector = SpeedStateDetector(debounce_s=1.0)
+        transitions = run(detector, [(0.0, 20.0), (0.5, 5.0), (1.0, 20.0)])
+        self.assertEqual(transitions, [('moving', 0.0)])
+
+    def test_odometro(self):
+        """La velocidad se deriva de las lecturas del odómetro."""
+        detector = OdometerStateDetector(debounce_s=0.5)
+        # 0.01 km por segundo = 36 km/h durante 3 s, luego parado
+        samples = [(t, min(t, 3) * 0.01) for t in range(8)]
+        self.assertEqual(run(detector, samples), [('moving', 1), ('stopped', 4)])
+
+    def test_coste_constante_por_muestra(self):
+        """Benchmark: el detector procesa cientos de miles de muestras por segundo."""
+        self.assertGreater(benchmark(200_000), 200_000)
+
+
+class TestSensorFeed(unittest.TestCase):
+    """Tests de la fuente de muestras y de su aplicación al taxímetro."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_transiciones_aplicadas_al_viaje(self):
+        """Las transiciones del fichero se facturan en su instante original."""
+        path = os.path.join(self.directory, 'velocidad.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            for t in range(100):
+                f.write(f"{1000 + t / 10},{30.0 if 20 <= t < 60 else 0.0}\n")
+            f.write("línea inválida\n")
+        feed = SensorFeed(file_samples(path), SpeedStateDetector(debounce_s=1.0)).start()
+        feed._thread.join(timeout=5)
+
+        fare = RunningFare(0.02, 0.05)
+        trip = Trip(fare)
+        trip.fire(START, 1000.0)
+        self.assertEqual(main.apply_sensor_transitions(feed, trip), 'stopped')
+        fare.close(1010.0)
+        self.assertAlmostEqual(fare.moving_time, 4.0)
+        self.assertAlmostEqual(fare.stopped_time, 6.0)
+
+    def test_sin_viaje_activo_se_descartan(self):
+        """Sin viaje activo las transiciones no se aplican."""
+        feed = SensorFeed(iter([(0.0, 30.0), (5.0, 30.0)]), SpeedStateDetector()).start()
+        feed._thread.join(timeout=5)
+        self.assertIsNone(main.apply_sensor_transitions(feed, Trip.with_rates(0.02, 0.05)))
+        self.assertEqual(feed.state, 'moving')
+
+    def test_fuente_inexistente(self):
+        """Una fuente que no se puede abrir detiene el hilo sin romper nada."""
+        feed = SensorFeed(file_samples(os.path.join(self.directory, 'no_existe')),
+                          SpeedStateDetector()).start()
+        feed._thread.join(timeout=5)
+        self.assertEqual(feed.drain(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
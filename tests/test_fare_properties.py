@@ -0,0 +1,218 @@
+"""
+Tests de propiedades de la tarifa con Hypothesis (todos los perfiles).
+
+Comprueban con duraciones y secuencias de tramos aleatorias que la tarifa es
+monótona, aditiva por tramos, igual en la versión por lotes y en la escalar,
+y estable al redondear a céntimos.
+
+Modo de larga duración (millones de viajes simulados, deriva de precisión y
+de rendimiento):
+    TAXIMETER_FUZZ_TRIPS=5000000 python -m pytest tests/test_fare_properties.py
+"""
+import unittest
+import math
+import time
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from hypothesis import given, settings, strategies as st
+except ImportError:
+    raise unittest.SkipTest("hypothesis no instalado")
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import main
+from src.meter import RunningFare
+from src.rules import CompiledProfile, load_rules
+from src.tariff import TariffSnapshot
+from src.trip import FINISH, MOVE, START, STOP, Trip
+
+# Viajes del modo de larga duración (0 = desactivado) y ejemplos de Hypothesis por test
+LONG_RUN_TRIPS = int(os.environ.get('TAXIMETER_FUZZ_TRIPS', '0'))
+settings.register_profile('taximetro', max_examples=100, deadline=None)
+settings.register_profile('taximetro-largo', max_examples=5000, deadline=None)
+settings.load_profile('taximetro-largo' if LONG_RUN_TRIPS else 'taximetro')
+
+PROFILE_KEYS = sorted(main.PRICE_PROFILES)
+# Perfiles con las reglas de ejemplo (bajada de bandera, mínimos, tramos, topes): no
+# dependen de que exista config/pricing_rules.json
+EXAMPLE_RULES = load_rules(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                        'config', 'pricing_rules.example.json'))
+RULED_TARIFF = TariffSnapshot(1, {key: dict(profile, rules=EXAMPLE_RULES.get(key, []))
+                                  for key, profile in main.PRICE_PROFILES.items()}, PROFILE_KEYS[0])
+CENT = 0.01
+# Margen de error de coma flotante en euros (tarifas de hasta ~10^6 €)
+EPSILON = 1e-6
+
+# Duraciones arbitrarias y en décimas de segundo (como las guarda el historial), que
+# caen a menudo en medio céntimo exacto
+durations = st.one_of(st.floats(min_value=0.0, max_value=1e6, allow_nan=False, allow_infinity=False),
+                      st.integers(min_value=0, max_value=10**7).map(lambda tenths: tenths / 10))
+short_durations = st.one_of(st.floats(min_value=0.0, max_value=3600.0, allow_nan=False, allow_infinity=False),
+                            st.integers(min_value=0, max_value=36000).map(lambda tenths: tenths / 10))
+segments = st.lists(st.tuples(st.sampled_from(['stopped', 'moving']), short_durations), max_size=40)
+amounts = st.floats(min_value=0.0, max_value=50.0, allow_nan=False, allow_infinity=False)
+rates = st.floats(min_value=0.0, max_value=0.5, allow_nan=False, allow_infinity=False)
+
+rule = st.one_of(
+    st.builds(lambda amount: {'type': 'flag_drop', 'amount': amount}, amounts),
+    st.builds(lambda amount: {'type': 'surcharge', 'amount': amount}, amounts),
+    st.builds(lambda after, stopped, moving: {'type': 'tiered', 'after_minutes': after,
+                                              'stopped': stopped, 'moving': moving},
+              st.integers(min_value=0, max_value=600), rates, rates),
+    st.builds(lambda amount: {'type': 'minimum', 'amount': amount}, amounts),
+    st.builds(lambda amount: {'type': 'cap', 'amount': amount}, st.floats(min_value=50.0, max_value=1e6)),
+)
+
+
+@st.composite
+def profiles(draw, with_rules=True):
+    """Un perfil de PRICE_PROFILES, opcionalmente con reglas aleatorias."""
+    key = draw(st.sampled_from(PROFILE_KEYS))
+    profile = dict(main.PRICE_PROFILES[key])
+    if with_rules:
+        profile['rules'] = draw(st.lists(rule, max_size=5))
+    return CompiledProfile(profile, key)
+
+
+def linear_fare(profile_key, stopped_s, moving_s):
+    # Tarifa sin redondear de un perfil sin reglas
+    profile = main.PRICE_PROFILES[profile_key]
+    return stopped_s * profile['stopped'] + moving_s * profile['moving']
+
+
+class TestFareProperties(unittest.TestCase):
+    """Invariantes de la tarifa compilada para todos los perfiles."""
+
+    def setUp(self):
+        # Los perfiles se pasan siempre explícitamente: el perfil activo no debe influir
+        self.profile_anterior = main.current_tariff().active
+
+    def tearDown(self):
+        main.activate_profile(self.profile_anterior)
+
+    @given(profiles(), durations, durations, durations, durations)
+    def test_monotona(self, profile, stopped, moving, extra_stopped, extra_moving):
+        """Más tiempo, parado o en movimiento, nunca baja la tarifa."""
+        fare = profile.fare(stopped, moving)
+        self.assertLessEqual(fare, profile.fare(stopped + extra_stopped, moving))
+        self.assertLessEqual(fare, profile.fare(stopped, moving + extra_moving))
+
+    @given(st.sampled_from(PROFILE_KEYS), segments)
+    def test_aditiva_por_tramos(self, key, trip_segments):
+        """La tarifa del viaje es la suma de sus tramos (salvo medio céntimo por tramo al redondear)."""
+        stopped = sum(duration for state, duration in trip_segments if state == 'stopped')
+        moving = sum(duration for state, duration in trip_segments if state == 'moving')
+        total = main.compute_fare(stopped, moving, key)
+        by_segment = math.fsum(main.compute_fare(*((duration, 0.0) if state == 'stopped' else (0.0, duration)), key)
+                               for state, duration in trip_segments)
+        self.assertLessEqual(abs(total - by_segment), CENT / 2 * (len(trip_segments) + 1) + EPSILON)
+        self.assertAlmostEqual(total, linear_fare(key, stopped, moving), delta=CENT / 2 + EPSILON)
+
+    @given(st.sampled_from(PROFILE_KEYS), segments)
+    def test_tarifa_en_curso_igual_a_la_final(self, key, trip_segments):
+        """La tarifa acumulada por tramos en el viaje (con reglas) coincide con la calculada al final."""
+        tariff = RULED_TARIFF.with_active(key, 2)
+        trip = Trip.with_rates(*tariff.rates())
+        trip.pin(tariff)
+        now = 1_700_000_000.0
+        trip.fire(START, now)
+        for state, duration in trip_segments:
+            trip.fire(STOP if state == 'stopped' else MOVE, now)
+            now += duration
+        estimate = trip.fare.estimate(now)
+        trip.fire(FINISH, now)
+        fare = trip.fare
+        self.assertAlmostEqual(fare.closed_fare, estimate, delta=EPSILON)
+        self.assertAlmostEqual(fare.stopped_time + fare.moving_time, now - fare.trip_start, delta=EPSILON)
+        self.assertAlmostEqual(main.compute_fare(fare.stopped_time, fare.moving_time, tariff=trip.tariff), estimate,
+                               delta=CENT / 2 + EPSILON)
+
+    @unittest.skipIf(np is None, "numpy no instalado")
+    @given(profiles(), st.lists(st.tuples(durations, durations), min_size=1, max_size=50))
+    def test_lotes_igual_que_escalar(self, profile, trips):
+        """fare_batch da exactamente la misma tarifa que fare para cada viaje."""
+        stopped = [trip[0] for trip in trips]
+        moving = [trip[1] for trip in trips]
+        batch = profile.fare_batch(np.array(stopped), np.array(moving))
+        self.assertEqual(batch.tolist(), [profile.fare(s, m) for s, m in trips])
+
+    @given(profiles(), durations, durations)
+    def test_redondeo_estable(self, profile, stopped, moving):
+        """La tarifa son céntimos exactos y redondearla otra vez no la cambia."""
+        fare = profile.fare(stopped, moving)
+        self.assertEqual(round(fare, 2), fare)
+        self.assertAlmostEqual(fare * 100, round(fare * 100), delta=1e-6 * max(1.0, fare))
+
+    @given(st.sampled_from(PROFILE_KEYS), durations, durations)
+    def test_calculate_fare_usa_el_perfil_activo(self, key, stopped, moving):
+        """calculate_fare depende solo del perfil activo, que se fija aquí explícitamente."""
+        main.activate_profile(key)
+        self.assertEqual(main.calculate_fare(stopped, moving), main.compute_fare(stopped, moving, key))
+
+
+@unittest.skipUnless(LONG_RUN_TRIPS and np is not None, "modo de larga duración: TAXIMETER_FUZZ_TRIPS=<viajes>")
+class TestLongRunFuzz(unittest.TestCase):
+    """Millones de viajes simulados: deriva de precisión y de rendimiento."""
+
+    CHUNK = 100_000
+    SEGMENTS = 24
+    SAMPLE = 500
+
+    def test_millones_de_viajes(self):
+        """Lotes y escalar coinciden, la acumulación no deriva y el ritmo no decae."""
+        rng = np.random.default_rng(int(os.environ.get('TAXIMETER_FUZZ_SEED', '0')))
+        compiled = {key: CompiledProfile(main.PRICE_PROFILES[key], key) for key in PROFILE_KEYS}
+        for profile in compiled.values():
+            profile.fare_batch(np.zeros(1), np.zeros(1))  # compilar la versión por lotes fuera del cronómetro
+        chunks = max(1, LONG_RUN_TRIPS // self.CHUNK)
+        # Viajes por segundo de cada bloque, por perfil (el coste depende de sus tarifas)
+        throughput = {}
+        worst_drift = 0.0
+        for chunk in range(chunks):
+            key = PROFILE_KEYS[chunk % len(PROFILE_KEYS)]
+            profile = compiled[key]
+            # Duraciones de cada tramo con décimas de segundo (como la GUI) y algunos viajes muy largos
+            durations = np.round(rng.exponential(120.0, size=(self.CHUNK, self.SEGMENTS)), 1)
+            durations[:self.CHUNK // 100] *= 1000.0
+            moving = rng.random((self.CHUNK, self.SEGMENTS)) < 0.6
+            stopped_s = np.where(moving, 0.0, durations).sum(axis=1)
+            moving_s = np.where(moving, durations, 0.0).sum(axis=1)
+
+            started = time.perf_counter()
+            fares = profile.fare_batch(stopped_s, moving_s)
+            throughput.setdefault(key, []).append(self.CHUNK / (time.perf_counter() - started))
+
+            sample = rng.choice(self.CHUNK, size=self.SAMPLE, replace=False)
+            for i in sample.tolist():
+                self.assertEqual(float(fares[i]), profile.fare(float(stopped_s[i]), float(moving_s[i])),
+                                 f"perfil {key}, viaje {chunk * self.CHUNK + i}")
+                # Acumulación tramo a tramo como RunningFare frente a la suma exacta
+                fare = RunningFare(main.PRICE_PROFILES[key]['stopped'], main.PRICE_PROFILES[key]['moving'])
+                now = 0.0
+                fare.start(now)
+                for duration, is_moving in zip(durations[i].tolist(), moving[i].tolist()):
+                    fare.switch('moving' if is_moving else 'stopped', now)
+                    now += duration
+                fare.close(now)
+                exact = linear_fare(key, math.fsum(durations[i][~moving[i]].tolist()),
+                                    math.fsum(durations[i][moving[i]].tolist()))
+                worst_drift = max(worst_drift, abs(fare.closed_fare - exact))
+        self.assertLess(worst_drift, EPSILON)
+        for key, rates in throughput.items():
+            if len(rates) < 2:
+                continue
+            half = len(rates) // 2
+            first, last = np.median(rates[:half]), np.median(rates[half:])
+            self.assertGreater(last, first * 0.5, f"rendimiento de {key}: {first:,.0f} -> {last:,.0f} viajes/s")
+
+
+if __name__ == '__main__':
+    unittest.main()
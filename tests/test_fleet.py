@@ -0,0 +1,188 @@
+"""
+Tests del servidor de flota: reparto de taxis, comandos y parada ordenada.
+"""
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fleet import HashRing, FleetWorker, FleetSupervisor
+from src.history import fleet_shard_path, history_paths, merge_history_lines, parse_history_line
+
+PROFILES = {
+    'normal': {'name': "Normal", 'stopped': 0.02, 'moving': 0.05},
+    'premium': {'name': "Premium", 'stopped': 0.03, 'moving': 0.08,
+                'rules': [{'type': 'minimum', 'amount': 5.0},
+                          {'type': 'surcharge', 'amount': 2.0, 'when': 'aeropuerto'}]},
+}
+
+
+class TestHashRing(unittest.TestCase):
+    """Tests del anillo de hash consistente."""
+
+    def test_owner_is_stable(self):
+        """El dueño de un taxi no depende de la instancia del anillo"""
+        first, second = HashRing(4), HashRing(4)
+        for cab in range(200):
+            self.assertEqual(first.owner(str(cab)), second.owner(str(cab)))
+
+    def test_all_workers_get_cabs(self):
+        """Con muchos taxis todos los trabajadores reciben una parte razonable"""
+        ring = HashRing(4)
+        counts = [0] * 4
+        for cab in range(4000):
+            counts[ring.owner(str(cab))] += 1
+        for count in counts:
+            self.assertGreater(count, 500)
+
+    def test_adding_worker_moves_few_cabs(self):
+        """Al pasar de 4 a 5 trabajadores solo cambia de dueño una fracción pequeña"""
+        before, after = HashRing(4), HashRing(5)
+        moved = sum(before.owner(str(cab)) != after.owner(str(cab)) for cab in range(4000))
+        self.assertLess(moved, 4000 * 0.35)
+
+
+class TestFleetWorker(unittest.TestCase):
+    """Tests de los comandos de un trabajador ejecutado en el propio proceso."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.shard_dir = os.path.join(self.directory, 'historial')
+        self.checkpoint_dir = os.path.join(self.directory, 'checkpoints')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_worker(self, index=0, workers=1):
+        return FleetWorker(index, HashRing(workers), PROFILES, self.shard_dir, self.checkpoint_dir)
+
+    def history(self, index=0):
+        with open(fleet_shard_path(self.shard_dir, index), 'r', encoding='utf-8') as f:
+            return [parse_history_line(line) for line in f]
+
+    def test_trip_is_written_to_history(self):
+        """Un viaje completo se factura y se escribe en el historial del trabajador"""
+        worker = self.make_worker()
+        replies = worker.run_batch([('7', 'start', None, 1000.0),
+                                    ('7', 'move', None, 1010.0),
+                                    ('7', 'finish', None, 1030.0)])
+        self.assertTrue(all(reply.ok for reply in replies))
+        self.assertAlmostEqual(replies[-1].value, 10 * 0.02 + 20 * 0.05)
+        trip, = self.history()
+        self.assertAlmostEqual(trip.stopped_time, 10.0)
+        self.assertAlmostEqual(trip.moving_time, 20.0)
+        self.assertNotIn('7', worker.meters)
+
+    def test_profile_rules_apply(self):
+        """La tarifa final usa el perfil compilado con sus reglas"""
+        worker = self.make_worker()
+        worker.handle('1', 'start', 'premium', 0.0)
+        self.assertEqual(worker.handle('1', 'finish', None, 10.0).value, 5.0)
+        # start <perfil> <etiquetas...>: el suplemento del aeropuerto solo con la etiqueta
+        worker.handle('2', 'start', 'premium Aeropuerto', 0.0)
+        self.assertEqual(worker.meters['2'].trip.fare.tags, ('aeropuerto',))
+        self.assertEqual(worker.handle('2', 'finish', None, 200.0).value, 8.0)
+
+    def test_profile_change_mid_trip(self):
+        """Cambiar de perfil con el viaje en curso cambia las tarifas de ahí en adelante"""
+        worker = self.make_worker()
+        worker.handle('1', 'start', None, 0.0)
+        self.assertTrue(worker.handle('1', 'profile', 'premium', 0.0).ok)
+        state, estimate = worker.handle('1', 'status', None, 100.0).value
+        self.assertEqual(state, 'stopped')
+        # La estimación en curso aplica las reglas del perfil: el mínimo hasta superarlo
+        self.assertAlmostEqual(estimate, 5.0)
+        self.assertAlmostEqual(worker.handle('1', 'status', None, 300.0).value[1], 300 * 0.03)
+
+    def test_invalid_commands(self):
+        """Los comandos sin viaje, repetidos o desconocidos devuelven error"""
+        worker = self.make_worker()
+        self.assertFalse(worker.handle('1', 'move', None, 0.0).ok)
+        # Sin viaje no hay a quién cambiarle el perfil: se elige en `start <perfil>`
+        reply = worker.handle('1', 'profile', 'premium', 0.0)
+        self.assertEqual((reply.ok, reply.value), (False, "sin viaje activo"))
+        self.assertTrue(worker.handle('1', 'start', None, 0.0).ok)
+        self.assertFalse(worker.handle('1', 'start', None, 1.0).ok)
+        self.assertFalse(worker.handle('1', 'profile', 'inexistente', 1.0).ok)
+        self.assertFalse(worker.handle('1', 'volar', None, 1.0).ok)
+
+    def test_shutdown_finalizes_active_trips(self):
+        """La parada con finalize escribe los viajes activos en el historial"""
+        worker = self.make_worker()
+        worker.handle('1', 'start', None, 0.0)
+        worker.handle('2', 'start', None, 0.0)
+        report = worker.shutdown(finalize=True, now=10.0)
+        self.assertEqual((report.finalized, report.checkpointed), (2, 0))
+        self.assertEqual(len(self.history()), 2)
+
+    def test_checkpoint_and_restore_with_other_worker_count(self):
+        """Los viajes en checkpoint los recupera su nuevo dueño aunque cambien los trabajadores"""
+        worker = self.make_worker()
+        for cab in range(20):
+            worker.handle(str(cab), 'start', None, 0.0)
+            worker.handle(str(cab), 'move', None, 5.0)
+        report = worker.shutdown(finalize=False, now=15.0)
+        self.assertEqual(report.checkpointed, 20)
+
+        restored = [self.make_worker(index, workers=3) for index in range(3)]
+        self.assertEqual(sum(w.restore(15.0) for w in restored), 20)
+        ring = HashRing(3)
+        for cab in range(20):
+            owner = restored[ring.owner(str(cab))]
+            reply = owner.handle(str(cab), 'finish', None, 25.0)
+            self.assertAlmostEqual(reply.value, 5 * 0.02 + 20 * 0.05)
+        for w in restored:
+            w.shutdown()
+        self.assertEqual(os.listdir(self.checkpoint_dir), [])
+
+    def test_restore_does_not_bill_downtime(self):
+        """El tiempo con el trabajador caído no se cobra: el viaje sigue donde quedó"""
+        worker = self.make_worker()
+        worker.handle('1', 'start', None, 0.0)
+        worker.handle('1', 'move', None, 5.0)
+        worker.shutdown(finalize=False, now=15.0)
+
+        restarted = self.make_worker()
+        self.assertEqual(restarted.restore(1000.0), 1)
+        state, estimate = restarted.handle('1', 'status', None, 1000.0).value
+        self.assertEqual(state, 'moving')
+        self.assertAlmostEqual(estimate, 5 * 0.02 + 10 * 0.05)
+        reply = restarted.handle('1', 'finish', None, 1010.0)
+        self.assertAlmostEqual(reply.value, 5 * 0.02 + 20 * 0.05)
+        restarted.shutdown()
+
+
+class TestFleetSupervisor(unittest.TestCase):
+    """Tests del supervisor con procesos trabajadores reales."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.shard_dir = os.path.join(self.directory, 'historial')
+        self.checkpoint_dir = os.path.join(self.directory, 'checkpoints')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_commands_are_routed_and_ordered(self):
+        """Las respuestas vuelven en el orden de los comandos y cada taxi va a su dueño"""
+        cabs = [str(cab) for cab in range(30)]
+        with FleetSupervisor(2, PROFILES, self.shard_dir, self.checkpoint_dir) as supervisor:
+            commands = ([(cab, 'start', None, 0.0) for cab in cabs]
+                        + [(cab, 'finish', None, 10.0) for cab in cabs])
+            replies = supervisor.execute(commands)
+            self.assertEqual([(r.cab_id, r.command) for r in replies], [c[:2] for c in commands])
+            self.assertTrue(all(r.ok for r in replies))
+            self.assertTrue(supervisor.send('0', 'start').ok)
+            report = supervisor.shutdown(finalize=True)
+        self.assertEqual(report.finalized, 1)
+        paths = history_paths(os.path.join(self.directory, 'no-existe.txt'), self.shard_dir)
+        self.assertEqual(len(paths), 2)
+        self.assertEqual(len(list(merge_history_lines(paths))), 31)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""
+Tests de la ingesta GPS: distancia, detección parado/movimiento y rendimiento.
+"""
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import gps
+import main
+from src.gps import GpsFeed, GpsIngestor, GpsFleetMeter, haversine_km, parse_fix, file_batches
+from src.trip import START, Trip
+
+# Un grado de latitud son ~111.2 km; 0.0001° cada 0.1 s ≈ 400 km/h, 0.00002° ≈ 80 km/h
+STEP_80_KMH = 0.00002
+
+
+def track(cab_id, start, steps, step, lat=40.0, t0=0.0, dt=0.1):
+    """Columnas de un recorrido hacia el norte con paso constante."""
+    return ([cab_id] * steps, [t0 + i * dt for i in range(steps)],
+            [lat + i * step for i in range(steps)], [start] * steps)
+
+
+class TestHaversine(unittest.TestCase):
+    """Tests de la distancia entre posiciones."""
+
+    def test_distancia_conocida(self):
+        """Madrid-Barcelona a vuelo de pájaro: ~505 km."""
+        self.assertAlmostEqual(haversine_km(40.4168, -3.7038, 41.3874, 2.1686), 505.0, delta=2.0)
+
+    @unittest.skipIf(gps.np is None, "numpy no instalado")
+    def test_vectorizado_igual_que_escalar(self):
+        """La versión con arrays da lo mismo que la escalar."""
+        np = gps.np
+        lat1, lon1, lat2, lon2 = np.array([40.0, 10.0]), np.array([-3.0, 5.0]), np.array([40.1, 10.0]), np.array([-3.0, 5.1])
+        vector = haversine_km(lat1, lon1, lat2, lon2)
+        for i in range(2):
+            self.assertAlmostEqual(vector[i], haversine_km(lat1[i], lon1[i], lat2[i], lon2[i]))
+
+
+class IngestorTests:
+    """Tests comunes a la ruta vectorizada y a la ruta sin numpy."""
+
+    def test_distancia_acumulada(self):
+        """La distancia por lote y la total suman los tramos recorridos."""
+        ingestor = GpsIngestor()
+        first = ingestor.feed(*track('A', -3.0, 11, STEP_80_KMH))
+        second = ingestor.feed(*track('A', -3.0, 10, STEP_80_KMH, lat=40.0 + 11 * STEP_80_KMH, t0=1.1))
+        expected = haversine_km(40.0, -3.0, 40.0 + 20 * STEP_80_KMH, -3.0)
+        self.assertAlmostEqual(first.distances['A'] + second.distances['A'], expected, places=6)
+        self.assertAlmostEqual(ingestor.total_distance('A'), expected, places=6)
+
+    def test_histeresis(self):
+        """Se pasa a movimiento sobre el umbral alto y a parado bajo el bajo."""
+        ingestor = GpsIngestor(stop_kmh=3.0, move_kmh=8.0)
+        # 80 km/h, luego ~5 km/h (entre umbrales: sigue en movimiento), luego parado
+        cab, ts, lats, lons = track('A', -3.0, 5, STEP_80_KMH)
+        lat = lats[-1]
+        for i in range(5, 10):
+            lat += STEP_80_KMH / 16
+            cab.append('A'), ts.append(i * 0.1), lats.append(lat), lons.append(-3.0)
+        for i in range(10, 15):
+            cab.append('A'), ts.append(i * 0.1), lats.append(lat), lons.append(-3.0)
+        result = ingestor.feed(cab, ts, lats, lons)
+        self.assertEqual([(t.state, round(t.timestamp, 1)) for t in result.transitions],
+                         [('moving', 0.1), ('stopped', 1.0)])
+        self.assertEqual(ingestor.state('A'), 'stopped')
+
+    def test_lote_desordenado_y_varios_taxis(self):
+        """Las posiciones se agrupan por taxi y se ordenan por tiempo."""
+        ingestor = GpsIngestor()
+        a = track('A', -3.0, 6, STEP_80_KMH)
+        b = track('B', 2.0, 6, 0.0)
+        rows = list(zip(*a)) + list(zip(*b))
+        rows.reverse()
+        result = ingestor.feed(*map(list, zip(*rows)))
+        self.assertEqual([(t.cab_id, t.state) for t in result.transitions], [('A', 'moving')])
+        self.assertEqual(result.distances['B'], 0.0)
+        self.assertEqual(ingestor.state('B'), 'stopped')
+
+    def test_flota_actualiza_viajes_activos(self):
+        """Las transiciones y la distancia se aplican a la tarifa en curso."""
+        fleet = GpsFleetMeter((0.02, 0.05, 1.0))
+        fleet.start_trip('A', 0.0)
+        fleet.feed(*track('A', -3.0, 11, STEP_80_KMH))
+        fare = fleet.finish_trip('A', 1.0)
+        self.assertEqual(fare.elapsed(1.0), (0.1, 0.9))
+        self.assertAlmostEqual(fare.distance_km, haversine_km(40.0, -3.0, 40.0 + 10 * STEP_80_KMH, -3.0))
+        self.assertAlmostEqual(fare.estimate(1.0), 0.1 * 0.02 + 0.9 * 0.05 + fare.distance_km * 1.0)
+
+
+@unittest.skipIf(gps.np is None, "numpy no instalado")
+class TestIngestorVectorizado(IngestorTests, unittest.TestCase):
+    """Ingesta con numpy."""
+
+    def test_rendimiento_flota(self):
+        """Procesa 500 taxis a 10 Hz muy por encima de tiempo real."""
+        cabs, steps = 500, 10
+        ingestor = GpsIngestor()
+        cab_ids = [f"cab{c}" for c in range(cabs)] * steps
+        ts = [s * 0.1 for s in range(steps) for _ in range(cabs)]
+        lats = [40.0 + s * STEP_80_KMH for s in range(steps) for _ in range(cabs)]
+        lons = [-3.0 + c * 0.01 for _ in range(steps) for c in range(cabs)]
+        started = time.perf_counter()
+        ingestor.feed(cab_ids, ts, lats, lons)
+        elapsed = time.perf_counter() - started
+        # Un segundo de posiciones de toda la flota en menos de 0.25 s
+        self.assertLess(elapsed, 0.25)
+
+
+class TestIngestorSinNumpy(IngestorTests, unittest.TestCase):
+    """Ingesta con la ruta de Python puro."""
+
+    def setUp(self):
+        self.np = gps.np
+        gps.np = None
+
+    def tearDown(self):
+        gps.np = self.np
+
+
+class TestFuentes(unittest.TestCase):
+    """Tests de lectura de posiciones."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_fix(self):
+        """Las líneas mal formadas se descartan."""
+        self.assertEqual(parse_fix("7,12.5,40.1,-3.2\n"), ('7', 12.5, 40.1, -3.2))
+        self.assertIsNone(parse_fix("7,12.5,40.1"))
+        self.assertIsNone(parse_fix("7,x,40.1,-3.2"))
+
+    def test_lotes_desde_fichero(self):
+        """El fichero se lee en lotes de columnas."""
+        path = os.path.join(self.directory, 'fixes.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(5):
+                f.write(f"A,{i},40.0,-3.0\n")
+            f.write("basura\n")
+        batches = list(file_batches(path, batch_size=2))
+        self.assertEqual([len(batch[0]) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][1], [0.0, 1.0])
+
+    def test_gps_como_sensor_del_taximetro(self):
+        """GpsFeed sigue solo a su taxi: transiciones y distancia llegan al viaje y a la tarifa."""
+        path = os.path.join(self.directory, 'fixes.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(50):
+                # Parado 2 s y luego ~80 km/h hacia el norte; otro taxi se mueve a la vez
+                moved = max(0, i - 20)
+                f.write(f"0,{100 + i * 0.1:.1f},{40.0 + moved * STEP_80_KMH:.6f},-3.0\n")
+                f.write(f"9,{100 + i * 0.1:.1f},{41.0 + i * 0.001:.6f},-3.0\n")
+        feed = GpsFeed(file_batches(path, batch_size=7), 0).start()
+        feed._thread.join(timeout=5)
+
+        trip = Trip.with_rates(0.02, 0.05, 1.0)
+        trip.fire(START, 100.0)
+        self.assertEqual(main.apply_sensor_transitions(feed, trip), 'moving')
+        km = main.apply_sensor_distance(feed, trip)
+        self.assertAlmostEqual(km, 29 * STEP_80_KMH * 111.2, delta=0.001)
+        self.assertEqual(main.apply_sensor_distance(feed, trip), 0.0)
+        trip.fare.finish(104.9)
+        fare = trip.fare
+        self.assertAlmostEqual(fare.moving_time, 2.8, places=6)
+        self.assertEqual(main.calculate_fare(fare.stopped_time, fare.moving_time, fare.distance_km),
+                         main.compute_fare(fare.stopped_time, fare.moving_time, None, km))
+
+    def test_distancia_sin_viaje_no_se_cobra(self):
+        """Lo recorrido sin viaje activo se descarta."""
+        feed = GpsFeed(iter([(['0', '0'], [0.0, 1.0], [40.0, 40.001], [-3.0, -3.0])]), '0').start()
+        feed._thread.join(timeout=5)
+        trip = Trip.with_rates(0.02, 0.05, 1.0)
+        self.assertEqual(main.apply_sensor_distance(feed, trip), 0.0)
+        self.assertEqual(feed.take_distance(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
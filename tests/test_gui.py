@@ -0,0 +1,165 @@
+"""
+Tests de la interfaz gráfica sin pantalla (tkinter falso y reloj falso).
+"""
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.checkpoint import TripCheckpoint
+from src.gui_harness import FakeClock, FakeRoot, HeadlessGUI, frame_stats
+from src.meter import RunningFare
+
+# Presupuestos por frame (ms). El display se refresca cada 100 ms: un tick
+# tiene que ocupar una fracción mínima del frame para que los clics no esperen.
+TICK_P99_MS = 2.0
+TICK_CPU_MS = 0.5
+TOGGLE_P99_MS = 10.0
+START_FINISH_MAX_MS = 100.0
+HISTORY_P99_MS = 20.0
+
+
+class TestHeadlessGUI(unittest.TestCase):
+    """Tests del ciclo de un viaje en la ventana principal."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profile_anterior = main.current_tariff().active
+        main.activate_profile("normal")
+
+    def tearDown(self):
+        main.activate_profile(self.profile_anterior)
+        shutil.rmtree(self.directory)
+
+    def test_viaje_completo(self):
+        """Iniciar, esperar, mover y finalizar: el display y el recibo muestran lo cobrado."""
+        with HeadlessGUI(self.directory) as harness:
+            harness.click('start_finish_btn')
+            harness.root.advance(10.0)
+            self.assertEqual(harness.display()['stopped'], "10.0")
+            self.assertEqual(harness.display()['fare'], "€0.20")
+
+            harness.click('stop_move_btn')
+            harness.root.advance(20.0)
+            shown = harness.display()
+            self.assertEqual((shown['stopped'], shown['moving'], shown['fare']), ("10.0", "20.0", "€1.20"))
+            self.assertIn("EN MOVIMIENTO", shown['status'])
+
+            harness.click('start_finish_btn')
+            kind, _, summary = harness.messagebox.shown[-1]
+            self.assertEqual(kind, 'info')
+            self.assertIn("1.20", summary)
+            shown = harness.display()
+            self.assertEqual(shown['last_trip'], summary)
+            self.assertEqual((shown['stopped'], shown['fare']), ("0.0", "€0.00"))
+            self.assertEqual(main.trip_repository().count(), 1)
+
+    def test_sin_viaje(self):
+        """Sin viaje el refresco sigue corriendo pero no cambia nada y el botón de estado no responde."""
+        with HeadlessGUI(self.directory) as harness:
+            harness.root.advance(5.0)
+            self.assertEqual(harness.root.stats('update_timer').count, 50)
+            self.assertIsNone(harness.click('stop_move_btn'))
+            self.assertEqual(harness.display()['fare'], "€0.00")
+            self.assertEqual(harness.root.pending, 1)
+
+    def test_cambio_de_perfil_durante_el_viaje(self):
+        """Elegir otro perfil reprecia el viaje en curso con el snapshot nuevo."""
+        with HeadlessGUI(self.directory) as harness:
+            harness.click('start_finish_btn')
+            harness.gui.profile_var.set("Demanda Alta")
+            harness.gui.on_profile_change(None)
+            harness.root.advance(10.0)
+            self.assertEqual(harness.display()['fare'], "€0.30")
+            self.assertEqual(harness.gui.trip.tariff.active, "alta")
+
+    def test_reanudar_tras_caida(self):
+        """El viaje huérfano se reanuda sin cobrar el tiempo entre el último latido y el arranque."""
+        clock = FakeClock()
+        fare = RunningFare(0.02, 0.05)
+        fare.start(clock() - 300.0)
+        checkpoint = TripCheckpoint.create(os.path.join(self.directory, 'checkpoints', 'cab-0'))
+        checkpoint.save(fare, 'normal', clock() - 300.0)
+        checkpoint.touch(clock() - 290.0)
+        checkpoint.close()
+        # El checkpoint es de este mismo proceso: scan_orphans lo trata como huérfano
+        with HeadlessGUI(self.directory, clock=clock) as harness:
+            harness.root.advance(5.0)
+            self.assertEqual(harness.display()['stopped'], "15.0")
+            self.assertIn("recuperado", harness.display()['status'])
+
+    def test_cerrar_con_viaje_activo(self):
+        """Al cerrar se pregunta: 'no' abandona el viaje sin guardar ni dejar checkpoint."""
+        with HeadlessGUI(self.directory, answer='no') as harness:
+            harness.click('start_finish_btn')
+            harness.root.advance(3.0)
+            harness.gui.on_closing()
+            self.assertEqual(harness.messagebox.shown[-1][0], 'question')
+            self.assertEqual(os.listdir(main.checkpoint_dir()), [])
+            self.assertEqual(main.trip_repository().count(), 0)
+
+
+class TestGUIBudgets(unittest.TestCase):
+    """Presupuestos de latencia del bucle de eventos y de CPU por frame."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_presupuestos_por_frame(self):
+        """Refresco, clics e historial caben en su presupuesto."""
+        with HeadlessGUI(self.directory) as harness:
+            main.trip_repository().add_many(("2025-01-01 08:00:00", i % 600, i % 1800, (i % 900) / 10, 'normal', 3)
+                                            for i in range(5000))
+            root = harness.root
+            harness.click('start_finish_btn')
+            for _ in range(20):
+                root.advance(5.0)
+                harness.click('stop_move_btn')
+            harness.click('start_finish_btn')
+            for _ in range(20):
+                root.measure('show_history', harness.gui.show_history)
+
+            tick = root.stats('update_timer')
+            self.assertEqual(tick.count, 1000)
+            self.assertLess(tick.p99_ms, TICK_P99_MS)
+            self.assertLess(tick.cpu_ms, TICK_CPU_MS)
+            self.assertLess(root.stats('stop_move_btn').p99_ms, TOGGLE_P99_MS)
+            self.assertLess(root.stats('start_finish_btn').max_ms, START_FINISH_MAX_MS)
+            self.assertLess(root.stats('show_history').p99_ms, HISTORY_P99_MS)
+
+
+class TestFakeRoot(unittest.TestCase):
+    """Tests del bucle de eventos falso."""
+
+    def test_orden_y_cancelacion(self):
+        """Los callbacks corren en el instante programado, en orden, y los cancelados no corren."""
+        clock = FakeClock(100.0)
+        root = FakeRoot(clock)
+        calls = []
+        root.after(200, lambda: calls.append(('b', clock())))
+        root.after(100, lambda: calls.append(('a', clock())))
+        cancelled = root.after(150, lambda: calls.append(('x', clock())))
+        root.after_cancel(cancelled)
+        root.advance(0.2)
+        self.assertEqual(calls, [('a', 100.1), ('b', 100.2)])
+        self.assertEqual(clock(), 100.2)
+
+    def test_estadisticas(self):
+        """Las estadísticas resumen las muestras en milisegundos."""
+        stats = frame_stats([(0.001, 0.0005)] * 99 + [(0.010, 0.001)])
+        self.assertEqual(stats.count, 100)
+        self.assertAlmostEqual(stats.max_ms, 10.0)
+        self.assertAlmostEqual(stats.p99_ms, 10.0)
+        self.assertAlmostEqual(stats.cpu_ms, 0.505)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Tests de la lectura, mezcla y exportación del historial de viajes.
+"""
+import unittest
+import tempfile
+import io
+import shutil
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.history import (history_paths, shard_path, merge_history_lines,
+                         history_stats, export_history_csv)
+from src.compact_history import compact_lines, compact_path
+
+
+class TestShardedHistory(unittest.TestCase):
+    """Tests del historial repartido en un fichero por taxi."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history_file = os.path.join(self.directory, 'historial_viajes.txt')
+        self.shard_dir = os.path.join(self.directory, 'historial')
+        os.makedirs(self.shard_dir)
+        self.write(self.history_file, ["2025-01-01 08:00:00", "2025-01-03 08:00:00"])
+        self.write(shard_path(self.shard_dir, 1), ["2025-01-02 08:00:00", "2025-01-05 08:00:00"])
+        self.write(shard_path(self.shard_dir, 2), ["2025-01-04 08:00:00"])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def write(path, timestamps):
+        with open(path, 'w', encoding='utf-8') as f:
+            for i, timestamp in enumerate(timestamps, 1):
+                f.write(f"{timestamp} | Parado: {i}.0s | Movimiento: 1.0s | Total: {i + 1}.0s | Tarifa: €1.{i}0\n")
+
+    def test_mezcla_en_orden_cronologico(self):
+        """La lectura mezcla los ficheros por taxi en un único orden por fecha."""
+        paths = history_paths(self.history_file, self.shard_dir)
+        self.assertEqual([os.path.basename(p) for p in paths],
+                         ['historial_viajes.txt', 'cab-1.txt', 'cab-2.txt'])
+        days = [line[8:10] for line in merge_history_lines(paths)]
+        self.assertEqual(days, ['01', '02', '03', '04', '05'])
+
+    def test_mezcla_perezosa(self):
+        """La mezcla no lee los ficheros hasta que se consume."""
+        merged = merge_history_lines(history_paths(self.history_file, self.shard_dir))
+        self.assertTrue(next(merged).startswith("2025-01-01"))
+
+    def test_estadisticas_y_exportacion(self):
+        """Estadísticas y exportación recorren el historial mezclado."""
+        paths = history_paths(self.history_file, self.shard_dir)
+        stats = history_stats(merge_history_lines(paths))
+        self.assertEqual((stats.trips, stats.revenue_cents), (5, 570))
+        self.assertEqual((stats.first, stats.last), ("2025-01-01 08:00:00", "2025-01-05 08:00:00"))
+        out = io.StringIO()
+        self.assertEqual(export_history_csv(merge_history_lines(paths), out), 5)
+        self.assertEqual(out.getvalue().splitlines()[2].split(',')[0], "2025-01-02 08:00:00")
+
+    def test_archivo_compactado_sin_borrar_el_texto(self):
+        """Un archivo con texto y .thc a la vez se lee una sola vez; solo el .thc, también."""
+        archive = os.path.join(self.directory, 'historial_viajes-2024.txt')
+        self.write(archive, ["2024-01-01 08:00:00", "2024-01-02 08:00:00", "2024-01-03 08:00:00"])
+        with open(archive, 'r', encoding='utf-8') as f:
+            compact_lines(f, compact_path(archive))
+        paths = history_paths(self.history_file, self.shard_dir)
+        self.assertEqual(os.path.basename(paths[0]), 'historial_viajes-2024.txt')
+        self.assertEqual(history_stats(merge_history_lines(paths)).trips, 8)
+        os.remove(archive)
+        paths = history_paths(self.history_file, self.shard_dir)
+        self.assertEqual(os.path.basename(paths[0]), 'historial_viajes-2024.thc')
+        self.assertEqual(history_stats(merge_history_lines(paths)).trips, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
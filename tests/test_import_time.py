@@ -0,0 +1,65 @@
+"""
+Tests del coste de arranque: el código de tarifas no debe cargar librerías de presentación.
+"""
+import unittest
+import subprocess
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Presupuesto de importación en frío de main (solo tarifas), en milisegundos
+IMPORT_BUDGET_MS = 100
+
+PRESENTATION_MODULES = ('colorama', 'rich', 'tkinter')
+
+
+def import_profile(module):
+    """Importar `module` en un proceso limpio con -X importtime.
+
+    Devuelve un diccionario {módulo: tiempo acumulado en microsegundos}.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT_DIR, capture_output=True, text=True, encoding='utf-8'
+    )
+    if result.returncode != 0:
+        raise AssertionError(f"Fallo importando {module}: {result.stderr}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            timings[name.strip()] = int(cumulative)
+    return timings
+
+
+class TestImportTime(unittest.TestCase):
+    """Tests de importación perezosa de colorama, rich y tkinter."""
+
+    def assert_no_presentation_imports(self, timings):
+        loaded = [name for name in timings
+                  if name.split('.')[0] in PRESENTATION_MODULES]
+        self.assertEqual(loaded, [])
+
+    def test_main_no_importa_presentacion(self):
+        """Importar main no carga colorama, rich ni tkinter."""
+        self.assert_no_presentation_imports(import_profile('main'))
+
+    def test_gui_no_importa_tkinter_ni_main(self):
+        """Importar la GUI no carga tkinter ni main hasta que se usa."""
+        timings = import_profile('gui_taximeter')
+        self.assert_no_presentation_imports(timings)
+        self.assertNotIn('main', timings)
+
+    def test_main_dentro_del_presupuesto(self):
+        """El arranque en frío de main cabe en el presupuesto fijado."""
+        # Mejor de tres ejecuciones para filtrar ruido del sistema
+        best = min(import_profile('main')['main'] for _ in range(3))
+        self.assertLess(best / 1000, IMPORT_BUDGET_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests de la tabla de estado en vivo en memoria compartida.
+"""
+import unittest
+import subprocess
+import struct
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Agregar el directorio principal al path
+sys.path.insert(0, ROOT_DIR)
+
+from src.meter import RunningFare
+from src.live_state import LiveStateTable
+
+READER_SCRIPT = """
+import sys
+from src.live_state import LiveStateTable
+table = LiveStateTable.open(sys.argv[1], create=False)
+state = table.read(int(sys.argv[2]))
+print(state.state, state.profile, round(state.estimated_fare(130.0), 4))
+table.close()
+"""
+
+
+class TestLiveStateTable(unittest.TestCase):
+    """Tests de publicación y lectura del estado de los taxímetros."""
+
+    def setUp(self):
+        self.name = f"taximeter_test_{os.getpid()}"
+        self.table = LiveStateTable.open(self.name, capacity=8)
+
+    def tearDown(self):
+        self.table.unlink()
+
+    def publish_trip(self, cab_id):
+        fare = RunningFare(0.02, 0.05)
+        fare.start(100.0)
+        fare.switch('moving', 110.0)
+        self.table.slot(cab_id).publish(fare, 'normal', 110.0)
+        return fare
+
+    def test_lectura_del_estado_publicado(self):
+        """El lector obtiene estado, tiempos y tarifa estimada del viaje."""
+        fare = self.publish_trip(3)
+        state = self.table.read(3)
+        self.assertEqual(state.state, 'moving')
+        self.assertEqual(state.profile, 'normal')
+        self.assertEqual(state.elapsed(130.0), fare.elapsed(130.0))
+        self.assertEqual(state.estimated_fare(130.0), fare.estimate(130.0))
+
+    def test_snapshot_solo_viajes_activos(self):
+        """El snapshot lista los taxis con viaje activo."""
+        self.publish_trip(1)
+        fare = self.publish_trip(5)
+        fare.reset()
+        self.table.slot(5).publish(fare, 'normal', 140.0)
+        self.assertEqual([state.cab_id for state in self.table.snapshot()], [1])
+
+    def test_lectura_desde_otro_proceso(self):
+        """Otro proceso local lee la tabla directamente de la memoria compartida."""
+        self.publish_trip(2)
+        result = subprocess.run(
+            [sys.executable, '-c', READER_SCRIPT, self.name, '2'],
+            cwd=ROOT_DIR, capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ['moving', 'normal', '1.2'])
+
+    def test_reintenta_durante_una_escritura(self):
+        """Una ranura a medio escribir (secuencia impar) no se devuelve."""
+        slot = self.table.slot(4)
+        struct.pack_into('<I', self.table._buf, slot._offset, 1)
+        with self.assertRaises(RuntimeError):
+            self.table.read(4)
+
+    def test_snapshot_omite_ranuras_de_escritores_muertos(self):
+        """Una ranura impar para siempre o de un proceso que ya no existe no tumba el snapshot."""
+        self.publish_trip(1)
+        self.publish_trip(2)
+        self.publish_trip(3)
+        # Escritor muerto a mitad de publish: secuencia impar
+        struct.pack_into('<I', self.table._buf, self.table.slot(2)._offset, 7)
+        # Viaje "activo" de un pid que no existe
+        struct.pack_into('<I', self.table._buf, self.table.slot(3)._offset + 8, 999_999_999)
+        self.assertEqual([state.cab_id for state in self.table.snapshot()], [1])
+        self.assertEqual([state.cab_id for state in self.table.snapshot(alive_only=False)], [1, 3])
+
+    def test_cab_id_fuera_de_rango(self):
+        """Un cab_id mayor que la tabla se rechaza."""
+        with self.assertRaises(ValueError):
+            self.table.slot(8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Tests del catálogo de mensajes de la CLI.
+"""
+import unittest
+import sys
+import os
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest.mock import patch
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.messages import MESSAGES, MessageCatalog, render_markup
+
+# Paleta de prueba: códigos legibles en lugar de secuencias ANSI
+PALETTE = {'/': '<reset>', 'bright': '<bright>', 'dim': '<dim>'}
+for _name in ('black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white'):
+    PALETTE[_name] = f'<{_name}>'
+    PALETTE['on ' + _name] = f'<bg-{_name}>'
+
+
+class TestMarkup(unittest.TestCase):
+    """Tests de la sustitución de marcas de estilo."""
+
+    def test_colores(self):
+        """Las marcas se sustituyen por los códigos de la paleta."""
+        self.assertEqual(render_markup("[bright cyan]hola[/]", PALETTE), "<bright><cyan>hola<reset>")
+        self.assertEqual(render_markup("[black on yellow] x [/]", PALETTE), "<black><bg-yellow> x <reset>")
+
+    def test_sin_colores(self):
+        """Sin paleta se quitan las marcas válidas y se respeta el resto del texto."""
+        self.assertEqual(render_markup("[yellow]Uso: quote [km][/]"), "Uso: quote [km]")
+
+
+class TestMessageCatalog(unittest.TestCase):
+    """Tests del catálogo precomputado."""
+
+    def test_todos_los_mensajes_se_formatean(self):
+        """Todas las claves existen en ambos idiomas, con y sin colores."""
+        params = dict(fare=1.5, profile='Normal', stopped=1.0, moving=2.0, total=3.0, page=1, pages=2,
+                      number=1, timestamp='2025-12-11 09:30:00', trips=1, first='a', last='b',
+                      revenue=1.0, average=1.0, error='e', count=1, path='p', name='Normal',
+                      command='normal', available='normal', hits=0, misses=1, profiles='normal',
+                      hour=9, median=1.0, p90=2.0, pending=0, lag=0.0, sent=1,
+                      retries=0, rejected=0)
+        for language in MESSAGES:
+            for palette in (None, PALETTE):
+                catalog = MessageCatalog(language, palette)
+                for key in MESSAGES['es']:
+                    text = catalog.format(key, **params)
+                    self.assertNotIn('[/]', text)
+                    if palette is None:
+                        self.assertNotIn('<', text.replace('<segundos', '').replace('<seconds', ''))
+
+    def test_idioma(self):
+        """Cada idioma tiene sus propios textos y los desconocidos usan el español."""
+        self.assertIn("Viaje iniciado", MessageCatalog('es').format('trip_started'))
+        self.assertIn("Trip started", MessageCatalog('en').format('trip_started'))
+        self.assertEqual(MessageCatalog('xx').language, 'es')
+
+    def test_variante_sin_colores(self):
+        """El modo sin colores usa su propio diseño."""
+        plain = MessageCatalog('es').format('history_trip', number=3, timestamp='2025-12-11 09:30:00',
+                                            stopped=8.1, moving=18.5, total=26.6, fare=1.09)
+        self.assertEqual(plain, "3. 2025-12-11 09:30:00 | Parado: 8.1s | Movimiento: 18.5s | "
+                                "Total: 26.6s | Tarifa: €1.09")
+        self.assertEqual(MessageCatalog('es').format('history_separator'), "")
+
+    def test_mensajes_fijos_precalculados(self):
+        """Los mensajes sin parámetros se devuelven como la misma cadena ya formateada."""
+        catalog = MessageCatalog('es', PALETTE)
+        self.assertIs(catalog.format('thanks'), catalog.format('thanks'))
+        self.assertTrue(catalog.format('thanks').startswith('<magenta>'))
+
+    def test_paint(self):
+        """paint colorea texto libre solo si hay colores."""
+        self.assertEqual(MessageCatalog('es', PALETTE).paint("x", "cyan", "bright"), "<bright><cyan>x<reset>")
+        self.assertEqual(MessageCatalog('es').paint("x", "cyan"), "x")
+
+
+class TestMainMessages(unittest.TestCase):
+    """Tests de la salida de main a través del catálogo."""
+
+    def test_calculate_fare_en_ingles(self):
+        """calculate_fare imprime el total en el idioma del catálogo."""
+        output = StringIO()
+        with patch.object(main, '_messages', MessageCatalog('en')), redirect_stdout(output):
+            fare = main.calculate_fare(10, 10)
+        self.assertEqual(fare, 0.7)
+        self.assertIn("💰 Total: €0.7", output.getvalue())
+        self.assertIn("Active profile: Normal", output.getvalue())
+
+    def test_perfil_invalido(self):
+        """Un perfil desconocido muestra los disponibles."""
+        output = StringIO()
+        with patch.object(main, '_messages', MessageCatalog('es')), redirect_stdout(output):
+            self.assertFalse(main.change_price_profile('inexistente'))
+        self.assertIn("Perfil 'inexistente' no válido.", output.getvalue())
+        self.assertIn("normal, alta", output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Tests del acumulador de tarifa en curso (RunningFare).
+"""
+import unittest
+import sys
+import os
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.meter import RunningFare
+from src.rules import load_rules
+from src.tariff import TariffSnapshot
+from src.trip import FINISH, MOVE, START, Trip
+
+EXAMPLE_RULES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'config', 'pricing_rules.example.json')
+
+
+class TestRunningFare(unittest.TestCase):
+    """Tests de la tarifa acumulada por tramos."""
+
+    def setUp(self):
+        self.profile_anterior = main.current_tariff().active
+
+    def tearDown(self):
+        main.activate_profile(self.profile_anterior)
+
+    def test_estimacion_tramo_abierto(self):
+        """La estimación suma tramos cerrados y el tramo abierto."""
+        fare = RunningFare(0.02, 0.05)
+        fare.start(1000.0)
+        fare.switch('moving', 1010.0)  # 10s parado
+        self.assertAlmostEqual(fare.estimate(1030.0), 10 * 0.02 + 20 * 0.05)
+        self.assertEqual(fare.elapsed(1030.0), (10.0, 20.0))
+
+    def test_estimar_no_modifica_el_estado(self):
+        """Estimar repetidamente no cierra tramos."""
+        fare = RunningFare(0.02, 0.05)
+        fare.start(0.0)
+        for tick in range(1, 100):
+            fare.estimate(tick / 10)
+        self.assertEqual(fare.stopped_time, 0.0)
+        self.assertAlmostEqual(fare.estimate(10.0), 0.2)
+
+    def test_total_identico_a_calculate_fare(self):
+        """Al finalizar, la tarifa acumulada coincide con calculate_fare."""
+        fare = RunningFare(*main.current_rates())
+        fare.start(0.0)
+        now = 0.0
+        for i, duration in enumerate([3.3, 12.7, 0.4, 58.1, 7.9, 101.3]):
+            now += duration
+            fare.switch('moving' if i % 2 == 0 else 'stopped', now)
+        fare.close(now + 4.2)
+        esperado = main.calculate_fare(fare.stopped_time, fare.moving_time)
+        self.assertEqual(round(fare.closed_fare, 2), esperado)
+
+    def test_cambio_de_perfil_invalida_la_cache(self):
+        """Cambiar de perfil recalcula la tarifa con las nuevas tarifas."""
+        fare = RunningFare(*main.current_rates())
+        fare.start(0.0)
+        fare.switch('moving', 60.0)
+        main.change_price_profile('aeropuerto')
+        fare.set_rates(*main.current_rates())
+        self.assertAlmostEqual(fare.estimate(120.0), 60 * 0.04 + 60 * 0.10)
+
+        fare.close(120.0)
+        esperado = main.calculate_fare(fare.stopped_time, fare.moving_time)
+        self.assertEqual(round(fare.closed_fare, 2), esperado)
+
+    def test_cuenta_tramos(self):
+        """Solo los cambios de estado abren un tramo nuevo."""
+        fare = RunningFare(0.02, 0.05)
+        fare.start(0.0)
+        fare.switch('moving', 5.0)
+        fare.switch('moving', 6.0)
+        fare.switch('stopped', 9.0)
+        self.assertEqual(fare.segments, 3)
+
+
+
+class TestRunningFareConReglas(unittest.TestCase):
+    """Tests de la tarifa en curso con las reglas del perfil fijado."""
+
+    def setUp(self):
+        rules = load_rules(EXAMPLE_RULES)
+        profiles = {key: dict(profile, rules=rules.get(key, [])) for key, profile in main.PRICE_PROFILES.items()}
+        self.tariff = TariffSnapshot(1, profiles, "normal")
+
+    def test_estimacion_igual_a_la_tarifa_final(self):
+        """Bajada de bandera y mínimo entran en la estimación: coincide con lo que se cobra."""
+        trip = Trip.with_rates(*self.tariff.rates())
+        trip.pin(self.tariff)
+        trip.fire(START, 0.0)
+        self.assertAlmostEqual(trip.fare.estimate(0.0), 4.0)
+        trip.fire(MOVE, 10.0)
+        self.assertAlmostEqual(trip.fare.estimate(40.0), 2.5 + 10 * 0.02 + 30 * 0.05)
+        trip.fire(FINISH, 40.0)
+        fare = trip.fare
+        self.assertEqual(round(fare.estimate(40.0), 2), 4.2)
+        self.assertEqual(main.calculate_fare(fare.stopped_time, fare.moving_time, tariff=trip.tariff), 4.2)
+
+    def test_tramos_y_recta_publicada(self):
+        """Al cruzar un tramo la estimación cambia de pendiente; la recta publicada sigue a la estimación."""
+        tariff = self.tariff.with_active("aeropuerto", 2)
+        fare = RunningFare(*tariff.rates(), evaluator=tariff.evaluator())
+        fare.start(0.0)
+        evaluator = tariff.evaluator()
+        for now in (60.0, 1799.0, 1801.0, 3000.0):
+            self.assertAlmostEqual(fare.estimate(now), evaluator.estimate(now, 0.0))
+        closed_fare, open_rate = fare.line(1801.0)
+        self.assertEqual(open_rate, 0.03)
+        self.assertAlmostEqual(closed_fare + open_rate * 3000.0, fare.estimate(3000.0))
+        # En el máximo el tiempo ya no suma
+        self.assertEqual(fare.estimate(5000.0), 120.0)
+        self.assertEqual(fare.line(5000.0), (120.0, 0.0))
+        # Sin reglas la recta es el propio acumulador
+        fare.set_rates(0.02, 0.05)
+        self.assertEqual(fare.line(100.0), (fare.closed_fare, fare.open_rate))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+"""
+Tests de la cola de envío de viajes al servidor central.
+"""
+import unittest
+import tempfile
+import shutil
+import socket
+import sqlite3
+import time
+import sys
+import os
+from unittest import mock
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.outbox import Outbox, OutboxSender, StubBackend
+
+RECORD = {'timestamp': '2025-12-11 09:30:00', 'stopped_time': 8.1, 'moving_time': 18.5, 'fare': 1.09,
+          'profile': 'normal', 'segments': 3}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condición no cumplida a tiempo")
+        time.sleep(0.01)
+
+
+def unused_url():
+    # Puerto libre sin nadie escuchando: las conexiones se rechazan
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/trips"
+
+
+class TestOutbox(unittest.TestCase):
+    """Tests de la cola en disco."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.outbox = Outbox(os.path.join(self.directory, 'outbox.db'))
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.directory)
+
+    def test_orden_y_confirmacion(self):
+        """Los registros salen en orden y solo se borran al confirmarse."""
+        ids = [self.outbox.put(dict(RECORD, fare=i), now=100.0 + i) for i in range(3)]
+        self.assertEqual([row[0] for row in self.outbox.peek(2)], ids[:2])
+        self.assertEqual(self.outbox.lag(now=110.0), 10.0)
+        self.outbox.ack(ids[:2])
+        self.assertEqual(self.outbox.pending(), 1)
+        self.assertEqual(self.outbox.lag(now=110.0), 8.0)
+
+    def test_ids_no_se_reutilizan(self):
+        """Vaciar la cola no reutiliza ids: el servidor descarta duplicados por id."""
+        first = self.outbox.put(RECORD)
+        self.outbox.ack([first])
+        self.assertGreater(self.outbox.put(RECORD), first)
+
+    def test_persistente(self):
+        """Lo encolado sobrevive a cerrar y volver a abrir la cola."""
+        self.outbox.put(RECORD)
+        self.outbox.close()
+        self.outbox = Outbox(os.path.join(self.directory, 'outbox.db'))
+        self.assertEqual(self.outbox.pending(), 1)
+
+
+class TestOutboxSender(unittest.TestCase):
+    """Tests del hilo emisor contra el servidor local."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'outbox.db')
+        self.outbox = Outbox(self.path)
+        self.backend = StubBackend().start()
+        self.sender = None
+
+    def tearDown(self):
+        if self.sender is not None:
+            self.sender.stop()
+        self.backend.stop()
+        self.outbox.close()
+        shutil.rmtree(self.directory)
+
+    def start_sender(self, url=None, **options):
+        options.setdefault('backoff', 0.01)
+        self.sender = OutboxSender(self.path, url or self.backend.url, cab_id=7, interval=0.05, **options).start()
+        return self.sender
+
+    def test_lotes_comprimidos_con_una_conexion(self):
+        """Los viajes van en lotes por una sola conexión persistente."""
+        for i in range(25):
+            self.outbox.put(dict(RECORD, fare=i / 100))
+        self.start_sender(batch_size=10)
+        wait_for(lambda: len(self.backend.trips) == 25)
+        self.assertEqual(self.backend.requests, 3)
+        self.assertEqual(self.backend.connections, 1)
+        self.assertEqual(self.backend.trips[(7, 1)]['profile'], 'normal')
+        wait_for(lambda: self.outbox.pending() == 0)
+        stats = self.sender.stats(self.outbox)
+        self.assertEqual((stats.sent, stats.batches, stats.connections), (25, 3, 1))
+
+    def test_reintento_con_espera(self):
+        """Con el servidor caído el lote se reintenta hasta que se acepta."""
+        self.backend.fail(2, status=503)
+        self.outbox.put(RECORD)
+        self.start_sender()
+        wait_for(lambda: len(self.backend.trips) == 1)
+        self.assertEqual(self.sender.retries, 2)
+        self.assertEqual(self.sender.last_error, "HTTP 503")
+
+    def test_error_pasajero_no_detiene_el_envio(self):
+        """Una excepción al leer la cola o al enviar se reintenta: los lotes siguientes salen."""
+        self.outbox.put(RECORD)
+        sender = OutboxSender(self.path, self.backend.url, cab_id=7, interval=0.05, backoff=0.01)
+        peek, send = Outbox.peek, sender.send
+        peek_errors = [sqlite3.OperationalError("database is locked")]
+        send_errors = [RuntimeError("fallo inesperado")]
+
+        def flaky_peek(outbox, limit):
+            if peek_errors:
+                raise peek_errors.pop()
+            return peek(outbox, limit)
+
+        def flaky_send(batch):
+            if send_errors:
+                raise send_errors.pop()
+            return send(batch)
+        sender.send = flaky_send
+        with mock.patch.object(Outbox, 'peek', flaky_peek):
+            self.sender = sender.start()
+            wait_for(lambda: len(self.backend.trips) == 1)
+            self.outbox.put(RECORD)
+            sender.notify()
+            wait_for(lambda: len(self.backend.trips) == 2)
+        self.assertEqual(sender.retries, 2)
+        self.assertEqual(sender.last_error, "fallo inesperado")
+        self.assertTrue(sender._thread.is_alive())
+
+    def test_lote_rechazado(self):
+        """Un 4xx marca el lote como rechazado: no se reenvía pero no se pierde."""
+        self.backend.fail(1, status=422)
+        self.outbox.put(RECORD)
+        self.start_sender()
+        wait_for(lambda: self.sender.rejected == 1)
+        self.outbox.put(RECORD)
+        self.sender.notify()
+        wait_for(lambda: len(self.backend.trips) == 1)
+        self.assertEqual((self.outbox.pending(), self.outbox.rejected()), (0, 1))
+
+    def test_sin_red_no_se_pierde_nada(self):
+        """Sin servidor los viajes se quedan en la cola y salen en la sesión siguiente."""
+        self.outbox.put(RECORD)
+        sender = self.start_sender(url=unused_url())
+        wait_for(lambda: sender.retries >= 1)
+        sender.stop()
+        self.assertEqual(self.outbox.pending(), 1)
+        self.start_sender()
+        wait_for(lambda: len(self.backend.trips) == 1)
+
+
+class TestTaximeterOutbox(unittest.TestCase):
+    """Tests del envío desde save_trip_to_history."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = StubBackend().start()
+        for name, value in (('HISTORY_FILE', os.path.join(self.directory, 'historial_viajes.txt')),
+                            ('HISTORY_SHARD_DIR', os.path.join(self.directory, 'historial')),
+                            ('TRIPS_DB', os.path.join(self.directory, 'viajes.db')),
+                            ('OUTBOX_DIR', os.path.join(self.directory, 'outbox')),
+                            ('OUTBOX_URL', self.backend.url)):
+            patcher = mock.patch.object(main.settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ('_repository', '_outbox', '_outbox_sender'):
+            patcher = mock.patch.object(main, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        main.stop_outbox()
+        if main._repository is not None:
+            main._repository.close()
+        self.backend.stop()
+        shutil.rmtree(self.directory)
+
+    def test_viaje_terminado_se_envia(self):
+        """Guardar un viaje lo encola y el hilo emisor lo entrega."""
+        main.save_trip_to_history(10.0, 20.0, 1.2, profile='alta', segments=2)
+        wait_for(lambda: len(self.backend.trips) == 1)
+        trip = next(iter(self.backend.trips.values()))
+        self.assertEqual((trip['fare'], trip['profile'], trip['segments']), (1.2, 'alta', 2))
+
+    def test_no_bloquea_sin_red(self):
+        """Sin servidor, guardar el viaje y salir no esperan a la red."""
+        main.settings.OUTBOX_URL = unused_url()
+        started = time.perf_counter()
+        main.save_trip_to_history(10.0, 20.0, 1.2)
+        main.stop_outbox()
+        self.assertLess(time.perf_counter() - started, 2.0)
+        outbox = Outbox(main.outbox_path())
+        self.assertEqual(outbox.pending(), 1)
+        outbox.close()
+
+    def test_una_cola_por_taxi(self):
+        """Cada taxi encola en su propia cola y el emisor firma los viajes con ese taxi."""
+        main.settings.OUTBOX_URL = unused_url()
+        with mock.patch.object(main.settings, 'CAB_ID', 7):
+            main.save_trip_to_history(10.0, 20.0, 1.2)
+            self.assertTrue(main.outbox_path().endswith('outbox-7.db'))
+            self.assertEqual(main._outbox_sender.cab_id, 7)
+        main.stop_outbox()
+        self.assertIn('outbox-7.db', os.listdir(main.settings.OUTBOX_DIR))
+
+    def test_se_encola_aunque_falle_el_repositorio(self):
+        """Un error del repositorio SQLite no impide encolar el viaje."""
+        main.settings.OUTBOX_URL = unused_url()
+        with mock.patch.object(main, 'trip_repository', side_effect=OSError("disco lleno")), \
+                self.assertLogs(level='WARNING'):
+            main.save_trip_to_history(10.0, 20.0, 1.2)
+        main.stop_outbox()
+        outbox = Outbox(main.outbox_path())
+        self.assertEqual(outbox.pending(), 1)
+        outbox.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tests de las estimaciones de tarifa antes del viaje.
+"""
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+from unittest import mock
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.prediction import FarePredictor, trip_cell, trip_hour
+from src.repository import TripRepository
+
+
+def linear(stopped, moving, profile_name):
+    rate = 2 if profile_name == 'alta' else 1
+    return round(rate * (stopped * 0.02 + moving * 0.05), 2)
+
+
+class TestFarePredictor(unittest.TestCase):
+    """Tests de los histogramas por perfil y hora y de sus cuantiles."""
+
+    def setUp(self):
+        self.calls = 0
+
+        def evaluate(stopped, moving, profile_name):
+            self.calls += 1
+            return linear(stopped, moving, profile_name)
+
+        self.predictor = FarePredictor(evaluate, min_trips=3)
+
+    def test_hora_y_celda(self):
+        """La hora sale de la fecha del historial y cada viaje cae en una celda del histograma."""
+        self.assertEqual(trip_hour("2025-12-11 09:30:00"), 9)
+        self.assertIsNone(trip_hour("corrupta"))
+        self.assertNotEqual(trip_cell(10.0, 100.0), trip_cell(100.0, 10.0))
+        self.assertEqual(trip_cell(0.0, 0.0), 0)
+
+    def test_mediana_y_p90(self):
+        """Mediana y p90 de viajes en celdas distintas, con la tarifa del perfil pedido."""
+        for moving in (60, 120, 240, 480, 960, 1920, 3840, 7680, 9000, 12000):
+            self.predictor.add("2025-12-11 09:00:00", 0.0, float(moving), 'normal')
+        prediction = self.predictor.predict('normal', 9)
+        self.assertEqual(prediction.median, linear(0, 960, 'normal'))
+        self.assertEqual(prediction.p90, linear(0, 9000, 'normal'))
+        self.assertEqual((prediction.trips, prediction.profile, prediction.hour), (10, 'normal', 9))
+        self.assertEqual(self.predictor.predict('alta', 9).median, linear(0, 960, 'alta'))
+
+    def test_pocos_viajes_usa_un_histograma_mas_general(self):
+        """Con pocos viajes a esa hora y perfil se usa la hora con todos los perfiles, y después todo."""
+        for hour in (9, 9, 10):
+            self.predictor.add(f"2025-12-11 {hour:02d}:00:00", 10.0, 100.0, 'alta')
+        self.predictor.add("2025-12-11 09:00:00", 10.0, 100.0, 'normal')
+        prediction = self.predictor.predict('normal', 9)
+        self.assertEqual((prediction.profile, prediction.hour, prediction.trips), (None, 9, 3))
+        prediction = self.predictor.predict('normal', 3)
+        self.assertEqual((prediction.profile, prediction.hour, prediction.trips), (None, None, 4))
+        self.assertIsNone(FarePredictor(linear).predict('normal', 9))
+
+    def test_tablas_precalculadas_e_incrementales(self):
+        """Estimar no evalúa la tarifa si la tabla ya está; añadir un viaje solo recalcula lo que toca."""
+        for _ in range(5):
+            self.predictor.add("2025-12-11 09:00:00", 30.0, 300.0, 'normal')
+            self.predictor.add("2025-12-11 22:00:00", 30.0, 300.0, 'normal')
+        self.predictor.precompute(['normal'])
+        calls = self.calls
+        self.predictor.predict('normal', 9)
+        self.assertEqual(self.calls, calls)
+        self.predictor.add("2025-12-11 09:00:00", 600.0, 3000.0, 'normal')
+        self.assertEqual(self.predictor.predict('normal', 9).trips, 6)
+        self.assertEqual(self.predictor.predict('normal', 22).trips, 5)
+        # Solo se recalcula el histograma de las 9 (2 celdas)
+        self.assertEqual(self.calls, calls + 2)
+
+    def test_invalidar_conserva_los_histogramas(self):
+        """Tras cambiar la tarifa se recalcula con la nueva sin releer el historial."""
+        rates = {'factor': 1}
+        predictor = FarePredictor(lambda s, m, p: rates['factor'] * linear(s, m, p), min_trips=1)
+        predictor.add("2025-12-11 09:00:00", 0.0, 100.0, 'normal')
+        before = predictor.predict('normal', 9).median
+        rates['factor'] = 3
+        predictor.invalidate()
+        self.assertAlmostEqual(predictor.predict('normal', 9).median, 3 * before)
+        self.assertEqual(predictor.stats().trips, 1)
+
+
+class TestRefreshFromRepository(unittest.TestCase):
+    """Tests de la lectura incremental del repositorio SQLite."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.repository = TripRepository(os.path.join(self.directory, 'viajes.db'))
+
+    def tearDown(self):
+        self.repository.close()
+        shutil.rmtree(self.directory)
+
+    def test_solo_los_viajes_nuevos(self):
+        """refresh lee los viajes guardados desde la última vez."""
+        predictor = FarePredictor(linear, min_trips=1)
+        for day in (1, 2):
+            self.repository.add(f"2025-12-0{day} 08:00:00", 10.0, 20.0, 1.1, 'normal')
+        self.assertEqual(predictor.refresh(self.repository), 2)
+        self.assertEqual(predictor.refresh(self.repository), 0)
+        self.repository.add("2025-12-03 08:00:00", 10.0, 20.0, 1.1, 'alta')
+        self.assertEqual(predictor.refresh(self.repository), 1)
+        self.assertEqual(predictor.stats().last_id, 3)
+        self.assertEqual(predictor.predict('alta', 8).trips, 1)
+
+
+class TestPredictFare(unittest.TestCase):
+    """Tests del comando estimate del taxímetro."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, value in (('HISTORY_FILE', os.path.join(self.directory, 'historial_viajes.txt')),
+                            ('HISTORY_SHARD_DIR', os.path.join(self.directory, 'historial')),
+                            ('TRIPS_DB', os.path.join(self.directory, 'viajes.db')),
+                            ('PREDICTION_MIN_TRIPS', 1)):
+            patcher = mock.patch.object(main.settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ('_repository', '_predictor'):
+            patcher = mock.patch.object(main, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        if main._repository is not None:
+            main._repository.close()
+        shutil.rmtree(self.directory)
+
+    def test_estimacion_sigue_al_historial(self):
+        """Los viajes guardados después de construir las tablas entran en la estimación."""
+        self.assertIsNone(main.predict_fare('normal', 9))
+        main.save_trip_to_history(60.0, 600.0, 0.0, timestamp=1765440000.0, profile='normal')
+        hour = main.time.localtime(1765440000.0).tm_hour
+        prediction = main.predict_fare('normal', hour)
+        self.assertEqual(prediction.trips, 1)
+        self.assertEqual(prediction.median, main.compute_fare(60.0, 600.0, 'normal'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Tests de la caché de presupuestos de tarifa.
+"""
+import unittest
+import sys
+import os
+from unittest import mock
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.quotes import QuoteCache
+
+
+class TestQuoteCache(unittest.TestCase):
+    """Tests de la caché LRU sobre una función de tarifa."""
+
+    def setUp(self):
+        self.calls = []
+
+        def evaluate(stopped, moving, profile_name, distance_km, version):
+            self.calls.append((stopped, moving, profile_name, distance_km, version))
+            return round(stopped * 0.02 + moving * 0.05, 2)
+
+        self.cache = QuoteCache(evaluate, maxsize=2)
+
+    def test_aciertos_con_duraciones_cuantizadas(self):
+        """Duraciones que redondean a la misma décima comparten entrada."""
+        self.assertEqual(self.cache.quote(10.02, 20.0, 'normal'), 1.2)
+        self.assertEqual(self.cache.quote(9.98, 20.04, 'normal'), 1.2)
+        self.assertEqual(len(self.calls), 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.size), (1, 1, 1))
+
+    def test_tamano_acotado(self):
+        """La caché descarta la entrada menos usada al llenarse."""
+        for moving in (10, 20, 30, 10):
+            self.cache.quote(0, moving, 'normal')
+        self.assertEqual(self.cache.stats().size, 2)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_version_en_la_clave(self):
+        """Cada versión de la tarifa tiene sus entradas; las de otras versiones no se vacían."""
+        self.cache.quote(10, 20, 'normal', version=1)
+        self.cache.quote(10, 20, 'normal', version=2)
+        self.cache.quote(10, 20, 'normal', version=1)
+        self.assertEqual([call[-1] for call in self.calls], [1, 2])
+        self.assertEqual(self.cache.stats().hits, 1)
+
+    def test_valores_invalidos(self):
+        """Negativos, NaN e infinitos se rechazan con ValueError sin llegar a la tarifa."""
+        for args in ((float('inf'), 1), (1, float('nan')), (-100, 5), (1, 1e308), (1, 2, 'normal', -1.0)):
+            with self.subTest(args=args), self.assertRaises(ValueError):
+                if len(args) == 2:
+                    self.cache.quote(*args, 'normal')
+                else:
+                    self.cache.quote(*args)
+        self.assertEqual(self.calls, [])
+
+    def test_redimensionar(self):
+        """El tamaño máximo es configurable."""
+        self.cache.resize(100)
+        self.assertEqual(self.cache.stats().maxsize, 100)
+
+
+class TestQuoteFare(unittest.TestCase):
+    """Tests del presupuesto del taxímetro."""
+
+    def setUp(self):
+        self.profile_anterior = main.current_tariff().active
+
+    def tearDown(self):
+        main.activate_profile(self.profile_anterior)
+        main.QUOTES.clear()
+
+    def test_igual_que_compute_fare(self):
+        """El presupuesto coincide con la tarifa calculada."""
+        self.assertEqual(main.quote_fare(8.1, 18.5), main.compute_fare(8.1, 18.5))
+
+    def test_cambio_de_perfil(self):
+        """Tras cambiar de perfil el presupuesto usa la tarifa nueva; los del perfil explícito siguen en caché."""
+        main.change_price_profile("normal")
+        normal = main.quote_fare(10, 20)
+        main.change_price_profile("alta")
+        self.assertEqual(main.quote_fare(10, 20), main.compute_fare(10, 20, "alta"))
+        self.assertNotEqual(main.quote_fare(10, 20), normal)
+        self.assertEqual(main.QUOTES.stats().size, 2)
+
+    def test_comando_con_valores_invalidos(self):
+        """`quote inf 1` o negativos muestran el uso y la sesión sigue; `quotex` no es quote."""
+        with mock.patch.object(main.settings, 'LIVE_STATE_ENABLED', False), \
+                mock.patch.object(main.settings, 'SENSOR_SOURCE', None):
+            session = main.CliSession()
+        with mock.patch.object(main, 'say') as say:
+            for line in ("quote inf 1", "quote -100 5", "quote 1 1e308", "quotex 1 2"):
+                self.assertTrue(session.handle(line))
+            self.assertTrue(session.handle("quote 10 20"))
+        keys = [call.args[0] for call in say.call_args_list]
+        self.assertEqual(keys, ['quote_usage'] * 3 + ['invalid_command', 'quote_result'])
+
+
+if __name__ == '__main__':
+    unittest.main()
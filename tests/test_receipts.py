@@ -0,0 +1,95 @@
+"""
+Tests del renderizado de recibos.
+"""
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.receipts import (compile_template, render_receipt, receipt_for, render_batch,
+                          render_history_range)
+
+PROFILE = {"stopped": 0.02, "moving": 0.05, "name": "Normal <Centro>"}
+RECEIPT = receipt_for("2025-12-11 09:30:00", 8.1, 18.5, 1.09)
+
+
+class TestReceipts(unittest.TestCase):
+    """Tests de los tres formatos de recibo."""
+
+    def test_texto(self):
+        """El recibo de texto es una caja con los datos del viaje."""
+        text = render_receipt('text', RECEIPT, PROFILE)
+        self.assertIn("RESUMEN DEL VIAJE", text)
+        self.assertIn("26.6s", text)
+        self.assertIn("1.09€", text)
+        self.assertEqual(len({len(line) for line in text.splitlines()[:4]}), 1)
+
+    def test_html_escapa_textos(self):
+        """El HTML escapa el nombre del perfil."""
+        page = render_receipt('html', RECEIPT, PROFILE, 'en')
+        self.assertIn("Normal &lt;Centro&gt;", page)
+        self.assertIn("<td>€1.09</td>", page)
+        self.assertIn("TRIP RECEIPT", page)
+
+    def test_escpos(self):
+        """ESC/POS son bytes con inicialización, € en cp858 y corte de papel."""
+        data = render_receipt('escpos', RECEIPT, PROFILE)
+        self.assertIsInstance(data, bytes)
+        self.assertTrue(data.startswith(b"\x1b@"))
+        self.assertIn(b"1.09\xd5", data)
+        self.assertTrue(data.endswith(b"\x1dV\x01"))
+
+    def test_plantilla_cacheada(self):
+        """La plantilla se compila una vez por formato, perfil e idioma."""
+        render_receipt('text', RECEIPT, PROFILE)
+        hits = compile_template.cache_info().hits
+        render_receipt('text', RECEIPT, PROFILE)
+        self.assertEqual(compile_template.cache_info().hits, hits + 1)
+
+    def test_formato_desconocido(self):
+        """Un formato no soportado se rechaza."""
+        with self.assertRaises(ValueError):
+            render_receipt('pdf', RECEIPT, PROFILE)
+
+    def test_recibo_del_taximetro(self):
+        """El taxímetro usa el perfil activo para el recibo."""
+        self.assertIn(main.current_tariff().profile['name'],
+                      main.trip_receipt(8.1, 18.5, 1.09, timestamp=0))
+
+
+class TestReceiptBatch(unittest.TestCase):
+    """Tests del renderizado por lotes."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lotes_en_paralelo_en_orden(self):
+        """El pool de procesos devuelve los recibos en el orden de entrada."""
+        receipts = [receipt_for(f"2025-12-11 09:{i:02d}:00", i, i, i / 10) for i in range(30)]
+        inline = list(render_batch(receipts, 'html', PROFILE, workers=0, chunk_size=7))
+        pooled = list(render_batch(receipts, 'html', PROFILE, workers=2, chunk_size=7))
+        self.assertEqual(inline, pooled)
+        self.assertIn("09:29:00", pooled[-1])
+
+    def test_rango_del_historial(self):
+        """Se renderiza a ficheros un rango de viajes del historial."""
+        path = os.path.join(self.directory, 'historial_viajes.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(10):
+                f.write(main.format_history_line(f"2025-01-01 08:00:0{i}", i, i, i / 10) + "\n")
+        output = os.path.join(self.directory, 'recibos')
+        written = render_history_range([path], 2, 5, 'escpos', PROFILE, output, workers=0)
+        self.assertEqual(written, 3)
+        self.assertEqual(sorted(os.listdir(output)), ['recibo-2.bin', 'recibo-3.bin', 'recibo-4.bin'])
+
+
+if __name__ == '__main__':
+    unittest.main()
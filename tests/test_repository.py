@@ -0,0 +1,182 @@
+"""
+Tests del repositorio SQLite de viajes.
+"""
+import unittest
+import tempfile
+import shutil
+import io
+import sys
+import os
+import time
+from contextlib import redirect_stdout
+from unittest import mock
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.checkpoint import TripCheckpoint
+from src.history import shard_path
+from src.meter import RunningFare
+from src.repository import TripRepository
+
+
+class TestTripRepository(unittest.TestCase):
+    """Tests de inserción y consultas paginadas."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.repository = TripRepository(os.path.join(self.directory, 'viajes.db'))
+        self.repository.add_many(
+            (f"2025-12-{day:02d} 10:00:00", 10.0 * day, 20.0, 0.5 * day, 'normal' if day % 2 else 'alta', day)
+            for day in range(1, 21)
+        )
+
+    def tearDown(self):
+        self.repository.close()
+        shutil.rmtree(self.directory)
+
+    def test_modo_wal(self):
+        """La conexión trabaja en modo WAL."""
+        mode = self.repository._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_paginacion(self):
+        """Las páginas se leen con LIMIT/OFFSET, de la más reciente a la más antigua."""
+        first = self.repository.query(limit=5)
+        second = self.repository.query(limit=5, offset=5)
+        self.assertEqual([t.timestamp[:10] for t in first][:2], ['2025-12-20', '2025-12-19'])
+        self.assertEqual(second[0].timestamp[:10], '2025-12-15')
+        self.assertEqual(first[0].total_time, 220.0)
+
+    def test_filtros(self):
+        """Se filtra por fecha, perfil y rango de tarifa."""
+        trips = self.repository.query(since='2025-12-05', until='2025-12-11', profile='alta',
+                                      min_fare=3.0, order='fare', descending=False)
+        self.assertEqual([t.fare for t in trips], [3.0, 4.0, 5.0])
+        self.assertEqual(self.repository.count(max_fare=2.0), 4)
+        self.assertEqual(self.repository.count(search='2025-12-1'), 10)
+
+    def test_orden_invalido(self):
+        """Solo se ordena por columnas conocidas."""
+        with self.assertRaises(ValueError):
+            self.repository.query(order='fare; DROP TABLE trips')
+
+    def test_importar_historial(self):
+        """El historial de texto se importa por lotes ignorando líneas corruptas."""
+        path = os.path.join(self.directory, 'historial_viajes.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(7):
+                f.write(main.format_history_line(f"2024-01-0{i + 1} 08:00:00", i, 2 * i, 0.12 * i) + "\n")
+            f.write("línea corrupta\n")
+        self.assertEqual(self.repository.sync_history([path], batch_size=3), 7)
+        self.assertEqual(self.repository.count(until='2025-01-01'), 7)
+
+    def test_importacion_incremental(self):
+        """Solo se importa lo añadido desde la última vez; una línea a medio escribir espera."""
+        path = os.path.join(self.directory, 'cab-1.txt')
+        line = main.format_history_line("2025-01-02 08:00:00", 1, 2, 0.12)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(main.format_history_line("2025-01-01 08:00:00", 1, 2, 0.12) + "\n" + line[:20])
+        self.assertEqual(self.repository.sync_history([path]), 1)
+        self.assertEqual(self.repository.sync_history([path]), 0)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line[20:] + "\n")
+        self.assertEqual(self.repository.sync_history([path]), 1)
+        self.assertEqual(self.repository.count(until='2025-01-03'), 2)
+
+    def test_fichero_sustituido(self):
+        """Un fichero más corto que lo ya importado se vuelve a leer desde el principio."""
+        path = os.path.join(self.directory, 'cab-1.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            for day in (1, 2):
+                f.write(main.format_history_line(f"2025-01-0{day} 08:00:00", 1, 2, 0.12) + "\n")
+        self.assertEqual(self.repository.sync_history([path]), 2)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(main.format_history_line("2025-01-03 08:00:00", 1, 2, 0.12) + "\n")
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(self.repository.sync_history([path]), 1)
+
+    def test_base_anterior_sin_offsets(self):
+        """Una base importada antes de guardar offsets no duplica los viajes que ya tiene."""
+        path = os.path.join(self.directory, 'historial_viajes.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(main.format_history_line("2025-12-03 10:00:00", 30.0, 20.0, 1.5) + "\n")
+            f.write(main.format_history_line("2025-12-25 10:00:00", 1, 2, 0.12) + "\n")
+        self.assertEqual(self.repository.sync_history([path]), 1)
+        self.assertEqual(self.repository.count(), 21)
+
+
+class TestHistoryCommand(unittest.TestCase):
+    """Tests de save_trip_to_history y del comando history sobre el repositorio."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history_file = os.path.join(self.directory, 'historial_viajes.txt')
+        with open(self.history_file, 'w', encoding='utf-8') as f:
+            f.write(main.format_history_line("2025-01-01 08:00:00", 8.1, 18.5, 1.09) + "\n")
+        for name, value in (('HISTORY_FILE', self.history_file),
+                            ('HISTORY_SHARD_DIR', os.path.join(self.directory, 'historial')),
+                            ('TRIPS_DB', os.path.join(self.directory, 'viajes.db'))):
+            patcher = mock.patch.object(main.settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(main, '_repository', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        main._repository.close()
+        shutil.rmtree(self.directory)
+
+    def test_guarda_en_texto_y_sqlite(self):
+        """El viaje se guarda en ambos sitios sin duplicar el historial importado."""
+        main.save_trip_to_history(10.0, 20.0, 1.2, profile='alta', segments=3)
+        repository = main.trip_repository()
+        self.assertEqual(repository.count(), 2)
+        latest = repository.query(limit=1)[0]
+        self.assertEqual((latest.profile, latest.segments, latest.fare), ('alta', 3, 1.2))
+        self.assertEqual(len(list(main.merged_history())), 2)
+
+    def test_historial_de_otros_taxis(self):
+        """Los viajes que otro taxímetro añade a su fichero llegan al repositorio sin duplicar los propios."""
+        main.save_trip_to_history(10.0, 20.0, 1.2)
+        other = shard_path(main.settings.HISTORY_SHARD_DIR, 'otro')
+        with open(other, 'a', encoding='utf-8') as f:
+            f.write(main.format_history_line("2025-01-02 08:00:00", 5.0, 5.0, 0.35) + "\n")
+        main.save_trip_to_history(3.0, 4.0, 0.26)
+        repository = main.sync_trip_repository()
+        self.assertEqual(repository.count(), 4)
+        self.assertEqual(repository.count(search='2025-01-02'), 1)
+        self.assertEqual(main.sync_trip_repository().count(), 4)
+
+    def test_huerfano_no_desordena_el_historial(self):
+        """Un viaje huérfano de hace días se guarda sin romper el orden cronológico del historial."""
+        main.save_trip_to_history(10.0, 20.0, 1.2)
+        checkpoints = os.path.join(self.directory, 'checkpoints')
+        with mock.patch.object(main.settings, 'CHECKPOINT_DIR', checkpoints):
+            for start in (time.time() - 2 * 86400, time.time() - 86400):
+                fare = RunningFare(0.02, 0.05)
+                fare.start(start)
+                checkpoint = TripCheckpoint.create(main.checkpoint_dir())
+                checkpoint.save(fare, 'normal', start + 60.0)
+                checkpoint.close()
+            resumable = main.recover_orphan_trips()
+        self.assertIsNotNone(resumable)
+        lines = list(main.merged_history())
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines, sorted(lines, key=lambda line: line[:19]))
+
+    def test_historial_paginado(self):
+        """El comando history muestra la página pedida."""
+        for i in range(6):
+            main.save_trip_to_history(i, i, 0.07 * i)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            main.show_trip_history(page=2)
+        self.assertIn("página 2/2", output.getvalue())
+        self.assertIn("€1.09", output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
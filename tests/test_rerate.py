@@ -0,0 +1,87 @@
+"""
+Tests de la lectura del historial y de la re-tarificación con perfiles candidatos.
+"""
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.history import parse_history_line, history_paths
+from src.rerate import rerate_history
+
+CANDIDATES = {
+    "normal": {"stopped": 0.02, "moving": 0.05, "name": "Normal"},
+    "alta": {"stopped": 0.03, "moving": 0.08, "name": "Demanda Alta"},
+}
+
+
+def history_line(stopped, moving, fare, timestamp="2025-12-11 09:30:00"):
+    return (f"{timestamp} | Parado: {stopped:.1f}s | Movimiento: {moving:.1f}s | "
+            f"Total: {stopped + moving:.1f}s | Tarifa: €{fare:.2f}\n")
+
+
+class TestHistoryParsing(unittest.TestCase):
+    """Tests del parser de líneas del historial."""
+
+    def test_linea_valida(self):
+        """Se extraen tiempos y tarifa de una línea del historial."""
+        trip = parse_history_line(history_line(8.1, 18.5, 1.09))
+        self.assertEqual(trip.timestamp, "2025-12-11 09:30:00")
+        self.assertEqual((trip.stopped_time, trip.moving_time, trip.fare), (8.1, 18.5, 1.09))
+
+    def test_linea_invalida(self):
+        """Las líneas con otro formato se ignoran."""
+        self.assertIsNone(parse_history_line("texto libre\n"))
+        self.assertIsNone(parse_history_line("a | b | c | d | e\n"))
+
+
+class TestRerateHistory(unittest.TestCase):
+    """Tests de re-tarificación en streaming."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history_file = os.path.join(self.directory, 'historial_viajes.txt')
+        with open(os.path.join(self.directory, 'historial_viajes-2024.txt'), 'w', encoding='utf-8') as f:
+            f.write(history_line(100, 0, 2.00))
+        with open(self.history_file, 'w', encoding='utf-8') as f:
+            f.write(history_line(60, 120, 7.20))
+            f.write("línea corrupta\n")
+            for i in range(50):
+                f.write(history_line(i, 2 * i, round(i * 0.02 + 2 * i * 0.05, 2)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_incluye_segmentos_archivados(self):
+        """El historial archivado se lee antes que el fichero activo."""
+        paths = history_paths(self.history_file)
+        self.assertEqual([os.path.basename(p) for p in paths],
+                         ['historial_viajes-2024.txt', 'historial_viajes.txt'])
+
+    def test_totales_por_perfil(self):
+        """Cada perfil candidato suma las tarifas recalculadas en céntimos."""
+        report = rerate_history(CANDIDATES, history_paths(self.history_file), workers=0)
+        self.assertEqual(report.trips, 52)
+        self.assertEqual(report.skipped_lines, 1)
+        totals = {t.profile: t for t in report.totals()}
+        self.assertEqual(totals['normal'].rerated_cents, totals['normal'].recorded_cents)
+        self.assertGreater(totals['alta'].rerated_cents, totals['normal'].rerated_cents)
+
+    def test_pool_y_proceso_unico_coinciden(self):
+        """El pool de procesos da los mismos totales y diferencias, en orden."""
+        paths = history_paths(self.history_file)
+        inline_diffs, pool_diffs = [], []
+        inline = rerate_history(CANDIDATES, paths, workers=0, chunk_size=7, on_diff=inline_diffs.append)
+        pooled = rerate_history(CANDIDATES, paths, workers=2, chunk_size=7, on_diff=pool_diffs.append)
+        self.assertEqual(inline.totals(), pooled.totals())
+        self.assertEqual(inline_diffs, pool_diffs)
+        self.assertEqual([d.line_number for d in pool_diffs][:3], [1, 2, 4])
+        self.assertEqual(pool_diffs[1].fares, {'normal': 7.2, 'alta': 11.4})
+
+
+if __name__ == '__main__':
+    unittest.main()
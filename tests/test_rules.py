@@ -0,0 +1,139 @@
+"""
+Tests del motor de reglas de tarificación compilado.
+"""
+import unittest
+import tempfile
+import shutil
+import json
+import sys
+import os
+from unittest import mock
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.rules import CompiledProfile, load_rules
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AIRPORT = {
+    "stopped": 0.04, "moving": 0.10, "km": 0.0,
+    "rules": [
+        {"type": "flag_drop", "amount": 2.5},
+        {"type": "surcharge", "amount": 5.0, "when": "aeropuerto"},
+        {"type": "tiered", "after_minutes": 10, "stopped": 0.03, "moving": 0.08},
+        {"type": "minimum", "amount": 4.0},
+        {"type": "cap", "amount": 120.0},
+    ],
+}
+
+
+class TestCompiledProfile(unittest.TestCase):
+    """Tests de la tarifa compilada de un perfil."""
+
+    def test_sin_reglas_igual_que_tarifa_plana(self):
+        """Sin reglas el resultado es exactamente la tarifa por tiempo."""
+        fare = CompiledProfile(main.PRICE_PROFILES["normal"]).fare
+        for stopped, moving in [(8.1, 18.5), (0, 0), (123.4, 567.8)]:
+            self.assertEqual(fare(stopped, moving), round(stopped * 0.02 + moving * 0.05, 2))
+
+    def test_reglas(self):
+        """Bajada de bandera, suplemento, tramos, mínimo y máximo."""
+        fare = CompiledProfile(AIRPORT).fare
+        self.assertEqual(fare(10, 10), 4.0)  # 2.5 + 1.4 por debajo del mínimo
+        self.assertEqual(fare(10, 10, tags=('aeropuerto',)), 8.9)
+        # 15 min en movimiento: 600s a 0.10 y 300s a 0.08
+        self.assertEqual(fare(0, 900), round(2.5 + 600 * 0.10 + 300 * 0.08, 2))
+        self.assertEqual(fare(0, 3600), 120.0)
+
+    def test_tramos_monotonos_en_viajes_largos(self):
+        """Un tramo más barato no hace bajar la tarifa al sumar tiempo, aunque el viaje dure días."""
+        fare = CompiledProfile({"stopped": 0.02, "moving": 0.05, "rules": [
+            {"type": "tiered", "after_minutes": 1, "stopped": 0.0, "moving": 0.0}]}).fare
+        self.assertEqual(fare(280345.0, 0.5), fare(280346.0, 0.5))
+        self.assertEqual(fare(280345.0, 0.5), round(60 * 0.02 + 0.5 * 0.05, 2))
+
+    def test_linea_recta(self):
+        """La función compilada no interpreta las reglas al evaluar."""
+        source = CompiledProfile(AIRPORT).source
+        self.assertNotIn('for ', source)
+        self.assertNotIn('rules', source)
+
+    def test_regla_invalida(self):
+        """Una regla desconocida o sin importe numérico se rechaza al compilar."""
+        with self.assertRaises(ValueError):
+            CompiledProfile({"stopped": 0.02, "moving": 0.05, "rules": [{"type": "descuento"}]})
+        with self.assertRaises(ValueError):
+            CompiledProfile({"stopped": 0.02, "moving": 0.05, "rules": [{"type": "cap", "amount": "x"}]})
+        with self.assertRaises(ValueError):
+            CompiledProfile({"stopped": 0.02, "moving": 0.05,
+                             "rules": [{"type": "tiered", "after_minutes": 10, "moving": float('nan')}]})
+
+    @unittest.skipIf(np is None, "numpy no instalado")
+    def test_lotes_igual_que_viaje_a_viaje(self):
+        """La versión por lotes coincide con la evaluación viaje a viaje."""
+        compiled = CompiledProfile(AIRPORT)
+        stopped = np.array([10.0, 10.0, 0.0, 0.0, 300.0])
+        moving = np.array([10.0, 10.0, 900.0, 3600.0, 1200.0])
+        airport = np.array([False, True, False, False, True])
+        batch = compiled.fare_batch(stopped, moving, tags={'aeropuerto': airport})
+        expected = [compiled.fare(s, m, tags=('aeropuerto',) if a else ())
+                    for s, m, a in zip(stopped, moving, airport)]
+        np.testing.assert_allclose(batch, expected)
+
+    def test_lotes_sin_numpy(self):
+        """Sin numpy los lotes se evalúan con la función de un viaje."""
+        compiled = CompiledProfile(AIRPORT)
+        batch = compiled._fallback_batch([10.0, 10.0], [10.0, 10.0], 0.0, {'aeropuerto': [False, True]})
+        self.assertEqual(batch, [4.0, 8.9])
+
+
+class TestPricingRulesFile(unittest.TestCase):
+    """Tests de la carga de reglas junto a los perfiles."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'pricing_rules.json')
+        self.rules_before = {key: profile.get("rules") for key, profile in main.PRICE_PROFILES.items()}
+
+    def tearDown(self):
+        for key, rules in self.rules_before.items():
+            if rules is None:
+                main.PRICE_PROFILES[key].pop("rules", None)
+            else:
+                main.PRICE_PROFILES[key]["rules"] = rules
+        main.publish_tariffs()
+        shutil.rmtree(self.directory)
+
+    def test_fichero_inexistente(self):
+        """Sin fichero de reglas no hay reglas."""
+        self.assertEqual(load_rules(self.path), {})
+
+    def test_reglas_aplicadas_a_compute_fare(self):
+        """Las reglas del fichero se aplican a la tarifa del perfil."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"normal": [{"type": "flag_drop", "amount": 2.5}]}, f)
+        with mock.patch.object(main.settings, 'PRICING_RULES_FILE', self.path):
+            main.load_pricing_rules()
+        self.assertEqual(main.compute_fare(10, 20, 'normal'), 3.7)
+        self.assertEqual(main.compute_fare(10, 20, 'alta'), 1.9)
+
+    def test_etiquetas_del_viaje(self):
+        """Los suplementos con `when` se cobran si el viaje lleva la etiqueta (sin distinguir mayúsculas)."""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"normal": [{"type": "surcharge", "amount": 5.0, "when": "Aeropuerto"}]}, f)
+        with mock.patch.object(main.settings, 'PRICING_RULES_FILE', self.path):
+            main.load_pricing_rules()
+        tariff = main.TARIFFS.current.with_active('normal', 0)
+        tags = main.parse_tags("Aeropuerto, nocturno")
+        self.assertEqual(tags, ('aeropuerto', 'nocturno'))
+        self.assertEqual(main.calculate_fare(10, 20, tags=tags, tariff=tariff), 6.2)
+        self.assertEqual(main.calculate_fare(10, 20, tariff=tariff), 1.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
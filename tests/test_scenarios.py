@@ -8,12 +8,21 @@ import os
 # Agregar el directorio principal al path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import main
 from main import calculate_fare
 
 
 class TestTaximeterScenarios(unittest.TestCase):
     """Tests de escenarios reales del taxímetro."""
     
+    def setUp(self):
+        """Las cifras esperadas son las del perfil normal, sea cual sea el activo."""
+        self.profile_anterior = main.current_tariff().active
+        main.activate_profile("normal")
+    
+    def tearDown(self):
+        main.activate_profile(self.profile_anterior)
+    
     def test_viaje_urbano_corto(self):
         """Escenario: Viaje urbano corto con varias paradas."""
         # 2 min parado en semáforos + 8 min movimiento
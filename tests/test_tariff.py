@@ -0,0 +1,138 @@
+"""
+Tests de los snapshots inmutables de tarifas.
+"""
+import unittest
+import threading
+import sys
+import os
+from unittest import mock
+
+# Agregar el directorio principal al path para importar main
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from src.tariff import TariffBoard, TariffSnapshot, benchmark
+from src.trip import FINISH, MOVE, START, Trip
+
+PROFILES = {
+    "normal": {"stopped": 0.02, "moving": 0.05, "km": 0.0, "name": "Normal"},
+    "alta": {"stopped": 0.03, "moving": 0.08, "km": 0.0, "name": "Demanda Alta",
+             "rules": [{"type": "flag_drop", "amount": 1.0}]},
+}
+
+
+class TestTariffSnapshot(unittest.TestCase):
+    """Tests del snapshot inmutable."""
+
+    def test_inmutable(self):
+        """Ni los atributos ni los perfiles del snapshot se pueden modificar."""
+        snapshot = TariffSnapshot(1, PROFILES, "normal")
+        with self.assertRaises(AttributeError):
+            snapshot.active = "alta"
+        with self.assertRaises(TypeError):
+            snapshot.profiles["normal"]["stopped"] = 1.0
+        with self.assertRaises(TypeError):
+            snapshot.profiles["alta"]["rules"][0]["amount"] = 9.0
+
+    def test_copia_de_los_perfiles(self):
+        """Cambiar el diccionario de origen no afecta a un snapshot ya construido."""
+        profiles = {key: dict(profile) for key, profile in PROFILES.items()}
+        snapshot = TariffSnapshot(1, profiles, "normal")
+        profiles["normal"]["stopped"] = 1.0
+        self.assertEqual(snapshot.rates(), (0.02, 0.05, 0.0))
+        self.assertEqual(snapshot.fare(10, 20), round(10 * 0.02 + 20 * 0.05, 2))
+        self.assertEqual(snapshot.fare(10, 20, "alta"), round(1.0 + 10 * 0.03 + 20 * 0.08, 2))
+
+    def test_perfil_desconocido(self):
+        """Activar un perfil que no existe es un error y no publica nada."""
+        board = TariffBoard(PROFILES, "normal")
+        with self.assertRaises(KeyError):
+            board.activate("inexistente")
+        self.assertEqual(board.current.version, 1)
+
+
+class TestTariffBoard(unittest.TestCase):
+    """Tests del cambio atómico de snapshots."""
+
+    def test_versiones(self):
+        """Cada cambio publica una versión nueva; las recientes se pueden consultar."""
+        board = TariffBoard(PROFILES, "normal")
+        first = board.current
+        second = board.activate("alta")
+        self.assertEqual((second.version, second.active), (2, "alta"))
+        self.assertIs(board.get(1), first)
+        self.assertEqual(first.active, "normal")
+        # Cambiar de perfil reutiliza las tarifas compiladas
+        self.assertIs(second.evaluators, first.evaluators)
+        third = board.load_profiles(dict(PROFILES, alta=dict(PROFILES["alta"], rules=[])))
+        self.assertEqual((third.version, third.active), (3, "alta"))
+        self.assertEqual(third.fare(10, 20), round(10 * 0.03 + 20 * 0.08, 2))
+
+    def test_lectores_concurrentes_coherentes(self):
+        """Con un hilo cambiando de perfil, ningún lector mezcla un perfil con las tarifas de otro."""
+        _, switches, mismatches = benchmark(PROFILES, readers=2, seconds=0.2)
+        self.assertGreater(switches, 0)
+        self.assertEqual(mismatches, 0)
+
+    def test_escritores_concurrentes(self):
+        """Los cambios simultáneos no repiten versión."""
+        board = TariffBoard(PROFILES, "normal")
+        threads = [threading.Thread(target=lambda: [board.activate("alta") for _ in range(200)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(board.current.version, 801)
+
+
+class TestPinnedTrip(unittest.TestCase):
+    """Tests del snapshot fijado por cada viaje."""
+
+    def setUp(self):
+        self.profile_anterior = main.current_tariff().active
+        main.activate_profile("normal")
+
+    def tearDown(self):
+        main.activate_profile(self.profile_anterior)
+
+    def test_el_viaje_se_cobra_con_su_snapshot(self):
+        """Un cambio de perfil global durante el viaje no cambia lo que cobra ese viaje."""
+        trip = Trip.with_rates(*main.current_rates())
+        trip.pin(main.current_tariff())
+        trip.fire(START, 0.0)
+        trip.fire(MOVE, 10.0)
+        main.activate_profile("aeropuerto")
+        trip.fire(FINISH, 30.0)
+        fare = trip.fare
+        self.assertEqual(trip.tariff.active, "normal")
+        self.assertEqual(main.calculate_fare(fare.stopped_time, fare.moving_time, tariff=trip.tariff),
+                         round(10 * 0.02 + 20 * 0.05, 2))
+        self.assertEqual(main.calculate_fare(fare.stopped_time, fare.moving_time),
+                         round(10 * 0.04 + 20 * 0.10, 2))
+
+    def test_volver_a_fijar_reprecia_el_viaje(self):
+        """Fijar el snapshot nuevo (cambio de perfil del propio viaje) reprecia el acumulado."""
+        trip = Trip.with_rates(*main.current_rates())
+        trip.pin(main.current_tariff())
+        trip.fire(START, 0.0)
+        trip.pin(main.activate_profile("alta"))
+        self.assertAlmostEqual(trip.fare.estimate(10.0), 10 * 0.03)
+        trip.reset()
+        self.assertIsNone(trip.tariff)
+
+    def test_menu_de_precios_no_reprecia_el_viaje(self):
+        """Ver los precios no cambia el snapshot del viaje en curso aunque otro hilo haya publicado uno."""
+        with mock.patch.object(main.settings, 'LIVE_STATE_ENABLED', False), \
+                mock.patch.object(main.settings, 'SENSOR_SOURCE', None):
+            session = main.CliSession()
+        pinned = main.current_tariff()
+        session.trip.pin(pinned)
+        session.trip.fire(START, 0.0)
+        main.activate_profile("alta")
+        with mock.patch.object(main, 'show_price_profiles'):
+            self.assertTrue(session.handle("precios"))
+        self.assertIs(session.trip.tariff, pinned)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Tests de la máquina de estados del viaje (Trip).
+"""
+import unittest
+import sys
+import os
+
+# Agregar el directorio principal al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.trip import (IDLE, STOPPED, MOVING, START, STOP, MOVE, FINISH, EXIT, TRANSITIONS,
+                      Trip, advance_trips)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TestTrip(unittest.TestCase):
+    """Tests de las transiciones validadas y de la cuenta de tramos."""
+
+    def setUp(self):
+        self.trip = Trip.with_rates(0.02, 0.05)
+
+    def test_ciclo_completo(self):
+        """start, move, stop y finish facturan cada tramo en su estado."""
+        trip = self.trip
+        self.assertTrue(trip.fire(START, 0.0))
+        self.assertEqual((trip.code, trip.state), (STOPPED, 'stopped'))
+        self.assertTrue(trip.fire(MOVE, 10.0))
+        self.assertTrue(trip.fire(STOP, 30.0))
+        self.assertTrue(trip.fire(FINISH, 35.0))
+        self.assertFalse(trip.active)
+        self.assertEqual(trip.fare.segments, 3)
+        self.assertAlmostEqual(trip.fare.stopped_time, 15.0)
+        self.assertAlmostEqual(trip.fare.moving_time, 20.0)
+        self.assertAlmostEqual(trip.fare.estimate(100.0), 15 * 0.02 + 20 * 0.05)
+
+    def test_transiciones_invalidas(self):
+        """Los eventos no permitidos se rechazan sin cambiar el viaje."""
+        trip = self.trip
+        for event in (STOP, MOVE, FINISH):
+            self.assertFalse(trip.fire(event, 1.0))
+        self.assertEqual(trip.code, IDLE)
+        trip.fire(START, 0.0)
+        self.assertFalse(trip.can(START))
+        self.assertFalse(trip.fire(START, 5.0))
+        self.assertEqual(trip.fare.trip_start, 0.0)
+        self.assertEqual(trip.rejected, 4)
+        self.assertEqual(trip.transitions, 1)
+
+    def test_exit_finaliza_el_viaje(self):
+        """exit cierra el viaje activo y no hace nada sin viaje."""
+        trip = self.trip
+        self.assertTrue(trip.fire(EXIT, 0.0))
+        trip.fire(START, 0.0)
+        trip.fire(MOVE, 2.0)
+        self.assertTrue(trip.fire(EXIT, 6.0))
+        self.assertEqual(trip.code, IDLE)
+        self.assertAlmostEqual(trip.fare.moving_time, 4.0)
+
+    def test_restore(self):
+        """Un viaje recuperado de un checkpoint queda activo en su estado."""
+        self.trip.restore('moving', 0.0, 10.0, 10.0, 0.0)
+        self.assertEqual(self.trip.code, MOVING)
+        self.assertTrue(self.trip.fire(FINISH, 20.0))
+        self.assertAlmostEqual(self.trip.fare.moving_time, 10.0)
+
+    def test_slots(self):
+        """Trip no tiene __dict__ (miles de viajes en un servidor)."""
+        with self.assertRaises(AttributeError):
+            self.trip.extra = 1
+
+
+@unittest.skipIf(np is None, "numpy no está instalado")
+class TestAdvanceTrips(unittest.TestCase):
+    """Tests de la tabla de transiciones aplicada a lotes con numpy."""
+
+    def test_igual_que_trip(self):
+        """El lote sigue la misma tabla que Trip.fire."""
+        codes = np.array([IDLE, IDLE, STOPPED, MOVING, MOVING], dtype=np.int8)
+        events = np.array([START, MOVE, MOVE, FINISH, START], dtype=np.int8)
+        new_codes, valid = advance_trips(codes, events)
+        self.assertEqual(new_codes.tolist(), [STOPPED, IDLE, MOVING, IDLE, MOVING])
+        self.assertEqual(valid.tolist(), [True, False, True, True, False])
+        for code, event, target in zip(codes.tolist(), events.tolist(), new_codes.tolist()):
+            expected = TRANSITIONS[code][event]
+            self.assertEqual(target, code if expected < 0 else expected)
+
+
+if __name__ == '__main__':
+    unittest.main()